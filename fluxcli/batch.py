@@ -0,0 +1,92 @@
+"""
+batch.py - Run one module command over many targets in a single process.
+
+Used by the dispatcher's --targets-file option:
+    fluxcli nmap portscan --targets-file hosts.txt --workers 8
+    cat hosts.txt | fluxcli nmap pingsweep --targets-file -
+
+Targets are read lazily and at most a small window of them is in flight at
+any time, so target lists of any length run in constant memory. Each target
+produces one record; failures are reported inline instead of aborting the run.
+
+Settings (fluxcli.yaml):
+    batch_workers: 4    # default for --workers
+"""
+
+import sys
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from .utils.runner import inCurrentScope
+
+__all__ = ["readTargets", "iterBatchResults"]
+
+_DEFAULT_WORKERS_ = 4
+
+# Targets submitted ahead of the workers, per worker
+_WINDOW_FACTOR_ = 4
+
+def readTargets(sPath: str):
+    """
+    Yield targets from sPath ('-' for stdin), one per line.
+    Blank lines and lines starting with '#' are skipped; trailing comments are stripped.
+    """
+    fTargets = sys.stdin if sPath == "-" else open(sPath, "r", encoding="utf-8")
+    try:
+        for sLine in fTargets:
+            sTarget = sLine.split("#", 1)[0].strip()
+            if sTarget:
+                yield sTarget
+    finally:
+        if fTargets is not sys.stdin:
+            fTargets.close()
+
+def runTarget(funcRun, sTarget: str) -> dict:
+    """
+    Run funcRun(sTarget) and wrap the outcome as a batch record:
+    {"target": ..., "result": {...}} on success or {"target": ..., "error": "..."} on failure.
+    """
+    try:
+        dResult = funcRun(sTarget)
+    except Exception as e:
+        return {"target": sTarget, "error": str(e)}
+    if isinstance(dResult, dict) and "error" in dResult:
+        return {"target": sTarget, "error": dResult["error"]}
+    return {"target": sTarget, "result": dResult}
+
+def iterBatchResults(funcRun, iterTargets, iWorkers: int = _DEFAULT_WORKERS_, bOrdered: bool = False):
+    """
+    Run funcRun(sTarget) for every target on a pool of iWorkers threads and yield
+    one record per target (see runTarget). Records come in completion order, or
+    in input order if bOrdered is True.
+    """
+    iWorkers = max(1, int(iWorkers))
+    iWindow = iWorkers * _WINDOW_FACTOR_
+    iterTargets = iter(iterTargets)
+
+    with ThreadPoolExecutor(max_workers=iWorkers, thread_name_prefix="fluxcli-batch") as oPool:
+        def submitNext(oPending) -> bool:
+            for sTarget in iterTargets:
+                oPending.append(oPool.submit(inCurrentScope(runTarget), funcRun, sTarget))
+                return True
+            return False
+
+        if bOrdered:
+            dqPending = deque()
+            while len(dqPending) < iWindow and submitNext(dqPending):
+                pass
+            while dqPending:
+                yield dqPending.popleft().result()
+                submitNext(dqPending)
+        else:
+            lstPending = []
+            while len(lstPending) < iWindow and submitNext(lstPending):
+                pass
+            setPending = set(lstPending)
+            while setPending:
+                setDone, setPending = wait(setPending, return_when=FIRST_COMPLETED)
+                for oFuture in setDone:
+                    yield oFuture.result()
+                lstNew = []
+                while len(setPending) + len(lstNew) < iWindow and submitNext(lstNew):
+                    pass
+                setPending.update(lstNew)
@@ -0,0 +1,4 @@
+"""
+__init__.py for the 'bench' package.
+Benchmarks and synthetic fixtures for FluxCLI's hot paths.
+"""
@@ -0,0 +1,67 @@
+"""
+fixtures.py - Synthetic nmap XML output for benchmarks.
+
+The generated documents follow the structure of 'nmap -oX -' closely enough
+for fluxcli.modules.nmap.parser, and are written in chunks so fixtures for
+very large scans never have to be held in memory.
+"""
+
+import ipaddress
+
+__all__ = ["iterNmapXml", "writeNmapXml"]
+
+_HEADER_ = '<?xml version="1.0" encoding="UTF-8"?>\n<nmaprun scanner="nmap" args="nmap -oX -" version="7.94">\n'
+_FOOTER_ = '<runstats><finished elapsed="1.00" exit="success"/></runstats>\n</nmaprun>\n'
+
+def buildHostXml(iIndex: int, sIp: str, bPorts: bool) -> str:
+    """
+    Return the <host> block for the iIndex-th synthetic host.
+    Every other host has a MAC address and every third host lacks a reverse DNS
+    name, so the parser's optional-field paths are exercised as well.
+    """
+    lstParts = [f'<host starttime="1700000000" endtime="1700000001"><status state="up" reason="arp-response" reason_ttl="0"/>'
+                f'<address addr="{sIp}" addrtype="ipv4"/>']
+    if iIndex % 2 == 0:
+        lstParts.append(f'<address addr="C4:41:1E:{(iIndex >> 16) & 0xFF:02X}:{(iIndex >> 8) & 0xFF:02X}:{iIndex & 0xFF:02X}" '
+                        f'addrtype="mac" vendor="Belkin International"/>')
+    if iIndex % 3:
+        lstParts.append(f'<hostnames><hostname name="host{iIndex}.example.net" type="PTR"/></hostnames>')
+    else:
+        lstParts.append('<hostnames/>')
+    if bPorts:
+        lstParts.append('<ports><extraports state="closed" count="996"/>'
+                        '<port protocol="tcp" portid="22"><state state="open" reason="syn-ack" reason_ttl="64"/><service name="ssh" method="table" conf="3"/></port>'
+                        '<port protocol="tcp" portid="80"><state state="closed" reason="reset" reason_ttl="64"/><service name="http" method="table" conf="3"/></port>'
+                        '<port protocol="tcp" portid="443"><state state="open" reason="syn-ack" reason_ttl="64"/><service name="https" method="table" conf="3"/></port>'
+                        '<port protocol="udp" portid="53"><state state="open|filtered" reason="no-response" reason_ttl="0"/><service name="domain" method="table" conf="3"/></port>'
+                        '</ports>')
+    lstParts.append(f'<times srtt="{1000 + iIndex % 5000}" rttvar="500" to="100000"/></host>\n')
+    return "".join(lstParts)
+
+def iterNmapXml(iHosts: int, bPorts: bool = False, sBase: str = "10.0.0.0"):
+    """
+    Yield a synthetic nmap XML document for iHosts live hosts as byte chunks.
+    Hosts are numbered consecutively from sBase.
+    """
+    iBase = int(ipaddress.ip_address(sBase))
+    yield _HEADER_.encode("utf-8")
+    lstBatch = []
+    for iIndex in range(iHosts):
+        lstBatch.append(buildHostXml(iIndex, str(ipaddress.ip_address(iBase + iIndex + 1)), bPorts))
+        if len(lstBatch) == 256:
+            yield "".join(lstBatch).encode("utf-8")
+            lstBatch = []
+    if lstBatch:
+        yield "".join(lstBatch).encode("utf-8")
+    yield _FOOTER_.encode("utf-8")
+
+def writeNmapXml(sPath: str, iHosts: int, bPorts: bool = False, sBase: str = "10.0.0.0") -> int:
+    """
+    Write a synthetic nmap XML document to sPath. Returns the number of bytes written.
+    """
+    iBytes = 0
+    with open(sPath, "wb") as fXml:
+        for bChunk in iterNmapXml(iHosts, bPorts, sBase):
+            fXml.write(bChunk)
+            iBytes += len(bChunk)
+    return iBytes
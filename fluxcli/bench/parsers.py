@@ -0,0 +1,101 @@
+"""
+parsers.py - Benchmark for the nmap XML parser on synthetic fixtures.
+
+Usage:
+    python -m fluxcli.bench.parsers [--sizes 256,4096,65536] [--ports]
+
+For every size a fixture is written to a temporary file and parsed with
+fluxcli.modules.nmap.parser.iterHosts. The report shows time per host,
+peak Python memory while streaming, and the memory per host of a sweep result
+held in a fluxcli.records.SweepTable; all should stay flat as the number of
+hosts grows.
+"""
+
+import os
+import sys
+import time
+import tempfile
+import tracemalloc
+from .fixtures import writeNmapXml
+from ..modules.nmap.parser import iterHosts
+from ..records import SweepTable, SweepRecord
+
+_DEFAULT_SIZES_ = [256, 4096, 65536]
+
+# Per-host time may grow by at most this factor between the smallest and largest fixture
+_LINEAR_TOLERANCE_ = 2.0
+
+def benchXmlParser(iHosts: int, bPorts: bool = False) -> dict:
+    """
+    Parse a synthetic fixture of iHosts hosts and return its timing record:
+    {"hosts": int, "bytes": int, "seconds": float, "us_per_host": float, "peak_kib": float,
+     "held_bytes_per_host": float}
+    """
+    with tempfile.TemporaryDirectory() as sTmpDir:
+        sPath = os.path.join(sTmpDir, f"nmap_{iHosts}.xml")
+        iBytes = writeNmapXml(sPath, iHosts, bPorts)
+
+        with open(sPath, "rb") as fXml:
+            fStart = time.perf_counter()
+            iParsed = 0
+            for _ in iterHosts(fXml):
+                iParsed += 1
+            fElapsed = time.perf_counter() - fStart
+
+        # Second pass for memory only; tracemalloc would distort the timing above
+        with open(sPath, "rb") as fXml:
+            tracemalloc.start()
+            for _ in iterHosts(fXml):
+                pass
+            _, iPeak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+        # Third pass: memory kept by the finished result, as pingsweep holds it
+        with open(sPath, "rb") as fXml:
+            tracemalloc.start()
+            iBefore, _ = tracemalloc.get_traced_memory()
+            oTable = SweepTable()
+            for oHost in iterHosts(fXml):
+                oTable.append(SweepRecord.fromHost(oHost))
+            iHeld = tracemalloc.get_traced_memory()[0] - iBefore
+            tracemalloc.stop()
+            del oTable
+
+    if iParsed != iHosts:
+        raise RuntimeError(f"Parsed {iParsed} hosts, expected {iHosts}")
+    return {
+        "hosts": iHosts,
+        "bytes": iBytes,
+        "seconds": fElapsed,
+        "us_per_host": fElapsed / iHosts * 1000000.0,
+        "peak_kib": iPeak / 1024.0,
+        "held_bytes_per_host": iHeld / float(iHosts)
+    }
+
+def main(lstArgv=None) -> int:
+    """
+    Run the parser benchmark and print one line per fixture size.
+    Returns a non-zero exit code if per-host time grows faster than _LINEAR_TOLERANCE_.
+    """
+    lstArgv = sys.argv[1:] if lstArgv is None else lstArgv
+    lstSizes = _DEFAULT_SIZES_
+    if "--sizes" in lstArgv:
+        lstSizes = [int(sSize) for sSize in lstArgv[lstArgv.index("--sizes") + 1].split(",")]
+    bPorts = "--ports" in lstArgv
+
+    lstResults = []
+    print(f"{'hosts':>10} {'MiB':>8} {'seconds':>9} {'us/host':>9} {'peak KiB':>10} {'B/host held':>12}")
+    for iHosts in lstSizes:
+        dResult = benchXmlParser(iHosts, bPorts)
+        lstResults.append(dResult)
+        print(f"{dResult['hosts']:>10} {dResult['bytes'] / 1048576.0:>8.2f} {dResult['seconds']:>9.3f} "
+              f"{dResult['us_per_host']:>9.2f} {dResult['peak_kib']:>10.1f} {dResult['held_bytes_per_host']:>12.1f}")
+
+    fRatio = lstResults[-1]["us_per_host"] / lstResults[0]["us_per_host"]
+    if fRatio > _LINEAR_TOLERANCE_:
+        print(f"[Warning] Per-host parse time grew {fRatio:.2f}x between the smallest and largest fixture.")
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
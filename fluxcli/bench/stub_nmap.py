@@ -0,0 +1,97 @@
+"""
+stub_nmap.py - Stand-in for the nmap binary in benchmarks.
+
+installStubNmap() writes an executable 'nmap' wrapper that runs main() below,
+so module code can be benchmarked end to end without scanning anything.
+The stub answers with XML (as for 'nmap -oX -') for the targets on its
+command line: a recorded fixture from $FLUXCLI_STUB_FIXTURES named after the
+target (see fixtureName) when one exists, otherwise a synthetic document in
+which a $FLUXCLI_STUB_DENSITY fraction (default 1.0) of the addresses is up.
+"""
+
+import os
+import sys
+import stat
+import ipaddress
+from .fixtures import iterNmapXml
+
+__all__ = ["installStubNmap", "fixtureName", "main"]
+
+# nmap options that consume the following token
+_VALUE_OPTIONS_ = (
+    "-p", "-oX", "-oN", "-oG", "-oA", "-e", "-S", "--max-rate", "--min-rate",
+    "--max-hostgroup", "--min-hostgroup", "--max-parallelism", "--min-parallelism",
+    "--host-timeout", "--max-retries", "--max-rtt-timeout", "--initial-rtt-timeout",
+    "--scan-delay", "--max-scan-delay", "--exclude"
+)
+
+def fixtureName(sTarget: str, bPorts: bool) -> str:
+    """
+    File name of the recorded fixture for a target, e.g. "10.0.0.0_24.xml".
+    """
+    return sTarget.replace("/", "_") + ("_ports" if bPorts else "") + ".xml"
+
+def countHosts(sTarget: str, fDensity: float) -> tuple:
+    """
+    Return (sFirstAddress, iLiveHosts) for a target address or network.
+    """
+    oNetwork = ipaddress.ip_network(sTarget, strict=False)
+    iUsable = oNetwork.num_addresses - 2 if oNetwork.num_addresses > 2 else oNetwork.num_addresses
+    iBase = int(oNetwork.network_address) - (1 if oNetwork.num_addresses <= 2 else 0)
+    return str(ipaddress.ip_address(max(iBase, 0))), max(1, int(iUsable * fDensity))
+
+def main(lstArgv) -> int:
+    """
+    Write XML scan results for the targets in lstArgv to stdout.
+    """
+    lstTargets = []
+    bSkipNext = False
+    for sArg in lstArgv:
+        if bSkipNext:
+            bSkipNext = False
+        elif sArg in _VALUE_OPTIONS_:
+            bSkipNext = True
+        elif not sArg.startswith("-"):
+            lstTargets.append(sArg)
+
+    bPorts = "-p" in lstArgv
+    sFixtures = os.environ.get("FLUXCLI_STUB_FIXTURES", "")
+    fDensity = float(os.environ.get("FLUXCLI_STUB_DENSITY", "1.0"))
+    fOut = sys.stdout.buffer
+
+    for sTarget in lstTargets:
+        sFixture = os.path.join(sFixtures, fixtureName(sTarget, bPorts)) if sFixtures else ""
+        if sFixture and os.path.isfile(sFixture):
+            with open(sFixture, "rb") as fXml:
+                while True:
+                    bChunk = fXml.read(65536)
+                    if not bChunk:
+                        break
+                    fOut.write(bChunk)
+            continue
+        sBase, iHosts = countHosts(sTarget, fDensity)
+        for bChunk in iterNmapXml(iHosts, bPorts, sBase):
+            fOut.write(bChunk)
+    fOut.flush()
+    return 0
+
+def installStubNmap(sDir: str) -> str:
+    """
+    Write an executable 'nmap' wrapper into sDir and return its path.
+    Prepend sDir to PATH so module code picks it up instead of the real nmap.
+    """
+    sPackageRoot = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    sPath = os.path.join(sDir, "nmap")
+    with open(sPath, "w", encoding="utf-8") as fStub:
+        fStub.write(
+            f"#!{sys.executable}\n"
+            "import sys\n"
+            f"sys.path.insert(0, {sPackageRoot!r})\n"
+            "from fluxcli.bench.stub_nmap import main\n"
+            "sys.exit(main(sys.argv[1:]))\n"
+        )
+    os.chmod(sPath, os.stat(sPath).st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+    return sPath
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,372 @@
+"""
+suite.py - The 'fluxcli bench' benchmark suite.
+
+Times the hot paths of FluxCLI in an isolated environment (temporary HOME,
+stub nmap on PATH, recorded XML fixtures):
+    startup_cold / startup_warm   fresh 'python -m fluxcli.main' processes
+                                  without / with a cached command manifest
+    startup_import                a fresh interpreter importing fluxcli.main
+    yaml_pure / yaml_c / yaml_cached
+                                  loading fluxcli.yaml and a commands.yaml with
+                                  PyYAML's pure-Python SafeLoader, the libyaml
+                                  CSafeLoader and from the marshal cache
+    registry_rebuild / registry_warm
+                                  buildCommandRegistry() in-process
+    reload_check / reload_module  reloadRegistry() with nothing changed (one
+                                  watch mode tick) / forcing the imported
+                                  nmap module to reload
+    dispatch_overhead             dispatchModuleCommand() on a no-op command
+    dispatch_isolated             one call of a trivial nmap module function in
+                                  a warm worker process (see workerpool.py)
+    parse_<size>                  nmap XML parser on recorded fixtures
+    pingsweep_<size>              nmap module pingsweep through the stub nmap
+    pingsweep_isolated_<size>     the same, run in a warm worker process
+Fixture sizes range from a /24 to a simulated /8 (2% of the addresses up).
+
+Results are written as JSON so runs of different versions can be compared:
+    fluxcli bench --output before.json
+    fluxcli bench --output after.json --compare before.json
+
+The cases can also be driven by pytest-benchmark style harnesses:
+    with BenchContext() as oContext:
+        for sName, funcCase in getBenchCases(oContext).items():
+            benchmark(funcCase)
+"""
+
+import io
+import os
+import sys
+import json
+import time
+import types
+import shutil
+import platform
+import tempfile
+import statistics
+import subprocess
+from contextlib import redirect_stdout
+from .fixtures import writeNmapXml
+from .stub_nmap import installStubNmap, fixtureName, countHosts
+from ..modules.nmap.parser import iterHosts
+
+__all__ = ["BenchContext", "getBenchCases", "runSuite", "main"]
+
+# name -> (target, density); the stub and fixtures derive the live host count from these
+_SIZES_ = {
+    "24": ("10.0.0.0/24", 1.0),
+    "20": ("10.0.0.0/20", 1.0),
+    "16": ("10.0.0.0/16", 1.0),
+    "8": ("10.0.0.0/8", 0.02),
+}
+_QUICK_SIZES_ = ("24", "20")
+
+# Slower end-to-end cases only run up to this size
+_PINGSWEEP_SIZES_ = ("24", "20", "16")
+
+# A fluxcli.yaml with every settings section, for the yaml_* cases
+_SETTINGS_FIXTURE_ = """\
+environment: lab
+output: {format: auto, json_backend: auto}
+cache: {enabled: true, ttl: 3600, max_entries: 10000, max_mb: 256}
+inventory: {enabled: true}
+checkpoint: {enabled: true, keep_days: 7}
+tmux: {socket_name: fluxcli, control_session: _fluxcli_, timeout: 10}
+timings: {enabled: false, metrics_file: ~/.fluxcli/metrics.ndjson}
+runner: {max_processes: 8}
+scheduler:
+  enabled: true
+  max_pps: 5000
+  max_hosts: 4096
+  template: normal
+pipeline: {workers: 4, queue_size: 64}
+cluster:
+  listen: 127.0.0.1:7420
+  token: change-me
+  unit_bits: 6
+  lease_timeout: 900
+  max_attempts: 3
+  heartbeat: 5
+  worker_slots: 2
+daemon: {max_concurrent: 8}
+"""
+
+_DEFAULT_RUNS_ = 10
+_SLOW_RUNS_ = 3
+
+class BenchContext:
+    """
+    Isolated environment for benchmark cases: a temporary HOME (so settings and
+    caches start empty), a stub nmap first on PATH and a directory of recorded fixtures.
+    """
+
+    def __init__(self, lstSizes=_QUICK_SIZES_):
+        self.lstSizes = list(lstSizes)
+        self.sRoot = None
+        self.dSavedEnv = {}
+        self.oWorkerPool = None
+
+    def __enter__(self):
+        self.sRoot = tempfile.mkdtemp(prefix="fluxcli-bench-")
+        self.sHome = os.path.join(self.sRoot, "home")
+        self.sBin = os.path.join(self.sRoot, "bin")
+        self.sFixtures = os.path.join(self.sRoot, "fixtures")
+        for sDir in (self.sHome, self.sBin, self.sFixtures):
+            os.makedirs(sDir)
+        installStubNmap(self.sBin)
+
+        dEnv = {
+            "HOME": self.sHome,
+            "APPDATA": self.sHome,
+            "PATH": self.sBin + os.pathsep + os.environ.get("PATH", ""),
+            "FLUXCLI_STUB_FIXTURES": self.sFixtures,
+            "FLUXCLI_NO_DAEMON": "1",
+        }
+        for sKey, sValue in dEnv.items():
+            self.dSavedEnv[sKey] = os.environ.get(sKey)
+            os.environ[sKey] = sValue
+
+        # Record the fixtures once; every case replays them
+        self.dFixtures = {}
+        for sSize in self.lstSizes:
+            sTarget, fDensity = _SIZES_[sSize]
+            sBase, iHosts = countHosts(sTarget, fDensity)
+            sPath = os.path.join(self.sFixtures, fixtureName(sTarget, False))
+            self.dFixtures[sSize] = {
+                "target": sTarget,
+                "path": sPath,
+                "hosts": iHosts,
+                "bytes": writeNmapXml(sPath, iHosts, False, sBase)
+            }
+
+        self.sSettingsFixture = os.path.join(self.sFixtures, "fluxcli.yaml")
+        with open(self.sSettingsFixture, "w", encoding="utf-8") as fSettings:
+            fSettings.write(_SETTINGS_FIXTURE_)
+        return self
+
+    def getWorkerPool(self):
+        """
+        Return a worker pool with the nmap module preloaded, started on first use.
+        """
+        if self.oWorkerPool is None:
+            from ..workerpool import WorkerPool
+            self.oWorkerPool = WorkerPool(["nmap"], 2)
+        return self.oWorkerPool
+
+    def __exit__(self, *lstExc):
+        if self.oWorkerPool is not None:
+            self.oWorkerPool.close()
+        for sKey, sValue in self.dSavedEnv.items():
+            if sValue is None:
+                os.environ.pop(sKey, None)
+            else:
+                os.environ[sKey] = sValue
+        shutil.rmtree(self.sRoot, ignore_errors=True)
+        return False
+
+def runCli(lstArgs):
+    """
+    Run 'python -m fluxcli.main <args>' in a fresh interpreter with the bench environment.
+    """
+    runPython(["-m", "fluxcli.main", *lstArgs])
+
+def runPython(lstArgs):
+    subprocess.run(
+        [sys.executable, *lstArgs],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        check=False,
+        cwd=os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    )
+
+def getBenchCases(oContext: BenchContext) -> dict:
+    """
+    Return {name: zero-argument callable} for every case, in run order.
+    Each callable performs exactly one iteration of its case.
+    """
+    from .. import main as mainModule
+    from ..manifest import clearManifest
+    from ..modules.nmap import module as nmapModule
+    from ..utils.yamlcache import loadYamlFile, clearYamlCache
+    import yaml
+
+    lstYamlFiles = [
+        oContext.sSettingsFixture,
+        os.path.join(os.path.dirname(nmapModule.__file__), "commands.yaml")
+    ]
+    sYamlCacheDir = os.path.join(oContext.sRoot, "yamlcache")
+
+    def startupCold():
+        clearManifest()
+        runCli(["cache"])
+
+    def startupWarm():
+        runCli(["cache"])
+
+    def startupImport():
+        runPython(["-c", "import fluxcli.main"])
+
+    def yamlPure():
+        for sPath in lstYamlFiles:
+            with open(sPath, "r", encoding="utf-8") as fYaml:
+                yaml.load(fYaml, Loader=yaml.SafeLoader)
+
+    def yamlC():
+        for sPath in lstYamlFiles:
+            loadYamlFile(sPath, bRefresh=True)
+
+    def yamlCached():
+        # Only the in-memory copies are dropped: this is what a fresh process sees
+        clearYamlCache()
+        for sPath in lstYamlFiles:
+            loadYamlFile(sPath, sYamlCacheDir)
+
+    # A registry with a single no-op command isolates the dispatcher's own cost
+    oNoop = types.SimpleNamespace(noop=lambda *lstArgs: {"ok": True})
+    dNoopRegistry = {
+        "bench": {"commands": {"noop": {"description": "no-op"}}, "instance": oNoop},
+        "_native_": {"commands": {}, "instance": None}
+    }
+
+    # A long-lived registry with the nmap module imported, as in a REPL session
+    dSessionRegistry = mainModule.buildCommandRegistry()
+    mainModule.resolveModuleInstance(dSessionRegistry, "nmap")
+
+    def reloadModule():
+        with redirect_stdout(io.StringIO()):
+            mainModule.reloadRegistry(dSessionRegistry, ["nmap"], bForce=True)
+
+    def dispatchOverhead():
+        with redirect_stdout(io.StringIO()):
+            mainModule.dispatchModuleCommand(dNoopRegistry, "bench", "noop", ["a", "b"])
+
+    dCases = {
+        "startup_cold": startupCold,
+        "startup_warm": startupWarm,
+        "startup_import": startupImport,
+        "yaml_pure": yamlPure,
+        "yaml_c": yamlC,
+        "yaml_cached": yamlCached,
+        "registry_rebuild": lambda: mainModule.buildCommandRegistry(bRebuild=True),
+        "registry_warm": lambda: mainModule.buildCommandRegistry(),
+        "reload_check": lambda: mainModule.reloadRegistry(dSessionRegistry),
+        "reload_module": reloadModule,
+        "dispatch_overhead": dispatchOverhead,
+        "dispatch_isolated": lambda: oContext.getWorkerPool().call("nmap", "splitSubnet", ("10.0.0.0/24", 26)),
+    }
+
+    for sSize, dFixture in oContext.dFixtures.items():
+        def parseFixture(sPath=dFixture["path"]):
+            with open(sPath, "rb") as fXml:
+                for _ in iterHosts(fXml):
+                    pass
+        dCases[f"parse_{sSize}"] = parseFixture
+
+    for sSize, dFixture in oContext.dFixtures.items():
+        if sSize in _PINGSWEEP_SIZES_:
+            dCases[f"pingsweep_{sSize}"] = lambda sTarget=dFixture["target"]: nmapModule.pingsweep(sTarget)
+
+    for sSize, dFixture in oContext.dFixtures.items():
+        if sSize in _PINGSWEEP_SIZES_:
+            dCases[f"pingsweep_isolated_{sSize}"] = lambda sTarget=dFixture["target"]: oContext.getWorkerPool().call("nmap", "pingsweep", (sTarget,))
+
+    return dCases
+
+def timeCase(funcCase, iRuns: int) -> dict:
+    """
+    Run funcCase once to warm up, then iRuns times, and return timing statistics in seconds.
+    """
+    funcCase()
+    lstTimes = []
+    for _ in range(iRuns):
+        fStart = time.perf_counter()
+        funcCase()
+        lstTimes.append(time.perf_counter() - fStart)
+    return {
+        "runs": iRuns,
+        "min": min(lstTimes),
+        "median": statistics.median(lstTimes),
+        "mean": statistics.mean(lstTimes),
+        "max": max(lstTimes),
+    }
+
+def runSuite(bFull: bool = False, lstOnly=None) -> dict:
+    """
+    Run the suite and return the JSON-serializable report.
+    bFull adds the /16 and simulated /8 fixtures; lstOnly limits the run to named cases.
+    """
+    lstSizes = list(_SIZES_) if bFull else list(_QUICK_SIZES_)
+    dResults = {}
+    with BenchContext(lstSizes) as oContext:
+        for sName, funcCase in getBenchCases(oContext).items():
+            if lstOnly and sName not in lstOnly:
+                continue
+            bSlow = sName.startswith(("parse_", "pingsweep_")) and sName.split("_")[-1] in ("16", "8")
+            dResult = timeCase(funcCase, _SLOW_RUNS_ if bSlow else _DEFAULT_RUNS_)
+            sSize = sName.split("_")[-1]
+            if sName.startswith(("parse_", "pingsweep_")) and sSize in oContext.dFixtures:
+                dResult["hosts"] = oContext.dFixtures[sSize]["hosts"]
+                dResult["bytes"] = oContext.dFixtures[sSize]["bytes"]
+                dResult["us_per_host"] = dResult["median"] / dResult["hosts"] * 1000000.0
+            dResults[sName] = dResult
+            printResult(sName, dResult)
+
+    return {
+        "timestamp": time.time(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "full": bFull,
+        "results": dResults
+    }
+
+def printResult(sName: str, dResult: dict) -> None:
+    sExtra = f"  {dResult['us_per_host']:.2f} us/host ({dResult['hosts']} hosts)" if "us_per_host" in dResult else ""
+    print(f"  {sName:<20} median {dResult['median'] * 1000:>10.3f} ms  min {dResult['min'] * 1000:>10.3f} ms{sExtra}")
+
+def compareReports(dOld: dict, dNew: dict) -> None:
+    """
+    Print the median ratio new/old for every case present in both reports.
+    """
+    print("Comparison (median, new vs old):")
+    for sName, dResult in dNew["results"].items():
+        dPrevious = dOld.get("results", {}).get(sName)
+        if not dPrevious:
+            continue
+        fRatio = dResult["median"] / dPrevious["median"] if dPrevious["median"] else 0.0
+        sFlag = "  <-- slower" if fRatio > 1.10 else ""
+        print(f"  {sName:<20} {fRatio:>6.2f}x{sFlag}")
+
+def main(lstArgv=None) -> int:
+    """
+    Command-line front end, shared by 'fluxcli bench' and 'python -m fluxcli.bench.suite'.
+      --full             include the /16 and simulated /8 fixtures
+      --cases a,b        only run the named cases
+      --output FILE      write the JSON report to FILE
+      --compare FILE     compare against an earlier JSON report
+    """
+    lstArgv = sys.argv[1:] if lstArgv is None else lstArgv
+
+    def optionValue(sName):
+        if sName in lstArgv:
+            iIndex = lstArgv.index(sName)
+            if iIndex + 1 < len(lstArgv):
+                return lstArgv[iIndex + 1]
+        return None
+
+    sCases = optionValue("--cases")
+    sOutput = optionValue("--output")
+    sCompare = optionValue("--compare")
+
+    print("Running fluxcli benchmarks...")
+    dReport = runSuite("--full" in lstArgv, sCases.split(",") if sCases else None)
+
+    if sOutput:
+        with open(sOutput, "w", encoding="utf-8") as fOut:
+            json.dump(dReport, fOut, indent=2)
+        print(f"Report written to {sOutput}")
+    if sCompare:
+        with open(sCompare, "r", encoding="utf-8") as fOld:
+            compareReports(json.load(fOld), dReport)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,323 @@
+"""
+checkpoint.py - Checkpoints that let interrupted scans resume.
+
+Long scans are split into units (the shards of a sweep, or the targets of
+a --targets-file run), and each unit's result is written to an SQLite
+database under the settings directory (~/.fluxcli/cache/checkpoints.db) as
+soon as it completes. If the scan is interrupted (Ctrl-C, a crash, a
+reboot), running it again with '--resume <scan-id>' skips the finished
+units and merges their stored results with the rest:
+
+    fluxcli nmap pingsweep 10.0.0.0/8
+    [Checkpoint] Scan 3f9a61c2: 64 units. Resume with --resume 3f9a61c2
+    ^C
+    fluxcli nmap pingsweep --resume 3f9a61c2
+
+The dispatcher opens a Checkpoint for commands marked 'checkpoint: true'
+in their commands.yaml; module code running under checkpointScope() finds
+it with currentCheckpoint() (worker threads started through
+utils.runner.inCurrentScope inherit it). A scan id is only allocated, and
+announced on stderr, once the command actually splits its work (begin()).
+
+Settings (fluxcli.yaml):
+    checkpoint:
+      enabled: true
+      keep_days: 7       # finished or abandoned scans are forgotten after this
+"""
+
+import os
+import sys
+import json
+import time
+import uuid
+import sqlite3
+import threading
+import contextvars
+from contextlib import contextmanager
+from .settings import getCacheDir, loadUserSettings
+from .records import toJsonValue
+
+__all__ = ["CheckpointStore", "Checkpoint", "getCheckpointStore", "checkpointScope", "currentCheckpoint"]
+
+_DB_NAME_ = "checkpoints.db"
+_DEFAULT_KEEP_DAYS_ = 7
+
+_SCHEMA_ = """
+CREATE TABLE IF NOT EXISTS scans (
+    scan_id TEXT PRIMARY KEY,
+    module TEXT NOT NULL,
+    command TEXT NOT NULL,
+    args TEXT NOT NULL,
+    units INTEGER,
+    status TEXT NOT NULL,
+    created REAL NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_scans_updated ON scans(updated);
+CREATE TABLE IF NOT EXISTS units (
+    scan_id TEXT NOT NULL,
+    unit TEXT NOT NULL,
+    completed REAL NOT NULL,
+    result TEXT NOT NULL,
+    PRIMARY KEY (scan_id, unit)
+) WITHOUT ROWID;
+"""
+
+_CURRENT_CHECKPOINT_ = contextvars.ContextVar("fluxcli_checkpoint", default=None)
+
+class CheckpointStore:
+    """
+    SQLite-backed store of scans and their finished units.
+    Safe to share between threads of one process and between concurrent processes.
+    """
+
+    def __init__(self, sPath: str, fKeepDays: float = _DEFAULT_KEEP_DAYS_):
+        self.sPath = sPath
+        self.oLock = threading.Lock()
+        os.makedirs(os.path.dirname(sPath), exist_ok=True)
+        self.oConn = sqlite3.connect(sPath, timeout=10, check_same_thread=False, isolation_level=None)
+        # WAL with synchronous=NORMAL: a committed unit survives the process dying (Ctrl-C, OOM kill)
+        self.oConn.execute("PRAGMA journal_mode=WAL")
+        self.oConn.execute("PRAGMA synchronous=NORMAL")
+        self.oConn.executescript(_SCHEMA_)
+        self.prune(time.time() - fKeepDays * 86400.0)
+
+    def create(self, sModuleName: str, sCmdName: str, dArgs: dict, iUnits) -> str:
+        """
+        Record a new scan and return its id.
+        """
+        sScanId = uuid.uuid4().hex[:8]
+        fNow = time.time()
+        with self.oLock:
+            self.oConn.execute(
+                "INSERT INTO scans (scan_id, module, command, args, units, status, created, updated) "
+                "VALUES (?, ?, ?, ?, ?, 'started', ?, ?)",
+                (sScanId, sModuleName, sCmdName, json.dumps(dArgs), iUnits, fNow, fNow)
+            )
+        return sScanId
+
+    def load(self, sScanId: str):
+        """
+        Return the scan's details as a dict, or None if it is unknown.
+        """
+        with self.oLock:
+            oRow = self.oConn.execute(
+                "SELECT scan_id, module, command, args, units, status, created, updated FROM scans WHERE scan_id = ?",
+                (sScanId,)
+            ).fetchone()
+            if oRow is None:
+                return None
+            iDone = self.oConn.execute("SELECT COUNT(*) FROM units WHERE scan_id = ?", (sScanId,)).fetchone()[0]
+        return {
+            "scan_id": oRow[0], "module": oRow[1], "command": oRow[2], "args": json.loads(oRow[3]),
+            "units": oRow[4], "done": iDone, "status": oRow[5], "created": oRow[6], "updated": oRow[7]
+        }
+
+    def list(self) -> list:
+        """
+        Return every stored scan, most recently updated first.
+        """
+        with self.oLock:
+            lstIds = [oRow[0] for oRow in self.oConn.execute("SELECT scan_id FROM scans ORDER BY updated DESC")]
+        return [dScan for dScan in map(self.load, lstIds) if dScan]
+
+    def update(self, sScanId: str, sStatus=None, iUnits=None) -> None:
+        with self.oLock:
+            self.oConn.execute(
+                "UPDATE scans SET status = COALESCE(?, status), units = COALESCE(?, units), updated = ? WHERE scan_id = ?",
+                (sStatus, iUnits, time.time(), sScanId)
+            )
+
+    def saveUnit(self, sScanId: str, sUnit: str, oResult) -> None:
+        """
+        Store the result of a finished unit.
+        """
+        fNow = time.time()
+        sResult = json.dumps(oResult, separators=(",", ":"), default=toJsonValue)
+        with self.oLock:
+            self.oConn.execute("BEGIN IMMEDIATE")
+            try:
+                self.oConn.execute(
+                    "INSERT OR REPLACE INTO units (scan_id, unit, completed, result) VALUES (?, ?, ?, ?)",
+                    (sScanId, sUnit, fNow, sResult)
+                )
+                self.oConn.execute("UPDATE scans SET updated = ? WHERE scan_id = ?", (fNow, sScanId))
+                self.oConn.execute("COMMIT")
+            except Exception:
+                self.oConn.execute("ROLLBACK")
+                raise
+
+    def loadUnit(self, sScanId: str, sUnit: str):
+        """
+        Return the stored result of one unit, or None if it has not finished.
+        """
+        with self.oLock:
+            oRow = self.oConn.execute(
+                "SELECT result FROM units WHERE scan_id = ? AND unit = ?", (sScanId, sUnit)
+            ).fetchone()
+        return json.loads(oRow[0]) if oRow else None
+
+    def loadUnits(self, sScanId: str) -> dict:
+        """
+        Return {unit: result} for every finished unit of the scan.
+        """
+        with self.oLock:
+            lstRows = self.oConn.execute("SELECT unit, result FROM units WHERE scan_id = ?", (sScanId,)).fetchall()
+        return {sUnit: json.loads(sResult) for sUnit, sResult in lstRows}
+
+    def delete(self, sScanId=None) -> None:
+        """
+        Forget one scan, or every scan if sScanId is None.
+        """
+        sWhere = "" if sScanId is None else " WHERE scan_id = ?"
+        tParams = () if sScanId is None else (sScanId,)
+        with self.oLock:
+            self.oConn.execute("BEGIN IMMEDIATE")
+            self.oConn.execute("DELETE FROM units" + sWhere, tParams)
+            self.oConn.execute("DELETE FROM scans" + sWhere, tParams)
+            self.oConn.execute("COMMIT")
+
+    def prune(self, fBefore: float) -> None:
+        """
+        Forget scans not updated since fBefore.
+        """
+        with self.oLock:
+            self.oConn.execute("BEGIN IMMEDIATE")
+            self.oConn.execute(
+                "DELETE FROM units WHERE scan_id IN (SELECT scan_id FROM scans WHERE updated < ?)", (fBefore,)
+            )
+            self.oConn.execute("DELETE FROM scans WHERE updated < ?", (fBefore,))
+            self.oConn.execute("COMMIT")
+
+class Checkpoint:
+    """
+    The checkpoint of one command run: either a new scan (sScanId None, allocated
+    by begin()) or a scan being resumed.
+    """
+
+    def __init__(self, oStore: CheckpointStore, sModuleName: str, sCmdName: str, dArgs: dict, sScanId=None):
+        self.oStore = oStore
+        self.sModuleName = sModuleName
+        self.sCmdName = sCmdName
+        self.dArgs = dArgs
+        self.sScanId = sScanId
+        self.iUnits = None
+        self.bFailed = False
+        self.oLock = threading.Lock()
+
+    def begin(self, iUnits=None) -> None:
+        """
+        Declare that the command splits its work into iUnits units (None if not
+        known up front). Allocates and announces the scan id of a new scan.
+        """
+        with self.oLock:
+            self.iUnits = iUnits
+            if self.sScanId is None:
+                self.sScanId = self.oStore.create(self.sModuleName, self.sCmdName, self.dArgs, iUnits)
+                sUnits = f"{iUnits} units" if iUnits is not None else "checkpointed per target"
+                sys.stderr.write(f"[Checkpoint] Scan {self.sScanId}: {sUnits}. Resume with --resume {self.sScanId}\n")
+                sys.stderr.flush()
+            else:
+                self.oStore.update(self.sScanId, "started", iUnits)
+
+    def results(self) -> dict:
+        """
+        Return {unit: result} for the units finished in earlier runs.
+        """
+        return self.oStore.loadUnits(self.sScanId) if self.sScanId else {}
+
+    def get(self, sUnit: str):
+        return self.oStore.loadUnit(self.sScanId, sUnit) if self.sScanId else None
+
+    def save(self, sUnit: str, oResult) -> None:
+        try:
+            self.oStore.saveUnit(self.sScanId, sUnit, oResult)
+        except sqlite3.Error as e:
+            self.bFailed = True
+            print(f"[Warning] Failed to checkpoint '{sUnit}': {e}")
+
+    def markFailed(self) -> None:
+        """
+        Record that a unit failed, so the scan stays resumable.
+        """
+        self.bFailed = True
+
+    def wrap(self, funcUnit):
+        """
+        Return funcUnit(sUnit) backed by the checkpoint: finished units return
+        their stored result, new results without an error are stored.
+        """
+        def funcCheckpointed(sUnit):
+            oStored = self.get(sUnit)
+            if oStored is not None:
+                return oStored
+            oResult = funcUnit(sUnit)
+            if isinstance(oResult, dict) and ("error" in oResult or "errors" in oResult):
+                self.markFailed()
+            else:
+                self.save(sUnit, oResult)
+            return oResult
+        return funcCheckpointed
+
+    def finish(self, bCompleted: bool) -> None:
+        """
+        Mark the scan complete, or partial (and print how to resume it) if the
+        command was interrupted or some units failed.
+        """
+        if self.sScanId is None:
+            return
+        dScan = self.oStore.load(self.sScanId) or {"done": 0}
+        bComplete = bCompleted and not self.bFailed and (self.iUnits is None or dScan["done"] >= self.iUnits)
+        self.oStore.update(self.sScanId, "complete" if bComplete else "partial")
+        if not bComplete:
+            sTotal = f"/{self.iUnits}" if self.iUnits is not None else ""
+            sys.stderr.write(
+                f"[Checkpoint] Scan {self.sScanId} is incomplete ({dScan['done']}{sTotal} units done). "
+                f"Resume with --resume {self.sScanId}\n"
+            )
+            sys.stderr.flush()
+
+@contextmanager
+def checkpointScope(oCheckpoint, bShare: bool = True):
+    """
+    Run the block with oCheckpoint (may be None) and finish it afterwards:
+    complete if the block returned, partial if it raised (e.g. KeyboardInterrupt).
+    With bShare, module code in the block finds it through currentCheckpoint().
+    """
+    if oCheckpoint is None:
+        yield None
+        return
+    oToken = _CURRENT_CHECKPOINT_.set(oCheckpoint) if bShare else None
+    bCompleted = False
+    try:
+        yield oCheckpoint
+        bCompleted = True
+    finally:
+        if oToken is not None:
+            _CURRENT_CHECKPOINT_.reset(oToken)
+        oCheckpoint.finish(bCompleted)
+
+def currentCheckpoint():
+    """
+    Return the Checkpoint of the running command, or None if it is not checkpointed.
+    """
+    return _CURRENT_CHECKPOINT_.get()
+
+_oCheckpointStore = None
+
+def getCheckpointStore():
+    """
+    Return the process-wide CheckpointStore, or None if checkpoints are disabled or unavailable.
+    """
+    global _oCheckpointStore
+    if _oCheckpointStore is None:
+        dSettings = loadUserSettings().get("checkpoint") or {}
+        if not dSettings.get("enabled", True):
+            return None
+        sPath = os.path.join(getCacheDir(), _DB_NAME_)
+        try:
+            _oCheckpointStore = CheckpointStore(sPath, float(dSettings.get("keep_days", _DEFAULT_KEEP_DAYS_)))
+        except sqlite3.Error as e:
+            print(f"[Warning] Checkpoints disabled, failed to open '{sPath}': {e}")
+            return None
+    return _oCheckpointStore
@@ -0,0 +1,157 @@
+"""
+client.py - Thin client for the FluxCLI daemon (see daemon.py).
+
+This module is imported before anything else on every fluxcli call, so it
+must stay cheap: standard library only, and nothing that pulls in PyYAML,
+sqlite3 or asyncio. If a daemon is listening on the socket, argv is
+forwarded to it and its output is streamed back; otherwise the caller falls
+back to running the command in-process.
+
+Wire format: the client sends one JSON line {"argv": [...], "tty": bool},
+where tty says whether its stdout is a terminal (for --format auto). The
+daemon answers with frames of a 1-byte type and a 4-byte big-endian length:
+    b"o" <text>    output to write to stdout
+    b"e" <text>    output to write to stderr
+    b"b" <bytes>   binary output to write to stdout (e.g. --format msgpack)
+    b"x" <code>    exit code (decimal text), always the last frame
+
+Set FLUXCLI_NO_DAEMON=1 to never forward, or FLUXCLI_SOCKET to use another socket.
+"""
+
+import os
+import sys
+import json
+import socket
+import struct
+
+__all__ = ["getSocketPath", "forwardToDaemon", "sendFrame", "readFrame", "main"]
+
+_HEADER_ = struct.Struct(">cI")
+
+# Options whose value names a local file
+_PATH_OPTIONS_ = ("--targets-file", "--profile")
+
+# Commands that must always run in the calling process
+_LOCAL_ONLY_ = ("serve", "bench", "worker")
+
+def getSocketPath() -> str:
+    """
+    Return the daemon's Unix socket path, next to fluxcli.yaml (~/.fluxcli/fluxcli.sock).
+    """
+    sPath = os.environ.get("FLUXCLI_SOCKET")
+    if sPath:
+        return sPath
+    return os.path.join(os.path.expanduser("~"), ".fluxcli", "fluxcli.sock")
+
+def sendFrame(oSock, bType: bytes, sPayload) -> None:
+    """
+    Send one typed frame over oSock. sPayload is text, or bytes for b"b" frames.
+    """
+    bPayload = sPayload if isinstance(sPayload, bytes) else sPayload.encode("utf-8")
+    oSock.sendall(_HEADER_.pack(bType, len(bPayload)) + bPayload)
+
+def readExactly(oSock, iSize: int) -> bytes:
+    """
+    Read exactly iSize bytes, or fewer if the peer closed the connection.
+    """
+    lstChunks = []
+    while iSize:
+        bChunk = oSock.recv(iSize)
+        if not bChunk:
+            break
+        lstChunks.append(bChunk)
+        iSize -= len(bChunk)
+    return b"".join(lstChunks)
+
+def readFrame(oSock):
+    """
+    Read one frame and return (bType, sPayload), or (None, None) at end of stream.
+    The payload of b"b" frames is returned as bytes.
+    """
+    bHeader = readExactly(oSock, _HEADER_.size)
+    if len(bHeader) < _HEADER_.size:
+        return None, None
+    bType, iSize = _HEADER_.unpack(bHeader)
+    bPayload = readExactly(oSock, iSize)
+    return bType, bPayload if bType == b"b" else bPayload.decode("utf-8")
+
+def absolutizeArgs(lstArgv) -> list:
+    """
+    Rewrite arguments that name local files so the daemon (which has its own
+    working directory) resolves them the same way the caller would.
+    """
+    lstResult = []
+    bNextIsPath = False
+    for sArg in lstArgv:
+        sOption, _, sValue = sArg.partition("=")
+        if bNextIsPath and sArg != "-":
+            sArg = os.path.abspath(sArg)
+        elif sOption in _PATH_OPTIONS_ and sValue and sValue != "-":
+            sArg = sOption + "=" + os.path.abspath(sValue)
+        bNextIsPath = sArg in _PATH_OPTIONS_
+        lstResult.append(sArg)
+    return lstResult
+
+def canForward(lstArgv) -> bool:
+    """
+    Return True if lstArgv may be executed by the daemon.
+    The REPL, the daemon itself and commands reading stdin always run locally.
+    """
+    if not lstArgv or lstArgv[0] in _LOCAL_ONLY_:
+        return False
+    if os.environ.get("FLUXCLI_NO_DAEMON") or not hasattr(socket, "AF_UNIX"):
+        return False
+    for iIndex, sArg in enumerate(lstArgv):
+        if sArg == "--targets-file=-" or (sArg == "--targets-file" and lstArgv[iIndex + 1:iIndex + 2] == ["-"]):
+            return False
+    return True
+
+def forwardToDaemon(lstArgv):
+    """
+    Run lstArgv on the daemon, streaming its output to stdout.
+    Returns the command's exit code, or None if no daemon is available
+    (in which case nothing has been written).
+    """
+    if not canForward(lstArgv):
+        return None
+
+    oSock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        oSock.connect(getSocketPath())
+    except OSError:
+        oSock.close()
+        return None
+
+    try:
+        oSock.sendall((json.dumps({"argv": absolutizeArgs(lstArgv), "tty": sys.stdout.isatty()}) + "\n").encode("utf-8"))
+        while True:
+            bType, sPayload = readFrame(oSock)
+            if bType is None:
+                sys.stderr.write("[Error] Connection to the fluxcli daemon was lost.\n")
+                return 1
+            if bType == b"o":
+                sys.stdout.write(sPayload)
+                sys.stdout.flush()
+            elif bType == b"b":
+                sys.stdout.buffer.write(sPayload)
+                sys.stdout.buffer.flush()
+            elif bType == b"e":
+                sys.stderr.write(sPayload)
+                sys.stderr.flush()
+            elif bType == b"x":
+                return int(sPayload)
+    except BrokenPipeError:
+        return 0
+    finally:
+        oSock.close()
+
+def main():
+    """
+    Console entry point: forward to the daemon when one is running,
+    otherwise run the full CLI in this process.
+    """
+    iCode = forwardToDaemon(sys.argv[1:])
+    if iCode is not None:
+        sys.exit(iCode)
+    from .main import main as localMain
+    localMain()
@@ -0,0 +1,478 @@
+"""
+cluster.py - Distributed scans: a coordinator and 'fluxcli worker' agents over TCP.
+
+    fluxcli worker 10.1.0.5:7420 --slots 4        # on each scanning box
+    fluxcli nmap pingsweep 10.0.0.0/8 --distribute  # on the coordinator (10.1.0.5)
+
+With --distribute, the command's target (its first argument) is split into
+up to 2**unit_bits units (never smaller than a /24, or /120 for IPv6; the
+same units as checkpoints, so either kind of run can resume the other), and
+the coordinator listens on cluster.listen until workers have
+run them all. Each worker connection takes one unit at a time on a lease:
+the worker runs the same command on the unit and sends heartbeats until it
+returns the result. A unit whose worker disconnects, stops sending
+heartbeats or exceeds lease_timeout is handed to another worker, up to
+max_attempts times. Unit results are merged in unit order into the same
+output shape as a local run (or streamed as units complete with --stream).
+While a connection waits for a unit, the coordinator sends it heartbeats
+in turn, so a worker that hears nothing for _MISSED_HEARTBEATS_ intervals
+drops the connection and reconnects. Workers reconnect by themselves, so
+one pool of workers serves any number of scans one after another.
+
+Wire format: one JSON object per line in both directions.
+    coordinator: {"type": "challenge", "nonce": ..., "heartbeat": seconds}
+    worker:      {"type": "hello", "worker": name, "nonce": ..., "proof": ...}
+    coordinator: {"type": "welcome", "proof": ...}  or  {"type": "error", "error": ...}
+    coordinator: {"type": "heartbeat"} ... while no unit is pending
+    coordinator: {"type": "unit", "id": N, "module": ..., "command": ..., "args": [...]}
+    worker:      {"type": "heartbeat", "id": N} ... {"type": "result", "id": N, "result": {...}}
+    coordinator: {"type": "bye"} once the scan is finished
+Both sides prove they know the shared token with an HMAC of the other's
+nonce; without a token on either side the proofs are empty.
+
+Settings (fluxcli.yaml):
+    cluster:
+      listen: 127.0.0.1:7420   # coordinator address; use 0.0.0.0:7420 for remote workers
+      token: null              # shared secret, required by both sides when set
+      unit_bits: 6             # a target is split into up to 2**unit_bits units (as checkpoints are)
+      lease_timeout: 900       # seconds a worker may hold one unit
+      max_attempts: 3          # workers a unit is tried on before it is reported failed
+      heartbeat: 5             # seconds between worker heartbeats
+      worker_slots: 2          # units a 'fluxcli worker' runs at once
+"""
+
+import os
+import sys
+import hmac
+import json
+import time
+import queue
+import socket
+import hashlib
+import secrets
+import threading
+import ipaddress
+import socketserver
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait as waitFutures, TimeoutError as FutureTimeoutError
+from .settings import loadUserSettings
+from .records import toJsonValue
+
+__all__ = ["Coordinator", "runWorker", "splitTarget", "mergeResults", "iterUnitRecords", "getClusterSettings", "parseAddress"]
+
+_DEFAULTS_ = {
+    "listen": "127.0.0.1:7420",
+    "token": None,
+    "unit_bits": 6,
+    "lease_timeout": 900,
+    "max_attempts": 3,
+    "heartbeat": 5,
+    "worker_slots": 2,
+}
+
+# Seconds a worker waits before reconnecting to the coordinator
+_RETRY_DELAY_ = 2.0
+
+# A connection that sends nothing for this many heartbeat intervals is lost
+_MISSED_HEARTBEATS_ = 3
+
+# Coordinator.take() result when no unit became pending within the timeout
+_IDLE_ = -1
+
+_PROTOCOL_ = 1
+
+class ClusterError(Exception):
+    """
+    The peer broke the protocol, went silent or the lease ran out.
+    """
+
+class ClusterAuthError(ClusterError):
+    """
+    The peer is not a fluxcli coordinator or does not know the cluster token.
+    """
+
+def getClusterSettings() -> dict:
+    """
+    Return the 'cluster' settings with defaults filled in.
+    """
+    return dict(_DEFAULTS_, **{sKey: oValue for sKey, oValue in (loadUserSettings().get("cluster") or {}).items() if oValue is not None})
+
+def parseAddress(sAddress: str, iDefaultPort: int = 7420) -> tuple:
+    """
+    Parse "host:port", "[v6]:port" or "host" into (host, port).
+    """
+    sHost, sSep, sPort = str(sAddress).rpartition(":")
+    if not sSep or "]" in sPort or (sHost.count(":") and not sHost.startswith("[")):
+        sHost, sPort = str(sAddress), ""
+    sHost = sHost.strip("[]")
+    try:
+        return sHost, int(sPort) if sPort else iDefaultPort
+    except ValueError:
+        raise ValueError(f"Invalid address '{sAddress}' (expected host:port).")
+
+def makeProof(sToken, sNonce: str) -> str:
+    if not sToken:
+        return ""
+    return hmac.new(str(sToken).encode("utf-8"), sNonce.encode("utf-8"), hashlib.sha256).hexdigest()
+
+def sendMessage(fOut, dMessage) -> None:
+    fOut.write((json.dumps(dMessage, separators=(",", ":"), default=toJsonValue) + "\n").encode("utf-8"))
+    fOut.flush()
+
+def readMessage(fIn) -> dict:
+    """
+    Read one message. Raises ClusterError if the connection closed or the line is not a message.
+    """
+    bLine = fIn.readline()
+    if not bLine:
+        raise ClusterError("connection closed")
+    try:
+        dMessage = json.loads(bLine.decode("utf-8"))
+    except ValueError:
+        raise ClusterError("malformed message")
+    if not isinstance(dMessage, dict):
+        raise ClusterError("malformed message")
+    return dMessage
+
+def splitTarget(sTarget: str, iUnitBits: int) -> list:
+    """
+    Split a network target into units up to iUnitBits bits longer than its
+    prefix, but no smaller than a /24 (/120 for IPv6). Other targets are one unit.
+    """
+    try:
+        oNetwork = ipaddress.ip_network(sTarget, strict=False)
+    except ValueError:
+        return [sTarget]
+    iUnitPrefix = min(oNetwork.prefixlen + max(0, int(iUnitBits)), oNetwork.max_prefixlen - 8)
+    if iUnitPrefix <= oNetwork.prefixlen:
+        return [str(oNetwork)]
+    return [str(oUnit) for oUnit in oNetwork.subnets(new_prefix=iUnitPrefix)]
+
+def mergeResults(lstUnits, dResults) -> dict:
+    """
+    Merge per-unit results into one result in unit order: list fields are
+    concatenated; failed units are listed under "errors" as {"shard": unit, "error": ...}.
+    """
+    dMerged = {}
+    lstErrors = []
+    for sUnit in lstUnits:
+        dResult = dResults.get(sUnit)
+        if not isinstance(dResult, dict):
+            continue
+        if "error" in dResult:
+            lstErrors.append({"shard": sUnit, "error": dResult["error"]})
+            continue
+        for sKey, oValue in dResult.items():
+            if sKey == "errors":
+                lstErrors.extend(oValue)
+            elif isinstance(oValue, list):
+                dMerged.setdefault(sKey, []).extend(oValue)
+    if lstErrors:
+        dMerged["errors"] = lstErrors
+    return dMerged
+
+def iterUnitRecords(sUnit: str, dResult):
+    """
+    Yield the records of one unit's result for streaming output.
+    """
+    if not isinstance(dResult, dict) or "error" in dResult:
+        yield {"shard": sUnit, "error": dResult.get("error") if isinstance(dResult, dict) else str(dResult)}
+        return
+    for sKey, oValue in dResult.items():
+        if isinstance(oValue, list):
+            yield from oValue
+
+def isLoopback(sHost: str) -> bool:
+    try:
+        return ipaddress.ip_address(sHost if ":" in sHost else socket.gethostbyname(sHost)).is_loopback
+    except (OSError, ValueError):
+        return False
+
+class UnitHandler(socketserver.StreamRequestHandler):
+    """
+    One worker connection: authenticate, then lease units to it until the scan is done.
+    """
+
+    def handle(self):
+        oCoordinator = self.server.oCoordinator
+        self.request.settimeout(oCoordinator.fHeartbeat * _MISSED_HEARTBEATS_)
+        sName = f"{self.client_address[0]}:{self.client_address[1]}"
+        try:
+            sNonce = secrets.token_hex(16)
+            sendMessage(self.wfile, {"type": "challenge", "nonce": sNonce, "protocol": _PROTOCOL_, "heartbeat": oCoordinator.fHeartbeat})
+            dHello = readMessage(self.rfile)
+            if dHello.get("type") != "hello" or not hmac.compare_digest(str(dHello.get("proof", "")), makeProof(oCoordinator.sToken, sNonce)):
+                sendMessage(self.wfile, {"type": "error", "error": "authentication failed"})
+                oCoordinator.event(f"Rejected worker {sName}: authentication failed")
+                return
+            sName = str(dHello.get("worker") or sName)
+            sendMessage(self.wfile, {"type": "welcome", "proof": makeProof(oCoordinator.sToken, str(dHello.get("nonce", "")))})
+        except (OSError, ClusterError):
+            return
+        oCoordinator.event(f"Worker {sName} joined")
+
+        while True:
+            iUnit = oCoordinator.take(oCoordinator.fHeartbeat)
+            if iUnit is None:
+                try:
+                    sendMessage(self.wfile, {"type": "bye"})
+                except OSError:
+                    pass
+                return
+            if iUnit == _IDLE_:
+                try:
+                    sendMessage(self.wfile, {"type": "heartbeat"})
+                except OSError:
+                    return
+                continue
+            try:
+                dResult = self.runUnit(oCoordinator, iUnit)
+            except (OSError, ClusterError) as e:
+                oCoordinator.release(iUnit, f"worker {sName}: {e}")
+                return
+            oCoordinator.complete(iUnit, dResult)
+
+    def runUnit(self, oCoordinator, iUnit: int) -> dict:
+        sendMessage(self.wfile, {
+            "type": "unit",
+            "id": iUnit,
+            "module": oCoordinator.sModuleName,
+            "command": oCoordinator.sCmdName,
+            "args": oCoordinator.lstUnitArgs[iUnit]
+        })
+        fDeadline = time.monotonic() + oCoordinator.fLeaseTimeout
+        while True:
+            try:
+                dMessage = readMessage(self.rfile)
+            except socket.timeout:
+                raise ClusterError("no heartbeat")
+            if dMessage.get("id") != iUnit:
+                raise ClusterError("reply for another unit")
+            if dMessage.get("type") == "result":
+                dResult = dMessage.get("result")
+                return dResult if isinstance(dResult, dict) else {"error": "malformed result"}
+            if time.monotonic() > fDeadline:
+                raise ClusterError(f"lease expired after {oCoordinator.fLeaseTimeout:g}s")
+
+class ClusterServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+class Coordinator:
+    """
+    Leases the units of one command (lstUnitArgs: one argument list per unit)
+    to connected workers and collects their results.
+    """
+
+    def __init__(self, sModuleName: str, sCmdName: str, lstUnitArgs, dSettings=None):
+        dSettings = dSettings or getClusterSettings()
+        self.sModuleName = sModuleName
+        self.sCmdName = sCmdName
+        self.lstUnitArgs = lstUnitArgs
+        self.sToken = dSettings["token"]
+        self.fLeaseTimeout = float(dSettings["lease_timeout"])
+        self.fHeartbeat = float(dSettings["heartbeat"])
+        self.iMaxAttempts = max(1, int(dSettings["max_attempts"]))
+        self.tAddress = parseAddress(dSettings["listen"])
+        self.oCond = threading.Condition()
+        self.dqPending = deque(range(len(lstUnitArgs)))
+        self.dAttempts = {}
+        self.bFinished = False
+        self.qEvents = queue.Queue()
+        self.oServer = None
+
+    def event(self, sMessage: str) -> None:
+        """
+        Queue a progress message; they are printed by the thread reading results.
+        """
+        self.qEvents.put(("event", sMessage))
+
+    def take(self, fTimeout=None):
+        """
+        Block until a unit is pending and return its index, or None once the scan
+        is finished; _IDLE_ if fTimeout seconds pass first.
+        """
+        with self.oCond:
+            if not self.oCond.wait_for(lambda: self.dqPending or self.bFinished, fTimeout):
+                return _IDLE_
+            return None if self.bFinished else self.dqPending.popleft()
+
+    def release(self, iUnit: int, sReason: str) -> None:
+        """
+        Put back the unit of a lost worker, or fail it after max_attempts tries.
+        """
+        with self.oCond:
+            self.dAttempts[iUnit] = self.dAttempts.get(iUnit, 0) + 1
+            if self.dAttempts[iUnit] < self.iMaxAttempts:
+                self.dqPending.appendleft(iUnit)
+                self.oCond.notify()
+                self.event(f"Unit {self.lstUnitArgs[iUnit][0]} lost ({sReason}); retrying")
+                return
+        self.complete(iUnit, {"error": f"failed on {self.iMaxAttempts} worker(s), last: {sReason}"})
+
+    def complete(self, iUnit: int, dResult) -> None:
+        self.qEvents.put(("result", iUnit, dResult))
+
+    def start(self) -> None:
+        """
+        Start accepting workers. Raises OSError if the address is unavailable.
+        """
+        sHost, iPort = self.tAddress
+        ClusterServer.address_family = socket.AF_INET6 if ":" in sHost else socket.AF_INET
+        self.oServer = ClusterServer((sHost, iPort), UnitHandler)
+        self.oServer.oCoordinator = self
+        threading.Thread(target=self.oServer.serve_forever, name="fluxcli-cluster", daemon=True).start()
+
+    def close(self) -> None:
+        with self.oCond:
+            self.bFinished = True
+            self.oCond.notify_all()
+        if self.oServer is not None:
+            self.oServer.shutdown()
+            self.oServer.server_close()
+
+    def iterResults(self):
+        """
+        Run every unit on the workers and yield (iUnit, dResult) as units finish.
+        Progress is reported on stderr.
+        """
+        if not self.lstUnitArgs:
+            return
+        self.start()
+        try:
+            sHost, iPort = self.tAddress
+            if not self.sToken and not isLoopback(sHost):
+                sys.stderr.write(f"[Warning] Coordinator listens on {sHost}:{iPort} without cluster.token; any host can join.\n")
+            sys.stderr.write(f"[Cluster] {len(self.lstUnitArgs)} units. Waiting for workers on {sHost}:{iPort} ('fluxcli worker {sHost}:{iPort}').\n")
+            iRemaining = len(self.lstUnitArgs)
+            while iRemaining:
+                oItem = self.qEvents.get()
+                if oItem[0] == "event":
+                    sys.stderr.write(f"[Cluster] {oItem[1]}\n")
+                    continue
+                iRemaining -= 1
+                yield oItem[1], oItem[2]
+        finally:
+            self.close()
+
+def runUnitMessage(funcRunUnit, dMessage) -> dict:
+    try:
+        return funcRunUnit(str(dMessage["module"]), str(dMessage["command"]), [sArg if sArg is None else str(sArg) for sArg in dMessage["args"]])
+    except Exception as e:
+        return {"error": str(e)}
+
+def serveConnection(oSock, funcRunUnit, sToken, sName: str, fHeartbeat: float, oPool) -> None:
+    """
+    Authenticate with the coordinator on oSock, then run units until it says bye.
+    Raises ClusterError if the coordinator goes silent. A unit still running
+    when the connection is lost is waited for, so the slot's pool is free again
+    before the caller reconnects.
+    """
+    fIn = oSock.makefile("rb")
+    fOut = oSock.makefile("wb")
+    dChallenge = readMessage(fIn)
+    if dChallenge.get("type") != "challenge":
+        raise ClusterAuthError("not a fluxcli coordinator")
+    sNonce = secrets.token_hex(16)
+    sendMessage(fOut, {"type": "hello", "worker": sName, "nonce": sNonce, "proof": makeProof(sToken, str(dChallenge.get("nonce", "")))})
+    dWelcome = readMessage(fIn)
+    if dWelcome.get("type") != "welcome":
+        raise ClusterAuthError(dWelcome.get("error") or "rejected by coordinator")
+    if not hmac.compare_digest(str(dWelcome.get("proof", "")), makeProof(sToken, sNonce)):
+        raise ClusterAuthError("coordinator failed authentication")
+    print(f"[Worker] {sName}: connected")
+    # Coordinators send heartbeats while they have no unit for us
+    fSilence = float(dChallenge.get("heartbeat") or 0) * _MISSED_HEARTBEATS_
+    oSock.settimeout(fSilence or None)
+
+    while True:
+        try:
+            dMessage = readMessage(fIn)
+        except socket.timeout:
+            raise ClusterError(f"coordinator silent for {fSilence:g}s")
+        if dMessage.get("type") == "bye":
+            print(f"[Worker] {sName}: scan finished")
+            return
+        if dMessage.get("type") != "unit":
+            continue
+        iUnit = dMessage.get("id")
+        print(f"[Worker] {sName}: {dMessage.get('module')} {dMessage.get('command')} {' '.join(map(str, dMessage.get('args') or []))}")
+        oFuture = oPool.submit(runUnitMessage, funcRunUnit, dMessage)
+        try:
+            while True:
+                try:
+                    dResult = oFuture.result(fHeartbeat)
+                    break
+                except FutureTimeoutError:
+                    sendMessage(fOut, {"type": "heartbeat", "id": iUnit})
+        except BaseException:
+            # The coordinator leases the unit elsewhere; its result here is discarded
+            if not oFuture.cancel():
+                print(f"[Worker] {sName}: connection lost; waiting for the current unit to finish")
+                waitFutures([oFuture])
+            raise
+        sendMessage(fOut, {"type": "result", "id": iUnit, "result": dResult})
+
+def workSlot(tAddress, funcRunUnit, sToken, sName: str, fHeartbeat: float, oStop) -> None:
+    """
+    Keep one connection to the coordinator, reconnecting whenever it goes away.
+    """
+    bWaiting = False
+    with ThreadPoolExecutor(max_workers=1, thread_name_prefix="fluxcli-unit") as oPool:
+        while not oStop.is_set():
+            try:
+                oSock = socket.create_connection(tAddress, timeout=10)
+            except OSError as e:
+                if not bWaiting:
+                    print(f"[Worker] {sName}: waiting for coordinator {tAddress[0]}:{tAddress[1]} ({e})")
+                    bWaiting = True
+                oStop.wait(_RETRY_DELAY_)
+                continue
+            bWaiting = False
+            try:
+                serveConnection(oSock, funcRunUnit, sToken, sName, fHeartbeat, oPool)
+            except ClusterAuthError as e:
+                # Retrying cannot help; stop every slot
+                print(f"[Worker] {sName}: {e}")
+                oStop.set()
+            except ClusterError as e:
+                print(f"[Worker] {sName}: {e}")
+            except OSError as e:
+                print(f"[Worker] {sName}: connection lost ({e})")
+            finally:
+                oSock.close()
+            oStop.wait(_RETRY_DELAY_ / 4)
+
+def runWorker(sAddress: str, funcRunUnit, iSlots=None, sToken=None, oStop=None) -> None:
+    """
+    Serve the coordinator at sAddress with iSlots connections until Ctrl-C (or
+    until the threading.Event oStop is set, for callers embedding a worker).
+    funcRunUnit(sModuleName, sCmdName, lstArgs) runs one unit and returns its result dict.
+    """
+    dSettings = getClusterSettings()
+    tAddress = parseAddress(sAddress)
+    iSlots = max(1, int(iSlots or dSettings["worker_slots"]))
+    sToken = sToken or dSettings["token"]
+    fHeartbeat = float(dSettings["heartbeat"])
+    sBase = f"{socket.gethostname()}:{os.getpid()}"
+
+    oStop = oStop or threading.Event()
+    lstThreads = [
+        threading.Thread(
+            target=workSlot,
+            args=(tAddress, funcRunUnit, sToken, f"{sBase}/{iSlot}", fHeartbeat, oStop),
+            name=f"fluxcli-worker-{iSlot}",
+            daemon=True
+        )
+        for iSlot in range(iSlots)
+    ]
+    print(f"fluxcli worker serving {tAddress[0]}:{tAddress[1]} with {iSlots} slot(s) (Ctrl-C to stop)")
+    for oThread in lstThreads:
+        oThread.start()
+    try:
+        while not oStop.is_set() and any(oThread.is_alive() for oThread in lstThreads):
+            oStop.wait(0.5)
+    except KeyboardInterrupt:
+        print("\nStopping fluxcli worker.")
+    finally:
+        oStop.set()
@@ -0,0 +1,150 @@
+"""
+completion.py - Tab completion for the REPL.
+
+Completes module names, commands, and the arguments of commands with an
+'args' schema in their commands.yaml (see utils/schema.py): '--name'
+options, choices and true/false for flags, plus dispatcher and global flags.
+Uses readline when the platform provides it; otherwise the REPL simply runs
+without completion.
+"""
+
+from .utils.parser import getCommandFlags
+from .output import getFormats
+
+try:
+    import readline
+except ImportError:
+    readline = None
+
+__all__ = ["ReplCompleter", "installCompletion"]
+
+# Words the REPL itself understands
+_REPL_WORDS_ = ["help", "load", "reload", "exit", "quit", "jobs", "wait", "cancel", "result"]
+
+class ReplCompleter:
+    """
+    Computes completions for a partial REPL line from the command registry.
+    funcCurrentModule returns the module selected with 'load', or None.
+    """
+
+    def __init__(self, dRegistry, funcCurrentModule=lambda: None):
+        self.dRegistry = dRegistry
+        self.funcCurrentModule = funcCurrentModule
+        self.lstMatches = []
+
+    def modules(self) -> list:
+        return [sName for sName in self.dRegistry if sName != "_native_"]
+
+    def commands(self, sModuleName) -> list:
+        return list((self.dRegistry.get(sModuleName) or {}).get("commands") or {})
+
+    def complete(self, sText: str, iState: int):
+        """
+        readline completer: return the iState-th completion of sText.
+        """
+        if iState == 0:
+            sLine = readline.get_line_buffer()[:readline.get_endidx()] if readline else sText
+            try:
+                self.lstMatches = self.candidates(sLine)
+            except Exception:
+                # Never let a completion bug break the prompt
+                self.lstMatches = []
+        return self.lstMatches[iState] if iState < len(self.lstMatches) else None
+
+    def candidates(self, sLine: str) -> list:
+        """
+        Return the sorted completions for the last (possibly empty) word of sLine.
+        """
+        lstWords = sLine.split()
+        if not sLine or sLine[-1].isspace():
+            lstWords.append("")
+        sWord = lstWords[-1]
+        lstBefore = lstWords[:-1]
+        sModule = self.funcCurrentModule()
+
+        if not lstBefore:
+            lstOptions = _REPL_WORDS_ + self.modules() + self.commands("_native_")
+            if sModule:
+                lstOptions += self.commands(sModule)
+        elif lstBefore == ["load"]:
+            lstOptions = self.modules()
+        elif lstBefore[0] == "reload":
+            lstOptions = ["on", "off"] if lstBefore[1:] == ["watch"] else self.modules() + ["watch", "--force"]
+        elif lstBefore[0] in self.modules() and len(lstBefore) == 1:
+            lstOptions = self.commands(lstBefore[0])
+        elif lstBefore[0] in self.modules():
+            lstOptions = self.arguments(lstBefore[0], lstBefore[1], lstBefore[2:], sWord)
+        elif sModule and lstBefore[0] in self.commands(sModule):
+            lstOptions = self.arguments(sModule, lstBefore[0], lstBefore[1:], sWord)
+        else:
+            lstOptions = []
+        return sorted({sOption for sOption in lstOptions if sOption.startswith(sWord)})
+
+    def arguments(self, sModuleName, sCmdName, lstArgs, sWord: str) -> list:
+        """
+        Return completions for the next argument of a module command, given the
+        arguments typed so far.
+        """
+        dSchema = ((self.dRegistry.get(sModuleName) or {}).get("commands", {}).get(sCmdName) or {}).get("schema")
+        lstSpecs = dSchema["args"] if dSchema else []
+        dOptions = dSchema["options"] if dSchema else {}
+
+        dFlags = getCommandFlags()
+
+        # The value of an option that takes one
+        if lstArgs:
+            sPrevious = lstArgs[-1]
+            if sPrevious == "--format":
+                return getFormats()
+            if sPrevious in dOptions:
+                dArg = lstSpecs[dOptions[sPrevious]]
+                if dArg["type"] != "flag":
+                    return self.values(dArg)
+            elif dFlags.get(sPrevious, False) is not False:
+                return []
+
+        if sWord.startswith("-"):
+            return list(dOptions) + list(dFlags)
+
+        # Otherwise the next positional argument
+        iPosition = 0
+        bValue = False
+        for sArg in lstArgs:
+            if bValue:
+                bValue = False
+            elif sArg in dOptions:
+                bValue = lstSpecs[dOptions[sArg]]["type"] != "flag"
+            elif sArg in dFlags:
+                bValue = dFlags[sArg] is not False
+            elif not sArg.startswith("--"):
+                iPosition += 1
+        if iPosition >= len(lstSpecs) and not (dSchema and dSchema["variadic"]):
+            return []
+        return self.values(lstSpecs[min(iPosition, len(lstSpecs) - 1)])
+
+    def values(self, dArg) -> list:
+        """
+        Return the known values of an argument: its choices, or true/false for flags.
+        """
+        if dArg.get("type") == "choice":
+            return list(dArg["choices"])
+        if dArg.get("type") == "flag":
+            return ["true", "false"]
+        return []
+
+def installCompletion(dRegistry, funcCurrentModule) -> bool:
+    """
+    Enable tab completion for input() in the REPL.
+    Returns False if readline is not available on this platform.
+    """
+    if readline is None:
+        return False
+    oCompleter = ReplCompleter(dRegistry, funcCurrentModule)
+    readline.set_completer(oCompleter.complete)
+    readline.set_completer_delims(" \t\n")
+    if "libedit" in (readline.__doc__ or ""):
+        # macOS ships readline on top of libedit, which uses its own syntax
+        readline.parse_and_bind("bind ^I rl_complete")
+    else:
+        readline.parse_and_bind("tab: complete")
+    return True
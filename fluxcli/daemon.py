@@ -0,0 +1,178 @@
+"""
+daemon.py - Resident FluxCLI process serving commands over a Unix socket.
+
+'fluxcli serve' builds the command registry once, keeps imported modules,
+the result cache and other process-wide state warm, and executes argv
+forwarded by the thin client (client.py). Each connection is handled on its
+own thread with that thread's stdout redirected to the socket, so output is
+streamed back to the caller as it is produced.
+
+Settings (fluxcli.yaml):
+    daemon:
+      max_concurrent: 8    # commands executed at once across all callers
+"""
+
+import os
+import json
+import signal
+import socket
+import threading
+import socketserver
+from .client import getSocketPath, sendFrame
+from .utils.capture import installThreadLocalStdout, installThreadLocalStderr, redirectThreadStdout, redirectThreadStderr
+
+__all__ = ["serve"]
+
+_DEFAULT_MAX_CONCURRENT_ = 8
+_FLUSH_SIZE_ = 65536
+
+class SocketWriter:
+    """
+    Text stream that forwards writes to a client as frames of type bType
+    (b"o" for stdout, b"e" for stderr). isatty() reports whether the
+    client's own stream is a terminal (bTty, sent with the request).
+    Buffers until a newline or _FLUSH_SIZE_ characters, like a line-buffered terminal.
+    """
+
+    def __init__(self, oSock, bType: bytes = b"o", bTty: bool = False):
+        self.oSock = oSock
+        self.bType = bType
+        self.bTty = bTty
+        self.lstBuffer = []
+        self.iBuffered = 0
+
+    def write(self, sText):
+        self.lstBuffer.append(sText)
+        self.iBuffered += len(sText)
+        if "\n" in sText or self.iBuffered >= _FLUSH_SIZE_:
+            self.flush()
+        return len(sText)
+
+    def flush(self):
+        if self.lstBuffer:
+            sendFrame(self.oSock, self.bType, "".join(self.lstBuffer))
+            self.lstBuffer = []
+            self.iBuffered = 0
+
+    def isatty(self):
+        return self.bTty
+
+    @property
+    def buffer(self):
+        """
+        Binary view of the stream, sent as b"b" frames (stdout only).
+        """
+        if self.bType != b"o":
+            raise AttributeError("buffer")
+        self.flush()
+        return SocketBinaryWriter(self.oSock)
+
+class SocketBinaryWriter:
+    """
+    Binary stream that forwards each write to a client as one b"b" frame.
+    """
+
+    def __init__(self, oSock):
+        self.oSock = oSock
+
+    def write(self, bData):
+        sendFrame(self.oSock, b"b", bytes(bData))
+        return len(bData)
+
+    def flush(self):
+        pass
+
+class CommandHandler(socketserver.StreamRequestHandler):
+    """
+    Read one {"argv": [...], "tty": bool} request, run it and stream back the output and exit code.
+    """
+
+    def handle(self):
+        bLine = self.rfile.readline()
+        if not bLine:
+            # A liveness probe (see isDaemonRunning) connects and hangs up
+            return
+        try:
+            dRequest = json.loads(bLine.decode("utf-8"))
+            lstArgv = [str(sArg) for sArg in dRequest["argv"]]
+            bTty = dRequest.get("tty") is True
+        except (ValueError, KeyError, TypeError):
+            sendFrame(self.request, b"x", "2")
+            return
+
+        oWriter = SocketWriter(self.request, bTty=bTty)
+        oErrorWriter = SocketWriter(self.request, b"e")
+        iCode = 0
+        with self.server.oSemaphore, redirectThreadStdout(oWriter), redirectThreadStderr(oErrorWriter):
+            try:
+                self.server.funcRun(lstArgv)
+            except SystemExit as e:
+                iCode = e.code if isinstance(e.code, int) else 1
+            except BrokenPipeError:
+                return
+            except Exception as e:
+                print(f"[Error] {e}")
+                iCode = 1
+        try:
+            oWriter.flush()
+            oErrorWriter.flush()
+            sendFrame(self.request, b"x", str(iCode))
+        except OSError:
+            pass
+
+class DaemonServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+def isDaemonRunning(sPath: str) -> bool:
+    """
+    Return True if something accepts connections on sPath.
+    """
+    oSock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        oSock.connect(sPath)
+        return True
+    except OSError:
+        return False
+    finally:
+        oSock.close()
+
+def stopOnSignal(iSignal, oFrame):
+    """
+    SIGTERM handler: unwind serve() like Ctrl-C so the socket file is removed.
+    """
+    raise KeyboardInterrupt
+
+def serve(funcRun, iMaxConcurrent: int = _DEFAULT_MAX_CONCURRENT_) -> None:
+    """
+    Serve forever on the daemon socket, calling funcRun(lstArgv) for each request.
+    At most iMaxConcurrent requests execute at once; the rest wait for a slot.
+    A stale socket file left by a crashed daemon is replaced.
+    """
+    if not hasattr(socket, "AF_UNIX"):
+        print("Error: daemon mode requires Unix domain socket support.")
+        return
+
+    sPath = getSocketPath()
+    if os.path.exists(sPath):
+        if isDaemonRunning(sPath):
+            print(f"Error: a fluxcli daemon is already listening on '{sPath}'.")
+            return
+        os.remove(sPath)
+    os.makedirs(os.path.dirname(sPath), exist_ok=True)
+
+    installThreadLocalStdout()
+    installThreadLocalStderr()
+    oServer = DaemonServer(sPath, CommandHandler)
+    oServer.funcRun = funcRun
+    oServer.oSemaphore = threading.BoundedSemaphore(max(1, int(iMaxConcurrent)))
+    os.chmod(sPath, 0o600)
+    signal.signal(signal.SIGTERM, stopOnSignal)
+    print(f"fluxcli daemon listening on {sPath} (Ctrl-C to stop)")
+    try:
+        oServer.serve_forever()
+    except KeyboardInterrupt:
+        print("\nStopping fluxcli daemon.")
+    finally:
+        oServer.server_close()
+        if os.path.exists(sPath):
+            os.remove(sPath)
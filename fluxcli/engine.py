@@ -0,0 +1,167 @@
+"""
+engine.py - Asyncio-based background job engine for the REPL.
+
+An event loop runs in a daemon thread next to the REPL. Each background job
+('portscan 10.0.0.0/24 &') is a task on that loop which waits for a slot on
+a semaphore and then runs the blocking dispatcher call in a worker thread,
+with the thread's output captured for 'result <id>'. The semaphore bounds how
+many jobs (and therefore external tool processes) run at once, while the
+REPL keeps reading input.
+
+Settings (fluxcli.yaml):
+    max_jobs: 4    # background jobs allowed to run concurrently
+"""
+
+import io
+import time
+import asyncio
+import threading
+import concurrent.futures
+from concurrent.futures import ThreadPoolExecutor
+from .utils.capture import redirectThreadStdout
+from .utils.runner import RunScope, runScope
+
+__all__ = ["Job", "JobEngine"]
+
+_DEFAULT_MAX_JOBS_ = 4
+
+class Job:
+    """
+    A background command and its captured output.
+    sState is one of: queued, running, done, failed, cancelled.
+    """
+
+    def __init__(self, iId: int, sCommandLine: str):
+        self.iId = iId
+        self.sCommandLine = sCommandLine
+        self.sState = "queued"
+        self.fSubmitted = time.time()
+        self.fStarted = None
+        self.fFinished = None
+        self.sOutput = ""
+        self.sError = None
+        self.oFuture = None
+        # External processes started by the job, killed when it is cancelled
+        self.oScope = RunScope(f"job {iId}")
+
+    def elapsed(self) -> float:
+        """
+        Seconds the job has been running (or ran), 0 while queued.
+        """
+        if self.fStarted is None:
+            return 0.0
+        return (self.fFinished or time.time()) - self.fStarted
+
+    def isFinished(self) -> bool:
+        return self.sState in ("done", "failed", "cancelled")
+
+class JobEngine:
+    """
+    Runs callables as background jobs on an asyncio loop, at most iMaxJobs at a time.
+    """
+
+    def __init__(self, iMaxJobs: int = _DEFAULT_MAX_JOBS_):
+        self.iMaxJobs = max(1, int(iMaxJobs))
+        self.dJobs = {}
+        self.iNextId = 1
+        self.oLock = threading.Lock()
+        self.oExecutor = ThreadPoolExecutor(max_workers=self.iMaxJobs, thread_name_prefix="fluxcli-job")
+        self.oLoop = asyncio.new_event_loop()
+        self.oThread = threading.Thread(target=self.oLoop.run_forever, name="fluxcli-engine", daemon=True)
+        self.oThread.start()
+        # Created on the loop itself; older Pythons bind primitives to the loop at construction
+        self.oSemaphore = asyncio.run_coroutine_threadsafe(self._makeSemaphore(), self.oLoop).result()
+
+    async def _makeSemaphore(self):
+        return asyncio.Semaphore(self.iMaxJobs)
+
+    def submit(self, sCommandLine: str, funcCall) -> Job:
+        """
+        Queue funcCall() as a background job and return its Job immediately.
+        """
+        with self.oLock:
+            oJob = Job(self.iNextId, sCommandLine)
+            self.dJobs[oJob.iId] = oJob
+            self.iNextId += 1
+        oJob.oFuture = asyncio.run_coroutine_threadsafe(self._runJob(oJob, funcCall), self.oLoop)
+        return oJob
+
+    async def _runJob(self, oJob: Job, funcCall) -> None:
+        try:
+            async with self.oSemaphore:
+                oJob.sState = "running"
+                oJob.fStarted = time.time()
+                oLoop = asyncio.get_running_loop()
+                oJob.sOutput = await oLoop.run_in_executor(self.oExecutor, self._capture, oJob, funcCall)
+                oJob.sState = "done"
+        except asyncio.CancelledError:
+            oJob.sState = "cancelled"
+            raise
+        except Exception as e:
+            oJob.sState = "failed"
+            oJob.sError = str(e)
+        finally:
+            if oJob.fStarted is not None:
+                oJob.fFinished = time.time()
+
+    @staticmethod
+    def _capture(oJob: Job, funcCall) -> str:
+        oBuffer = io.StringIO()
+        with redirectThreadStdout(oBuffer), runScope(oJob.oScope):
+            funcCall()
+        return oBuffer.getvalue()
+
+    def get(self, iId: int):
+        """
+        Return the Job with the given id, or None.
+        """
+        return self.dJobs.get(iId)
+
+    def listJobs(self) -> list:
+        """
+        Return all jobs, oldest first.
+        """
+        return [self.dJobs[iId] for iId in sorted(self.dJobs)]
+
+    def cancel(self, iId: int) -> bool:
+        """
+        Cancel a job. Queued jobs never start; a running job's external processes
+        are killed (see utils/runner.py) and its result is discarded.
+        Returns False if the job does not exist or already finished.
+        """
+        oJob = self.dJobs.get(iId)
+        if not oJob or oJob.isFinished():
+            return False
+        oJob.oFuture.cancel()
+        oJob.oScope.cancel()
+        oJob.sState = "cancelled"
+        return True
+
+    def wait(self, iId=None, fTimeout=None) -> bool:
+        """
+        Block until job iId (or every job, if iId is None) has finished.
+        Returns False if fTimeout seconds elapsed first.
+        """
+        lstJobs = [self.dJobs[iId]] if iId is not None else list(self.dJobs.values())
+        lstFutures = [oJob.oFuture for oJob in lstJobs if not oJob.isFinished()]
+        if not lstFutures:
+            return True
+        _, setPending = concurrent.futures.wait(lstFutures, timeout=fTimeout)
+        return not setPending
+
+    def runningCount(self) -> int:
+        """
+        Number of jobs that are queued or running.
+        """
+        return sum(1 for oJob in self.dJobs.values() if not oJob.isFinished())
+
+    def shutdown(self) -> None:
+        """
+        Cancel outstanding jobs and stop the event loop.
+        """
+        for oJob in self.dJobs.values():
+            if not oJob.isFinished():
+                self.cancel(oJob.iId)
+        self.oLoop.call_soon_threadsafe(self.oLoop.stop)
+        self.oThread.join(timeout=1)
+        self.oExecutor.shutdown(wait=False)
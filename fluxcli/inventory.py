@@ -0,0 +1,348 @@
+"""
+inventory.py - Local index of discovered hosts and open ports.
+
+Results of commands marked 'inventory: true' in their commands.yaml (nmap
+pingsweep and portscan) are ingested into an SQLite database under the
+settings directory (~/.fluxcli/cache/inventory.db), so questions about
+known hosts can be answered without rescanning:
+
+    query ip 10.0.0.0/16            hosts inside a network (or one address)
+    query mac C4:41:1E              MAC address or OUI prefix
+    query vendor Belkin             vendor name prefix
+    query hostname *.lan            exact name, or a glob pattern
+    query port 22 [tcp]             hosts with an open port
+    query service ssh               hosts with an open port running a service
+    query ... --since 3600          only hosts seen in the last hour
+    query stats                     inventory size
+
+Filters can be combined and are ANDed. Each filter is served by an index,
+except hostname patterns that start with a wildcard (e.g. *.lan), which scan
+the hosts table; a pattern with a literal prefix (web*) scans only that range.
+Addresses are stored as fixed-width 16-byte keys (IPv4 as IPv4-mapped IPv6),
+so a CIDR query is a single range scan.
+
+Settings (fluxcli.yaml):
+    inventory:
+      enabled: true
+"""
+
+import os
+import time
+import sqlite3
+import ipaddress
+import threading
+from collections.abc import Mapping
+from .settings import getCacheDir, loadUserSettings
+from .records import RecordTable
+
+__all__ = ["Inventory", "getInventory", "iterInventoryRecords", "parseQuery"]
+
+_DB_NAME_ = "inventory.db"
+
+# Rows written per transaction while ingesting a stream
+_INGEST_BATCH_ = 1000
+
+# Host addresses per query when attaching ports to query results
+_IN_BATCH_ = 500
+
+_SCHEMA_ = """
+CREATE TABLE IF NOT EXISTS hosts (
+    ip TEXT PRIMARY KEY,
+    ip_key BLOB NOT NULL,
+    mac TEXT,
+    oui TEXT,
+    vendor TEXT,
+    hostname TEXT COLLATE NOCASE,
+    latency REAL,
+    first_seen REAL NOT NULL,
+    last_seen REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_hosts_ip_key ON hosts(ip_key);
+CREATE INDEX IF NOT EXISTS idx_hosts_mac ON hosts(mac);
+CREATE INDEX IF NOT EXISTS idx_hosts_oui ON hosts(oui);
+CREATE INDEX IF NOT EXISTS idx_hosts_vendor ON hosts(vendor COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS idx_hosts_hostname ON hosts(hostname);
+CREATE INDEX IF NOT EXISTS idx_hosts_last_seen ON hosts(last_seen);
+CREATE TABLE IF NOT EXISTS ports (
+    ip TEXT NOT NULL,
+    port INTEGER NOT NULL,
+    protocol TEXT NOT NULL,
+    state TEXT NOT NULL,
+    service TEXT,
+    last_seen REAL NOT NULL,
+    PRIMARY KEY (ip, port, protocol)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_ports_port ON ports(port, protocol);
+CREATE INDEX IF NOT EXISTS idx_ports_service ON ports(service);
+"""
+
+_HOST_UPSERT_ = """
+INSERT INTO hosts (ip, ip_key, mac, oui, vendor, hostname, latency, first_seen, last_seen)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT(ip) DO UPDATE SET
+    mac = COALESCE(excluded.mac, hosts.mac),
+    oui = COALESCE(excluded.oui, hosts.oui),
+    vendor = COALESCE(excluded.vendor, hosts.vendor),
+    hostname = COALESCE(excluded.hostname, hosts.hostname),
+    latency = COALESCE(excluded.latency, hosts.latency),
+    last_seen = excluded.last_seen
+"""
+
+_PORT_UPSERT_ = """
+INSERT INTO ports (ip, port, protocol, state, service, last_seen)
+VALUES (?, ?, ?, ?, ?, ?)
+ON CONFLICT(ip, port, protocol) DO UPDATE SET
+    state = excluded.state,
+    service = COALESCE(excluded.service, ports.service),
+    last_seen = excluded.last_seen
+"""
+
+# query keyword -> number of values it takes (the second one optional)
+_QUERY_FILTERS_ = {"ip": 1, "mac": 1, "vendor": 1, "hostname": 1, "port": 2, "service": 1}
+
+def ipKey(oAddress) -> bytes:
+    """
+    Return the 16-byte sort key of an address; IPv4 maps into ::ffff:0:0/96.
+    """
+    if oAddress.version == 4:
+        return b"\x00" * 10 + b"\xff\xff" + oAddress.packed
+    return oAddress.packed
+
+def normalizeMac(sMac: str) -> str:
+    """
+    Return a MAC address or prefix in upper-case colon form ("c4411e" -> "C4:41:1E").
+    """
+    sHex = "".join(sChar for sChar in sMac if sChar.isalnum()).upper()
+    return ":".join(sHex[iPos:iPos + 2] for iPos in range(0, len(sHex), 2))
+
+def iterInventoryRecords(oResult):
+    """
+    Yield the host and port records contained in a command result: lists of
+    records in a dict ("hosts", "ports_open", diff "added" and "changed" after
+    values), a list of records, or a single record.
+    """
+    if isinstance(oResult, (list, RecordTable)):
+        for oItem in oResult:
+            yield from iterInventoryRecords(oItem)
+    elif isinstance(oResult, Mapping):
+        if "ip" in oResult:
+            yield oResult
+        elif "after" in oResult:
+            yield from iterInventoryRecords(oResult["after"])
+        else:
+            for sKey, oValue in oResult.items():
+                if sKey not in ("removed", "errors") and isinstance(oValue, (list, RecordTable)):
+                    yield from iterInventoryRecords(oValue)
+
+class Inventory:
+    """
+    SQLite-backed index of hosts and open ports.
+    Safe to share between threads of one process and between concurrent processes.
+    """
+
+    def __init__(self, sPath: str):
+        self.sPath = sPath
+        self.oLock = threading.Lock()
+        os.makedirs(os.path.dirname(sPath), exist_ok=True)
+        self.oConn = sqlite3.connect(sPath, timeout=10, check_same_thread=False, isolation_level=None)
+        self.oConn.execute("PRAGMA journal_mode=WAL")
+        self.oConn.execute("PRAGMA synchronous=NORMAL")
+        self.oConn.executescript(_SCHEMA_)
+
+    def ingest(self, iterRecords) -> int:
+        """
+        Insert or update every host record ({"ip", "hostname", "mac", ...}) and port
+        record ({"ip", "port", "protocol", "state", ...}) in iterRecords.
+        Records are written in batches, so a stream is ingested as it goes.
+        Returns the number of records ingested.
+        """
+        iCount = 0
+        lstHosts = []
+        lstPorts = []
+        fNow = time.time()
+        for dRecord in iterRecords:
+            try:
+                oAddress = ipaddress.ip_address(dRecord["ip"])
+            except (KeyError, TypeError, ValueError):
+                continue
+            sIp = str(oAddress)
+            if "port" in dRecord:
+                # Port records carry no host details; only make sure the host exists
+                lstHosts.append((sIp, ipKey(oAddress), None, None, None, None, None, fNow, fNow))
+                lstPorts.append((sIp, int(dRecord["port"]), dRecord.get("protocol") or "tcp",
+                                 dRecord.get("state") or "open", dRecord.get("service"), fNow))
+            else:
+                sMac = normalizeMac(dRecord["mac"]) if dRecord.get("mac") else None
+                lstHosts.append((sIp, ipKey(oAddress), sMac, sMac[:8] if sMac else None, dRecord.get("vendor"),
+                                 dRecord.get("hostname"), dRecord.get("latency"), fNow, fNow))
+                for dPort in dRecord.get("ports") or []:
+                    lstPorts.append((sIp, int(dPort["port"]), dPort.get("protocol") or "tcp",
+                                     dPort.get("state") or "open", dPort.get("service"), fNow))
+            iCount += 1
+            if len(lstHosts) >= _INGEST_BATCH_:
+                self._write(lstHosts, lstPorts)
+                lstHosts, lstPorts = [], []
+        if lstHosts:
+            self._write(lstHosts, lstPorts)
+        return iCount
+
+    def _write(self, lstHosts, lstPorts) -> None:
+        with self.oLock:
+            self.oConn.execute("BEGIN IMMEDIATE")
+            try:
+                self.oConn.executemany(_HOST_UPSERT_, lstHosts)
+                self.oConn.executemany(_PORT_UPSERT_, lstPorts)
+                self.oConn.execute("COMMIT")
+            except Exception:
+                self.oConn.execute("ROLLBACK")
+                raise
+
+    def query(self, dFilters, fSince=None, iLimit=None) -> list:
+        """
+        Return the host records matching every filter in dFilters (see parseQuery),
+        each with the list of its known open ports, ordered by address.
+        """
+        lstWhere = []
+        lstParams = []
+        if "ip" in dFilters:
+            oNetwork = ipaddress.ip_network(dFilters["ip"], strict=False)
+            lstWhere.append("h.ip_key BETWEEN ? AND ?")
+            lstParams += [ipKey(oNetwork.network_address), ipKey(oNetwork.broadcast_address)]
+        if "mac" in dFilters:
+            sMac = normalizeMac(dFilters["mac"])
+            if len(sMac) == 17:
+                lstWhere.append("h.mac = ?")
+                lstParams.append(sMac)
+            elif len(sMac) == 8:
+                lstWhere.append("h.oui = ?")
+                lstParams.append(sMac)
+            else:
+                lstWhere.append("h.mac >= ? AND h.mac < ?")
+                lstParams += [sMac, sMac + "￿"]
+        if "vendor" in dFilters:
+            lstWhere.append("h.vendor LIKE ? COLLATE NOCASE")
+            lstParams.append(dFilters["vendor"].replace("%", "") + "%")
+        if "hostname" in dFilters:
+            sPattern = dFilters["hostname"]
+            if any(sChar in sPattern for sChar in "*?["):
+                lstWhere.append("LOWER(h.hostname) GLOB ?")
+                lstParams.append(sPattern.lower())
+                # hostname is NOCASE, so its index can narrow the search to the literal prefix
+                iEnd = min(sPattern.find(sChar) for sChar in "*?[" if sChar in sPattern)
+                if iEnd:
+                    lstWhere.append("h.hostname >= ? AND h.hostname < ?")
+                    lstParams += [sPattern[:iEnd], sPattern[:iEnd] + "￿"]
+            else:
+                lstWhere.append("h.hostname = ?")
+                lstParams.append(sPattern)
+        if "port" in dFilters:
+            iPort, sProtocol = dFilters["port"]
+            sPortWhere = "p.port = ? AND p.state LIKE 'open%'"
+            lstParams.append(int(iPort))
+            if sProtocol:
+                sPortWhere += " AND p.protocol = ?"
+                lstParams.append(sProtocol.lower())
+            lstWhere.append(f"h.ip IN (SELECT p.ip FROM ports p WHERE {sPortWhere})")
+        if "service" in dFilters:
+            lstWhere.append("h.ip IN (SELECT p.ip FROM ports p WHERE p.service = ? AND p.state LIKE 'open%')")
+            lstParams.append(dFilters["service"])
+        if fSince is not None:
+            lstWhere.append("h.last_seen >= ?")
+            lstParams.append(time.time() - fSince)
+
+        sSql = "SELECT h.ip, h.hostname, h.mac, h.vendor, h.latency, h.first_seen, h.last_seen FROM hosts h"
+        if lstWhere:
+            sSql += " WHERE " + " AND ".join(lstWhere)
+        sSql += " ORDER BY h.ip_key"
+        if iLimit:
+            sSql += f" LIMIT {int(iLimit)}"
+
+        with self.oLock:
+            lstHosts = [
+                {"ip": oRow[0], "hostname": oRow[1], "mac": oRow[2], "vendor": oRow[3], "latency": oRow[4],
+                 "first_seen": oRow[5], "last_seen": oRow[6], "ports": []}
+                for oRow in self.oConn.execute(sSql, lstParams)
+            ]
+            dByIp = {dHost["ip"]: dHost for dHost in lstHosts}
+            lstIps = list(dByIp)
+            for iStart in range(0, len(lstIps), _IN_BATCH_):
+                lstBatch = lstIps[iStart:iStart + _IN_BATCH_]
+                for oRow in self.oConn.execute(
+                    "SELECT ip, port, protocol, state, service FROM ports "
+                    f"WHERE ip IN ({','.join('?' * len(lstBatch))}) AND state LIKE 'open%' ORDER BY ip, port",
+                    lstBatch
+                ):
+                    dByIp[oRow[0]]["ports"].append(
+                        {"port": oRow[1], "protocol": oRow[2], "state": oRow[3], "service": oRow[4]}
+                    )
+        return lstHosts
+
+    def stats(self) -> dict:
+        """
+        Return the number of hosts and open ports in the inventory.
+        """
+        with self.oLock:
+            iHosts = self.oConn.execute("SELECT COUNT(*) FROM hosts").fetchone()[0]
+            iPorts = self.oConn.execute("SELECT COUNT(*) FROM ports WHERE state LIKE 'open%'").fetchone()[0]
+            fLast = self.oConn.execute("SELECT MAX(last_seen) FROM hosts").fetchone()[0]
+        return {"path": self.sPath, "hosts": iHosts, "open_ports": iPorts, "last_seen": fLast}
+
+    def clear(self) -> None:
+        """
+        Remove every host and port.
+        """
+        with self.oLock:
+            self.oConn.execute("BEGIN IMMEDIATE")
+            self.oConn.execute("DELETE FROM ports")
+            self.oConn.execute("DELETE FROM hosts")
+            self.oConn.execute("COMMIT")
+
+def parseQuery(lstArgs) -> dict:
+    """
+    Parse query filters, e.g. ["port", "22", "ip", "10.0.0.0/24"] ->
+    {"port": (22, None), "ip": "10.0.0.0/24"}. A port may be followed by a protocol.
+    Raises ValueError for unknown keywords or malformed values.
+    """
+    dFilters = {}
+    iIndex = 0
+    while iIndex < len(lstArgs):
+        sKeyword = lstArgs[iIndex].lower()
+        if sKeyword not in _QUERY_FILTERS_:
+            raise ValueError(f"Unknown query filter '{lstArgs[iIndex]}'. Use: {', '.join(_QUERY_FILTERS_)}.")
+        if iIndex + 1 >= len(lstArgs):
+            raise ValueError(f"Query filter '{sKeyword}' expects a value.")
+        sValue = lstArgs[iIndex + 1]
+        iIndex += 2
+        if sKeyword == "port":
+            if not sValue.isdigit():
+                raise ValueError(f"Invalid port '{sValue}'.")
+            sProtocol = None
+            if iIndex < len(lstArgs) and lstArgs[iIndex].lower() in ("tcp", "udp", "sctp"):
+                sProtocol = lstArgs[iIndex].lower()
+                iIndex += 1
+            dFilters["port"] = (int(sValue), sProtocol)
+        elif sKeyword == "ip":
+            ipaddress.ip_network(sValue, strict=False)
+            dFilters["ip"] = sValue
+        else:
+            dFilters[sKeyword] = sValue
+    return dFilters
+
+_oInventory = None
+
+def getInventory():
+    """
+    Return the process-wide Inventory, or None if it is disabled or cannot be opened.
+    """
+    global _oInventory
+    if _oInventory is None:
+        dSettings = loadUserSettings().get("inventory") or {}
+        if not dSettings.get("enabled", True):
+            return None
+        sPath = os.path.join(getCacheDir(), _DB_NAME_)
+        try:
+            _oInventory = Inventory(sPath)
+        except sqlite3.Error as e:
+            print(f"[Warning] Inventory disabled, failed to open '{sPath}': {e}")
+            return None
+    return _oInventory
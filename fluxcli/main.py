@@ -10,11 +10,26 @@
 
 import sys
 import os
-import yaml
 import importlib
-import json
+import time
+import functools
+import threading
+import contextlib
 from .settings import loadUserSettings
 from .settings import saveUserSettings
+from .settings import getCacheDir
+from .manifest import fingerprintDirectory, loadManifest, saveManifest, clearManifest, getManifestPath
+from .utils.parser import splitFlags, splitDispatchFlags, splitGlobalFlags
+from .utils.schema import compileSchema, ArgValidator, formatUsage
+from .utils.yamlcache import loadYamlFile, clearYamlCache
+from .utils.timings import timedPhase, addPhase, isRecording, recordTimings
+from .output import getWriter, iterRows
+
+# Subsystems (result cache, inventory, checkpoints, workers, cluster, daemon,
+# job engine, pipelines, reloader, completion) are imported by the functions
+# that use them: most of them pull in sqlite3, asyncio, multiprocessing or
+# socketserver, which a one-shot command line should only pay for when it
+# needs them. tests/test_startup.py checks this.
 
 def discoverModules():
     """
@@ -35,16 +50,16 @@ def discoverModules():
                 lstModules.append(sItem)
     return lstModules
 
-def loadModuleCommands(sModuleName):
+def loadModuleCommands(sModuleName, bRefresh=False):
     """
     Load the commands.yaml file for the specified module.
     Returns a dictionary of command definitions or an empty dict if not found.
+    Unchanged files come from the parsed-YAML cache; bRefresh parses them anyway.
     """
     sCmdPath = os.path.join(os.path.dirname(__file__), "modules", sModuleName, "commands.yaml")
     if not os.path.exists(sCmdPath):
         return {}
-    with open(sCmdPath, "r", encoding="utf-8") as fCmd:
-        return yaml.safe_load(fCmd)
+    return loadYamlFile(sCmdPath, getCacheDir(), bRefresh) or {}
 
 def getModuleInstance(sModuleName):
     """
@@ -59,29 +74,133 @@ def getModuleInstance(sModuleName):
         print(f"Error importing module '{sModuleName}': {e}")
         return None
 
-def discoverNativeCommands():
+def getIsolatedInstance(dRegistry, sModuleName):
+    """
+    Return a RemoteModule running sModuleName's module.py in the worker pool
+    (see workerpool.py), or None if the workers cannot import it.
+    """
+    from .workerpool import RemoteModule, getWorkerPool
+    oPool = getWorkerPool()
+    oPool.preload(sModuleName)
+    try:
+        oPool.exports(sModuleName)
+    except Exception as e:
+        print(f"Error importing module '{sModuleName}': {e}")
+        return None
+    return RemoteModule(oPool, sModuleName, dRegistry[sModuleName])
+
+def resolveModuleInstance(dRegistry, sModuleName):
+    """
+    Return the imported module.py for sModuleName, importing it on first use.
+    The registry only holds command definitions until a command is dispatched,
+    so modules that are never used are never imported.
+    Modules isolated in the 'isolation' settings are imported by worker
+    processes instead, and a RemoteModule calling into them is returned.
+    """
+    dModuleInfo = dRegistry.get(sModuleName)
+    if not dModuleInfo:
+        return None
+    if dModuleInfo.get("instance") is None:
+        from .workerpool import isIsolated
+        from .reloader import snapshotSources
+        with timedPhase("import"):
+            # Taken first: an edit made during the import is then picked up by 'reload'
+            dModuleInfo["sources"] = snapshotSources(getSourceDir(sModuleName))
+            if isIsolated(sModuleName):
+                dModuleInfo["instance"] = getIsolatedInstance(dRegistry, sModuleName)
+            else:
+                dModuleInfo["instance"] = getModuleInstance(sModuleName)
+    return dModuleInfo["instance"]
+
+def discoverNativeCommands(bRefresh=False):
     """
     Load the top-level commands from config/commands.yaml.
     These commands do not belong to any module, but to the CLI itself.
     """
-    sConfigPath = os.path.join(os.path.dirname(__file__), "..", "config", "commands.yaml")
+    sConfigPath = os.path.join(os.path.dirname(__file__), "config", "commands.yaml")
     if os.path.exists(sConfigPath):
-        with open(sConfigPath, "r", encoding="utf-8") as fNative:
-            return yaml.safe_load(fNative)
+        return loadYamlFile(sConfigPath, getCacheDir(), bRefresh) or {}
     return {}
 
-def buildCommandRegistry():
+def compileCommands(sModuleName, dCommands):
+    """
+    Compile the 'args' declaration of every command in dCommands (see
+    utils/schema.py) into its "schema" entry, which is cached in the manifest.
+    A bad declaration is reported and leaves that command unvalidated.
+    Returns dCommands.
+    """
+    for sCmdName, dCmdInfo in dCommands.items():
+        if not dCmdInfo or "args" not in dCmdInfo:
+            continue
+        try:
+            dCmdInfo["schema"] = compileSchema(dCmdInfo["args"])
+        except ValueError as e:
+            print(f"[Warning] Ignoring argument schema of '{sModuleName} {sCmdName}': {e}")
+    return dCommands
+
+def getArgValidator(dModuleInfo, sCmdName):
+    """
+    Return the ArgValidator for a command with a compiled schema, or None.
+    Validators are built on first use and kept in the registry.
+    """
+    dValidators = dModuleInfo.setdefault("validators", {})
+    if sCmdName not in dValidators:
+        dSchema = (dModuleInfo["commands"].get(sCmdName) or {}).get("schema")
+        dValidators[sCmdName] = ArgValidator(dSchema) if dSchema else None
+    return dValidators[sCmdName]
+
+def getSourceDir(sName) -> str:
+    """
+    Return the directory a registry entry is built from: the module package,
+    or config/ for the native commands ("_native_").
+    """
+    sBasePath = os.path.dirname(__file__)
+    if sName == "_native_":
+        return os.path.join(sBasePath, "config")
+    return os.path.join(sBasePath, "modules", sName)
+
+def buildManifestEntry(sName, sFingerprint, bRefresh=False) -> dict:
+    """
+    Parse the commands of a module (or of "_native_") into a manifest entry:
+    {"fingerprint": str, "commands": dict}.
+    """
+    if sName == "_native_":
+        dCommands = discoverNativeCommands(bRefresh).get("commands") or {}
+    else:
+        dCommands = compileCommands(sName, loadModuleCommands(sName, bRefresh).get("commands") or {})
+    return {"fingerprint": sFingerprint, "commands": dCommands}
+
+def newRegistryEntry(dEntry) -> dict:
+    return {
+        "commands": dEntry["commands"],
+        "fingerprint": dEntry["fingerprint"],
+        "instance": None,
+        "sources": None,
+        "validators": {}
+    }
+
+def buildCommandRegistry(bRebuild=False):
     """
     Build a registry of all modules and their commands, plus any native commands.
+    Command definitions are read from the cached manifest (see manifest.py) when
+    the fingerprint of a module directory still matches; otherwise that module's
+    commands.yaml is parsed (see utils/yamlcache.py) and the manifest is
+    refreshed. Pass bRebuild=True to ignore the manifest and the parsed-YAML
+    cache entirely. Argument schemas are compiled while parsing (see
+    compileCommands) and cached with the rest of the manifest.
+    Module code is NOT imported here; see resolveModuleInstance().
     Returns a dictionary like:
     {
       "nmap": {
           "commands": {...},
-          "instance": <module 'fluxcli.modules.nmap.module'>
+          "fingerprint": "...", # see reloadRegistry()
+          "instance": None,     # set on first dispatch
+          "sources": None,      # snapshot of the .py files taken at import
+          "validators": {}      # see getArgValidator()
       },
       "tmux": {
           "commands": {...},
-          "instance": <module 'fluxcli.modules.tmux.module'>
+          "instance": None
       },
       "_native_": {
           "commands": {...},  # from config/commands.yaml
@@ -89,26 +208,120 @@ def buildCommandRegistry():
       }
     }
     """
-    dRegistry = {}
-
-    # Load modules
-    lstFoundModules = discoverModules()
-    for sMod in lstFoundModules:
-        dCmds = loadModuleCommands(sMod).get("commands", {})
-        oInst = getModuleInstance(sMod)
-        dRegistry[sMod] = {
-            "commands": dCmds,
-            "instance": oInst
-        }
-
-    # Load native commands
-    dNative = discoverNativeCommands().get("commands", {})
-    dRegistry["_native_"] = {
-        "commands": dNative,
-        "instance": None
-    }
+    sBasePath = os.path.dirname(__file__)
+    dCached = {} if bRebuild else loadManifest(sBasePath)
+    dEntries = {}
+    bDirty = bRebuild
+
+    # Load modules, then the native commands
+    for sName in discoverModules() + ["_native_"]:
+        sFingerprint = fingerprintDirectory(getSourceDir(sName))
+        dEntry = dCached.get(sName)
+        if not dEntry or dEntry.get("fingerprint") != sFingerprint:
+            dEntry = buildManifestEntry(sName, sFingerprint, bRebuild)
+            bDirty = True
+        dEntries[sName] = dEntry
+
+    # Modules that disappeared also invalidate the manifest
+    if bDirty or set(dEntries) != set(dCached):
+        saveManifest(sBasePath, dEntries)
+
+    return {sName: newRegistryEntry(dEntry) for sName, dEntry in dEntries.items()}
+
+# Serializes reloadRegistry() between the REPL, the daemon and the watch thread
+_RELOAD_LOCK_ = threading.Lock()
+
+def reloadRegistry(dRegistry, lstNames=None, bForce=False) -> list:
+    """
+    Bring registry entries up to date with the files on disk, in place, so the
+    REPL context, background jobs and caches of a long-lived process are kept
+    (see reloader.py). lstNames selects modules (default: every module, the
+    native commands, and modules added or removed since the registry was built).
+    An entry is only refreshed if its directory fingerprint changed, or always
+    with bForce, which also re-executes every imported file of the module.
+    Cached results of a module whose commands or code changed are dropped.
+    Only the changed entries are rewritten in the manifest.
+    Returns one line per changed entry, e.g. "nmap: parser.py, module.py".
+    """
+    from .workerpool import RemoteModule, getWorkerPool
+    from .reloader import snapshotSources, getChangedSources, reloadSources, unloadModule
+    sBasePath = os.path.dirname(__file__)
+    lstReport = []
+    with _RELOAD_LOCK_:
+        lstFound = discoverModules()
+        if lstNames is None:
+            lstNames = sorted(set(lstFound) | {sName for sName in dRegistry if sName != "_native_"}) + ["_native_"]
+        dUpdates = {}
+        lstRemoved = []
+
+        for sName in lstNames:
+            if sName != "_native_" and sName not in lstFound:
+                if sName in dRegistry:
+                    del dRegistry[sName]
+                    unloadModule(sName)
+                    lstRemoved.append(sName)
+                    lstReport.append(f"{sName}: removed")
+                continue
+
+            sDirPath = getSourceDir(sName)
+            sFingerprint = fingerprintDirectory(sDirPath)
+            dModuleInfo = dRegistry.get(sName)
+            if dModuleInfo and not bForce and dModuleInfo.get("fingerprint") == sFingerprint:
+                continue
+            dEntry = buildManifestEntry(sName, sFingerprint, bForce)
+            dUpdates[sName] = dEntry
+            if not dModuleInfo:
+                dRegistry[sName] = newRegistryEntry(dEntry)
+                lstReport.append(f"{sName}: added")
+                continue
+
+            lstChanges = []
+            if dEntry["commands"] != dModuleInfo["commands"]:
+                lstChanges.append("commands.yaml")
+            if isinstance(dModuleInfo.get("instance"), RemoteModule):
+                # Workers import the module afresh; only they hold its code
+                dSources = snapshotSources(sDirPath)
+                lstFiles = list(dSources) if bForce else getChangedSources(dModuleInfo.get("sources") or {}, dSources)
+                if lstFiles:
+                    getWorkerPool().recycle()
+                    lstChanges += lstFiles + ["workers restarted"]
+                dModuleInfo["sources"] = dSources
+            elif dModuleInfo.get("instance") is not None:
+                dSources = snapshotSources(sDirPath)
+                lstFiles = list(dSources) if bForce else getChangedSources(dModuleInfo.get("sources") or {}, dSources)
+                try:
+                    lstChanges += reloadSources(sName, lstFiles)
+                    # Left at the old snapshot on failure, so the next reload retries these files
+                    dModuleInfo["sources"] = dSources
+                except Exception as e:
+                    print(f"Error: Reloading module '{sName}' failed: {type(e).__name__}: {e}")
+
+            dModuleInfo["commands"] = dEntry["commands"]
+            dModuleInfo["fingerprint"] = sFingerprint
+            dModuleInfo["validators"] = {}
+            if lstChanges:
+                lstReport.append(f"{sName}: {', '.join(lstChanges)}")
+                forgetCachedResults(sName)
 
-    return dRegistry
+        if dUpdates or lstRemoved:
+            dManifest = loadManifest(sBasePath)
+            if dManifest:
+                dManifest.update(dUpdates)
+                for sName in lstRemoved:
+                    dManifest.pop(sName, None)
+                saveManifest(sBasePath, dManifest)
+    return lstReport
+
+def forgetCachedResults(sModuleName) -> None:
+    """
+    Drop the cached results of a module whose code or commands changed.
+    """
+    if sModuleName == "_native_":
+        return
+    from .resultcache import getResultCache
+    oCache = getResultCache()
+    if oCache is not None:
+        oCache.forget(sModuleName)
 
 def listAllModules(dRegistry):
     """
@@ -137,10 +350,300 @@ def listModuleCommands(dRegistry, sModuleName):
     for sCmdName, dCmdData in dCmds.items():
         print(f"  {sCmdName} - {dCmdData.get('description', '')}")
 
+def silenceStdout():
+    """
+    Point stdout at devnull after the consumer went away (e.g. piped into 'head'),
+    so the interpreter doesn't fail flushing it on exit.
+    """
+    try:
+        iDevNull = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(iDevNull, sys.stdout.fileno())
+    except (AttributeError, OSError, ValueError):
+        # stdout is not a real file (e.g. a daemon client's socket); nothing to redirect
+        pass
+
+def emitRecords(iterRecords, oWriter=None):
+    """
+    Write each record with oWriter (see output.py; NDJSON by default) and flush
+    immediately, so downstream consumers (jq, ingest pipelines) can start work right away.
+    """
+    oWriter = oWriter or getWriter("ndjson")
+    bTimed = isRecording()
+    try:
+        for dRecord in iterRecords:
+            if bTimed:
+                fStart = time.perf_counter()
+                oWriter.writeRecord(dRecord)
+                addPhase("serialize", time.perf_counter() - fStart)
+            else:
+                oWriter.writeRecord(dRecord)
+        oWriter.close()
+    except BrokenPipeError:
+        # The consumer went away. Stop the producer as well.
+        if hasattr(iterRecords, "close"):
+            iterRecords.close()
+        silenceStdout()
+
+def emitResult(oResult, oWriter) -> None:
+    """
+    Write a buffered command result with oWriter (see output.py).
+    """
+    try:
+        with timedPhase("serialize"):
+            oWriter.writeResult(oResult)
+            oWriter.close()
+    except BrokenPipeError:
+        silenceStdout()
+
+def runCachedCommand(funcCmd, sModuleName, sCmdName, dCmdInfo, lstArgs, dFlags):
+    """
+    Call funcCmd(*lstArgs), going through the result cache (see resultcache.py)
+    when the command is marked 'cache: true' in its commands.yaml and the
+    caller did not pass --no-cache. Results carrying an error are never cached.
+    """
+    oCache = None
+    if dCmdInfo.get("cache") and not dFlags["no_cache"]:
+        from .resultcache import getResultCache
+        oCache = getResultCache()
+    if not oCache:
+        return funcCmd(*lstArgs)
+
+    fMaxAge = None if dFlags["max_age"] is None else float(dFlags["max_age"])
+    sKey = oCache.makeKey(sModuleName, sCmdName, lstArgs)
+    try:
+        dResult = oCache.get(sKey, fMaxAge)
+        if dResult is not None:
+            return dResult
+    except Exception as e:
+        print(f"[Warning] Result cache lookup failed: {e}")
+
+    dResult = funcCmd(*lstArgs)
+    if isinstance(dResult, dict) and "error" not in dResult and "errors" not in dResult:
+        try:
+            oCache.put(sKey, sModuleName, sCmdName, lstArgs, dResult)
+        except Exception as e:
+            print(f"[Warning] Failed to store result in cache: {e}")
+    return dResult
+
+def ingestResult(oResult) -> None:
+    """
+    Add the host and port records of a command result to the inventory (see inventory.py).
+    """
+    from .inventory import getInventory, iterInventoryRecords
+    oInventory = getInventory()
+    if not oInventory or (isinstance(oResult, dict) and "error" in oResult):
+        return
+    try:
+        with timedPhase("inventory"):
+            oInventory.ingest(iterInventoryRecords(oResult))
+    except Exception as e:
+        print(f"[Warning] Failed to update inventory: {e}")
+
+def withInventory(funcCmd, dCmdInfo):
+    """
+    Return funcCmd, wrapped to ingest its results into the inventory when the
+    command is marked 'inventory: true' in its commands.yaml.
+    """
+    if not dCmdInfo.get("inventory"):
+        return funcCmd
+
+    @functools.wraps(funcCmd)
+    def funcIngesting(*lstArgs):
+        oResult = funcCmd(*lstArgs)
+        ingestResult(oResult)
+        return oResult
+    return funcIngesting
+
+# Streamed records buffered before they are written to the inventory
+_INVENTORY_BATCH_ = 500
+
+def iterIngesting(iterRecords, dCmdInfo):
+    """
+    Pass the records of a stream through, ingesting them into the inventory in
+    batches when the command is marked 'inventory: true'.
+    """
+    if not dCmdInfo.get("inventory"):
+        yield from iterRecords
+        return
+    lstBatch = []
+    try:
+        for dRecord in iterRecords:
+            lstBatch.append(dRecord)
+            if len(lstBatch) >= _INVENTORY_BATCH_:
+                ingestResult(lstBatch)
+                lstBatch = []
+            yield dRecord
+    finally:
+        if lstBatch:
+            ingestResult(lstBatch)
+        if hasattr(iterRecords, "close"):
+            iterRecords.close()
+
+def openCheckpoint(sModuleName, sCmdName, dCmdInfo, lstArgs, dFlags):
+    """
+    Return (oCheckpoint, lstArgs): a Checkpoint (see checkpoint.py) for commands
+    marked 'checkpoint: true' in their commands.yaml, resuming scan dFlags["resume"]
+    if given, or None. A scan resumed without arguments reuses its original
+    arguments and --targets-file. Raises ValueError if it cannot be resumed.
+    """
+    sResume = dFlags["resume"]
+    if not dCmdInfo.get("checkpoint") or dFlags["diff"]:
+        if sResume:
+            raise ValueError(f"'{sModuleName} {sCmdName}'{' --diff' if dFlags['diff'] else ''} cannot be resumed.")
+        return None, lstArgs
+    from .checkpoint import Checkpoint, getCheckpointStore
+    from .resultcache import normalizeArgs
+    oStore = getCheckpointStore()
+    if oStore is None:
+        if sResume:
+            raise ValueError("Checkpoints are disabled (checkpoint.enabled in fluxcli.yaml).")
+        return None, lstArgs
+
+    sTargetsFile = dFlags["targets_file"]
+    if sTargetsFile is not None and sTargetsFile != "-":
+        sTargetsFile = os.path.abspath(sTargetsFile)
+    if not sResume:
+        return Checkpoint(oStore, sModuleName, sCmdName, {"args": lstArgs, "targets_file": sTargetsFile}), lstArgs
+
+    dScan = oStore.load(sResume)
+    if dScan is None:
+        raise ValueError(f"Unknown scan id '{sResume}'. See 'scans' for the resumable scans.")
+    if (dScan["module"], dScan["command"]) != (sModuleName, sCmdName):
+        raise ValueError(f"Scan '{sResume}' is a '{dScan['module']} {dScan['command']}' scan.")
+    dArgs = dScan["args"]
+    if not lstArgs and sTargetsFile is None:
+        lstArgs = dArgs["args"]
+        dFlags["targets_file"] = dArgs["targets_file"]
+    elif normalizeArgs(lstArgs) != normalizeArgs(dArgs["args"]) or sTargetsFile != dArgs["targets_file"]:
+        sOriginal = " ".join(dArgs["args"] + (["--targets-file", dArgs["targets_file"]] if dArgs["targets_file"] else []))
+        raise ValueError(f"Scan '{sResume}' was started with different arguments: {sOriginal}")
+    return Checkpoint(oStore, sModuleName, sCmdName, dArgs, dScan["scan_id"]), lstArgs
+
+def checkpointContext(oCheckpoint, bShare: bool = True):
+    """
+    checkpointScope(oCheckpoint, bShare) (see checkpoint.py); commands that are
+    not checkpointed get a no-op context without importing the checkpoint store.
+    """
+    if oCheckpoint is None:
+        return contextlib.nullcontext()
+    from .checkpoint import checkpointScope
+    return checkpointScope(oCheckpoint, bShare)
+
+def iterDistributed(sModuleName, sCmdName, lstUnits, lstArgs, oCheckpoint):
+    """
+    Run the command once per unit on cluster workers (see cluster.py), with the
+    unit in place of the first argument, and yield (sUnit, dResult) as units
+    finish. Units stored in oCheckpoint by an earlier run come first; new
+    results are saved to it.
+    """
+    dDone = {}
+    if oCheckpoint is not None:
+        oCheckpoint.begin(len(lstUnits))
+        dDone = oCheckpoint.results()
+    lstPending = []
+    for sUnit in lstUnits:
+        if sUnit in dDone:
+            yield sUnit, dDone[sUnit]
+        else:
+            lstPending.append(sUnit)
+
+    from .cluster import Coordinator
+    oCoordinator = Coordinator(sModuleName, sCmdName, [[sUnit, *lstArgs[1:]] for sUnit in lstPending])
+    for iUnit, dResult in oCoordinator.iterResults():
+        sUnit = lstPending[iUnit]
+        if oCheckpoint is not None:
+            if "error" in dResult:
+                oCheckpoint.markFailed()
+            else:
+                oCheckpoint.save(sUnit, dResult)
+        yield sUnit, dResult
+
+def distributeCommand(sModuleName, sCmdName, dCmdInfo, lstArgs, dFlags, oCheckpoint, oWriter):
+    """
+    The dispatcher's --distribute mode: split the target (first argument) into
+    units, run them on 'fluxcli worker' agents and emit the merged result, or
+    each unit's records as it finishes with --stream.
+    """
+    from .cluster import splitTarget, mergeResults, iterUnitRecords, getClusterSettings
+    lstUnits = splitTarget(lstArgs[0], getClusterSettings()["unit_bits"])
+
+    def funcDistributed(*lstCmdArgs):
+        dResults = dict(iterDistributed(sModuleName, sCmdName, lstUnits, list(lstCmdArgs), oCheckpoint))
+        return mergeResults(lstUnits, dResults)
+
+    with checkpointContext(oCheckpoint, bShare=False), timedPhase("command"):
+        if dFlags["stream"]:
+            iterRecords = (
+                dRecord
+                for sUnit, dResult in iterDistributed(sModuleName, sCmdName, lstUnits, lstArgs, oCheckpoint)
+                for dRecord in iterUnitRecords(sUnit, dResult)
+            )
+            emitRecords(iterIngesting(iterRecords, dCmdInfo), oWriter)
+            return
+        dResult = runCachedCommand(withInventory(funcDistributed, dCmdInfo), sModuleName, sCmdName, dCmdInfo, lstArgs, dFlags)
+    emitResult(dResult, oWriter)
+
+def runClusterUnit(dRegistry, sModuleName, sCmdName, lstArgs) -> dict:
+    """
+    Run one unit leased by a coordinator (see cluster.py) and return its result.
+    Only commands marked 'distribute: true' in their commands.yaml are accepted,
+    and their arguments are validated like local ones.
+    """
+    dModuleInfo = dRegistry.get(sModuleName) or {}
+    dCmdInfo = dModuleInfo.get("commands", {}).get(sCmdName) or {}
+    if sModuleName == "_native_" or not dCmdInfo.get("distribute"):
+        return {"error": f"'{sModuleName} {sCmdName}' cannot run on a worker."}
+    oValidator = getArgValidator(dModuleInfo, sCmdName)
+    try:
+        if oValidator:
+            lstArgs = oValidator.validate(lstArgs)
+    except ValueError as e:
+        return {"error": str(e)}
+    oModule = resolveModuleInstance(dRegistry, sModuleName)
+    if not oModule or not hasattr(oModule, sCmdName):
+        return {"error": f"'{sCmdName}' is not implemented in {sModuleName}.module.py."}
+    return getattr(oModule, sCmdName)(*lstArgs)
+
 def dispatchModuleCommand(dRegistry, sModuleName, sCmdName, lstArgs):
     """
     Dispatch to the appropriate function in the specified module with given arguments.
+    Dispatcher flags (see utils/parser.py) are removed from lstArgs first:
+      --format F     Output format: pretty, json, ndjson, csv, raw or msgpack
+                     (default: output.format, see output.py).
+      --stream       Emit records as they are produced (NDJSON unless --format
+                     selects a record format). Uses the module's
+                     '<command>Stream' generator if it defines one; otherwise the
+                     buffered result is emitted as a single record. Streams bypass
+                     the result cache.
+      --no-cache     Always run the command, ignoring and not updating the result cache.
+      --max-age N    Only accept cached results younger than N seconds; values
+                     above cache.ttl are capped at it, as older entries are expired.
+      --diff         Report only what changed since the previous --diff run, using
+                     the module's '<command>Diff' function. Never cached.
+      --targets-file F
+                     Run the command once per target listed in F ('-' for stdin),
+                     passing each target as the first argument. Emits one
+                     record per target (see batch.py).
+      --workers N    Concurrent targets in --targets-file mode (default: batch_workers).
+      --ordered      Emit --targets-file records in input order instead of completion order.
+      --resume ID    Continue an interrupted scan of a command marked 'checkpoint: true',
+                     skipping its finished units (see checkpoint.py). Without
+                     arguments, the scan's original arguments are reused.
+      --distribute   Split the target into units and run them on 'fluxcli worker'
+                     agents, for commands marked 'distribute: true' (see cluster.py).
+    Commands with an 'args' schema in their commands.yaml get their arguments
+    validated and normalized first (see utils/schema.py); arguments may then also
+    be given as '--name value'.
+    Results of commands marked 'inventory: true' are also added to the host
+    inventory (see inventory.py), except when served from the result cache.
     """
+    try:
+        dFlags, lstArgs = splitDispatchFlags(lstArgs)
+        oWriter = getWriter(dFlags["format"])
+    except ValueError as e:
+        print(f"Error: {e}")
+        return
+
     dModuleInfo = dRegistry.get(sModuleName)
     if not dModuleInfo:
         print(f"Error: Module '{sModuleName}' not found.")
@@ -151,7 +654,7 @@ def dispatchModuleCommand(dRegistry, sModuleName, sCmdName, lstArgs):
         print(f"Error: Command '{sCmdName}' not found in module '{sModuleName}'.")
         return
 
-    oModule = dModuleInfo.get("instance")
+    oModule = resolveModuleInstance(dRegistry, sModuleName)
     if not oModule:
         print(f"Error: Module instance for '{sModuleName}' is not loaded.")
         return
@@ -161,40 +664,504 @@ def dispatchModuleCommand(dRegistry, sModuleName, sCmdName, lstArgs):
         print(f"Error: '{sCmdName}' is not implemented in {sModuleName}.module.py.")
         return
 
+    dCmdInfo = dCmds[sCmdName] or {}
+    funcCmd = withInventory(getattr(oModule, sCmdName), dCmdInfo)
+    funcDiff = None
+    if dFlags["diff"]:
+        funcDiff = getattr(oModule, f"{sCmdName}Diff", None)
+        if not funcDiff:
+            print(f"Error: '{sCmdName}' in module '{sModuleName}' does not support --diff.")
+            return
+        funcDiff = withInventory(funcDiff, dCmdInfo)
+
+    # Typed arguments are checked before anything runs; a resumed scan reuses checked ones
+    oValidator = getArgValidator(dModuleInfo, sCmdName)
+    if oValidator and (lstArgs or not dFlags["resume"]):
+        try:
+            lstArgs = oValidator.validate(lstArgs, 0 if dFlags["targets_file"] is None else 1)
+        except ValueError as e:
+            print(f"Error: {e}")
+            print(f"Usage: {dCmdInfo.get('usage') or formatUsage(sCmdName, dCmdInfo['schema'])}")
+            return
+
+    try:
+        oCheckpoint, lstArgs = openCheckpoint(sModuleName, sCmdName, dCmdInfo, lstArgs, dFlags)
+    except ValueError as e:
+        print(f"Error: {e}")
+        return
+
+    if dFlags["distribute"]:
+        if funcDiff or dFlags["targets_file"] is not None or not dCmdInfo.get("distribute") or not lstArgs:
+            print(f"Error: '{sModuleName} {sCmdName}'{' --diff' if funcDiff else ''}{' --targets-file' if dFlags['targets_file'] is not None else ''} cannot be distributed.")
+            return
+        try:
+            distributeCommand(sModuleName, sCmdName, dCmdInfo, lstArgs, dFlags, oCheckpoint, oWriter)
+        except OSError as e:
+            print(f"Error: Cannot start the coordinator: {e}")
+        return
+
+    if dFlags["targets_file"] is not None:
+        if funcDiff:
+            funcRun = lambda sTarget: funcDiff(sTarget, *lstArgs)
+        else:
+            funcRun = lambda sTarget: runCachedCommand(funcCmd, sModuleName, sCmdName, dCmdInfo, [sTarget, *lstArgs], dFlags)
+        if oValidator and oValidator.lstArgs:
+            # Bad targets become error records without running the command
+            funcTarget = funcRun
+            funcRun = lambda sTarget: funcTarget(oValidator.check(0, sTarget))
+        try:
+            iWorkers = int(dFlags["workers"] or loadUserSettings().get("batch_workers", 4))
+            # Each target is one checkpoint unit; the command itself runs unsplit
+            with checkpointContext(oCheckpoint, bShare=False), timedPhase("command"):
+                if oCheckpoint:
+                    oCheckpoint.begin()
+                    funcRun = oCheckpoint.wrap(funcRun)
+                from .batch import readTargets, iterBatchResults
+                emitRecords(iterBatchResults(funcRun, readTargets(dFlags["targets_file"]), iWorkers, dFlags["ordered"]), oWriter)
+        except (OSError, ValueError) as e:
+            print(f"Error: {e}")
+        return
+
+    if funcDiff:
+        try:
+            with timedPhase("command"):
+                dResult = funcDiff(*lstArgs)
+            if dFlags["stream"]:
+                emitRecords([dResult], oWriter)
+            else:
+                emitResult(dResult, oWriter)
+        except Exception as e:
+            print(f"Command '{sCmdName}' failed: {e}")
+        return
+
+    if dFlags["stream"]:
+        funcStream = getattr(oModule, f"{sCmdName}Stream", None)
+        try:
+            with checkpointContext(oCheckpoint), timedPhase("command"):
+                if funcStream:
+                    emitRecords(iterIngesting(funcStream(*lstArgs), dCmdInfo), oWriter)
+                else:
+                    emitRecords([funcCmd(*lstArgs)], oWriter)
+        except Exception as e:
+            print(f"Command '{sCmdName}' failed: {e}")
+        return
+
     # Call the function
-    funcCmd = getattr(oModule, sCmdName)
     try:
-        dResult = funcCmd(*lstArgs)
-        # You might format output as JSON or something
-        print(json.dumps(dResult, indent=2))
+        with checkpointContext(oCheckpoint), timedPhase("command"):
+            dResult = runCachedCommand(funcCmd, sModuleName, sCmdName, dCmdInfo, lstArgs, dFlags)
+        emitResult(dResult, oWriter)
     except Exception as e:
         print(f"Command '{sCmdName}' failed: {e}")
 
+def splitPipeline(dRegistry, lstTokens, sDefaultModule=None) -> list:
+    """
+    Split a command line into pipeline stages at '|' tokens.
+    Returns a list of (sModuleName, sCmdName, lstArgs); a stage may name its
+    module or use the previous stage's (the first stage: sDefaultModule).
+    A '|' only starts a new stage if the next token is a module or a command of
+    the current module, so e.g. 'tmux send %1 ps aux | grep nmap' stays one stage.
+    Raises ValueError if the first stage names no command.
+    """
+    lstStages = []
+    lstCurrent = []
+    sModule = sDefaultModule
+
+    def closeStage():
+        nonlocal sModule
+        if lstCurrent and lstCurrent[0] in dRegistry and lstCurrent[0] != "_native_":
+            sModule = lstCurrent.pop(0)
+        if not lstCurrent or not sModule:
+            raise ValueError("Each pipeline stage needs a module command.")
+        lstStages.append((sModule, lstCurrent[0], lstCurrent[1:]))
+
+    for iIndex, sToken in enumerate(lstTokens):
+        sNext = lstTokens[iIndex + 1] if iIndex + 1 < len(lstTokens) else ""
+        sStageModule = lstCurrent[0] if lstCurrent and lstCurrent[0] in dRegistry else sModule
+        bStageBreak = sToken == "|" and lstCurrent and (
+            (sNext in dRegistry and sNext != "_native_") or
+            sNext in ((dRegistry.get(sStageModule) or {}).get("commands") or {})
+        )
+        if bStageBreak:
+            closeStage()
+            lstCurrent = []
+        else:
+            lstCurrent.append(sToken)
+    closeStage()
+    return lstStages
+
+def iterStageRecords(oModule, sCmdName, dCmdInfo, lstArgs):
+    """
+    Yield the records of one module command run: from its '<command>Stream'
+    generator if it has one, otherwise the rows of its buffered result.
+    Results of 'inventory: true' commands are ingested on the way.
+    """
+    funcStream = getattr(oModule, f"{sCmdName}Stream", None)
+    if funcStream:
+        return iterIngesting(funcStream(*lstArgs), dCmdInfo)
+    return iterRows(withInventory(getattr(oModule, sCmdName), dCmdInfo)(*lstArgs))
+
+def dispatchPipeline(dRegistry, lstStages):
+    """
+    Run a pipeline of module commands in this process (see pipeline.py), e.g.
+        nmap pingsweep 10.0.0.0/16 | portscan --ports 22,443
+    lstStages comes from splitPipeline(). Each stage after the first runs once
+    per target found by the stage before it, which is passed as its first argument.
+    Stages accept --workers N (concurrent targets); --format applies to the
+    output of the last stage. Every stage is checked before anything runs.
+    """
+    from .pipeline import PipelineStage, iterPipeline, getPipelineSettings
+    dPipeline = getPipelineSettings()
+    oSource = None
+    lstPipeline = []
+    sFormat = None
+    try:
+        for iStage, (sModuleName, sCmdName, lstArgs) in enumerate(lstStages):
+            dFlags, lstArgs = splitDispatchFlags(lstArgs)
+            for sFlag in ("diff", "targets_file", "resume", "max_age", "ordered", "distribute"):
+                if dFlags[sFlag] not in (None, False):
+                    raise ValueError(f"--{sFlag.replace('_', '-')} is not supported in pipelines.")
+            sFormat = dFlags["format"] or sFormat
+
+            dModuleInfo = dRegistry.get(sModuleName) or {}
+            if sCmdName not in dModuleInfo.get("commands", {}):
+                raise ValueError(f"Command '{sCmdName}' not found in module '{sModuleName}'.")
+            dCmdInfo = dModuleInfo["commands"][sCmdName] or {}
+            oModule = resolveModuleInstance(dRegistry, sModuleName)
+            if not oModule or not hasattr(oModule, sCmdName):
+                raise ValueError(f"'{sCmdName}' is not implemented in {sModuleName}.module.py.")
+
+            oValidator = getArgValidator(dModuleInfo, sCmdName)
+            if oValidator:
+                try:
+                    lstArgs = oValidator.validate(lstArgs, 0 if iStage == 0 else 1)
+                except ValueError as e:
+                    raise ValueError(f"{e}\nUsage: {dCmdInfo.get('usage') or formatUsage(sCmdName, dCmdInfo['schema'])}")
+
+            if iStage == 0:
+                oSource = (oModule, sCmdName, dCmdInfo, lstArgs)
+                continue
+
+            def funcRun(sTarget, oModule=oModule, sCmdName=sCmdName, dCmdInfo=dCmdInfo, lstArgs=lstArgs, oValidator=oValidator):
+                if oValidator and oValidator.lstArgs:
+                    sTarget = oValidator.check(0, sTarget)
+                return iterStageRecords(oModule, sCmdName, dCmdInfo, [sTarget, *lstArgs])
+            lstPipeline.append(PipelineStage(f"{sModuleName} {sCmdName}", funcRun, int(dFlags["workers"] or dPipeline["workers"])))
+        oWriter = getWriter(sFormat)
+    except ValueError as e:
+        print(f"Error: {e}")
+        return
+
+    try:
+        with timedPhase("command"):
+            emitRecords(iterPipeline(iterStageRecords(*oSource), lstPipeline, dPipeline["queue_size"]), oWriter)
+    except Exception as e:
+        print(f"Pipeline failed: {e}")
+
+def nativeCache(dRegistry, lstArgs):
+    """
+    Native 'cache' command.
+      cache rebuild  - Re-parse every commands.yaml, rewrite the manifest and
+                       report cold-start vs warm-start registry build times.
+      cache clear    - Remove the cached manifest, parsed YAML files and all cached results.
+      cache stats    - Show result cache hit/miss counters and size.
+    """
+    sAction = lstArgs[0] if lstArgs else ""
+    if sAction == "rebuild":
+        fStart = time.perf_counter()
+        buildCommandRegistry(bRebuild=True)
+        fCold = time.perf_counter() - fStart
+
+        fStart = time.perf_counter()
+        buildCommandRegistry()
+        fWarm = time.perf_counter() - fStart
+
+        print(f"Command manifest rebuilt: {getManifestPath()}")
+        print(f"  cold start (parse commands.yaml): {fCold * 1000:.2f} ms")
+        print(f"  warm start (cached manifest):     {fWarm * 1000:.2f} ms")
+    elif sAction == "clear":
+        if clearManifest():
+            print(f"Removed command manifest: {getManifestPath()}")
+        else:
+            print("No command manifest to remove.")
+        iRemoved = clearYamlCache(getCacheDir())
+        if iRemoved:
+            print(f"Removed {iRemoved} parsed YAML file(s) from the cache.")
+        from .resultcache import getResultCache
+        oCache = getResultCache()
+        if oCache:
+            oCache.clear()
+            print(f"Cleared result cache: {oCache.sPath}")
+    elif sAction == "stats":
+        from .resultcache import getResultCache
+        oCache = getResultCache()
+        if not oCache:
+            print("Result cache is disabled.")
+            return
+        dStats = oCache.stats()
+        iLookups = dStats["hits"] + dStats["misses"]
+        fRatio = dStats["hits"] / iLookups * 100.0 if iLookups else 0.0
+        print(f"Result cache: {dStats['path']}")
+        print(f"  entries: {dStats['entries']} ({dStats['bytes'] / 1024.0:.1f} KiB)")
+        print(f"  hits:    {dStats['hits']}")
+        print(f"  misses:  {dStats['misses']} (hit ratio {fRatio:.1f}%)")
+    else:
+        print("Usage: cache <rebuild|clear|stats>")
+
+def nativeServe(dRegistry, lstArgs):
+    """
+    Native 'serve' command: keep dRegistry loaded in a resident daemon that executes
+    commands forwarded by the thin client (see daemon.py and client.py).
+    """
+    from .daemon import serve
+    from .reloader import startWatching, getReloadSettings
+    dSettings = loadUserSettings().get("daemon") or {}
+    if getReloadSettings()["watch"]:
+        startWatching(functools.partial(watchRegistry, dRegistry))
+    serve(
+        functools.partial(runCommandLine, dRegistry),
+        dSettings.get("max_concurrent", 8)
+    )
+
+def watchRegistry(dRegistry) -> None:
+    """
+    Watch mode check (see reloader.py): reload whatever changed and say so.
+    """
+    for sLine in reloadRegistry(dRegistry):
+        print(f"[Reload] {sLine}")
+
+def nativeReload(dRegistry, lstArgs):
+    """
+    Native 'reload' command: pick up edited modules without restarting the REPL
+    or daemon (see reloadRegistry and reloader.py).
+    Usage: reload [module ...] [--force]
+           reload watch [on|off]
+    """
+    from .reloader import startWatching, stopWatching, isWatching, getReloadSettings
+    if lstArgs[:1] == ["watch"]:
+        sState = lstArgs[1] if len(lstArgs) > 1 else None
+        if sState not in (None, "on", "off"):
+            print("Usage: reload watch [on|off]")
+        elif sState == "on":
+            if startWatching(functools.partial(watchRegistry, dRegistry)):
+                print(f"Watching modules for changes every {getReloadSettings()['interval']:g}s.")
+            else:
+                print("Already watching modules for changes.")
+        elif sState == "off":
+            print("Stopped watching modules." if stopWatching() else "Not watching modules.")
+        else:
+            print(f"Watch mode is {'on' if isWatching() else 'off'}.")
+        return
+
+    dFlags, lstNames = splitFlags(lstArgs, {"--force": False})
+    for sName in lstNames:
+        if sName not in dRegistry and sName not in discoverModules():
+            print(f"Error: Module '{sName}' not found.")
+            return
+    lstReport = reloadRegistry(dRegistry, lstNames or None, dFlags["force"])
+    for sLine in lstReport:
+        print(f"[Reload] {sLine}")
+    if not lstReport:
+        print("Nothing changed." if not lstNames else f"No changes in {', '.join(lstNames)}.")
+
+def nativeQuery(dRegistry, lstArgs):
+    """
+    Native 'query' command: look up hosts in the inventory (see inventory.py).
+    Usage: query [ip <addr|cidr>] [mac <mac|oui>] [vendor <prefix>] [hostname <name|glob>]
+                 [port <n> [tcp|udp]] [service <name>] [--since N] [--limit N] [--format F]
+           query stats | query clear
+    Filters are combined; each host is reported with its known open ports.
+    """
+    from .inventory import getInventory, parseQuery
+    oInventory = getInventory()
+    if not oInventory:
+        print("Inventory is disabled.")
+        return
+    if lstArgs[:1] == ["stats"]:
+        dStats = oInventory.stats()
+        sLast = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(dStats["last_seen"])) if dStats["last_seen"] else "never"
+        print(f"Inventory: {dStats['path']}")
+        print(f"  hosts:      {dStats['hosts']}")
+        print(f"  open ports: {dStats['open_ports']}")
+        print(f"  last seen:  {sLast}")
+        return
+    if lstArgs[:1] == ["clear"]:
+        oInventory.clear()
+        print(f"Cleared inventory: {oInventory.sPath}")
+        return
+    try:
+        dFlags, lstArgs = splitFlags(lstArgs, {"--since": None, "--limit": None, "--format": None})
+        dFilters = parseQuery(lstArgs)
+        oWriter = getWriter(dFlags["format"])
+        fSince = None if dFlags["since"] is None else float(dFlags["since"])
+        iLimit = None if dFlags["limit"] is None else int(dFlags["limit"])
+    except ValueError as e:
+        print(f"Error: {e}")
+        return
+    with timedPhase("command"):
+        lstHosts = oInventory.query(dFilters, fSince, iLimit)
+    emitResult({"hosts": lstHosts}, oWriter)
+
+def nativeScans(dRegistry, lstArgs):
+    """
+    Native 'scans' command: list and forget checkpointed scans (see checkpoint.py).
+      scans             - List stored scans with their progress.
+      scans forget ID   - Forget one scan.
+      scans clear       - Forget every scan.
+    """
+    from .checkpoint import getCheckpointStore
+    oStore = getCheckpointStore()
+    if not oStore:
+        print("Checkpoints are disabled.")
+        return
+    sAction = lstArgs[0] if lstArgs else ""
+    if sAction == "clear":
+        oStore.delete()
+        print(f"Cleared checkpoints: {oStore.sPath}")
+    elif sAction == "forget" and len(lstArgs) > 1:
+        oStore.delete(lstArgs[1])
+        print(f"Forgot scan '{lstArgs[1]}'.")
+    elif not sAction:
+        lstScans = oStore.list()
+        if not lstScans:
+            print("No checkpointed scans.")
+        for dScan in lstScans:
+            sUnits = f"{dScan['done']}/{dScan['units']}" if dScan["units"] is not None else str(dScan["done"])
+            sUpdated = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(dScan["updated"]))
+            lstCommand = [dScan["module"], dScan["command"], *dScan["args"]["args"]]
+            if dScan["args"]["targets_file"]:
+                lstCommand += ["--targets-file", dScan["args"]["targets_file"]]
+            print(f"  {dScan['scan_id']}  {dScan['status']:<8}  {sUnits:>9} units  {sUpdated}  {' '.join(lstCommand)}")
+    else:
+        print("Usage: scans [forget <scan-id> | clear]")
+
+def nativeWorker(dRegistry, lstArgs):
+    """
+    Native 'worker' command: run scan units for a coordinator (see cluster.py).
+    Usage: worker HOST:PORT [--slots N] [--token T]
+    """
+    from .cluster import runWorker
+    try:
+        dFlags, lstArgs = splitFlags(lstArgs, {"--slots": None, "--token": None})
+        if len(lstArgs) != 1:
+            raise ValueError("Usage: worker HOST:PORT [--slots N] [--token T]")
+        runWorker(lstArgs[0], functools.partial(runClusterUnit, dRegistry), dFlags["slots"], dFlags["token"])
+    except ValueError as e:
+        print(f"Error: {e}")
+
+def nativeBench(dRegistry, lstArgs):
+    """
+    Native 'bench' command: run the benchmark suite (see bench/suite.py).
+    Usage: bench [--full] [--cases a,b] [--output FILE] [--compare FILE]
+    """
+    from .bench.suite import main as benchMain
+    benchMain(lstArgs)
+
+# Python callbacks for native commands, keyed by the name used in config/commands.yaml
+_NATIVE_HANDLERS_ = {
+    "cache": nativeCache,
+    "serve": nativeServe,
+    "bench": nativeBench,
+    "query": nativeQuery,
+    "scans": nativeScans,
+    "worker": nativeWorker,
+    "reload": nativeReload
+}
+
 def dispatchNativeCommand(dRegistry, sCmdName, lstArgs):
     """
     Dispatch a CLI-native command (found in config/commands.yaml).
-    You might later implement Python callbacks for these, or some static behavior.
-    Here we just show that it exists. You could do something advanced if needed.
+    Commands with an entry in _NATIVE_HANDLERS_ run their Python callback;
+    anything else is only reported as existing.
     """
     dNative = dRegistry["_native_"]["commands"]
     if sCmdName not in dNative:
         print(f"Error: Native command '{sCmdName}' not recognized.")
         return
-    dCmdInfo = dNative[sCmdName]
+    funcHandler = _NATIVE_HANDLERS_.get(sCmdName)
+    if funcHandler:
+        funcHandler(dRegistry, lstArgs)
+        return
     print(f"Running native command '{sCmdName}'. No custom logic implemented.")
-    # Possibly parse dCmdInfo or implement a callback.
+
+def handleJobCommand(oEngine, sCmd, lstArgs):
+    """
+    Handle the REPL's background job commands:
+      jobs            - List background jobs and their state.
+      wait [id]       - Block until job <id> (or all jobs) finished.
+      cancel <id>     - Cancel a queued or running job.
+      result <id>     - Print the output of a finished job.
+    """
+    if oEngine is None:
+        print("No background jobs. Append '&' to a module command to start one.")
+        return
+
+    if sCmd == "jobs":
+        lstJobs = oEngine.listJobs()
+        if not lstJobs:
+            print("No background jobs.")
+        for oJob in lstJobs:
+            print(f"  [{oJob.iId}] {oJob.sState:<9} {oJob.elapsed():>8.1f}s  {oJob.sCommandLine}")
+        return
+
+    iId = None
+    if lstArgs:
+        if not lstArgs[0].isdigit() or not oEngine.get(int(lstArgs[0])):
+            print(f"No job with id '{lstArgs[0]}'.")
+            return
+        iId = int(lstArgs[0])
+    elif sCmd != "wait":
+        print(f"Usage: {sCmd} <id>")
+        return
+
+    if sCmd == "wait":
+        try:
+            oEngine.wait(iId)
+        except KeyboardInterrupt:
+            print("\nStopped waiting; jobs keep running.")
+            return
+        print("Done." if iId is None else f"[{iId}] {oEngine.get(iId).sState}")
+    elif sCmd == "cancel":
+        if oEngine.cancel(iId):
+            print(f"[{iId}] cancelled")
+        else:
+            print(f"[{iId}] already finished")
+    elif sCmd == "result":
+        oJob = oEngine.get(iId)
+        if not oJob.isFinished():
+            print(f"[{iId}] is still {oJob.sState}. Use 'wait {iId}' to block until it finishes.")
+        elif oJob.sState == "failed":
+            print(f"[{iId}] failed: {oJob.sError}")
+        elif oJob.sState == "cancelled":
+            print(f"[{iId}] was cancelled.")
+        else:
+            print(oJob.sOutput, end="")
 
 def replLoop(dRegistry):
     """
     A simple REPL that:
     - Uses 'load <module>' to switch context
     - Then runs commands within that module
+    - Runs module commands ending in '&' as background jobs (see engine.py),
+      managed with 'jobs', 'wait', 'cancel' and 'result'
+    - Chains module commands with '|' into in-process pipelines (see pipeline.py)
+    - 'reload [module]' picks up edited modules, keeping the loaded module and
+      background jobs; 'reload watch on' does so automatically (see reloader.py)
     - 'help' to show usage
     - 'exit' to quit
+    Tab completes modules, commands and typed arguments (see completion.py).
     """
+    from .engine import JobEngine
+    from .completion import installCompletion
+    from .reloader import startWatching, stopWatching, getReloadSettings
     dSettings = loadUserSettings()
     sPrompt = dSettings.get("prompt", "[ fluxcli ] > ")
     sCurrentModule = None
+    oEngine = None
+
+    installCompletion(dRegistry, lambda: sCurrentModule)
+    if getReloadSettings()["watch"]:
+        startWatching(functools.partial(watchRegistry, dRegistry))
 
     print("Welcome to FluxCLI!")
     print("Type 'help' for a list of commands, 'exit'/'quit' to leave.\n")
@@ -210,19 +1177,85 @@ def replLoop(dRegistry):
             continue
 
         if sLine in ("exit", "quit"):
+            if oEngine and oEngine.runningCount():
+                print(f"Abandoning {oEngine.runningCount()} unfinished background job(s).")
+            stopWatching()
             print("Goodbye.")
             break
 
+        # A trailing '&' runs the command as a background job
+        bBackground = sLine.endswith("&")
+        if bBackground:
+            sLine = sLine[:-1].strip()
+            if not sLine:
+                continue
+
         lstParts = sLine.split()
         sCmd = lstParts[0]
         lstArgs = lstParts[1:]
 
+        if sCmd in ("jobs", "wait", "cancel", "result"):
+            handleJobCommand(oEngine, sCmd, lstArgs)
+            continue
+
+        # Checked before resolving commands, since the watch thread may have removed it
+        if sCurrentModule and sCurrentModule not in dRegistry:
+            print(f"Module '{sCurrentModule}' is no longer available.")
+            sCurrentModule = None
+
+        if sCmd == "reload":
+            nativeReload(dRegistry, lstArgs)
+            if sCurrentModule and sCurrentModule not in dRegistry:
+                print(f"Module '{sCurrentModule}' is no longer available.")
+                sCurrentModule = None
+            continue
+
+        # "<command> ... | <command> ..." runs as an in-process pipeline (see pipeline.py)
+        lstStages = None
+        if "|" in lstParts and (sCurrentModule or sCmd in dRegistry) and sCmd not in ("help", "load", "_native_"):
+            try:
+                lstStages = splitPipeline(dRegistry, lstParts, sCurrentModule)
+            except ValueError as e:
+                print(f"Error: {e}")
+                continue
+            if len(lstStages) < 2:
+                lstStages = None
+
+        # Resolve "<module> <command> <args>" or "<command> <args>" in the loaded module
+        sTargetModule = None
+        if sCmd in dRegistry and sCmd != "_native_" and lstArgs:
+            sTargetModule, sTargetCmd, lstTargetArgs = sCmd, lstArgs[0], lstArgs[1:]
+        elif sCurrentModule and sCmd not in ("help", "load"):
+            sTargetModule, sTargetCmd, lstTargetArgs = sCurrentModule, sCmd, lstArgs
+
+        if lstStages:
+            if not bBackground:
+                dispatchPipeline(dRegistry, lstStages)
+                continue
+            if oEngine is None:
+                oEngine = JobEngine(dSettings.get("max_jobs", 4))
+            oJob = oEngine.submit(sLine, functools.partial(dispatchPipeline, dRegistry, lstStages))
+            print(f"[{oJob.iId}] {sLine}")
+            continue
+
+        if bBackground:
+            if not sTargetModule:
+                print("Only module commands can run in the background.")
+                continue
+            if oEngine is None:
+                oEngine = JobEngine(dSettings.get("max_jobs", 4))
+            oJob = oEngine.submit(sLine, functools.partial(dispatchModuleCommand, dRegistry, sTargetModule, sTargetCmd, lstTargetArgs))
+            print(f"[{oJob.iId}] {sLine}")
+            continue
+
         if sCmd == "help":
             if not sCurrentModule:
                 # List all modules + usage
                 listAllModules(dRegistry)
                 print("To load a module: load <moduleName>")
                 print("To run a native command: <nativeCmd>")
+                print("Append '&' to run a module command in the background (jobs, wait, cancel, result).")
+                print("To pick up edited modules: reload [moduleName] (reload watch on|off)")
             else:
                 # List commands in the current module
                 listModuleCommands(dRegistry, sCurrentModule)
@@ -258,34 +1291,99 @@ def replLoop(dRegistry):
             # Maybe it's a native command?
             dispatchNativeCommand(dRegistry, sCmd, lstArgs)
 
+def timeCommandLine(lstArgv, dGlobalFlags):
+    """
+    Return a context that records timings for lstArgv (see utils/timings.py) when
+    --timings or --profile was given or the 'timings' setting is enabled,
+    or a no-op context otherwise.
+    """
+    dSettings = loadUserSettings().get("timings") or {}
+    bEnabled = bool(dSettings.get("enabled"))
+    bRequested = dGlobalFlags["timings"] or dGlobalFlags["profile"] is not None
+    if not (bRequested or bEnabled):
+        return contextlib.nullcontext()
+    return recordTimings(lstArgv, bRequested, dSettings.get("metrics_file"), dGlobalFlags["profile"])
+
+def runCommandLine(dRegistry, lstArgv):
+    """
+    Run one non-interactive command line (argv without the program name), e.g.
+        ["nmap", "pingsweep", "192.168.1.0/24"]  or  ["cache", "stats"]
+    Shared by main() and the daemon.
+    Global flags (--timings, --profile FILE) may appear anywhere on the line.
+    """
+    try:
+        dGlobalFlags, lstArgv = splitGlobalFlags(lstArgv)
+    except ValueError as e:
+        print(f"Error: {e}")
+        return
+    if not lstArgv:
+        print("Usage: fluxcli <module> <command> [args...]")
+        return
+    with timeCommandLine(lstArgv, dGlobalFlags):
+        runParsedCommandLine(dRegistry, lstArgv)
+
+def runParsedCommandLine(dRegistry, lstArgv):
+    """
+    Dispatch lstArgv (global flags already removed) to a module or native command.
+    """
+    # Example usage: fluxcli nmap pingsweep 192.168.1.0/24
+    # or fluxcli tmux attach
+    sModOrCmd = lstArgv[0]
+    lstArgs = lstArgv[1:]
+
+    if sModOrCmd in dRegistry and sModOrCmd != "_native_":
+        # They specified a module
+        if len(lstArgs) < 1:
+            print(f"Usage: fluxcli {sModOrCmd} <command> [args...]")
+            sys.exit(1)
+        # A quoted '|' chains commands, e.g. fluxcli nmap pingsweep 10.0.0.0/24 '|' portscan
+        if "|" in lstArgs:
+            try:
+                lstStages = splitPipeline(dRegistry, lstArgv)
+            except ValueError as e:
+                print(f"Error: {e}")
+                sys.exit(1)
+            if len(lstStages) > 1:
+                dispatchPipeline(dRegistry, lstStages)
+                return
+        sCommand = lstArgs[0]
+        lstCmdArgs = lstArgs[1:]
+        dispatchModuleCommand(dRegistry, sModOrCmd, sCommand, lstCmdArgs)
+    else:
+        # Possibly a native command
+        dispatchNativeCommand(dRegistry, sModOrCmd, lstArgs)
+
 def main():
     """
     Entry point. If called with arguments:
         fluxcli <module> <command> [args...]
-      we run that command directly.
-      Otherwise, we drop into the REPL.
+      the command is forwarded to the daemon when one is running ('fluxcli serve'),
+      otherwise we run that command directly.
+      Without arguments, we drop into the REPL.
     """
-    dRegistry = buildCommandRegistry()
+    from .client import forwardToDaemon
+    iCode = forwardToDaemon(sys.argv[1:])
+    if iCode is not None:
+        sys.exit(iCode)
+
     if len(sys.argv) < 2:
         # No arguments -> REPL
-        replLoop(dRegistry)
-    else:
-        # Example usage: fluxcli nmap pingsweep 192.168.1.0/24
-        # or fluxcli tmux attach
-        sModOrCmd = sys.argv[1]
-        lstArgs = sys.argv[2:]
+        replLoop(buildCommandRegistry())
+        return
 
-        if sModOrCmd in dRegistry and sModOrCmd != "_native_":
-            # They specified a module
-            if len(lstArgs) < 1:
-                print(f"Usage: fluxcli {sModOrCmd} <command> [args...]")
-                sys.exit(1)
-            sCommand = lstArgs[0]
-            lstCmdArgs = lstArgs[1:]
-            dispatchModuleCommand(dRegistry, sModOrCmd, sCommand, lstCmdArgs)
-        else:
-            # Possibly a native command
-            dispatchNativeCommand(dRegistry, sModOrCmd, lstArgs)
+    try:
+        dGlobalFlags, lstArgv = splitGlobalFlags(sys.argv[1:])
+    except ValueError as e:
+        print(f"Error: {e}")
+        sys.exit(2)
+    if not lstArgv:
+        replLoop(buildCommandRegistry())
+        return
+    # Start recording before the registry is built so its cost is included
+    with timeCommandLine(lstArgv, dGlobalFlags):
+        with timedPhase("registry"):
+            dRegistry = buildCommandRegistry()
+        runParsedCommandLine(dRegistry, lstArgv)
 
 if __name__ == "__main__":
     main()
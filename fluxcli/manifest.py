@@ -0,0 +1,101 @@
+"""
+manifest.py - Precompiled command manifest for fast FluxCLI startup.
+
+The merged command definitions of every module (plus the native commands)
+are stored in a JSON manifest under the settings directory. Each entry is
+keyed on a fingerprint of its source directory (file names, sizes, mtimes
+and a hash of commands.yaml), so a warm start only has to stat a handful of
+files instead of parsing every commands.yaml with PyYAML.
+"""
+
+import os
+import json
+import hashlib
+from .settings import getCacheDir
+
+__all__ = ["getManifestPath", "fingerprintDirectory", "loadManifest", "saveManifest", "clearManifest"]
+
+_MANIFEST_VERSION_ = 2
+_MANIFEST_NAME_ = "manifest.json"
+_SKIP_ENTRIES_ = ("__pycache__",)
+
+def getManifestPath() -> str:
+    """
+    Return the path to the cached command manifest.
+    Typically: ~/.fluxcli/cache/manifest.json.
+    """
+    return os.path.join(getCacheDir(), _MANIFEST_NAME_)
+
+def fingerprintDirectory(sDirPath: str, sYamlName: str = "commands.yaml") -> str:
+    """
+    Return a hex digest identifying the current state of sDirPath.
+    The digest covers the name, size and mtime of every entry in the directory,
+    plus a content hash of sYamlName so same-second edits are still detected.
+    Returns an empty string if the directory does not exist.
+    """
+    if not os.path.isdir(sDirPath):
+        return ""
+
+    oHash = hashlib.sha1()
+    lstEntries = sorted(os.scandir(sDirPath), key=lambda oEntry: oEntry.name)
+    for oEntry in lstEntries:
+        if oEntry.name in _SKIP_ENTRIES_:
+            continue
+        oStat = oEntry.stat()
+        oHash.update(f"{oEntry.name}:{oStat.st_size}:{oStat.st_mtime_ns};".encode("utf-8"))
+
+    sYamlPath = os.path.join(sDirPath, sYamlName)
+    if os.path.isfile(sYamlPath):
+        with open(sYamlPath, "rb") as fYaml:
+            oHash.update(hashlib.sha1(fYaml.read()).digest())
+    return oHash.hexdigest()
+
+def loadManifest(sBasePath: str) -> dict:
+    """
+    Load the cached manifest if it was built for the modules in sBasePath.
+    Returns a dict of {name: {"fingerprint": str, "commands": dict}}, or an
+    empty dict if the manifest is missing, stale or unreadable.
+    """
+    sPath = getManifestPath()
+    if not os.path.exists(sPath):
+        return {}
+
+    try:
+        with open(sPath, "r", encoding="utf-8") as fManifest:
+            dData = json.load(fManifest)
+    except (OSError, ValueError):
+        return {}
+
+    if dData.get("version") != _MANIFEST_VERSION_ or dData.get("base") != sBasePath:
+        return {}
+    return dData.get("entries", {})
+
+def saveManifest(sBasePath: str, dEntries: dict) -> None:
+    """
+    Write the manifest atomically so concurrent fluxcli calls never read a partial file.
+    Failures are reported but never fatal; the registry simply stays uncached.
+    """
+    sPath = getManifestPath()
+    sTmpPath = f"{sPath}.{os.getpid()}.tmp"
+    dData = {
+        "version": _MANIFEST_VERSION_,
+        "base": sBasePath,
+        "entries": dEntries
+    }
+    try:
+        os.makedirs(os.path.dirname(sPath), exist_ok=True)
+        with open(sTmpPath, "w", encoding="utf-8") as fManifest:
+            json.dump(dData, fManifest, separators=(",", ":"))
+        os.replace(sTmpPath, sPath)
+    except OSError as e:
+        print(f"[Warning] Failed to write command manifest '{sPath}': {e}")
+
+def clearManifest() -> bool:
+    """
+    Remove the cached manifest. Returns True if a file was removed.
+    """
+    sPath = getManifestPath()
+    if not os.path.exists(sPath):
+        return False
+    os.remove(sPath)
+    return True
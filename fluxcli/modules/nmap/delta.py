@@ -0,0 +1,160 @@
+"""
+delta.py - Baselines and diffs for the nmap module's --diff mode.
+
+The last result of every diff-mode scan is stored per target (and, for ping
+sweeps, per shard) in ~/.fluxcli/cache/nmap_baselines.db. Each new scan is
+compared against that baseline and only added, removed or changed records
+are reported. Shard metadata (last full scan, whether it changed) lets
+pingsweepDiff decide which shards actually need a full rescan.
+"""
+
+import os
+import json
+import sqlite3
+import threading
+from ...settings import getCacheDir
+from ...records import toJsonValue
+
+__all__ = ["BaselineStore", "getBaselineStore", "diffRecords", "hasChanges", "sweepKey", "portKey"]
+
+_DB_NAME_ = "nmap_baselines.db"
+
+# Fields that change on every scan and must not count as a change
+_VOLATILE_FIELDS_ = ("latency",)
+
+_SCHEMA_ = """
+CREATE TABLE IF NOT EXISTS baselines (
+    command TEXT NOT NULL,
+    target TEXT NOT NULL,
+    shard TEXT NOT NULL,
+    scanned REAL NOT NULL,
+    full_scan REAL NOT NULL,
+    changed INTEGER NOT NULL,
+    records TEXT NOT NULL,
+    PRIMARY KEY (command, target, shard)
+);
+"""
+
+def sweepKey(dRecord):
+    """
+    Identity of a pingsweep host record.
+    """
+    return dRecord["ip"]
+
+def portKey(dRecord):
+    """
+    Identity of a portscan port record.
+    """
+    return (dRecord["ip"], dRecord["port"], dRecord["protocol"])
+
+def stripVolatile(dRecord) -> dict:
+    """
+    Return dRecord without fields that are expected to change between scans.
+    """
+    return {sKey: oValue for sKey, oValue in dRecord.items() if sKey not in _VOLATILE_FIELDS_}
+
+def diffRecords(lstOld, lstNew, funcKey) -> dict:
+    """
+    Compare two record lists by identity (funcKey) and return:
+    {
+      "added":     [new records],
+      "removed":   [old records],
+      "changed":   [{"before": old, "after": new}],
+      "unchanged": <count>
+    }
+    Volatile fields such as latency are ignored when deciding if a record changed.
+    """
+    dOld = {funcKey(dRecord): dRecord for dRecord in lstOld}
+    dNew = {funcKey(dRecord): dRecord for dRecord in lstNew}
+
+    lstAdded = []
+    lstChanged = []
+    iUnchanged = 0
+    for oKey, dRecord in dNew.items():
+        dPrevious = dOld.get(oKey)
+        if dPrevious is None:
+            lstAdded.append(dRecord)
+        elif stripVolatile(dPrevious) != stripVolatile(dRecord):
+            lstChanged.append({"before": dPrevious, "after": dRecord})
+        else:
+            iUnchanged += 1
+
+    return {
+        "added": lstAdded,
+        "removed": [dRecord for oKey, dRecord in dOld.items() if oKey not in dNew],
+        "changed": lstChanged,
+        "unchanged": iUnchanged
+    }
+
+def hasChanges(dDiff) -> bool:
+    """
+    Return True if a diffRecords() result contains any added, removed or changed record.
+    """
+    return bool(dDiff["added"] or dDiff["removed"] or dDiff["changed"])
+
+class BaselineStore:
+    """
+    SQLite store of the last diff-mode result per (command, target, shard).
+    """
+
+    def __init__(self, sPath: str):
+        self.sPath = sPath
+        self.oLock = threading.Lock()
+        os.makedirs(os.path.dirname(sPath), exist_ok=True)
+        self.oConn = sqlite3.connect(sPath, timeout=10, check_same_thread=False, isolation_level=None)
+        self.oConn.execute("PRAGMA journal_mode=WAL")
+        self.oConn.executescript(_SCHEMA_)
+
+    def load(self, sCommand: str, sTarget: str) -> dict:
+        """
+        Return {shard: {"scanned", "full_scan", "changed", "records"}} for a target.
+        Targets that were never scanned in diff mode return an empty dict.
+        """
+        with self.oLock:
+            lstRows = self.oConn.execute(
+                "SELECT shard, scanned, full_scan, changed, records FROM baselines WHERE command = ? AND target = ?",
+                (sCommand, sTarget)
+            ).fetchall()
+        return {
+            sShard: {
+                "scanned": fScanned,
+                "full_scan": fFullScan,
+                "changed": bool(iChanged),
+                "records": json.loads(sRecords)
+            }
+            for sShard, fScanned, fFullScan, iChanged, sRecords in lstRows
+        }
+
+    def save(self, sCommand: str, sTarget: str, dShards: dict) -> None:
+        """
+        Replace the baseline of a target with dShards (same shape as load()).
+        """
+        with self.oLock:
+            self.oConn.execute("BEGIN IMMEDIATE")
+            try:
+                self.oConn.execute("DELETE FROM baselines WHERE command = ? AND target = ?", (sCommand, sTarget))
+                self.oConn.executemany(
+                    "INSERT INTO baselines (command, target, shard, scanned, full_scan, changed, records) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    [
+                        (sCommand, sTarget, sShard, dShard["scanned"], dShard["full_scan"],
+                         int(dShard["changed"]), json.dumps(dShard["records"], separators=(",", ":"), default=toJsonValue))
+                        for sShard, dShard in dShards.items()
+                    ]
+                )
+                self.oConn.execute("COMMIT")
+            except Exception:
+                self.oConn.execute("ROLLBACK")
+                raise
+
+# Kept when this file is hot-reloaded (see fluxcli/reloader.py)
+_oBaselineStore = globals().get("_oBaselineStore")
+
+def getBaselineStore() -> BaselineStore:
+    """
+    Return the process-wide BaselineStore.
+    """
+    global _oBaselineStore
+    if _oBaselineStore is None:
+        _oBaselineStore = BaselineStore(os.path.join(getCacheDir(), _DB_NAME_))
+    return _oBaselineStore
@@ -1,53 +1,449 @@
+import io
+import time
 import subprocess
-import re
+import ipaddress
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from .parser import iterHosts, iterHostsFromChunks
+from ...utils.runner import runCommand, streamCommand, inCurrentScope
+from ...checkpoint import currentCheckpoint
+from .delta import getBaselineStore, diffRecords, hasChanges, sweepKey, portKey
+from .scheduler import scanLease, getSchedulerStats
+from ...records import SweepRecord, SweepTable, PortTable
 
-def pingsweep(sSubnet: str) -> dict:
+# Defaults for sharded sweeps (see pingsweep)
+_SHARD_WORKERS_ = 4
+_SHARD_TIMEOUT_ = 300
+
+# Defaults for diff-mode sweeps (see pingsweepDiff)
+_DIFF_SHARD_PREFIX_ = 24
+_DIFF_FULL_INTERVAL_ = 3600
+
+# Checkpointed scans of large networks are split into up to 2**_UNIT_BITS_ units (see getUnitPrefix)
+_UNIT_BITS_ = 6
+
+def iterNmapHosts(lstNmapArgs, lstTargets):
+    """
+    Run nmap over lstTargets with XML output on stdout and yield host records
+    (see parser.py) as soon as each <host> block is complete. The scan is paced
+    by the scheduler (see scheduler.py) and holds its lease until it ends,
+    except while the consumer holds a record (see ScanLease.suspend).
+    The nmap process is killed if the consumer stops iterating early.
+    """
+    with scanLease(lstTargets) as oLease:
+        oStream = streamCommand(["nmap", "-oX", "-", *oLease.nmapArgs(), *lstNmapArgs, *lstTargets])
+        try:
+            for dHost in iterHostsFromChunks(oStream):
+                oLease.observe(dHost)
+                oLease.suspend()
+                yield dHost
+                oLease.resume()
+        finally:
+            oStream.close()
+
+def runNmap(lstNmapArgs, fTimeout=None) -> bytes:
+    """
+    Run nmap with XML output on stdout to completion and return that output.
+    Raises subprocess.TimeoutExpired if nmap runs longer than fTimeout seconds
+    (the nmap process is killed in that case).
+    """
+    return runCommand(["nmap", "-oX", "-", *lstNmapArgs], fTimeout).bStdout
+
+def iterScannedHosts(lstNmapArgs, lstTargets, fTimeout=None, iExpected=None):
+    """
+    Run nmap over lstTargets under a scheduler lease (see scheduler.py) and,
+    once it has finished, yield the parsed host records. Hosts are parsed one
+    at a time, so only the records the caller keeps stay in memory.
+    iExpected is the number of hosts known to be up, so silent ones are
+    reported to the scheduler as loss. See runNmap for timeout behaviour.
+    """
+    with scanLease(lstTargets, iExpected=iExpected) as oLease:
+        bOutput = runNmap([*oLease.nmapArgs(), *lstNmapArgs, *lstTargets], fTimeout)
+        for oHost in iterHosts(io.BytesIO(bOutput)):
+            oLease.observe(oHost)
+            oLease.suspend()
+            yield oHost
+            oLease.resume()
+
+def toSweepRecord(oHost) -> SweepRecord:
+    """
+    Reduce a parsed host record to the pingsweep output shape
+    {"ip", "hostname", "mac", "vendor", "latency"} (see records.py).
+    """
+    return SweepRecord.fromHost(oHost)
+
+def iterOpenPorts(iterHostRecords):
+    """
+    Flatten parsed host records into one PortRecord per open port, e.g.
+    {"ip": "10.0.0.1", "port": 22, "protocol": "tcp", "state": "open", "service": "ssh"}.
+    UDP ports reported as 'open|filtered' are included.
+    """
+    for oHost in iterHostRecords:
+        for oPort in oHost.ports:
+            if oPort.state and oPort.state.startswith("open"):
+                yield oPort
+
+def splitSubnet(sSubnet: str, iShardPrefix: int) -> list:
+    """
+    Split sSubnet into sub-blocks with the given prefix length.
+    e.g. splitSubnet("10.0.0.0/16", 24) -> ["10.0.0.0/24", ..., "10.0.255.0/24"].
+    A subnet that is already as small as iShardPrefix is returned as a single shard.
+    """
+    oNetwork = ipaddress.ip_network(sSubnet, strict=False)
+    if iShardPrefix > oNetwork.max_prefixlen:
+        raise ValueError(f"Shard prefix /{iShardPrefix} is too long for {oNetwork}")
+    if iShardPrefix <= oNetwork.prefixlen:
+        return [str(oNetwork)]
+    return [str(oShard) for oShard in oNetwork.subnets(new_prefix=iShardPrefix)]
+
+def sweepHosts(sSubnet: str, fTimeout=None) -> SweepTable:
+    """
+    Run a single 'nmap -sn' over sSubnet and return the hosts that are up.
+    Raises subprocess.TimeoutExpired if nmap runs longer than fTimeout seconds
+    (the nmap process is killed in that case).
+    """
+    return sweepTargets([sSubnet], fTimeout)
+
+def sweepTargets(lstTargets, fTimeout=None, iExpected=None) -> SweepTable:
+    """
+    Run a single 'nmap -sn' over every target in lstTargets (subnets or addresses)
+    and return the hosts that are up, as a SweepTable (see records.py). See
+    sweepHosts for timeout behaviour and iterScannedHosts for iExpected.
+    """
+    return SweepTable(
+        toSweepRecord(oHost)
+        for oHost in iterScannedHosts(["-sn"], lstTargets, fTimeout, iExpected)
+        if oHost.status == "up"
+    )
+
+def getUnitPrefix(sTarget: str):
+    """
+    Return the prefix length that splits sTarget into checkpoint units (see
+    checkpoint.py) when the command runs checkpointed and sTarget is larger than
+    one unit, otherwise None. Units are _UNIT_BITS_ bits longer than the target's
+    prefix, so a scan has at most 64 of them, and never smaller than a /24 (/120 for IPv6).
+    """
+    if currentCheckpoint() is None:
+        return None
+    try:
+        oNetwork = ipaddress.ip_network(sTarget, strict=False)
+    except ValueError:
+        return None
+    iUnitPrefix = min(oNetwork.prefixlen + _UNIT_BITS_, oNetwork.max_prefixlen - 8)
+    return iUnitPrefix if iUnitPrefix > oNetwork.prefixlen else None
+
+def iterUnits(lstUnits, funcUnit, iWorkers: int, fTimeout, typeTable):
+    """
+    Run funcUnit(sUnit, fTimeout) for every unit on up to iWorkers threads,
+    yielding (sUnit, lstRecords, sError) as each unit completes; sError is None
+    on success. When the command runs checkpointed, units finished by an earlier
+    run are yielded from the checkpoint first (their records loaded into a
+    typeTable, e.g. SweepTable) and every newly finished unit is saved to it.
+    """
+    oCheckpoint = currentCheckpoint() if len(lstUnits) > 1 else None
+    dDone = {}
+    if oCheckpoint is not None:
+        oCheckpoint.begin(len(lstUnits))
+        dDone = oCheckpoint.results()
+    lstPending = []
+    for sUnit in lstUnits:
+        if sUnit in dDone:
+            yield sUnit, typeTable(dDone.pop(sUnit)), None
+        else:
+            lstPending.append(sUnit)
+    if not lstPending:
+        return
+
+    with ThreadPoolExecutor(max_workers=min(max(1, iWorkers), len(lstPending))) as oPool:
+        dFutures = {oPool.submit(inCurrentScope(funcUnit), sUnit, fTimeout): sUnit for sUnit in lstPending}
+        for oFuture in as_completed(dFutures):
+            sUnit = dFutures[oFuture]
+            try:
+                lstRecords = oFuture.result()
+            except subprocess.TimeoutExpired as e:
+                sError = f"timed out after {e.timeout:g}s"
+            except Exception as e:
+                sError = str(e)
+            else:
+                if oCheckpoint is not None:
+                    oCheckpoint.save(sUnit, lstRecords)
+                yield sUnit, lstRecords, None
+                continue
+            if oCheckpoint is not None:
+                oCheckpoint.markFailed()
+            yield sUnit, typeTable(), sError
+
+def getShardTimeout(sShardPrefix, sTimeout):
+    """
+    Return the seconds each shard of a sweep may take: sTimeout if given,
+    otherwise _SHARD_TIMEOUT_ for sweeps sharded on request (sShardPrefix) and
+    None (no limit, like an unsharded sweep) for checkpoint units.
+    """
+    if sTimeout is not None:
+        return float(sTimeout)
+    return _SHARD_TIMEOUT_ if sShardPrefix else None
+
+def iterShardedSweep(sSubnet: str, sShardPrefix, sWorkers, fTimeout):
+    """
+    Sweep the shards of sSubnet concurrently, yielding (sShard, lstHosts, sError)
+    for each shard as soon as it completes. sError is None on success.
+    """
+    return iterUnits(splitSubnet(sSubnet, int(sShardPrefix)), sweepHosts, int(sWorkers), fTimeout, SweepTable)
+
+def pingsweep(sSubnet: str, sShardPrefix=None, sWorkers=str(_SHARD_WORKERS_), sTimeout=None,
+              sFullInterval=None) -> dict:
     """
     Perform an Nmap ping sweep on sSubnet.
+    If sShardPrefix is given (e.g. "24"), the subnet is split into sub-blocks of that
+    prefix length which are swept by at most sWorkers concurrent nmap processes,
+    each limited to sTimeout seconds (default: _SHARD_TIMEOUT_). Shards that fail
+    or time out are listed under "errors" without discarding the hosts found by
+    the other shards.
+    Checkpointed runs of large subnets are always sharded (see getUnitPrefix); their
+    units only have a time limit if sTimeout is given.
+    sFullInterval is only used by pingsweepDiff; it is accepted so both share one argument list.
     Returns a dict with discovered hosts, e.g. {"hosts": [...]}.
     """
     try:
-        oResult = subprocess.run(
-            ["nmap", "-sn", sSubnet],
-            capture_output=True,
-            text=True,
-            check=False
-        )
-        sOutput = oResult.stdout
-        sPattern = r"Nmap scan report for ([^ ]+) \(([\d\.]+)\).*?MAC Address: ([\w:]+)"
-        lstMatches = re.findall(sPattern, sOutput, flags=re.DOTALL)
-        lstHosts = []
-        for sHostname, sIp, sMac in lstMatches:
-            lstHosts.append({
-                "ip": sIp,
-                "hostname": sHostname,
-                "mac": sMac
-            })
-        return {"hosts": lstHosts}
+        fTimeout = getShardTimeout(sShardPrefix, sTimeout)
+        sShardPrefix = sShardPrefix or getUnitPrefix(sSubnet)
+        if sShardPrefix is None:
+            return {"hosts": sweepHosts(sSubnet)}
+
+        dShardHosts = {}
+        lstErrors = []
+        for sShard, lstShardHosts, sError in iterShardedSweep(sSubnet, sShardPrefix, sWorkers, fTimeout):
+            dShardHosts[sShard] = lstShardHosts
+            if sError:
+                lstErrors.append({"shard": sShard, "error": sError})
+
+        # Merge in shard order so the output is stable regardless of completion order
+        lstHosts = SweepTable()
+        for sShard in splitSubnet(sSubnet, int(sShardPrefix)):
+            lstHosts.extend(dShardHosts.get(sShard, []))
+        dResult = {"hosts": lstHosts}
+        if lstErrors:
+            dResult["errors"] = lstErrors
+        return dResult
     except Exception as e:
         return {"error": str(e)}
 
+def pingsweepStream(sSubnet: str, sShardPrefix=None, sWorkers=str(_SHARD_WORKERS_), sTimeout=None,
+                    sFullInterval=None):
+    """
+    Streaming variant of pingsweep, used by the dispatcher's --stream mode.
+    Yields each host dict as soon as nmap reports it (or, for sharded sweeps,
+    as soon as its shard completes). Failures are yielded as {"error": ...} records.
+    """
+    try:
+        fTimeout = getShardTimeout(sShardPrefix, sTimeout)
+        sShardPrefix = sShardPrefix or getUnitPrefix(sSubnet)
+        if sShardPrefix is None:
+            for oHost in iterNmapHosts(["-sn"], [sSubnet]):
+                if oHost.status == "up":
+                    yield toSweepRecord(oHost)
+            return
+
+        for sShard, lstShardHosts, sError in iterShardedSweep(sSubnet, sShardPrefix, sWorkers, fTimeout):
+            yield from lstShardHosts
+            if sError:
+                yield {"shard": sShard, "error": sError}
+    except Exception as e:
+        yield {"error": str(e)}
+
+def scanPorts(sTarget: str, sPorts: str, fTimeout=None) -> PortTable:
+    """
+    Port scan sTarget with a single nmap run and return its open port records.
+    """
+    return PortTable(iterOpenPorts(iterScannedHosts(["-p", sPorts], [sTarget], fTimeout)))
+
+def iterPortscanUnits(sTarget: str, sPorts: str, sUnitPrefix):
+    """
+    Port scan the checkpoint units of a network target (see getUnitPrefix).
+    """
+    return iterUnits(
+        splitSubnet(sTarget, int(sUnitPrefix)),
+        lambda sUnit, fTimeout: scanPorts(sUnit, sPorts, fTimeout),
+        _SHARD_WORKERS_,
+        None,
+        PortTable
+    )
+
 def portscan(sTarget: str, sPorts="1-1000") -> dict:
     """
     Perform an Nmap port scan on sTarget for ports in sPorts range.
-    Returns a dict with open ports or an error.
+    Checkpointed runs over large networks are split into units (see getUnitPrefix).
+    Returns a dict with one record per open port, e.g.
+    {"ports_open": [{"ip": "10.0.0.1", "port": 22, "protocol": "tcp", "state": "open", "service": "ssh"}]}.
     """
     try:
-        oResult = subprocess.run(
-            ["nmap", "-p", sPorts, sTarget],
-            capture_output=True,
-            text=True,
-            check=False
-        )
-        sOutput = oResult.stdout
-        # For simplicity, let's parse lines indicating open ports:
-        # e.g. "PORT   STATE SERVICE"
-        # We'll return them in a simple structure
-        lstOpen = []
-        for sLine in sOutput.splitlines():
-            # A very naive parse, e.g. "80/tcp open  http"
-            if "/tcp" in sLine and " open " in sLine:
-                lstOpen.append(sLine.strip())
-        return {"ports_open": lstOpen}
+        sUnitPrefix = getUnitPrefix(sTarget)
+        if sUnitPrefix is None:
+            return {"ports_open": scanPorts(sTarget, sPorts)}
+
+        dUnitPorts = {}
+        lstErrors = []
+        for sUnit, lstPorts, sError in iterPortscanUnits(sTarget, sPorts, sUnitPrefix):
+            dUnitPorts[sUnit] = lstPorts
+            if sError:
+                lstErrors.append({"shard": sUnit, "error": sError})
+        lstPorts = PortTable()
+        for sUnit in splitSubnet(sTarget, sUnitPrefix):
+            lstPorts.extend(dUnitPorts.get(sUnit, []))
+        dResult = {"ports_open": lstPorts}
+        if lstErrors:
+            dResult["errors"] = lstErrors
+        return dResult
     except Exception as e:
         return {"error": str(e)}
+
+def portscanStream(sTarget: str, sPorts="1-1000"):
+    """
+    Streaming variant of portscan, used by the dispatcher's --stream mode.
+    Yields one record per open port as soon as nmap prints it (or, for
+    checkpointed scans of large networks, as soon as its unit completes).
+    """
+    try:
+        sUnitPrefix = getUnitPrefix(sTarget)
+        if sUnitPrefix is None:
+            yield from iterOpenPorts(iterNmapHosts(["-p", sPorts], [sTarget]))
+            return
+        for sUnit, lstPorts, sError in iterPortscanUnits(sTarget, sPorts, sUnitPrefix):
+            yield from lstPorts
+            if sError:
+                yield {"shard": sUnit, "error": sError}
+    except Exception as e:
+        yield {"error": str(e)}
+
+def refreshShard(sShard: str, dBaseline, fFullInterval: float, fTimeout: float) -> tuple:
+    """
+    Bring one shard of a diff-mode sweep up to date. Returns (lstHosts, bFullScan).
+    A shard gets a full sweep if it has no baseline, changed on its last scan, or
+    was last fully swept more than fFullInterval seconds ago. Otherwise only its
+    known hosts are re-pinged, and the shard is fully swept only if one of them
+    changed or disappeared. New hosts in a quiet shard are therefore picked up
+    by the next full sweep at the latest.
+    """
+    if dBaseline and not dBaseline["changed"] and time.time() - dBaseline["full_scan"] < fFullInterval:
+        lstKnown = [dHost["ip"] for dHost in dBaseline["records"]]
+        if not lstKnown:
+            return [], False
+        lstHosts = sweepTargets(lstKnown, fTimeout, len(lstKnown))
+        if not hasChanges(diffRecords(dBaseline["records"], lstHosts, sweepKey)):
+            return lstHosts, False
+    return sweepTargets([sShard], fTimeout), True
+
+def pingsweepDiff(sSubnet: str, sShardPrefix=str(_DIFF_SHARD_PREFIX_), sWorkers=str(_SHARD_WORKERS_),
+                  sTimeout=None, sFullInterval=str(_DIFF_FULL_INTERVAL_)) -> dict:
+    """
+    Ping sweep sSubnet and report only what changed since the previous diff-mode sweep
+    of the same subnet (see delta.py). Used by the dispatcher's --diff mode.
+    Shards that look stable are only re-checked host by host (see refreshShard).
+    Returns e.g.
+    {"added": [...], "removed": [...], "changed": [{"before": ..., "after": ...}],
+     "unchanged": 12, "previous_scan": 1700000000.0, "shards": {"full": 1, "quick": 15}}
+    """
+    try:
+        sTarget = str(ipaddress.ip_network(sSubnet, strict=False))
+        lstShards = splitSubnet(sTarget, int(sShardPrefix or _DIFF_SHARD_PREFIX_))
+        iWorkers = max(1, int(sWorkers))
+        fTimeout = getShardTimeout(sShardPrefix or _DIFF_SHARD_PREFIX_, sTimeout)
+        fFullInterval = float(sFullInterval)
+
+        oStore = getBaselineStore()
+        dBaseline = oStore.load("pingsweep", sTarget)
+        fNow = time.time()
+
+        dShards = {}
+        lstErrors = []
+        iFull = 0
+        with ThreadPoolExecutor(max_workers=min(iWorkers, len(lstShards))) as oPool:
+            dFutures = {
+                oPool.submit(inCurrentScope(refreshShard), sShard, dBaseline.get(sShard), fFullInterval, fTimeout): sShard
+                for sShard in lstShards
+            }
+            for oFuture in as_completed(dFutures):
+                sShard = dFutures[oFuture]
+                dPrevious = dBaseline.get(sShard)
+                try:
+                    lstHosts, bFull = oFuture.result()
+                except subprocess.TimeoutExpired:
+                    lstErrors.append({"shard": sShard, "error": f"timed out after {fTimeout:g}s"})
+                    lstHosts, bFull = None, False
+                except Exception as e:
+                    lstErrors.append({"shard": sShard, "error": str(e)})
+                    lstHosts, bFull = None, False
+
+                if lstHosts is None:
+                    # Keep the old baseline so a failed shard is not reported as removed
+                    if dPrevious:
+                        dShards[sShard] = dPrevious
+                    continue
+
+                iFull += int(bFull)
+                dShards[sShard] = {
+                    "scanned": fNow,
+                    "full_scan": fNow if bFull or not dPrevious else dPrevious["full_scan"],
+                    "changed": hasChanges(diffRecords(dPrevious["records"] if dPrevious else [], lstHosts, sweepKey)),
+                    "records": lstHosts
+                }
+
+        lstOld = [dHost for dShard in dBaseline.values() for dHost in dShard["records"]]
+        lstNew = [dHost for sShard in lstShards if sShard in dShards for dHost in dShards[sShard]["records"]]
+        dResult = diffRecords(lstOld, lstNew, sweepKey)
+        dResult["previous_scan"] = max((dShard["scanned"] for dShard in dBaseline.values()), default=None)
+        dResult["shards"] = {"full": iFull, "quick": len(dShards) - iFull}
+        if lstErrors:
+            dResult["errors"] = lstErrors
+        oStore.save("pingsweep", sTarget, dShards)
+        return dResult
+    except Exception as e:
+        return {"error": str(e)}
+
+def portscanDiff(sTarget: str, sPorts="1-1000") -> dict:
+    """
+    Port scan sTarget and report only the open ports that were added, removed or
+    changed since the previous diff-mode scan with the same target and ports.
+    Used by the dispatcher's --diff mode.
+    Units of a checkpointed scan that failed (see portscan) keep their previous
+    ports, both in the comparison and in the saved baseline, and are listed under
+    "errors", so their ports are not reported as removed and then added again.
+    """
+    dScan = portscan(sTarget, sPorts)
+    if "error" in dScan:
+        return dScan
+
+    sKey = f"{sTarget.strip()} -p {sPorts.strip()}"
+    oStore = getBaselineStore()
+    dBaseline = oStore.load("portscan", sKey).get("")
+    lstOld = dBaseline["records"] if dBaseline else []
+    lstPorts = dScan["ports_open"]
+    lstErrors = dScan.get("errors") or []
+    if lstErrors:
+        lstFailed = [ipaddress.ip_network(dError["shard"], strict=False) for dError in lstErrors]
+        lstPorts = list(lstPorts) + [
+            dRecord for dRecord in lstOld
+            if any(ipaddress.ip_address(dRecord["ip"]) in oUnit for oUnit in lstFailed)
+        ]
+    dResult = diffRecords(lstOld, lstPorts, portKey)
+    dResult["previous_scan"] = dBaseline["scanned"] if dBaseline else None
+    if lstErrors:
+        dResult["errors"] = lstErrors
+
+    fNow = time.time()
+    oStore.save("portscan", sKey, {"": {
+        "scanned": fNow,
+        "full_scan": fNow,
+        "changed": hasChanges(dResult),
+        "records": lstPorts
+    }})
+    return dResult
+
+def scheduler() -> dict:
+    """
+    Report the scan scheduler's current budgets and counters (see scheduler.py), e.g.
+    {"scale": 0.8, "max_pps": 800.0, "max_hosts": 204, "template": 4, "queued": 0, ...}.
+    """
+    dStats = getSchedulerStats()
+    if dStats is None:
+        return {"error": "The scan scheduler is disabled (scheduler.enabled in fluxcli.yaml)."}
+    return dStats
@@ -0,0 +1,120 @@
+"""
+parser.py - Incremental parser for nmap's XML output (nmap -oX -).
+
+Hosts are parsed with xml.etree's pull parser and yielded one at a time as
+soon as their closing </host> tag has been read. Each finished <host> element
+is discarded from the tree, so parsing is linear in the size of the output and
+memory stays bounded by a single host block, however large the scan is.
+Hosts and ports are compact records (see records.py), not dicts.
+"""
+
+import time
+import xml.etree.ElementTree as ET
+from ...utils.timings import addPhase
+from ...records import HostRecord, PortRecord, internText
+
+__all__ = ["iterHosts", "iterHostsFromChunks", "parseHostElement"]
+
+_CHUNK_SIZE_ = 65536
+
+def parseHostElement(oHost) -> HostRecord:
+    """
+    Convert a finished <host> element into a host record (see records.py),
+    which reads like:
+    {
+      "ip": "192.168.1.1",
+      "hostname": "rabbit.hole.net",     # None without reverse DNS
+      "mac": "C4:41:1E:0E:70:21",        # None when nmap did not report one
+      "vendor": "Belkin International",  # None when unknown
+      "status": "up",
+      "latency": 0.0012,                 # smoothed RTT in seconds, or None
+      "ports": [
+        {"ip": "192.168.1.1", "port": 22, "protocol": "tcp", "state": "open", "service": "ssh"}
+      ]
+    }
+    """
+    oRecord = HostRecord()
+    lstPorts = oRecord.ports
+
+    for oChild in oHost:
+        sTag = oChild.tag
+        if sTag == "address":
+            sType = oChild.get("addrtype")
+            if sType == "mac":
+                oRecord.mac = oChild.get("addr")
+                oRecord.vendor = internText(oChild.get("vendor"))
+            elif oRecord._ip is None:
+                oRecord.ip = oChild.get("addr")
+        elif sTag == "status":
+            oRecord.status = internText(oChild.get("state"))
+        elif sTag == "hostnames":
+            oName = oChild.find("hostname")
+            if oName is not None:
+                oRecord.hostname = oName.get("name")
+        elif sTag == "times":
+            sSrtt = oChild.get("srtt")
+            if sSrtt and sSrtt.lstrip("-").isdigit() and int(sSrtt) >= 0:
+                # nmap reports srtt in microseconds
+                oRecord.latency = int(sSrtt) / 1000000.0
+        elif sTag == "ports":
+            for oPort in oChild.iter("port"):
+                oState = oPort.find("state")
+                oService = oPort.find("service")
+                lstPorts.append(PortRecord(
+                    None,
+                    int(oPort.get("portid")),
+                    oPort.get("protocol"),
+                    oState.get("state") if oState is not None else None,
+                    oService.get("name") if oService is not None else None
+                ))
+
+    # The address is normally listed before the ports, but nmap does not promise that
+    for oPort in lstPorts:
+        oPort._ip = oRecord._ip
+    return oRecord
+
+def iterHostsFromChunks(iterChunks):
+    """
+    Yield host records (see parseHostElement) from an iterable of XML byte chunks.
+    Chunk boundaries do not need to line up with elements.
+    Time spent parsing (not waiting for chunks or for the consumer) is reported
+    as the 'parse' phase when timings are recorded (see utils/timings.py).
+    """
+    oParser = ET.XMLPullParser(events=("start", "end"))
+    oRoot = None
+    fParse = 0.0
+    try:
+        for bChunk in iterChunks:
+            fStart = time.perf_counter()
+            oParser.feed(bChunk)
+            for sEvent, oElem in oParser.read_events():
+                if oRoot is None and sEvent == "start":
+                    oRoot = oElem
+                elif sEvent == "end" and oElem.tag == "host":
+                    dHost = parseHostElement(oElem)
+                    # Drop everything parsed so far; only the current host was needed
+                    oRoot.clear()
+                    fParse += time.perf_counter() - fStart
+                    yield dHost
+                    fStart = time.perf_counter()
+            fParse += time.perf_counter() - fStart
+        oParser.close()
+    finally:
+        addPhase("parse", fParse)
+
+def iterHosts(fStream):
+    """
+    Yield host records from a binary file-like object containing nmap XML.
+    Uses read1() when available so records from a pipe are yielded as soon as
+    nmap writes them instead of waiting for a full buffer.
+    """
+    funcRead = getattr(fStream, "read1", fStream.read)
+
+    def iterChunks():
+        while True:
+            bChunk = funcRead(_CHUNK_SIZE_)
+            if not bChunk:
+                return
+            yield bChunk
+
+    yield from iterHostsFromChunks(iterChunks())
@@ -0,0 +1,480 @@
+"""
+scheduler.py - Adaptive pacing for nmap runs.
+
+Every nmap process started by this module first takes a lease from the
+process-wide ScanScheduler, which paces it against two global budgets
+shared by all concurrent scans (shards, --targets-file targets, background
+jobs, daemon clients):
+    max_pps     packets per second (nmap --max-rate), divided evenly between
+                the scans running when a scan starts: a scan on its own gets
+                all of it. nmap keeps the rate it was started with, so scans
+                started next to an earlier one can take the total above
+                max_pps until that one finishes.
+    max_hosts   hosts scanned in parallel (nmap --max-hostgroup); a scan of
+                more hosts than that gets half of the budget
+Scans waiting for budget sit in a priority queue; by default smaller targets
+go first, so many independent targets finish as early as possible.
+A scan whose records are handed to a consumer one at a time (--stream,
+pipelines) gives its hosts back while the consumer holds a record and takes
+them again before reading on, so a scan held up by a slow or blocked consumer
+(e.g. a pipeline stage waiting for its own leases) never blocks other scans;
+nmap itself stalls meanwhile, once its output pipe is full.
+
+The budgets are scaled by a congestion factor that adapts to what the scans
+observe (additive increase, multiplicative decrease): it starts at the full
+budgets, grows back after each healthy scan and is halved when a scan times
+out, loses known hosts, or reports round-trip times well above the best seen
+so far. The nmap timing template (-T2..-T4) and probe parallelism follow the
+same factor.
+Budgets and what was learned are per process: under 'fluxcli serve' they
+are shared by every call the daemon runs. When the module runs isolated in
+worker processes (see workerpool.py), the workers take their leases from
+the scheduler of the process that owns them (LeaseService), so the budgets
+stay global to it as well.
+
+Settings (fluxcli.yaml):
+    scheduler:
+      enabled: true
+      max_pps: 1000       # 0 = no rate limit
+      max_hosts: 1024
+      template: auto      # auto, or a fixed nmap timing template 0-5
+"""
+
+import time
+import heapq
+import itertools
+import threading
+import ipaddress
+import subprocess
+from contextlib import contextmanager
+from ...settings import loadUserSettings
+from ...utils.timings import addCount
+from ...workerpool import WorkerService, inWorkerProcess, callParent
+
+__all__ = ["ScanScheduler", "ScanLease", "LeaseService", "getScheduler", "scanLease", "getSchedulerStats"]
+
+_DEFAULT_MAX_PPS_ = 1000
+_DEFAULT_MAX_HOSTS_ = 1024
+
+# Probes in flight per scan at full scale (nmap --max-parallelism)
+_MAX_PARALLELISM_ = 256
+
+# Congestion factor: starting point, floor, and additive step after a healthy scan
+_INITIAL_SCALE_ = 1.0
+_MIN_SCALE_ = 0.05
+_SCALE_STEP_ = 0.1
+
+# A scan is congested if its median RTT exceeds the baseline by this factor (and
+# by at least _LATENCY_SLACK_ seconds), or more than _LOSS_LIMIT_ of known hosts stay silent
+_LATENCY_FACTOR_ = 2.0
+_LATENCY_SLACK_ = 0.005
+_LOSS_LIMIT_ = 0.1
+
+# Lowest --max-rate handed to a single scan
+_MIN_RATE_ = 10
+
+# Where worker processes take their leases (see LeaseService)
+_LEASE_SERVICE_ = f"{__name__}:LeaseService"
+
+def countAddresses(lstTargets) -> int:
+    """
+    Return the number of addresses covered by lstTargets (networks, addresses or
+    anything else nmap accepts; unparsable targets count as one host).
+    """
+    iCount = 0
+    for sTarget in lstTargets:
+        try:
+            iCount += ipaddress.ip_network(sTarget, strict=False).num_addresses
+        except ValueError:
+            iCount += 1
+    return iCount
+
+class ScanLease:
+    """
+    Permission to run one nmap scan, with the pacing options it must use.
+    Scans report what they saw through observe() so the scheduler can adapt.
+    """
+
+    def __init__(self, iHosts: int = 0, fRate=None, iParallelism=None, iTemplate=None, iExpected=None):
+        self.iHosts = iHosts
+        self.fRate = fRate
+        self.iParallelism = iParallelism
+        self.iTemplate = iTemplate
+        self.iExpected = iExpected
+        self.iAnswered = 0
+        self.lstLatencies = []
+        self.bFailed = False
+        self.bAborted = False
+        self.bSuspended = False
+        self.bReleased = False
+        self.oScheduler = None
+
+    def nmapArgs(self) -> list:
+        """
+        Return the nmap options that keep the scan within its lease.
+        """
+        lstArgs = []
+        if self.iTemplate is not None:
+            lstArgs.append(f"-T{self.iTemplate}")
+        if self.fRate is not None:
+            lstArgs += ["--max-rate", f"{self.fRate:.0f}"]
+        if self.iHosts:
+            lstArgs += ["--max-hostgroup", str(self.iHosts)]
+        if self.iParallelism is not None:
+            lstArgs += ["--max-parallelism", str(self.iParallelism)]
+        return lstArgs
+
+    def suspend(self) -> None:
+        """
+        Give the lease's hosts back while the scan waits for its consumer.
+        """
+        if self.oScheduler is not None:
+            self.oScheduler.suspend(self)
+
+    def resume(self) -> None:
+        """
+        Take the hosts of a suspended lease again, waiting for room if needed.
+        """
+        if self.oScheduler is not None:
+            self.oScheduler.resume(self)
+
+    def observe(self, dHost) -> None:
+        """
+        Record a parsed host (see parser.py) of the scan.
+        """
+        if dHost.get("status") == "up":
+            self.iAnswered += 1
+            if dHost.get("latency") is not None:
+                self.lstLatencies.append(dHost["latency"])
+
+class ScanScheduler:
+    """
+    Admits nmap scans against global packets-per-second and concurrent-host
+    budgets, in priority order, and adapts the budgets to observed latency and loss.
+    """
+
+    def __init__(self, fMaxPps: float = _DEFAULT_MAX_PPS_, iMaxHosts: int = _DEFAULT_MAX_HOSTS_, oTemplate="auto"):
+        self.fMaxPps = float(fMaxPps or 0)
+        self.iMaxHosts = max(1, int(iMaxHosts))
+        self.iTemplate = None if str(oTemplate).lower() == "auto" else min(5, max(0, int(oTemplate)))
+        self.oCond = threading.Condition()
+        self.lstQueue = []
+        self.oSequence = itertools.count()
+        self.iActiveHosts = 0
+        self.iActiveScans = 0
+        self.fScale = _INITIAL_SCALE_
+        self.fBaseline = None
+        self.dStats = {"admitted": 0, "congested": 0, "healthy": 0, "waited": 0.0}
+
+    def hostBudget(self) -> int:
+        return max(1, int(self.iMaxHosts * self.fScale))
+
+    def template(self) -> int:
+        if self.iTemplate is not None:
+            return self.iTemplate
+        if self.fScale >= 0.75:
+            return 4
+        return 3 if self.fScale >= 0.3 else 2
+
+    def acquire(self, lstTargets, iPriority=None, iExpected=None) -> ScanLease:
+        """
+        Wait until the scan of lstTargets fits in the budgets and return its ScanLease,
+        to be given back with release(). See lease() for the parameters.
+        """
+        iAddresses = max(1, countAddresses(lstTargets))
+        oTicket = object()
+        fStart = time.perf_counter()
+        with self.oCond:
+            heapq.heappush(self.lstQueue, (iAddresses if iPriority is None else iPriority, next(self.oSequence), oTicket))
+            try:
+                while True:
+                    iBudget = self.hostBudget()
+                    # A target larger than the budget only gets half of it, so smaller scans
+                    # (e.g. per-host pipeline stages fed by this one) always find room
+                    iHosts = iAddresses if iAddresses <= iBudget else max(1, iBudget // 2)
+                    if self.lstQueue[0][2] is oTicket and self.iActiveHosts + iHosts <= iBudget:
+                        break
+                    self.oCond.wait()
+            except BaseException:
+                self.lstQueue = [oItem for oItem in self.lstQueue if oItem[2] is not oTicket]
+                heapq.heapify(self.lstQueue)
+                self.oCond.notify_all()
+                raise
+            heapq.heappop(self.lstQueue)
+            self.iActiveHosts += iHosts
+            self.iActiveScans += 1
+            self.dStats["admitted"] += 1
+            self.dStats["waited"] += time.perf_counter() - fStart
+            # The rate is shared between the scans running now, this one included
+            oLease = ScanLease(
+                iHosts,
+                max(_MIN_RATE_, self.fMaxPps * self.fScale / self.iActiveScans) if self.fMaxPps else None,
+                max(1, int(_MAX_PARALLELISM_ * self.fScale)),
+                self.template(),
+                iExpected
+            )
+            oLease.oScheduler = self
+            # The next scan in line may fit alongside this one
+            self.oCond.notify_all()
+        return oLease
+
+    def release(self, oLease: ScanLease) -> None:
+        """
+        Give back a lease from acquire() and learn from what its scan observed.
+        """
+        with self.oCond:
+            if not oLease.bSuspended:
+                self.iActiveHosts -= oLease.iHosts
+            oLease.bReleased = True
+            self.iActiveScans -= 1
+            self.adapt(oLease)
+            self.oCond.notify_all()
+
+    @contextmanager
+    def lease(self, lstTargets, iPriority=None, iExpected=None):
+        """
+        Wait until the scan of lstTargets fits in the budgets and yield its ScanLease.
+        Lower iPriority values are admitted first (default: the number of addresses).
+        iExpected is the number of hosts known to be up, if any; silent ones count as loss.
+        A subprocess.TimeoutExpired raised in the block counts as congestion.
+        """
+        oLease = self.acquire(lstTargets, iPriority, iExpected)
+        try:
+            yield oLease
+        except subprocess.TimeoutExpired:
+            oLease.bFailed = True
+            raise
+        except BaseException:
+            # Cancelled, closed early or broken: says nothing about the network
+            oLease.bAborted = True
+            raise
+        finally:
+            self.release(oLease)
+
+    def suspend(self, oLease: ScanLease) -> None:
+        """
+        Release the hosts of oLease until resume() is called.
+        """
+        with self.oCond:
+            if not (oLease.bSuspended or oLease.bReleased):
+                oLease.bSuspended = True
+                self.iActiveHosts -= oLease.iHosts
+                self.oCond.notify_all()
+
+    def resume(self, *lstLeases) -> None:
+        """
+        Take back the hosts of suspended leases, all at once so that a caller
+        never waits while holding part of them. Scans already under way go
+        ahead of queued ones; they only wait for the budget to have room, or to
+        be idle if the budget has shrunk below the leases since they were granted.
+        """
+        with self.oCond:
+            fStart = time.perf_counter()
+            while True:
+                lstSuspended = [oLease for oLease in lstLeases if oLease.bSuspended and not oLease.bReleased]
+                iHosts = sum(oLease.iHosts for oLease in lstSuspended)
+                if not self.iActiveHosts or self.iActiveHosts + iHosts <= self.hostBudget():
+                    break
+                self.oCond.wait()
+            for oLease in lstSuspended:
+                oLease.bSuspended = False
+            self.iActiveHosts += iHosts
+            self.dStats["waited"] += time.perf_counter() - fStart
+
+    def adapt(self, oLease: ScanLease) -> None:
+        """
+        Update the congestion factor from a finished scan. Called with oCond held.
+        """
+        if oLease.bAborted:
+            return
+        bCongested = oLease.bFailed
+        if oLease.lstLatencies:
+            lstSorted = sorted(oLease.lstLatencies)
+            fMedian = lstSorted[len(lstSorted) // 2]
+            if self.fBaseline is None or fMedian < self.fBaseline:
+                self.fBaseline = fMedian
+            else:
+                # Let the baseline drift up slowly, in case the path itself changed
+                if fMedian > self.fBaseline * _LATENCY_FACTOR_ and fMedian - self.fBaseline > _LATENCY_SLACK_:
+                    bCongested = True
+                self.fBaseline += (fMedian - self.fBaseline) * 0.05
+        if oLease.iExpected:
+            fLoss = 1.0 - min(oLease.iAnswered, oLease.iExpected) / oLease.iExpected
+            bCongested = bCongested or fLoss > _LOSS_LIMIT_
+
+        if bCongested:
+            self.fScale = max(_MIN_SCALE_, self.fScale / 2.0)
+            self.dStats["congested"] += 1
+            addCount("scheduler_backoffs", 1)
+        else:
+            self.fScale = min(1.0, self.fScale + _SCALE_STEP_)
+            self.dStats["healthy"] += 1
+
+    def stats(self) -> dict:
+        """
+        Return the current budgets and counters.
+        """
+        with self.oCond:
+            return dict(
+                self.dStats,
+                scale=round(self.fScale, 3),
+                max_pps=self.fMaxPps * self.fScale if self.fMaxPps else None,
+                max_hosts=self.hostBudget(),
+                template=self.template(),
+                baseline_rtt=self.fBaseline,
+                active_scans=self.iActiveScans,
+                active_hosts=self.iActiveHosts,
+                queued=len(self.lstQueue)
+            )
+
+_SCHEDULER_ = None
+_SCHEDULER_LOCK_ = threading.Lock()
+
+def getScheduler():
+    """
+    Return the process-wide ScanScheduler, or None if it is disabled in the settings.
+    """
+    global _SCHEDULER_
+    if _SCHEDULER_ is None:
+        with _SCHEDULER_LOCK_:
+            if _SCHEDULER_ is None:
+                dSettings = loadUserSettings().get("scheduler") or {}
+                if not dSettings.get("enabled", True):
+                    _SCHEDULER_ = False
+                else:
+                    _SCHEDULER_ = ScanScheduler(
+                        dSettings.get("max_pps", _DEFAULT_MAX_PPS_),
+                        dSettings.get("max_hosts", _DEFAULT_MAX_HOSTS_),
+                        dSettings.get("template", "auto")
+                    )
+    return _SCHEDULER_ or None
+
+class LeaseService(WorkerService):
+    """
+    The scheduler leases of one isolated call, held in the parent process on
+    behalf of its worker (see parentLease). While the caller holds a batch of
+    the call's records, its leases are suspended, as iterNmapHosts does.
+    Leases still held when the call ends are given back as aborted.
+    """
+
+    def __init__(self):
+        self.dLeases = {}
+        self.oIds = itertools.count()
+        self.oLock = threading.Lock()
+        self.bClosed = False
+        self.bSuspended = False
+
+    def acquire(self, lstTargets, iPriority=None, iExpected=None):
+        """
+        Wait for a lease and return (lease id, iHosts, fRate, iParallelism,
+        iTemplate), or None when the scheduler is disabled.
+        """
+        oScheduler = getScheduler()
+        if oScheduler is None:
+            return None
+        oLease = oScheduler.acquire(lstTargets, iPriority, iExpected)
+        with self.oLock:
+            if not self.bClosed:
+                iId = next(self.oIds)
+                self.dLeases[iId] = oLease
+                if self.bSuspended:
+                    # Counted again when the caller takes the next batch
+                    oLease.suspend()
+                return iId, oLease.iHosts, oLease.fRate, oLease.iParallelism, oLease.iTemplate
+        oLease.bAborted = True
+        oScheduler.release(oLease)
+        raise RuntimeError("The scan was stopped.")
+
+    def release(self, iId: int, bFailed: bool, bAborted: bool, iAnswered: int, lstLatencies) -> None:
+        """
+        Give back a lease with what its scan observed.
+        """
+        with self.oLock:
+            oLease = self.dLeases.pop(iId, None)
+        if oLease is None:
+            return
+        oLease.bFailed = bFailed
+        oLease.bAborted = bAborted
+        oLease.iAnswered = iAnswered
+        oLease.lstLatencies = list(lstLatencies)
+        oLease.oScheduler.release(oLease)
+
+    def stats(self):
+        return getSchedulerStats()
+
+    def suspend(self) -> None:
+        with self.oLock:
+            self.bSuspended = True
+            for oLease in self.dLeases.values():
+                oLease.suspend()
+
+    def resume(self) -> None:
+        while True:
+            with self.oLock:
+                lstLeases = [oLease for oLease in self.dLeases.values() if oLease.bSuspended]
+                if not lstLeases:
+                    self.bSuspended = False
+                    return
+            lstLeases[0].oScheduler.resume(*lstLeases)
+
+    def close(self) -> None:
+        with self.oLock:
+            self.bClosed = True
+            lstLeases = list(self.dLeases.values())
+            self.dLeases = {}
+        for oLease in lstLeases:
+            oLease.bAborted = True
+            oLease.oScheduler.release(oLease)
+
+@contextmanager
+def parentLease(lstTargets, iPriority=None, iExpected=None):
+    """
+    scanLease() in a worker process: the lease is held by the parent's
+    scheduler (see LeaseService) and given back with what the scan observed.
+    """
+    tupGrant = callParent(_LEASE_SERVICE_, "acquire", list(lstTargets), iPriority, iExpected)
+    if tupGrant is None:
+        yield ScanLease()
+        return
+    iId, iHosts, fRate, iParallelism, iTemplate = tupGrant
+    oLease = ScanLease(iHosts, fRate, iParallelism, iTemplate, iExpected)
+    try:
+        yield oLease
+    except subprocess.TimeoutExpired:
+        oLease.bFailed = True
+        raise
+    except BaseException:
+        oLease.bAborted = True
+        raise
+    finally:
+        try:
+            callParent(_LEASE_SERVICE_, "release", iId, oLease.bFailed, oLease.bAborted, oLease.iAnswered, oLease.lstLatencies)
+        except (OSError, EOFError):
+            # The parent is gone or has ended the call; it gives the lease back itself
+            pass
+
+@contextmanager
+def scanLease(lstTargets, iPriority=None, iExpected=None):
+    """
+    ScanScheduler.lease() on the process-wide scheduler (the parent's, in a
+    worker process); yields an unrestricted lease when the scheduler is disabled.
+    """
+    if inWorkerProcess():
+        with parentLease(lstTargets, iPriority, iExpected) as oLease:
+            yield oLease
+        return
+    oScheduler = getScheduler()
+    if oScheduler is None:
+        yield ScanLease()
+        return
+    with oScheduler.lease(lstTargets, iPriority, iExpected) as oLease:
+        yield oLease
+
+def getSchedulerStats():
+    """
+    Return the scheduler's budgets and counters, or None if it is disabled.
+    """
+    if inWorkerProcess():
+        return callParent(_LEASE_SERVICE_, "stats")
+    oScheduler = getScheduler()
+    return oScheduler.stats() if oScheduler else None
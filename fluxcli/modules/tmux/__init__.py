@@ -0,0 +1,4 @@
+"""
+__init__.py for the 'tmux' module package.
+This can be empty or can import objects if desired.
+"""
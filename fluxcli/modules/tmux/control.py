@@ -0,0 +1,209 @@
+"""
+control.py - Persistent tmux control-mode connection.
+
+Instead of forking a 'tmux' process per command, the module keeps one
+'tmux -C' client attached to a small dedicated session (_fluxcli by default)
+and writes commands to its stdin. tmux answers every command line with a
+block on stdout:
+
+    %begin <time> <command-number> <flags>
+    ...output lines...
+    %end <time> <command-number> <flags>      (or %error ... on failure)
+
+Replies arrive in the order the commands were sent, so a reader thread
+completes a FIFO of futures; any number of threads can share the connection
+and pipeline commands (see ControlClient.commands). Asynchronous
+notifications (%window-add, %sessions-changed, ...) are ignored and pane
+output notifications are switched off.
+
+The connection is opened on first use and reopened if tmux goes away.
+
+Settings (fluxcli.yaml):
+    tmux:
+      socket_name: null          # tmux -L <name>; null = the default server
+      control_session: _fluxcli  # session the control client attaches to
+      timeout: 5                 # seconds to wait for a reply
+"""
+
+import atexit
+import threading
+import subprocess
+from collections import deque
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from ...settings import loadUserSettings
+from ...utils.runner import getSpawnOptions
+from ...utils.timings import addCount
+
+__all__ = ["TmuxError", "ControlClient", "getControlClient", "quoteArg"]
+
+_DEFAULT_SESSION_ = "_fluxcli"
+_DEFAULT_TIMEOUT_ = 5.0
+
+# Characters escaped inside a double-quoted tmux argument
+_ESCAPES_ = {"\\": "\\\\", "\"": "\\\"", "$": "\\$", "\n": "\\n", "\r": "\\r", "\t": "\\t"}
+
+class TmuxError(Exception):
+    """
+    A tmux command failed, or the control connection is unavailable.
+    """
+
+def quoteArg(sArg) -> str:
+    """
+    Quote one argument for a tmux command line, so it reaches the command
+    verbatim (no ';' splitting, '$' expansion or '~' substitution).
+    """
+    return "\"" + "".join(_ESCAPES_.get(sChar, sChar) for sChar in str(sArg)) + "\""
+
+class ControlClient:
+    """
+    One 'tmux -C' client process and the reader thread that matches its replies to commands.
+    """
+
+    def __init__(self, lstTmux, sSession: str = _DEFAULT_SESSION_, fTimeout: float = _DEFAULT_TIMEOUT_):
+        self.fTimeout = fTimeout
+        self.oLock = threading.Lock()
+        self.dqPending = deque()
+        self.bClosed = False
+        try:
+            self.oProc = subprocess.Popen(
+                [*lstTmux, "-C", "new-session", "-A", "-s", sSession, "-x", "80", "-y", "24"],
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL,
+                **getSpawnOptions()
+            )
+        except OSError as e:
+            raise TmuxError(f"Failed to start tmux: {e}")
+        self.oReader = threading.Thread(target=self._read, name="fluxcli-tmux", daemon=True)
+        self.oReader.start()
+        try:
+            # Pane output would otherwise be copied to this client as %output notifications
+            self.command("refresh-client", "-f", "no-output")
+        except TmuxError:
+            # Older tmux without client flags; the notifications are dropped by the reader
+            if self.bClosed:
+                raise
+
+    def _read(self) -> None:
+        lstLines = None
+        sEnd = None
+        bOurs = False
+        for bLine in self.oProc.stdout:
+            sLine = bLine.decode("utf-8", "replace").rstrip("\r\n")
+            if lstLines is None:
+                if sLine.startswith("%begin "):
+                    lstParts = sLine.split(" ")
+                    lstLines = []
+                    sEnd = " ".join(lstParts[1:])
+                    # Flag 1 marks replies to commands sent by this client
+                    bOurs = len(lstParts) > 3 and int(lstParts[3]) & 1 == 1
+                continue
+            sTag, _, sRest = sLine.partition(" ")
+            if sTag in ("%end", "%error") and sRest == sEnd:
+                if bOurs:
+                    with self.oLock:
+                        oFuture = self.dqPending.popleft() if self.dqPending else None
+                    if oFuture is not None:
+                        if sTag == "%end":
+                            oFuture.set_result(lstLines)
+                        else:
+                            oFuture.set_exception(TmuxError("; ".join(lstLines) or "tmux command failed"))
+                lstLines = None
+            else:
+                lstLines.append(sLine)
+
+        with self.oLock:
+            self.bClosed = True
+            lstPending = list(self.dqPending)
+            self.dqPending.clear()
+        for oFuture in lstPending:
+            oFuture.set_exception(TmuxError("tmux control connection closed"))
+
+    def submit(self, *lstArgs) -> Future:
+        """
+        Send one tmux command (each argument is quoted) and return a Future of its output lines.
+        """
+        bLine = (" ".join(quoteArg(sArg) for sArg in lstArgs) + "\n").encode("utf-8")
+        oFuture = Future()
+        with self.oLock:
+            if self.bClosed:
+                raise TmuxError("tmux control connection closed")
+            self.dqPending.append(oFuture)
+            try:
+                self.oProc.stdin.write(bLine)
+                self.oProc.stdin.flush()
+            except OSError as e:
+                self.dqPending.pop()
+                self.bClosed = True
+                raise TmuxError(f"tmux control connection closed: {e}")
+        addCount("tmux_commands", 1)
+        return oFuture
+
+    def command(self, *lstArgs) -> list:
+        """
+        Run one tmux command and return its output lines. Raises TmuxError if it fails.
+        """
+        return self.wait(self.submit(*lstArgs))
+
+    def commands(self, lstCommands) -> list:
+        """
+        Send every command in lstCommands (lists of arguments) before waiting for any
+        reply, and return one entry per command: its output lines, or the TmuxError.
+        """
+        lstFutures = [self.submit(*lstArgs) for lstArgs in lstCommands]
+        lstResults = []
+        for oFuture in lstFutures:
+            try:
+                lstResults.append(self.wait(oFuture))
+            except TmuxError as e:
+                lstResults.append(e)
+        return lstResults
+
+    def wait(self, oFuture: Future) -> list:
+        try:
+            return oFuture.result(self.fTimeout)
+        except FutureTimeoutError:
+            raise TmuxError(f"tmux did not reply within {self.fTimeout:g}s")
+
+    def isAlive(self) -> bool:
+        return not self.bClosed and self.oProc.poll() is None
+
+    def close(self) -> None:
+        """
+        Detach the control client (the tmux server and its sessions keep running).
+        """
+        with self.oLock:
+            self.bClosed = True
+        try:
+            self.oProc.stdin.close()
+            self.oProc.wait(self.fTimeout)
+        except (OSError, subprocess.TimeoutExpired):
+            self.oProc.kill()
+
+# Kept when this file is hot-reloaded (see fluxcli/reloader.py), so the connection survives
+_CLIENT_ = globals().get("_CLIENT_")
+_CLIENT_LOCK_ = globals().get("_CLIENT_LOCK_") or threading.Lock()
+
+def getTmuxCommand() -> list:
+    """
+    Return the tmux command prefix for the configured server, e.g. ["tmux", "-L", "work"].
+    """
+    sSocket = (loadUserSettings().get("tmux") or {}).get("socket_name")
+    return ["tmux", "-L", str(sSocket)] if sSocket else ["tmux"]
+
+def getControlSession() -> str:
+    return str((loadUserSettings().get("tmux") or {}).get("control_session") or _DEFAULT_SESSION_)
+
+def getControlClient() -> ControlClient:
+    """
+    Return the process-wide ControlClient, connecting (or reconnecting) as needed.
+    Raises TmuxError if tmux cannot be started.
+    """
+    global _CLIENT_
+    with _CLIENT_LOCK_:
+        if _CLIENT_ is None or not _CLIENT_.isAlive():
+            dSettings = loadUserSettings().get("tmux") or {}
+            if _CLIENT_ is None:
+                atexit.register(lambda: _CLIENT_ and _CLIENT_.close())
+            _CLIENT_ = ControlClient(getTmuxCommand(), getControlSession(), float(dSettings.get("timeout", _DEFAULT_TIMEOUT_)))
+        return _CLIENT_
@@ -0,0 +1,233 @@
+import os
+from .control import getControlClient, getControlSession, TmuxError
+
+# Fields reported for each object, as (record key, tmux format variable, converter)
+_SESSION_FIELDS_ = [
+    ("id", "session_id", str),
+    ("name", "session_name", str),
+    ("windows", "session_windows", int),
+    ("attached", "session_attached", int),
+    ("created", "session_created", int),
+    ("path", "session_path", str)
+]
+_WINDOW_FIELDS_ = [
+    ("id", "window_id", str),
+    ("session", "session_name", str),
+    ("index", "window_index", int),
+    ("name", "window_name", str),
+    ("active", "window_active", bool),
+    ("panes", "window_panes", int),
+    ("width", "window_width", int),
+    ("height", "window_height", int)
+]
+_PANE_FIELDS_ = [
+    ("id", "pane_id", str),
+    ("session", "session_name", str),
+    ("window", "window_index", int),
+    ("index", "pane_index", int),
+    ("active", "pane_active", bool),
+    ("pid", "pane_pid", int),
+    ("command", "pane_current_command", str),
+    ("path", "pane_current_path", str),
+    ("width", "pane_width", int),
+    ("height", "pane_height", int),
+    ("dead", "pane_dead", bool)
+]
+
+# Size of sessions created by fanout, so a useful number of panes fits in one window
+_FANOUT_WIDTH_ = 240
+_FANOUT_HEIGHT_ = 64
+
+def getFormat(lstFields) -> str:
+    return "\t".join(f"#{{{sVariable}}}" for _, sVariable, _ in lstFields)
+
+def toValue(sValue: str, funcConvert):
+    if funcConvert is bool:
+        return sValue == "1"
+    if funcConvert is int:
+        return int(sValue) if sValue.lstrip("-").isdigit() else None
+    return sValue
+
+def listObjects(lstCommand, lstFields) -> list:
+    """
+    Run a tmux list command with a tab-separated format for lstFields and
+    return one record per output line.
+    """
+    lstRecords = []
+    for sLine in getControlClient().command(*lstCommand, "-F", getFormat(lstFields)):
+        lstValues = sLine.split("\t")
+        if len(lstValues) == len(lstFields):
+            lstRecords.append({
+                sKey: toValue(sValue, funcConvert)
+                for (sKey, _, funcConvert), sValue in zip(lstFields, lstValues)
+            })
+    return lstRecords
+
+def sessions() -> dict:
+    """
+    List tmux sessions, e.g.
+    {"sessions": [{"id": "$1", "name": "work", "windows": 2, "attached": 1, "created": 1700000000, "path": "/root"}]}.
+    The session hosting FluxCLI's control connection is left out.
+    """
+    try:
+        sControl = getControlSession()
+        return {"sessions": [
+            dSession for dSession in listObjects(["list-sessions"], _SESSION_FIELDS_) if dSession["name"] != sControl
+        ]}
+    except TmuxError as e:
+        return {"error": str(e)}
+
+def windows(sSession=None) -> dict:
+    """
+    List the windows of sSession, or of every session.
+    Returns {"windows": [{"id": "@1", "session": "work", "index": 0, "name": "bash", ...}]}.
+    """
+    try:
+        lstCommand = ["list-windows", "-t", sSession] if sSession else ["list-windows", "-a"]
+        return {"windows": listObjects(lstCommand, _WINDOW_FIELDS_)}
+    except TmuxError as e:
+        return {"error": str(e)}
+
+def panes(sSession=None) -> dict:
+    """
+    List the panes of sSession, or of every session.
+    Returns {"panes": [{"id": "%3", "session": "work", "window": 0, "index": 1, "command": "bash", ...}]}.
+    """
+    try:
+        lstCommand = ["list-panes", "-s", "-t", sSession] if sSession else ["list-panes", "-a"]
+        return {"panes": listObjects(lstCommand, _PANE_FIELDS_)}
+    except TmuxError as e:
+        return {"error": str(e)}
+
+def send(sTarget: str, *lstWords) -> dict:
+    """
+    Type the words of a command line into pane sTarget and press Enter, e.g.
+    send work:0.1 nmap -sn 10.0.0.0/24.
+    """
+    sText = " ".join(lstWords)
+    try:
+        getControlClient().command("send-keys", "-t", sTarget, "-l", sText)
+        getControlClient().command("send-keys", "-t", sTarget, "Enter")
+        return {"target": sTarget, "sent": sText}
+    except TmuxError as e:
+        return {"error": str(e)}
+
+def sendkeys(sTarget: str, *lstKeys) -> dict:
+    """
+    Send tmux key names (C-c, Enter, Up, ...) or strings to pane sTarget, as 'tmux send-keys' does.
+    """
+    try:
+        getControlClient().command("send-keys", "-t", sTarget, *lstKeys)
+        return {"target": sTarget, "keys": list(lstKeys)}
+    except TmuxError as e:
+        return {"error": str(e)}
+
+def capture(sTarget: str, sLines="50") -> dict:
+    """
+    Return the last sLines lines of pane sTarget (joined where tmux wrapped them),
+    e.g. {"pane": "%3", "lines": ["$ nmap -sn 10.0.0.0/24", ...]}.
+    """
+    try:
+        lstLines = getControlClient().command("capture-pane", "-p", "-J", "-t", sTarget, "-S", f"-{int(sLines)}")
+        while lstLines and not lstLines[-1].strip():
+            lstLines.pop()
+        return {"pane": sTarget, "lines": lstLines}
+    except (TmuxError, ValueError) as e:
+        return {"error": str(e)}
+
+def newsession(sName: str, *lstCommand) -> dict:
+    """
+    Create a detached session sName, optionally running a command in it.
+    Returns the new session's record (see sessions).
+    """
+    try:
+        oClient = getControlClient()
+        oClient.command("new-session", "-d", "-s", sName, "-c", os.getcwd(), *([" ".join(lstCommand)] if lstCommand else []))
+        for dSession in listObjects(["list-sessions"], _SESSION_FIELDS_):
+            if dSession["name"] == sName:
+                return dSession
+        return {"name": sName}
+    except TmuxError as e:
+        return {"error": str(e)}
+
+def killsession(sName: str) -> dict:
+    """
+    Kill session sName and every process running in it.
+    """
+    try:
+        getControlClient().command("kill-session", "-t", sName)
+        return {"killed": sName}
+    except TmuxError as e:
+        return {"error": str(e)}
+
+def run(*lstArgs) -> dict:
+    """
+    Run any tmux command over the control connection and return its output lines,
+    e.g. run display-message -p '#{version}' -> {"output": ["3.3a"]}.
+    """
+    if not lstArgs:
+        return {"error": "Usage: run <tmux command> [args...]"}
+    try:
+        return {"output": getControlClient().command(*lstArgs)}
+    except TmuxError as e:
+        return {"error": str(e)}
+
+def addPane(oClient, sSession: str, sWindow):
+    """
+    Return (sWindow, sPane) for a new pane in sWindow, or in a new window of
+    sSession when sWindow is None or has no room left for another pane.
+    """
+    if sWindow is not None:
+        try:
+            sPane = oClient.command("split-window", "-d", "-t", sWindow, "-c", os.getcwd(), "-P", "-F", "#{pane_id}")[0]
+            oClient.command("select-layout", "-t", sWindow, "tiled")
+            return sWindow, sPane
+        except TmuxError:
+            # No space for another pane; continue in a new window
+            pass
+    sWindow, sPane = oClient.command(
+        "new-window", "-d", "-t", f"{sSession}:", "-c", os.getcwd(), "-P", "-F", "#{window_id}\t#{pane_id}"
+    )[0].split("\t")
+    return sWindow, sPane
+
+def fanout(sSession: str, sCommand: str, *lstTargets) -> dict:
+    """
+    Run sCommand once per target, each in its own pane of session sSession
+    (created if needed), e.g.
+        fanout scans "fluxcli nmap portscan {}" 10.0.0.1 10.0.0.2 10.0.0.3
+    '{}' in sCommand is replaced by the target; without it the target is appended.
+    Panes are tiled in new windows of the session, which grow as long as panes fit.
+    Returns {"session": ..., "panes": [{"pane": "%4", "window": "@2", "target": ..., "command": ...}]}.
+    """
+    if not lstTargets:
+        return {"error": "Usage: fanout <session> <command> <target> [target...]"}
+    try:
+        oClient = getControlClient()
+        lstPanes = []
+        sWindow = None
+        try:
+            oClient.command("has-session", "-t", f"={sSession}")
+        except TmuxError:
+            sWindow, sPane = oClient.command(
+                "new-session", "-d", "-s", sSession, "-x", str(_FANOUT_WIDTH_), "-y", str(_FANOUT_HEIGHT_),
+                "-c", os.getcwd(), "-P", "-F", "#{window_id}\t#{pane_id}"
+            )[0].split("\t")
+            lstPanes.append((sWindow, sPane))
+        while len(lstPanes) < len(lstTargets):
+            sWindow, sPane = addPane(oClient, sSession, sWindow if lstPanes else None)
+            lstPanes.append((sWindow, sPane))
+
+        lstRecords = []
+        lstCommands = []
+        for (sWindow, sPane), sTarget in zip(lstPanes, lstTargets):
+            sLine = sCommand.replace("{}", sTarget) if "{}" in sCommand else f"{sCommand} {sTarget}"
+            lstRecords.append({"pane": sPane, "window": sWindow, "target": sTarget, "command": sLine})
+            lstCommands += [["send-keys", "-t", sPane, "-l", sLine], ["send-keys", "-t", sPane, "Enter"]]
+        # All keystrokes go out in one batch; replies are collected afterwards
+        lstErrors = [str(oResult) for oResult in oClient.commands(lstCommands) if isinstance(oResult, TmuxError)]
+        dResult = {"session": sSession, "panes": lstRecords}
+        if lstErrors:
+            dResult["errors"] = lstErrors
+        return dResult
+    except TmuxError as e:
+        return {"error": str(e)}
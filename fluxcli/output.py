@@ -0,0 +1,284 @@
+"""
+output.py - Output encoders for module command results.
+
+Formats (chosen with --format, or output.format in fluxcli.yaml):
+    pretty    indented JSON (the default on a terminal)
+    json      compact JSON (the default when stdout is a pipe or file)
+    ndjson    one compact JSON record per line
+    csv       one row per record, header taken from the first record
+    raw       tab-separated values without a header, for grep/awk/cut
+    msgpack   a stream of MessagePack objects (needs the msgpack package)
+
+A result such as {"hosts": [...]} is written as a whole document in the
+JSON formats, and as one row per host in the record formats (ndjson, csv,
+raw, and --stream output); its "errors" list goes to stderr in that case.
+JSON is encoded with the json module by default and written to stdout in
+chunks, so large results are never duplicated in memory as one big string.
+output.json_backend: orjson (or auto, to use it only when installed) encodes
+with orjson instead; it is faster, but its text differs from the json module:
+floats keep their shortest decimal form (0.00001, not 1e-05) and non-ASCII
+characters are written as UTF-8 rather than \\u escapes. Compact records
+and record tables (see records.py) are encoded exactly like the dicts and
+lists they stand for.
+
+Settings (fluxcli.yaml):
+    output:
+      format: auto          # auto | pretty | json | ndjson | csv | raw | msgpack
+      json_backend: json    # json | orjson | auto (orjson when installed)
+"""
+
+import sys
+import csv
+import json
+from collections.abc import Mapping
+from .settings import loadUserSettings
+from .records import RecordTable, toJsonValue
+
+__all__ = ["getFormats", "resolveFormat", "getWriter", "iterRows", "dumpsJson"]
+
+_DEFAULT_FORMAT_ = "auto"
+
+# Characters buffered before a chunk of JSON is written out
+_CHUNK_SIZE_ = 65536
+
+# List items encoded per call when a large result is written in chunks
+_BATCH_ = 1024
+
+_ORJSON_ = None
+
+def getJsonBackend():
+    """
+    Return the orjson module if it should be used, otherwise None.
+    """
+    global _ORJSON_
+    if _ORJSON_ is None:
+        sBackend = (loadUserSettings().get("output") or {}).get("json_backend", "json")
+        _ORJSON_ = False
+        if sBackend in ("auto", "orjson"):
+            try:
+                import orjson
+                _ORJSON_ = orjson
+            except ImportError:
+                if sBackend == "orjson":
+                    print("[Warning] output.json_backend is 'orjson' but orjson is not installed; using json.")
+    return _ORJSON_ or None
+
+def dumpsJson(oValue, bPretty: bool = False) -> str:
+    """
+    Encode oValue as JSON text (compact, or indented by two spaces if bPretty).
+    """
+    oOrjson = getJsonBackend()
+    if oOrjson:
+        try:
+            return oOrjson.dumps(oValue, default=toJsonValue, option=oOrjson.OPT_INDENT_2 if bPretty else 0).decode("utf-8")
+        except TypeError:
+            # Types orjson refuses (e.g. non-string keys) still work with the json module
+            pass
+    if bPretty:
+        return json.dumps(oValue, indent=2, default=toJsonValue)
+    return json.dumps(oValue, separators=(",", ":"), default=toJsonValue)
+
+def iterJsonChunks(oResult, bPretty: bool = False):
+    """
+    Yield oResult as JSON text in pieces, producing the same document as
+    dumpsJson(oResult, bPretty). Long lists at the top level of a dict (e.g.
+    "hosts") are encoded _BATCH_ items at a time, so the full document is never
+    built as one string.
+    """
+    if not isinstance(oResult, dict) or not oResult:
+        yield dumpsJson(oResult, bPretty)
+        return
+    sIndent = "\n  " if bPretty else ""
+    yield "{"
+    for iKey, (sKey, oValue) in enumerate(oResult.items()):
+        yield ("," if iKey else "") + sIndent + dumpsJson(str(sKey)) + (": " if bPretty else ":")
+        if isinstance(oValue, (list, RecordTable)) and len(oValue) > _BATCH_:
+            yield "["
+            for iStart in range(0, len(oValue), _BATCH_):
+                if isinstance(oValue, RecordTable):
+                    lstBatch = oValue.toDicts(iStart, iStart + _BATCH_)
+                else:
+                    lstBatch = oValue[iStart:iStart + _BATCH_]
+                sBatch = dumpsJson(lstBatch, bPretty)
+                # Strip the batch's own brackets ("[\n  ...\n]" when indented) and nest it one level deeper
+                sItems = sBatch[1:-2].replace("\n", "\n  ") if bPretty else sBatch[1:-1]
+                yield ("," if iStart else "") + sItems
+            yield sIndent + "]" if bPretty else "]"
+        else:
+            sValue = dumpsJson(oValue, bPretty)
+            yield sValue.replace("\n", "\n  ") if bPretty else sValue
+    yield "\n}" if bPretty else "}"
+
+def iterRows(oResult):
+    """
+    Yield the records of a command result: the items of its single list of
+    records (e.g. "hosts" or "ports_open"), or the result itself otherwise.
+    Entries of an "errors" list are reported on stderr.
+    """
+    if isinstance(oResult, RecordTable):
+        yield from oResult.iterDicts()
+        return
+    if isinstance(oResult, list):
+        yield from oResult
+        return
+    if not isinstance(oResult, Mapping):
+        yield {"value": oResult}
+        return
+    lstKeys = [sKey for sKey, oValue in oResult.items() if sKey != "errors" and isinstance(oValue, (list, RecordTable))]
+    if len(lstKeys) != 1 or len(oResult) - ("errors" in oResult) != 1:
+        yield oResult
+        return
+    for oError in oResult.get("errors") or []:
+        sys.stderr.write(f"[Error] {json.dumps(oError)}\n")
+    yield from iterRows(oResult[lstKeys[0]])
+
+def toCell(oValue) -> str:
+    """
+    Render one field for csv/raw output; nested values become compact JSON.
+    """
+    if oValue is None:
+        return ""
+    if isinstance(oValue, (Mapping, list, RecordTable)):
+        return dumpsJson(oValue)
+    return str(oValue)
+
+class OutputWriter:
+    """
+    Base class of the encoders. writeResult() writes a buffered command result,
+    writeRecord() one record of a stream; close() finishes the output.
+    """
+
+    def __init__(self, fOut):
+        self.fOut = fOut
+
+    def writeResult(self, oResult) -> None:
+        for dRecord in iterRows(oResult):
+            self.writeRecord(dRecord)
+
+    def writeRecord(self, dRecord) -> None:
+        raise NotImplementedError
+
+    def close(self) -> None:
+        self.fOut.flush()
+
+class JsonWriter(OutputWriter):
+    """
+    'json' and 'pretty': whole results as one JSON document, streamed records as NDJSON.
+    """
+
+    def __init__(self, fOut, bPretty: bool):
+        super().__init__(fOut)
+        self.bPretty = bPretty
+
+    def writeResult(self, oResult) -> None:
+        lstChunks = []
+        iBuffered = 0
+        for sChunk in iterJsonChunks(oResult, self.bPretty):
+            lstChunks.append(sChunk)
+            iBuffered += len(sChunk)
+            if iBuffered >= _CHUNK_SIZE_:
+                self.fOut.write("".join(lstChunks))
+                lstChunks = []
+                iBuffered = 0
+        lstChunks.append("\n")
+        self.fOut.write("".join(lstChunks))
+
+    def writeRecord(self, dRecord) -> None:
+        self.fOut.write(dumpsJson(dRecord) + "\n")
+        self.fOut.flush()
+
+class NdjsonWriter(OutputWriter):
+    def writeRecord(self, dRecord) -> None:
+        self.fOut.write(dumpsJson(dRecord) + "\n")
+        self.fOut.flush()
+
+class CsvWriter(OutputWriter):
+    """
+    Columns are the keys of the first record; later keys not in it are dropped.
+    """
+
+    def __init__(self, fOut):
+        super().__init__(fOut)
+        self.oWriter = None
+        self.lstColumns = None
+
+    def writeRecord(self, dRecord) -> None:
+        if not isinstance(dRecord, Mapping):
+            dRecord = {"value": dRecord}
+        if self.oWriter is None:
+            self.lstColumns = list(dRecord)
+            self.oWriter = csv.writer(self.fOut, lineterminator="\n")
+            self.oWriter.writerow(self.lstColumns)
+        self.oWriter.writerow([toCell(dRecord.get(sColumn)) for sColumn in self.lstColumns])
+        self.fOut.flush()
+
+class RawWriter(OutputWriter):
+    def writeRecord(self, dRecord) -> None:
+        lstValues = dRecord.values() if isinstance(dRecord, Mapping) else [dRecord]
+        self.fOut.write("\t".join(toCell(oValue) for oValue in lstValues) + "\n")
+        self.fOut.flush()
+
+class MsgpackWriter(OutputWriter):
+    """
+    Writes MessagePack objects to the binary stream under fOut (fOut.buffer).
+    """
+
+    def __init__(self, fOut):
+        try:
+            import msgpack
+        except ImportError:
+            raise ValueError("the msgpack format needs the 'msgpack' package (pip install msgpack)")
+        oBuffer = getattr(fOut, "buffer", None)
+        if oBuffer is None:
+            raise ValueError("the msgpack format needs a binary stdout")
+        super().__init__(oBuffer)
+        self.oPacker = msgpack.Packer(use_bin_type=True, default=toJsonValue)
+        self.fText = fOut
+
+    def writeResult(self, oResult) -> None:
+        self.fText.flush()
+        self.fOut.write(self.oPacker.pack(oResult))
+
+    def writeRecord(self, dRecord) -> None:
+        self.fText.flush()
+        self.fOut.write(self.oPacker.pack(dRecord))
+        self.fOut.flush()
+
+_FORMATS_ = {
+    "pretty": lambda fOut: JsonWriter(fOut, True),
+    "json": lambda fOut: JsonWriter(fOut, False),
+    "ndjson": NdjsonWriter,
+    "csv": CsvWriter,
+    "raw": RawWriter,
+    "msgpack": MsgpackWriter,
+}
+
+def getFormats() -> list:
+    """
+    Return the names accepted by --format.
+    """
+    return ["auto", *_FORMATS_]
+
+def resolveFormat(sFormat=None, fOut=None) -> str:
+    """
+    Return the concrete format for sFormat (the --format value), falling back to
+    output.format from the settings; 'auto' means pretty on a terminal, json otherwise.
+    Raises ValueError for unknown formats.
+    """
+    if not sFormat:
+        sFormat = (loadUserSettings().get("output") or {}).get("format", _DEFAULT_FORMAT_)
+    sFormat = str(sFormat).lower()
+    if sFormat == "auto":
+        fOut = fOut or sys.stdout
+        return "pretty" if hasattr(fOut, "isatty") and fOut.isatty() else "json"
+    if sFormat not in _FORMATS_:
+        raise ValueError(f"Unknown output format '{sFormat}'. Choose from: {', '.join(getFormats())}.")
+    return sFormat
+
+def getWriter(sFormat=None, fOut=None) -> OutputWriter:
+    """
+    Return an OutputWriter for sFormat (see resolveFormat) writing to fOut (default: stdout).
+    Raises ValueError if the format is unknown or unavailable.
+    """
+    fOut = fOut or sys.stdout
+    return _FORMATS_[resolveFormat(sFormat, fOut)](fOut)
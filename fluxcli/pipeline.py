@@ -0,0 +1,185 @@
+"""
+pipeline.py - Chain module commands inside one process.
+
+    fluxcli nmap pingsweep 10.0.0.0/16 '|' portscan --ports 22,443
+    [ fluxcli ] > nmap pingsweep 10.0.0.0/16 | portscan --ports 22,443
+
+The first stage streams its records as with --stream. Every record is handed
+on as a Python object (nothing is serialized) to the next stage, which runs
+its command once per record, with the record's target ("ip", "target" or
+"host" field) as the first argument, on its own pool of worker threads.
+Stages are connected by bounded queues: a slow stage holds back the stages
+feeding it (and their nmap processes) instead of buffering everything, and
+downstream scans start as soon as the first records arrive.
+
+Error records and records without a target are passed through unchanged.
+Each target runs at most once per stage. Output is in completion order.
+
+Settings (fluxcli.yaml):
+    pipeline:
+      workers: 4        # concurrent targets per stage (default for a stage's --workers)
+      queue_size: 64    # records buffered between two stages
+"""
+
+import queue
+import threading
+from collections.abc import Mapping
+from .settings import loadUserSettings
+from .utils.runner import inCurrentScope
+
+__all__ = ["PipelineStage", "iterPipeline", "getRecordTarget", "getPipelineSettings"]
+
+_DEFAULT_WORKERS_ = 4
+_DEFAULT_QUEUE_SIZE_ = 64
+
+# Record fields holding the target a downstream stage runs on, in order of preference
+_TARGET_FIELDS_ = ("ip", "target", "host")
+
+# Seconds between checks for a stopped pipeline while blocked on a queue
+_POLL_INTERVAL_ = 0.1
+
+_END_ = object()
+
+def getPipelineSettings() -> dict:
+    """
+    Return the 'pipeline' settings with defaults filled in.
+    """
+    dSettings = loadUserSettings()
+    dPipeline = dSettings.get("pipeline") or {}
+    return {
+        "workers": max(1, int(dPipeline.get("workers") or dSettings.get("batch_workers") or _DEFAULT_WORKERS_)),
+        "queue_size": max(1, int(dPipeline.get("queue_size") or _DEFAULT_QUEUE_SIZE_))
+    }
+
+def getRecordTarget(dRecord):
+    """
+    Return the target of a record for the next stage, or None if it has none
+    (or is an error record).
+    """
+    if not isinstance(dRecord, Mapping) or "error" in dRecord:
+        return None
+    for sField in _TARGET_FIELDS_:
+        if dRecord.get(sField):
+            return str(dRecord[sField])
+    return None
+
+def putItem(qItems, oItem, oStop) -> bool:
+    """
+    Put oItem on qItems, waiting for room. Returns False if the pipeline was stopped first.
+    """
+    while not oStop.is_set():
+        try:
+            qItems.put(oItem, timeout=_POLL_INTERVAL_)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+def getItem(qItems, oStop):
+    """
+    Take the next item from qItems, or return _END_ if the pipeline was stopped.
+    """
+    while not oStop.is_set():
+        try:
+            return qItems.get(timeout=_POLL_INTERVAL_)
+        except queue.Empty:
+            continue
+    return _END_
+
+def putRecords(iterRecords, qOut, oStop) -> bool:
+    """
+    Forward every record of iterRecords to qOut. If the pipeline stops first,
+    the iterator is closed (ending its subprocess) and False is returned.
+    """
+    try:
+        for dRecord in iterRecords:
+            if not putItem(qOut, dRecord, oStop):
+                return False
+        return True
+    finally:
+        if hasattr(iterRecords, "close"):
+            iterRecords.close()
+
+class PipelineStage:
+    """
+    One downstream stage: funcRun(sTarget) returns an iterable of records and is
+    called for each distinct target received, on iWorkers threads.
+    """
+
+    def __init__(self, sName: str, funcRun, iWorkers: int = _DEFAULT_WORKERS_):
+        self.sName = sName
+        self.funcRun = funcRun
+        self.iWorkers = max(1, int(iWorkers))
+        self.setSeen = set()
+        self.iRunning = self.iWorkers
+        self.oLock = threading.Lock()
+
+    def threads(self, qIn, qOut, oStop) -> list:
+        return [
+            threading.Thread(target=inCurrentScope(self.work), args=(qIn, qOut, oStop), name=f"fluxcli-pipe-{self.sName}", daemon=True)
+            for _ in range(self.iWorkers)
+        ]
+
+    def work(self, qIn, qOut, oStop) -> None:
+        try:
+            while True:
+                dRecord = getItem(qIn, oStop)
+                if dRecord is _END_:
+                    # Let the other workers of this stage see the end as well
+                    putItem(qIn, _END_, oStop)
+                    return
+                sTarget = getRecordTarget(dRecord)
+                if sTarget is None:
+                    if not putItem(qOut, dRecord, oStop):
+                        return
+                    continue
+                with self.oLock:
+                    if sTarget in self.setSeen:
+                        continue
+                    self.setSeen.add(sTarget)
+                try:
+                    if not putRecords(self.funcRun(sTarget), qOut, oStop):
+                        return
+                except Exception as e:
+                    if not putItem(qOut, {"target": sTarget, "stage": self.sName, "error": str(e)}, oStop):
+                        return
+        finally:
+            with self.oLock:
+                self.iRunning -= 1
+                bLast = self.iRunning == 0
+            if bLast:
+                putItem(qOut, _END_, oStop)
+
+def feedSource(iterSource, qOut, oStop) -> None:
+    try:
+        putRecords(iterSource, qOut, oStop)
+    except Exception as e:
+        putItem(qOut, {"error": str(e)}, oStop)
+    finally:
+        putItem(qOut, _END_, oStop)
+
+def iterPipeline(iterSource, lstStages, iQueueSize: int = _DEFAULT_QUEUE_SIZE_):
+    """
+    Run iterSource and lstStages (PipelineStage objects) concurrently, connected by
+    queues of iQueueSize records, and yield the records of the last stage.
+    Closing the generator early stops every stage.
+    """
+    oStop = threading.Event()
+    qIn = queue.Queue(iQueueSize)
+    lstThreads = [threading.Thread(target=inCurrentScope(feedSource), args=(iterSource, qIn, oStop), name="fluxcli-pipe-source", daemon=True)]
+    for oStage in lstStages:
+        qOut = queue.Queue(iQueueSize)
+        lstThreads += oStage.threads(qIn, qOut, oStop)
+        qIn = qOut
+    for oThread in lstThreads:
+        oThread.start()
+
+    try:
+        while True:
+            oItem = qIn.get()
+            if oItem is _END_:
+                break
+            yield oItem
+    finally:
+        # Releases any thread blocked on a full or empty queue
+        oStop.set()
@@ -0,0 +1,493 @@
+"""
+records.py - Compact host and port records for large scan results.
+
+A /8 sweep can return millions of hosts, and as plain dicts each one costs
+several hundred bytes before it is even encoded. The record types here use
+__slots__ instead of a per-instance dict, store IPv4/IPv6 addresses and MAC
+addresses as packed ints, and intern the few strings that repeat across
+hosts (vendors, protocols, states, services):
+
+    SweepRecord   {"ip", "hostname", "mac", "vendor", "latency"}      (pingsweep)
+    HostRecord    SweepRecord plus "status" and "ports"               (parsed nmap host)
+    PortRecord    {"ip", "port", "protocol", "state", "service"}      (portscan)
+
+Records are read-only Mappings: record["ip"], record.get("mac"), "port" in
+record, iteration and comparison with dicts work as for the dicts they
+replace, and the field order is the key order of those dicts. Addresses are
+unpacked to the same strings nmap reported when a field is read; an address
+that would not survive the round trip unchanged is simply kept as a string.
+
+JSON encoders need toJsonValue() as their 'default' hook (output.py,
+resultcache.py, checkpoint.py, ...); records then encode to exactly the
+JSON of the equivalent dict.
+"""
+
+import sys
+import math
+import socket
+from array import array
+from itertools import repeat
+from collections.abc import Mapping, Sequence
+
+__all__ = [
+    "Record", "SweepRecord", "HostRecord", "PortRecord",
+    "RecordTable", "SweepTable", "PortTable",
+    "toJsonValue", "packIp", "unpackIp", "packMac", "unpackMac"
+]
+
+# Packed IPv6 addresses are stored above the IPv4 range
+_IPV6_OFFSET_ = 1 << 32
+
+_OCTETS_ = [str(iOctet) for iOctet in range(256)]
+
+# Rows per batch when a RecordTable is converted to dicts for output
+_DICT_BATCH_ = 1024
+
+def packIp(sIp):
+    """
+    Return sIp ("10.0.0.1", "fe80::1") as an int, or sIp itself (None, or a
+    string whose canonical form differs, e.g. "010.0.0.1").
+    """
+    if not isinstance(sIp, str):
+        return sIp
+    try:
+        if ":" in sIp:
+            bPacked = socket.inet_pton(socket.AF_INET6, sIp)
+            if socket.inet_ntop(socket.AF_INET6, bPacked) == sIp:
+                return _IPV6_OFFSET_ + int.from_bytes(bPacked, "big")
+        else:
+            bPacked = socket.inet_pton(socket.AF_INET, sIp)
+            if socket.inet_ntop(socket.AF_INET, bPacked) == sIp:
+                return int.from_bytes(bPacked, "big")
+    except (OSError, ValueError):
+        pass
+    return sIp
+
+def unpackIp(oIp):
+    """
+    Inverse of packIp.
+    """
+    if not isinstance(oIp, int):
+        return oIp
+    if oIp >= _IPV6_OFFSET_:
+        return socket.inet_ntop(socket.AF_INET6, (oIp - _IPV6_OFFSET_).to_bytes(16, "big"))
+    return socket.inet_ntop(socket.AF_INET, oIp.to_bytes(4, "big"))
+
+def unpackIps(lstValues) -> list:
+    """
+    unpackIp for a whole column slice; IPv4 addresses are formatted inline.
+    """
+    lstOctets = _OCTETS_
+    return [
+        lstOctets[oIp >> 24] + "." + lstOctets[(oIp >> 16) & 255] + "." + lstOctets[(oIp >> 8) & 255] + "." + lstOctets[oIp & 255]
+        if oIp.__class__ is int and 0 <= oIp < _IPV6_OFFSET_ else unpackIp(oIp)
+        for oIp in lstValues
+    ]
+
+def packMac(sMac):
+    """
+    Return a MAC address in nmap's form ("C4:41:1E:0E:70:21") as a 48-bit int,
+    or sMac itself if it is None or in any other form.
+    """
+    if not isinstance(sMac, str) or len(sMac) != 17:
+        return sMac
+    try:
+        iMac = int(sMac.replace(":", ""), 16)
+    except ValueError:
+        return sMac
+    return iMac if unpackMac(iMac) == sMac else sMac
+
+def unpackMac(oMac):
+    """
+    Inverse of packMac.
+    """
+    if not isinstance(oMac, int):
+        return oMac
+    return oMac.to_bytes(6, "big").hex(":").upper()
+
+def unpackMacs(lstValues) -> list:
+    """
+    unpackMac for a whole column slice.
+    """
+    return [oMac.to_bytes(6, "big").hex(":").upper() if oMac.__class__ is int else oMac for oMac in lstValues]
+
+def internText(sText):
+    return sys.intern(sText) if isinstance(sText, str) else sText
+
+class Record(Mapping):
+    """
+    Base class of the compact records: a read-only Mapping over _FIELDS_, each
+    read with getattr (packed fields are exposed through properties). Fields
+    listed in _INTERNED_ are interned when a record is built.
+    """
+    __slots__ = ()
+    _FIELDS_ = ()
+    _INTERNED_ = ()
+
+    def __getitem__(self, sKey):
+        if sKey in self._FIELDS_:
+            return getattr(self, sKey)
+        raise KeyError(sKey)
+
+    def __iter__(self):
+        return iter(self._FIELDS_)
+
+    def __len__(self) -> int:
+        return len(self._FIELDS_)
+
+    def __contains__(self, sKey) -> bool:
+        return sKey in self._FIELDS_
+
+    def get(self, sKey, oDefault=None):
+        return getattr(self, sKey) if sKey in self._FIELDS_ else oDefault
+
+    def toDict(self) -> dict:
+        return {sKey: getattr(self, sKey) for sKey in self._FIELDS_}
+
+    def __reduce__(self):
+        return (self.__class__.fromDict, (self.toDict(),))
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}({self.toDict()!r})"
+
+    @classmethod
+    def fromDict(cls, dRecord):
+        """
+        Build a record from a dict with the same keys (e.g. one read back from JSON).
+        Anything else, including error records, is returned unchanged.
+        """
+        if not isinstance(dRecord, Mapping) or isinstance(dRecord, Record) or "error" in dRecord:
+            return dRecord
+        oRecord = cls.__new__(cls)
+        for sKey in cls._FIELDS_:
+            oValue = dRecord.get(sKey)
+            setattr(oRecord, sKey, internText(oValue) if sKey in cls._INTERNED_ else oValue)
+        return oRecord
+
+class SweepRecord(Record):
+    """
+    One host found by a ping sweep.
+    """
+    __slots__ = ("_ip", "hostname", "_mac", "vendor", "latency")
+    _FIELDS_ = ("ip", "hostname", "mac", "vendor", "latency")
+    _INTERNED_ = ("vendor",)
+
+    def __init__(self, sIp=None, sHostname=None, sMac=None, sVendor=None, fLatency=None):
+        self._ip = packIp(sIp)
+        self.hostname = sHostname
+        self._mac = packMac(sMac)
+        self.vendor = internText(sVendor)
+        self.latency = fLatency
+
+    @property
+    def ip(self):
+        return unpackIp(self._ip)
+
+    @ip.setter
+    def ip(self, sIp):
+        self._ip = packIp(sIp)
+
+    @property
+    def mac(self):
+        return unpackMac(self._mac)
+
+    @mac.setter
+    def mac(self, sMac):
+        self._mac = packMac(sMac)
+
+    @classmethod
+    def fromHost(cls, oHost):
+        """
+        Reduce a HostRecord to its sweep fields without unpacking them.
+        """
+        oRecord = cls.__new__(cls)
+        oRecord._ip = oHost._ip
+        oRecord.hostname = oHost.hostname
+        oRecord._mac = oHost._mac
+        oRecord.vendor = oHost.vendor
+        oRecord.latency = oHost.latency
+        return oRecord
+
+class HostRecord(SweepRecord):
+    """
+    One <host> of nmap's XML output (see modules/nmap/parser.py).
+    """
+    __slots__ = ("status", "ports")
+    _FIELDS_ = ("ip", "hostname", "mac", "vendor", "status", "latency", "ports")
+    _INTERNED_ = ("vendor", "status")
+
+    def __init__(self, sIp=None, sHostname=None, sMac=None, sVendor=None, fLatency=None, sStatus=None, lstPorts=None):
+        super().__init__(sIp, sHostname, sMac, sVendor, fLatency)
+        self.status = internText(sStatus)
+        self.ports = [] if lstPorts is None else lstPorts
+
+class PortRecord(Record):
+    """
+    One port of a host.
+    """
+    __slots__ = ("_ip", "port", "protocol", "state", "service")
+    _FIELDS_ = ("ip", "port", "protocol", "state", "service")
+    _INTERNED_ = ("protocol", "state", "service")
+
+    def __init__(self, sIp=None, iPort=None, sProtocol=None, sState=None, sService=None):
+        self._ip = packIp(sIp)
+        self.port = iPort
+        self.protocol = internText(sProtocol)
+        self.state = internText(sState)
+        self.service = internText(sService)
+
+    @property
+    def ip(self):
+        return unpackIp(self._ip)
+
+    @ip.setter
+    def ip(self, sIp):
+        self._ip = packIp(sIp)
+
+class ArrayColumn:
+    """
+    A RecordTable column of ints or floats in a typed array. Values that do not
+    fit (None, strings, IPv6 addresses, ...) are stored as oMissing and kept in
+    an overflow dict. funcDecode turns a list of stored values into output values.
+    """
+
+    def __init__(self, sCode: str, typeValue, oMissing, funcDecode=None):
+        self.aValues = array(sCode)
+        self.typeValue = typeValue
+        self.oMissing = oMissing
+        self.funcDecode = funcDecode
+        self.dOverflow = {}
+
+    def empty(self):
+        return ArrayColumn(self.aValues.typecode, self.typeValue, self.oMissing, self.funcDecode)
+
+    def append(self, oValue) -> None:
+        if oValue.__class__ is self.typeValue:
+            try:
+                self.aValues.append(oValue)
+                return
+            except OverflowError:
+                pass
+        self.dOverflow[len(self.aValues)] = oValue
+        self.aValues.append(self.oMissing)
+
+    def extend(self, oOther) -> None:
+        iOffset = len(self.aValues)
+        self.aValues.extend(oOther.aValues)
+        self.dOverflow.update({iIndex + iOffset: oValue for iIndex, oValue in oOther.dOverflow.items()})
+
+    def get(self, iIndex: int):
+        if self.dOverflow and iIndex in self.dOverflow:
+            return self.dOverflow[iIndex]
+        return self.aValues[iIndex]
+
+    def values(self, iStart: int, iStop: int) -> list:
+        lstValues = self.aValues[iStart:iStop].tolist()
+        if self.dOverflow:
+            for iIndex in range(iStart, iStop):
+                if iIndex in self.dOverflow:
+                    lstValues[iIndex - iStart] = self.dOverflow[iIndex]
+        if self.funcDecode:
+            lstValues = self.funcDecode(lstValues)
+        return lstValues
+
+class ObjectColumn:
+    """
+    A RecordTable column of arbitrary values (e.g. interned vendor names).
+    """
+
+    def __init__(self):
+        self.lstValues = []
+
+    def empty(self):
+        return ObjectColumn()
+
+    def append(self, oValue) -> None:
+        self.lstValues.append(oValue)
+
+    def extend(self, oOther) -> None:
+        self.lstValues.extend(oOther.lstValues)
+
+    def get(self, iIndex: int):
+        return self.lstValues[iIndex]
+
+    def values(self, iStart: int, iStop: int) -> list:
+        return self.lstValues[iStart:iStop]
+
+class TextColumn:
+    """
+    A RecordTable column of mostly unique strings (e.g. hostnames), stored as
+    UTF-8 in one shared buffer. aEnds holds the end offset of each value in
+    the buffer, or -1 - end for None; any other value goes to the overflow dict.
+    """
+
+    def __init__(self):
+        self.bData = bytearray()
+        self.aEnds = array("q")
+        self.dOverflow = {}
+
+    def empty(self):
+        return TextColumn()
+
+    def append(self, oValue) -> None:
+        if oValue.__class__ is str:
+            self.bData += oValue.encode("utf-8")
+            self.aEnds.append(len(self.bData))
+            return
+        if oValue is not None:
+            self.dOverflow[len(self.aEnds)] = oValue
+        self.aEnds.append(-1 - len(self.bData))
+
+    def extend(self, oOther) -> None:
+        iOffset = len(self.aEnds)
+        iBase = len(self.bData)
+        self.bData += oOther.bData
+        self.aEnds.extend(iEnd + iBase if iEnd >= 0 else iEnd - iBase for iEnd in oOther.aEnds)
+        self.dOverflow.update({iIndex + iOffset: oValue for iIndex, oValue in oOther.dOverflow.items()})
+
+    def offset(self, iIndex: int) -> int:
+        """
+        Return where value iIndex starts in the buffer.
+        """
+        if not iIndex:
+            return 0
+        iEnd = self.aEnds[iIndex - 1]
+        return iEnd if iEnd >= 0 else -1 - iEnd
+
+    def get(self, iIndex: int):
+        iEnd = self.aEnds[iIndex]
+        if iEnd < 0:
+            return self.dOverflow.get(iIndex)
+        return self.bData[self.offset(iIndex):iEnd].decode("utf-8")
+
+    def values(self, iStart: int, iStop: int) -> list:
+        lstValues = []
+        iPos = self.offset(iStart)
+        bData = self.bData
+        for iIndex, iEnd in enumerate(self.aEnds[iStart:iStop].tolist(), iStart):
+            if iEnd < 0:
+                lstValues.append(self.dOverflow.get(iIndex))
+                iPos = -1 - iEnd
+            else:
+                lstValues.append(bData[iPos:iEnd].decode("utf-8"))
+                iPos = iEnd
+        return lstValues
+
+# RecordTable column kinds: factories of empty columns
+_COLUMN_KINDS_ = {
+    "ip": lambda: ArrayColumn("Q", int, (1 << 64) - 1, unpackIps),
+    "mac": lambda: ArrayColumn("Q", int, (1 << 64) - 1, unpackMacs),
+    "int": lambda: ArrayColumn("q", int, -(1 << 63)),
+    "float": lambda: ArrayColumn("d", float, math.nan),
+    "object": ObjectColumn,
+    "text": TextColumn,
+}
+
+class RecordTable(Sequence):
+    """
+    A list of records of one type (_RECORD_) stored column by column, for
+    results that are held in memory as a whole (e.g. the "hosts" of a
+    pingsweep). Packed addresses, ports and latencies live in typed arrays,
+    hostnames in one text buffer, so a row costs a few dozen bytes and the
+    garbage collector never has to walk millions of record objects.
+    Rows are rebuilt as records when read; slices are tables again.
+    _COLUMNS_ lists (slot, kind) for every slot of _RECORD_, in the order of
+    its _FIELDS_; kinds are the keys of _COLUMN_KINDS_.
+    """
+    _RECORD_ = Record
+    _COLUMNS_ = ()
+
+    def __init__(self, iterRecords=()):
+        self.iRows = 0
+        self.lstColumns = [_COLUMN_KINDS_[sKind]() for _, sKind in self._COLUMNS_]
+        self.extend(iterRecords)
+
+    def append(self, oRecord) -> None:
+        """
+        Add a record (or a dict with the record's keys) as the last row.
+        """
+        if not isinstance(oRecord, self._RECORD_):
+            oRecord = self._RECORD_.fromDict(oRecord)
+            if not isinstance(oRecord, self._RECORD_):
+                raise TypeError(f"{self.__class__.__name__} only holds {self._RECORD_.__name__} rows, not {oRecord!r}")
+        for (sSlot, _), oColumn in zip(self._COLUMNS_, self.lstColumns):
+            oColumn.append(getattr(oRecord, sSlot))
+        self.iRows += 1
+
+    def extend(self, iterRecords) -> None:
+        if iterRecords.__class__ is self.__class__:
+            # Another table of the same type: copy its columns without building records
+            for oColumn, oOther in zip(self.lstColumns, iterRecords.lstColumns):
+                oColumn.extend(oOther)
+            self.iRows += iterRecords.iRows
+            return
+        for oRecord in iterRecords:
+            self.append(oRecord)
+
+    def row(self, iIndex: int):
+        oRecord = self._RECORD_.__new__(self._RECORD_)
+        for (sSlot, _), oColumn in zip(self._COLUMNS_, self.lstColumns):
+            setattr(oRecord, sSlot, oColumn.get(iIndex))
+        return oRecord
+
+    def toDicts(self, iStart: int = 0, iStop=None) -> list:
+        """
+        Return rows iStart to iStop as plain dicts, decoded a column at a time.
+        """
+        iStop = self.iRows if iStop is None else min(iStop, self.iRows)
+        lstColumns = [oColumn.values(iStart, iStop) for oColumn in self.lstColumns]
+        return list(map(dict, map(zip, repeat(self._RECORD_._FIELDS_), zip(*lstColumns))))
+
+    def iterDicts(self):
+        """
+        Yield every row as a plain dict, converting _DICT_BATCH_ rows at a time.
+        """
+        for iStart in range(0, self.iRows, _DICT_BATCH_):
+            yield from self.toDicts(iStart, iStart + _DICT_BATCH_)
+
+    def __len__(self) -> int:
+        return self.iRows
+
+    def __getitem__(self, oIndex):
+        if isinstance(oIndex, slice):
+            oTable = self.__class__()
+            for iIndex in range(*oIndex.indices(self.iRows)):
+                oTable.append(self.row(iIndex))
+            return oTable
+        if oIndex < 0:
+            oIndex += self.iRows
+        if not 0 <= oIndex < self.iRows:
+            raise IndexError("record table index out of range")
+        return self.row(oIndex)
+
+    def __iter__(self):
+        for iIndex in range(self.iRows):
+            yield self.row(iIndex)
+
+    def __repr__(self) -> str:
+        return f"<{self.__class__.__name__} of {self.iRows} rows>"
+
+class SweepTable(RecordTable):
+    """
+    Rows of SweepRecord: about 40 bytes per host plus the length of its hostname.
+    """
+    _RECORD_ = SweepRecord
+    _COLUMNS_ = (("_ip", "ip"), ("hostname", "text"), ("_mac", "mac"), ("vendor", "object"), ("latency", "float"))
+
+class PortTable(RecordTable):
+    """
+    Rows of PortRecord: about 40 bytes per port.
+    """
+    _RECORD_ = PortRecord
+    _COLUMNS_ = (("_ip", "ip"), ("port", "int"), ("protocol", "object"), ("state", "object"), ("service", "object"))
+
+def toJsonValue(oValue):
+    """
+    'default' hook for json.dumps / orjson.dumps / msgpack: encode a record as
+    its dict and a record table as a list.
+    """
+    if isinstance(oValue, Record):
+        return oValue.toDict()
+    if isinstance(oValue, RecordTable):
+        return oValue.toDicts()
+    raise TypeError(f"Object of type {oValue.__class__.__name__} is not JSON serializable")
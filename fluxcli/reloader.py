@@ -0,0 +1,231 @@
+"""
+reloader.py - Hot reload of FluxCLI modules in long-lived processes.
+
+The REPL and the daemon keep the command registry and every imported module
+for their whole lifetime. 'reload [module]' picks up edits to a module
+without restarting them (see reloadRegistry in main.py):
+    - a module whose directory fingerprint (see manifest.py) is unchanged is
+      left alone; otherwise only its commands.yaml is re-read and only its
+      registry and manifest entries are replaced;
+    - of the module's imported Python files, only those whose size or mtime
+      changed are re-executed, followed by the files that imported names from
+      them, each after its own dependencies. Untouched files keep their
+      state, such as open connections.
+Reloading re-executes a file in its existing namespace, so module-level state
+meant to survive a reload can be written as
+    _oStore = globals().get("_oStore")
+
+In watch mode a background thread checks the module directories every few
+seconds and reloads whatever changed.
+
+Settings (fluxcli.yaml):
+    reload:
+      watch: false      # start watch mode with the REPL and the daemon
+      interval: 1.0     # seconds between checks in watch mode
+"""
+
+import os
+import sys
+import types
+import importlib
+import threading
+from .settings import loadUserSettings
+
+__all__ = [
+    "snapshotSources", "getChangedSources", "reloadSources", "unloadModule",
+    "ModuleWatcher", "startWatching", "stopWatching", "isWatching", "getReloadSettings"
+]
+
+_PACKAGE_ = "fluxcli.modules"
+_DEFAULT_INTERVAL_ = 1.0
+_MIN_INTERVAL_ = 0.1
+
+def getReloadSettings() -> dict:
+    """
+    Return the 'reload' settings with defaults filled in.
+    """
+    dReload = loadUserSettings().get("reload") or {}
+    return {
+        "watch": bool(dReload.get("watch", False)),
+        "interval": max(_MIN_INTERVAL_, float(dReload.get("interval") or _DEFAULT_INTERVAL_))
+    }
+
+def getPackageName(sModuleName: str) -> str:
+    return f"{_PACKAGE_}.{sModuleName}"
+
+def snapshotSources(sDirPath: str) -> dict:
+    """
+    Return {file name: (mtime_ns, size)} for the Python files in sDirPath.
+    """
+    dSources = {}
+    try:
+        lstEntries = list(os.scandir(sDirPath))
+    except OSError:
+        return dSources
+    for oEntry in lstEntries:
+        if oEntry.name.endswith(".py") and oEntry.is_file():
+            oStat = oEntry.stat()
+            dSources[oEntry.name] = (oStat.st_mtime_ns, oStat.st_size)
+    return dSources
+
+def getChangedSources(dOld: dict, dNew: dict) -> list:
+    """
+    Return the file names that were added, removed or modified between two snapshots.
+    """
+    return sorted(sName for sName in set(dOld) | set(dNew) if dOld.get(sName) != dNew.get(sName))
+
+def getLoadedSubmodules(sModuleName: str) -> dict:
+    """
+    Return {qualified name: module object} for the imported files of a module
+    package, including the package itself.
+    """
+    sPackage = getPackageName(sModuleName)
+    return {
+        sName: oModule for sName, oModule in list(sys.modules.items())
+        if oModule is not None and (sName == sPackage or sName.startswith(sPackage + "."))
+    }
+
+def getDependencies(oModule, dLoaded: dict) -> set:
+    """
+    Return the names in dLoaded that oModule imported: submodules it refers to
+    and submodules whose functions, classes or constants it holds. The package
+    attributes the import system sets for child modules are not dependencies.
+    """
+    setDeps = set()
+    sChildPrefix = oModule.__name__ + "."
+    for oValue in list(vars(oModule).values()):
+        try:
+            if isinstance(oValue, types.ModuleType):
+                sName = oValue.__name__
+                if sName.startswith(sChildPrefix):
+                    continue
+            else:
+                sName = getattr(oValue, "__module__", None)
+        except Exception:
+            continue
+        if sName in dLoaded and sName != oModule.__name__:
+            setDeps.add(sName)
+    return setDeps
+
+def orderReloads(lstChanged: list, dLoaded: dict) -> list:
+    """
+    Return lstChanged plus every loaded module depending on one of them,
+    ordered so that each module comes after the modules it imports from.
+    """
+    dDeps = {sName: getDependencies(oModule, dLoaded) for sName, oModule in dLoaded.items()}
+    setReload = set(lstChanged)
+    bGrown = True
+    while bGrown:
+        bGrown = False
+        for sName, setDeps in dDeps.items():
+            if sName not in setReload and setDeps & setReload:
+                setReload.add(sName)
+                bGrown = True
+
+    lstOrder = []
+    setVisited = set()
+    lstStack = [(sName, False) for sName in sorted(setReload, reverse=True)]
+    while lstStack:
+        sName, bExpanded = lstStack.pop()
+        if bExpanded:
+            lstOrder.append(sName)
+            continue
+        if sName in setVisited:
+            continue
+        setVisited.add(sName)
+        lstStack.append((sName, True))
+        for sDep in sorted(dDeps[sName] & setReload, reverse=True):
+            if sDep not in setVisited:
+                lstStack.append((sDep, False))
+    return lstOrder
+
+def reloadSources(sModuleName: str, lstFiles: list) -> list:
+    """
+    Re-execute the imported files among lstFiles (names as in a snapshot, e.g.
+    "parser.py") of a module package, then the files depending on them.
+    Files that were never imported are skipped; they load fresh on first use.
+    Returns the file names reloaded, in order. An error raised by a file is
+    passed on; the files reloaded before it keep their new code.
+    """
+    sPackage = getPackageName(sModuleName)
+    dLoaded = getLoadedSubmodules(sModuleName)
+    lstNames = []
+    for sFile in lstFiles:
+        sStem = sFile[:-3] if sFile.endswith(".py") else sFile
+        sName = sPackage if sStem == "__init__" else f"{sPackage}.{sStem}"
+        if sName in dLoaded:
+            lstNames.append(sName)
+
+    lstReloaded = []
+    for sName in orderReloads(lstNames, dLoaded):
+        importlib.reload(dLoaded[sName])
+        lstReloaded.append("__init__.py" if sName == sPackage else sName[len(sPackage) + 1:] + ".py")
+    return lstReloaded
+
+def unloadModule(sModuleName: str) -> int:
+    """
+    Drop every imported file of a module package from sys.modules, so a module
+    that is added again later is imported from scratch. Returns the number dropped.
+    """
+    lstNames = list(getLoadedSubmodules(sModuleName))
+    for sName in lstNames:
+        sys.modules.pop(sName, None)
+    return len(lstNames)
+
+class ModuleWatcher:
+    """
+    Daemon thread calling funcCheck() every fInterval seconds until stopped.
+    Errors raised by funcCheck are reported and do not end the thread.
+    """
+
+    def __init__(self, funcCheck, fInterval: float = _DEFAULT_INTERVAL_):
+        self.funcCheck = funcCheck
+        self.fInterval = max(_MIN_INTERVAL_, float(fInterval))
+        self.oStop = threading.Event()
+        self.oThread = threading.Thread(target=self.run, name="fluxcli-reload-watch", daemon=True)
+
+    def start(self) -> None:
+        self.oThread.start()
+
+    def stop(self) -> None:
+        self.oStop.set()
+
+    def isRunning(self) -> bool:
+        return self.oThread.is_alive() and not self.oStop.is_set()
+
+    def run(self) -> None:
+        while not self.oStop.wait(self.fInterval):
+            try:
+                self.funcCheck()
+            except Exception as e:
+                print(f"[Warning] Module watch check failed: {e}")
+
+_WATCHER_ = None
+_WATCHER_LOCK_ = threading.Lock()
+
+def startWatching(funcCheck, fInterval: float = None) -> bool:
+    """
+    Start the process-wide watcher. Returns False if it is already running.
+    """
+    global _WATCHER_
+    with _WATCHER_LOCK_:
+        if _WATCHER_ is not None and _WATCHER_.isRunning():
+            return False
+        _WATCHER_ = ModuleWatcher(funcCheck, getReloadSettings()["interval"] if fInterval is None else fInterval)
+        _WATCHER_.start()
+        return True
+
+def stopWatching() -> bool:
+    """
+    Stop the process-wide watcher. Returns False if it was not running.
+    """
+    global _WATCHER_
+    with _WATCHER_LOCK_:
+        if _WATCHER_ is None or not _WATCHER_.isRunning():
+            return False
+        _WATCHER_.stop()
+        _WATCHER_ = None
+        return True
+
+def isWatching() -> bool:
+    return _WATCHER_ is not None and _WATCHER_.isRunning()
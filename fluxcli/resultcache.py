@@ -0,0 +1,228 @@
+"""
+resultcache.py - Persistent cache of module command results.
+
+Results are stored in an SQLite database under the settings directory
+(~/.fluxcli/cache/results.db), keyed on module, command and normalized
+arguments. Entries expire after a TTL and the store is kept under a size
+bound by evicting the least recently used entries. Entry and byte totals
+are maintained by triggers, so no operation has to scan the whole table.
+
+Settings (fluxcli.yaml):
+    cache:
+      enabled: true      # set to false to disable result caching entirely
+      ttl: 300           # seconds a result stays fresh
+      max_entries: 20000
+      max_mb: 64
+"""
+
+import os
+import json
+import time
+import hashlib
+import sqlite3
+import ipaddress
+import threading
+from .settings import getCacheDir, loadUserSettings
+from .records import toJsonValue
+
+__all__ = ["ResultCache", "getResultCache", "normalizeArgs"]
+
+_DB_NAME_ = "results.db"
+_DEFAULT_TTL_ = 300
+_DEFAULT_MAX_ENTRIES_ = 20000
+_DEFAULT_MAX_MB_ = 64
+
+_SCHEMA_ = """
+CREATE TABLE IF NOT EXISTS results (
+    key TEXT PRIMARY KEY,
+    module TEXT NOT NULL,
+    command TEXT NOT NULL,
+    args TEXT NOT NULL,
+    created REAL NOT NULL,
+    accessed REAL NOT NULL,
+    size INTEGER NOT NULL,
+    payload TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_results_accessed ON results(accessed);
+CREATE INDEX IF NOT EXISTS idx_results_created ON results(created);
+CREATE TABLE IF NOT EXISTS counters (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO counters VALUES ('hits', 0), ('misses', 0), ('entries', 0), ('bytes', 0);
+CREATE TRIGGER IF NOT EXISTS trg_results_insert AFTER INSERT ON results BEGIN
+    UPDATE counters SET value = value + 1 WHERE name = 'entries';
+    UPDATE counters SET value = value + NEW.size WHERE name = 'bytes';
+END;
+CREATE TRIGGER IF NOT EXISTS trg_results_delete AFTER DELETE ON results BEGIN
+    UPDATE counters SET value = value - 1 WHERE name = 'entries';
+    UPDATE counters SET value = value - OLD.size WHERE name = 'bytes';
+END;
+"""
+
+def normalizeArgs(lstArgs) -> list:
+    """
+    Normalize command arguments so equivalent invocations share a cache entry.
+    Whitespace is stripped and IP addresses / networks are written in canonical
+    form, e.g. "10.0.0.7/24" -> "10.0.0.0/24".
+    """
+    lstNormalized = []
+    for sArg in lstArgs:
+        sArg = str(sArg).strip()
+        try:
+            if "/" in sArg:
+                sArg = str(ipaddress.ip_network(sArg, strict=False))
+            else:
+                sArg = str(ipaddress.ip_address(sArg))
+        except ValueError:
+            pass
+        lstNormalized.append(sArg)
+    return lstNormalized
+
+class ResultCache:
+    """
+    SQLite-backed result store with TTL expiry, LRU eviction and hit/miss counters.
+    Safe to share between threads of one process and between concurrent processes.
+    """
+
+    def __init__(self, sPath: str, fTtl: float = _DEFAULT_TTL_, iMaxEntries: int = _DEFAULT_MAX_ENTRIES_,
+                 iMaxBytes: int = _DEFAULT_MAX_MB_ * 1048576):
+        self.sPath = sPath
+        self.fTtl = fTtl
+        self.iMaxEntries = iMaxEntries
+        self.iMaxBytes = iMaxBytes
+        self.oLock = threading.Lock()
+        os.makedirs(os.path.dirname(sPath), exist_ok=True)
+        self.oConn = sqlite3.connect(sPath, timeout=10, check_same_thread=False, isolation_level=None)
+        self.oConn.execute("PRAGMA journal_mode=WAL")
+        self.oConn.execute("PRAGMA synchronous=NORMAL")
+        self.oConn.executescript(_SCHEMA_)
+
+    @staticmethod
+    def makeKey(sModule: str, sCommand: str, lstArgs) -> str:
+        """
+        Return the cache key for a module command invocation.
+        """
+        sIdentity = json.dumps([sModule, sCommand, normalizeArgs(lstArgs)], separators=(",", ":"))
+        return hashlib.sha1(sIdentity.encode("utf-8")).hexdigest()
+
+    def _bump(self, sCounter: str) -> None:
+        self.oConn.execute("UPDATE counters SET value = value + 1 WHERE name = ?", (sCounter,))
+
+    def get(self, sKey: str, fMaxAge=None):
+        """
+        Return the cached result for sKey, or None on a miss.
+        Entries older than fMaxAge seconds count as misses. fMaxAge defaults to
+        the configured TTL and is capped at it: older entries are expired and
+        may already have been evicted (see _evict).
+        """
+        fMaxAge = self.fTtl if fMaxAge is None else min(fMaxAge, self.fTtl)
+        fNow = time.time()
+        with self.oLock:
+            oRow = self.oConn.execute(
+                "SELECT payload, created FROM results WHERE key = ?", (sKey,)
+            ).fetchone()
+            if oRow is None or fNow - oRow[1] > fMaxAge:
+                self._bump("misses")
+                return None
+            self.oConn.execute("UPDATE results SET accessed = ? WHERE key = ?", (fNow, sKey))
+            self._bump("hits")
+        return json.loads(oRow[0])
+
+    def put(self, sKey: str, sModule: str, sCommand: str, lstArgs, dResult) -> None:
+        """
+        Store dResult under sKey, then evict expired and least recently used entries
+        until the store is back within its entry and byte limits.
+        """
+        sPayload = json.dumps(dResult, separators=(",", ":"), default=toJsonValue)
+        fNow = time.time()
+        with self.oLock:
+            self.oConn.execute("BEGIN IMMEDIATE")
+            try:
+                self.oConn.execute("DELETE FROM results WHERE key = ?", (sKey,))
+                self.oConn.execute(
+                    "INSERT INTO results (key, module, command, args, created, accessed, size, payload) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (sKey, sModule, sCommand, json.dumps(normalizeArgs(lstArgs)), fNow, fNow, len(sPayload), sPayload)
+                )
+                self._evict()
+                self.oConn.execute("COMMIT")
+            except Exception:
+                self.oConn.execute("ROLLBACK")
+                raise
+
+    def _evict(self) -> None:
+        self.oConn.execute("DELETE FROM results WHERE created < ?", (time.time() - self.fTtl,))
+        iEntries, iBytes = self._totals()
+        while iEntries > self.iMaxEntries or iBytes > self.iMaxBytes:
+            # Evict in batches so a large overshoot does not take one query per row
+            iBatch = max(1, iEntries - self.iMaxEntries, iEntries // 100)
+            self.oConn.execute(
+                "DELETE FROM results WHERE key IN (SELECT key FROM results ORDER BY accessed LIMIT ?)",
+                (iBatch,)
+            )
+            iEntries, iBytes = self._totals()
+
+    def _totals(self) -> tuple:
+        dCounters = dict(self.oConn.execute(
+            "SELECT name, value FROM counters WHERE name IN ('entries', 'bytes')"
+        ).fetchall())
+        return dCounters["entries"], dCounters["bytes"]
+
+    def stats(self) -> dict:
+        """
+        Return the hit/miss counters and current size of the store.
+        """
+        with self.oLock:
+            dCounters = dict(self.oConn.execute("SELECT name, value FROM counters").fetchall())
+        dCounters["path"] = self.sPath
+        return dCounters
+
+    def forget(self, sModule: str) -> int:
+        """
+        Remove every entry of one module. Returns the number of entries removed.
+        """
+        with self.oLock:
+            self.oConn.execute("BEGIN IMMEDIATE")
+            try:
+                iRemoved = self.oConn.execute("DELETE FROM results WHERE module = ?", (sModule,)).rowcount
+                self.oConn.execute("COMMIT")
+            except Exception:
+                self.oConn.execute("ROLLBACK")
+                raise
+        return iRemoved
+
+    def clear(self) -> None:
+        """
+        Remove every entry and reset the counters.
+        """
+        with self.oLock:
+            self.oConn.execute("BEGIN IMMEDIATE")
+            self.oConn.execute("DELETE FROM results")
+            self.oConn.execute("UPDATE counters SET value = 0")
+            self.oConn.execute("COMMIT")
+
+_oResultCache = None
+
+def getResultCache():
+    """
+    Return the process-wide ResultCache configured from the user settings,
+    or None if caching is disabled or the database cannot be opened.
+    """
+    global _oResultCache
+    if _oResultCache is None:
+        dSettings = loadUserSettings().get("cache") or {}
+        if not dSettings.get("enabled", True):
+            return None
+        sPath = os.path.join(getCacheDir(), _DB_NAME_)
+        try:
+            _oResultCache = ResultCache(
+                sPath,
+                fTtl=float(dSettings.get("ttl", _DEFAULT_TTL_)),
+                iMaxEntries=int(dSettings.get("max_entries", _DEFAULT_MAX_ENTRIES_)),
+                iMaxBytes=int(float(dSettings.get("max_mb", _DEFAULT_MAX_MB_)) * 1048576)
+            )
+        except sqlite3.Error as e:
+            print(f"[Warning] Result cache disabled, failed to open '{sPath}': {e}")
+            return None
+    return _oResultCache
@@ -6,10 +6,10 @@ and change paths accordingly. But this example focuses on Windows AppData.
 """
 
 import os
-import yaml
 import platform
+from .utils.yamlcache import loadYamlFile
 
-__all__ = ["loadUserSettings", "saveUserSettings"]  # Ensures these are exported
+__all__ = ["loadUserSettings", "saveUserSettings", "getCacheDir"]  # Ensures these are exported
 
 def getWindowsSettingsPath() -> str:
     """
@@ -39,20 +39,28 @@ def getSettingsPath() -> str:
         sHome = os.path.expanduser("~")
         return os.path.join(sHome, ".fluxcli", "fluxcli.yaml")
 
+def getCacheDir() -> str:
+    """
+    Return the directory FluxCLI uses for cached data (manifests, results, etc.).
+    It lives next to fluxcli.yaml, e.g. ~/.fluxcli/cache.
+    """
+    return os.path.join(os.path.dirname(getSettingsPath()), "cache")
+
 def loadUserSettings() -> dict:
     """
     Load user settings from the fluxcli.yaml file, creating an empty dict if none exist.
+    The parsed file is cached until it changes (see utils/yamlcache.py), so this
+    is cheap enough to call wherever a setting is needed.
     """
     sPath = getSettingsPath()
     if not os.path.exists(sPath):
         return {}  # No settings file yet
 
     try:
-        with open(sPath, "r", encoding="utf-8") as fSettings:
-            dData = yaml.safe_load(fSettings)
-            if not dData:
-                return {}
-            return dData
+        dData = loadYamlFile(sPath, getCacheDir())
+        if not dData:
+            return {}
+        return dData
     except Exception as e:
         # If something goes wrong reading YAML, return empty or log error.
         print(f"[Warning] Failed to read settings file '{sPath}': {e}")
@@ -63,6 +71,8 @@ def saveUserSettings(dSettings: dict) -> None:
     Save the given dictionary of settings to fluxcli.yaml.
     Creates the necessary directory if it doesn't exist.
     """
+    import yaml
+
     sPath = getSettingsPath()
     try:
         os.makedirs(os.path.dirname(sPath), exist_ok=True)
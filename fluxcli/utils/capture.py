@@ -0,0 +1,95 @@
+"""
+capture.py - Per-thread redirection of sys.stdout and sys.stderr.
+
+Module commands report through print(). To run several of them at once
+(background jobs, daemon clients) each thread needs its own destination for
+that output, which contextlib.redirect_stdout cannot provide because it
+swaps the process-wide sys.stdout. Instead, sys.stdout is replaced once by a
+proxy that forwards writes to a per-thread stream, or to the real stdout
+for threads that did not redirect. sys.stderr can be proxied the same way.
+"""
+
+import sys
+import threading
+from contextlib import contextmanager
+
+__all__ = [
+    "ThreadLocalStream", "installThreadLocalStdout", "redirectThreadStdout",
+    "installThreadLocalStderr", "redirectThreadStderr"
+]
+
+class ThreadLocalStream:
+    """
+    File-like proxy that writes to the current thread's stream, falling back to oDefault.
+    """
+
+    def __init__(self, oDefault):
+        self.oDefault = oDefault
+        self.oLocal = threading.local()
+
+    def getTarget(self):
+        """
+        Return the stream writes from the calling thread currently go to.
+        """
+        return getattr(self.oLocal, "oStream", None) or self.oDefault
+
+    def write(self, sText):
+        return self.getTarget().write(sText)
+
+    def flush(self):
+        return self.getTarget().flush()
+
+    def fileno(self):
+        return self.getTarget().fileno()
+
+    def isatty(self):
+        oTarget = self.getTarget()
+        return hasattr(oTarget, "isatty") and oTarget.isatty()
+
+    def __getattr__(self, sName):
+        return getattr(self.getTarget(), sName)
+
+def installThreadLocalStdout() -> ThreadLocalStream:
+    """
+    Replace sys.stdout with a ThreadLocalStream (once) and return it.
+    """
+    if not isinstance(sys.stdout, ThreadLocalStream):
+        sys.stdout = ThreadLocalStream(sys.stdout)
+    return sys.stdout
+
+def installThreadLocalStderr() -> ThreadLocalStream:
+    """
+    Replace sys.stderr with a ThreadLocalStream (once) and return it.
+    """
+    if not isinstance(sys.stderr, ThreadLocalStream):
+        sys.stderr = ThreadLocalStream(sys.stderr)
+    return sys.stderr
+
+@contextmanager
+def redirectThreadStdout(oStream):
+    """
+    Send everything the calling thread prints to oStream for the duration of the block.
+    Other threads keep writing to their own destination.
+    """
+    with redirectThread(installThreadLocalStdout(), oStream):
+        yield oStream
+
+@contextmanager
+def redirectThreadStderr(oStream):
+    """
+    Like redirectThreadStdout, for what the calling thread writes to sys.stderr.
+    """
+    with redirectThread(installThreadLocalStderr(), oStream):
+        yield oStream
+
+@contextmanager
+def redirectThread(oProxy, oStream):
+    """
+    Point oProxy at oStream for the calling thread for the duration of the block.
+    """
+    oPrevious = getattr(oProxy.oLocal, "oStream", None)
+    oProxy.oLocal.oStream = oStream
+    try:
+        yield oStream
+    finally:
+        oProxy.oLocal.oStream = oPrevious
@@ -0,0 +1,76 @@
+"""
+parser.py - Argument helpers shared by the CLI entry point and the REPL.
+"""
+
+# Flags handled by the dispatcher itself rather than by module functions,
+# mapped to their default value. Boolean flags take no value.
+_DISPATCH_FLAGS_ = {
+    "--stream": False,
+    "--no-cache": False,
+    "--max-age": None,
+    "--diff": False,
+    "--targets-file": None,
+    "--workers": None,
+    "--ordered": False,
+    "--format": None,
+    "--resume": None,
+    "--distribute": False,
+}
+
+# Flags accepted anywhere on a command line (module and native commands alike)
+_GLOBAL_FLAGS_ = {
+    "--timings": False,
+    "--profile": None,
+}
+
+def splitFlags(lstArgs, dKnownFlags) -> tuple:
+    """
+    Separate the flags listed in dKnownFlags (flag -> default) from the other arguments.
+    Returns (dFlags, lstRemaining) where dFlags holds every known flag, keyed by its
+    name without leading dashes and with '-' replaced by '_' (e.g. "stream").
+    Non-boolean flags accept either '--flag value' or '--flag=value'.
+    Unknown tokens are passed through untouched in lstRemaining.
+    """
+    dFlags = {sFlag.lstrip("-").replace("-", "_"): oDefault for sFlag, oDefault in dKnownFlags.items()}
+    lstRemaining = []
+
+    iIndex = 0
+    while iIndex < len(lstArgs):
+        sToken = lstArgs[iIndex]
+        sFlag, _, sValue = sToken.partition("=")
+        if sFlag not in dKnownFlags:
+            lstRemaining.append(sToken)
+            iIndex += 1
+            continue
+
+        sKey = sFlag.lstrip("-").replace("-", "_")
+        if isinstance(dKnownFlags[sFlag], bool):
+            dFlags[sKey] = True
+        elif "=" in sToken:
+            dFlags[sKey] = sValue
+        else:
+            if iIndex + 1 >= len(lstArgs):
+                raise ValueError(f"Flag '{sFlag}' expects a value.")
+            iIndex += 1
+            dFlags[sKey] = lstArgs[iIndex]
+        iIndex += 1
+
+    return dFlags, lstRemaining
+
+def splitDispatchFlags(lstArgs) -> tuple:
+    """
+    Separate dispatcher flags (see _DISPATCH_FLAGS_) from the arguments of a module command.
+    """
+    return splitFlags(lstArgs, _DISPATCH_FLAGS_)
+
+def splitGlobalFlags(lstArgs) -> tuple:
+    """
+    Separate global flags (see _GLOBAL_FLAGS_) from a full command line.
+    """
+    return splitFlags(lstArgs, _GLOBAL_FLAGS_)
+
+def getCommandFlags() -> dict:
+    """
+    Return every dispatcher and global flag mapped to its default (False for boolean flags).
+    """
+    return {**_DISPATCH_FLAGS_, **_GLOBAL_FLAGS_}
@@ -0,0 +1,539 @@
+"""
+runner.py - Shared runner for external tools (nmap, tmux, ...).
+
+Every child process is started and supervised by one asyncio event loop
+running in a daemon thread, so modules get the same behaviour for free:
+    - stdout and stderr are read concurrently in chunks, never buffered
+      by the pipe until the process exits;
+    - a global semaphore bounds how many processes run at once, across all
+      threads (shards, batch targets, background jobs, daemon clients);
+    - timeouts and cancellation kill the whole process group, not just the
+      direct child;
+    - each run reports metrics (RunResult.metrics()) and feeds --timings.
+
+Blocking callers (module functions run in threads) use runCommand() and
+streamCommand(); coroutines on any event loop use runAsync() and
+iterOutputAsync().
+
+Cancellation is scoped: code running under runScope(oScope) - and worker
+threads started through inCurrentScope() - registers its processes with
+oScope, and oScope.cancel() kills all of them. The REPL's job engine uses
+this to stop a running background job. Runs execute in the context of the
+code that started them, so they also report to its --timings recording.
+
+Settings (fluxcli.yaml):
+    runner:
+      max_processes: 16    # external processes running at once (split between
+                           # worker processes, see workerpool.py)
+"""
+
+import os
+import time
+import queue
+import atexit
+import signal
+import asyncio
+import threading
+import contextvars
+import subprocess
+from contextlib import contextmanager
+from .timings import recordSubprocess
+
+__all__ = [
+    "RunResult", "RunCancelled", "RunScope", "runScope", "currentScope", "inCurrentScope",
+    "runCommand", "streamCommand", "runAsync", "iterOutputAsync", "getRunnerStats", "killRunning",
+    "getMaxProcesses", "setProcessLimit"
+]
+
+_DEFAULT_MAX_PROCESSES_ = 16
+_CHUNK_SIZE_ = 65536
+
+# Bytes of stderr kept on a RunResult when no stderr callback is given
+_STDERR_LIMIT_ = 65536
+
+# Chunks a streaming consumer may fall behind before the process is paused
+_STREAM_BACKLOG_ = 16
+
+# Seconds between SIGTERM and SIGKILL when a process group is killed
+_KILL_GRACE_ = 2.0
+
+_CURRENT_SCOPE_ = contextvars.ContextVar("fluxcli_run_scope", default=None)
+_END_ = object()
+
+class RunCancelled(Exception):
+    """
+    Raised by a run whose scope was cancelled.
+    """
+
+class RunResult:
+    """
+    Outcome and metrics of one external process run.
+    """
+
+    def __init__(self, lstCmd):
+        self.lstCmd = list(lstCmd)
+        self.iPid = None
+        self.iExitCode = None
+        self.bStdout = b""
+        self.bStderr = b""
+        self.iStdoutBytes = 0
+        self.iStderrBytes = 0
+        self.fQueued = 0.0
+        self.fElapsed = 0.0
+        self.bTimedOut = False
+        self.bCancelled = False
+
+    def metrics(self) -> dict:
+        """
+        Return the run's metrics as a JSON-serializable dict.
+        """
+        return {
+            "command": self.lstCmd[0] if self.lstCmd else "",
+            "pid": self.iPid,
+            "exit_code": self.iExitCode,
+            "queued": round(self.fQueued, 6),
+            "elapsed": round(self.fElapsed, 6),
+            "stdout_bytes": self.iStdoutBytes,
+            "stderr_bytes": self.iStderrBytes,
+            "timed_out": self.bTimedOut,
+            "cancelled": self.bCancelled
+        }
+
+class RunScope:
+    """
+    A group of runs that can be cancelled together. Cancelling kills the runs
+    in progress, and later runs in the scope fail with RunCancelled at once.
+    Work not run by the runner (e.g. isolated module calls, see workerpool.py)
+    can register a callback to be stopped with the scope.
+    """
+
+    def __init__(self, sName: str = ""):
+        self.sName = sName
+        self.bCancelled = False
+        self.setProcesses = set()
+        self.setCallbacks = set()
+        self.oLock = threading.Lock()
+
+    def add(self, oProc) -> None:
+        with self.oLock:
+            self.setProcesses.add(oProc)
+
+    def discard(self, oProc) -> None:
+        with self.oLock:
+            self.setProcesses.discard(oProc)
+
+    def addCallback(self, funcCancel) -> bool:
+        """
+        Have cancel() call funcCancel(). Returns False (and registers nothing)
+        if the scope is already cancelled.
+        """
+        with self.oLock:
+            if self.bCancelled:
+                return False
+            self.setCallbacks.add(funcCancel)
+            return True
+
+    def discardCallback(self, funcCancel) -> None:
+        with self.oLock:
+            self.setCallbacks.discard(funcCancel)
+
+    def cancel(self) -> None:
+        """
+        Cancel the scope, kill every process it is running and call its callbacks.
+        """
+        with self.oLock:
+            self.bCancelled = True
+            lstProcesses = list(self.setProcesses)
+            lstCallbacks = list(self.setCallbacks)
+        for funcCancel in lstCallbacks:
+            funcCancel()
+        if lstProcesses:
+            oLoop = getRunner().oLoop
+            for oProc in lstProcesses:
+                oLoop.call_soon_threadsafe(killProcessGroup, oProc, signal.SIGKILL if hasattr(signal, "SIGKILL") else None)
+
+@contextmanager
+def runScope(oScope: RunScope):
+    """
+    Register runs started by the calling code (and by work passed through
+    inCurrentScope) with oScope for the duration of the block.
+    """
+    oToken = _CURRENT_SCOPE_.set(oScope)
+    try:
+        yield oScope
+    finally:
+        _CURRENT_SCOPE_.reset(oToken)
+
+def currentScope():
+    """
+    Return the RunScope of the calling code, or None.
+    """
+    return _CURRENT_SCOPE_.get()
+
+def inCurrentScope(funcCall):
+    """
+    Wrap funcCall so it runs in the caller's scope when executed on another
+    thread, e.g. oPool.submit(inCurrentScope(sweepHosts), sShard).
+    Wrap once per submitted task: a captured context cannot run on two threads at once.
+    """
+    oContext = contextvars.copy_context()
+    return lambda *lstArgs, **dKwargs: oContext.run(funcCall, *lstArgs, **dKwargs)
+
+class Runner:
+    """
+    The event loop thread that owns all child processes, and its global semaphore.
+    """
+
+    def __init__(self, iMaxProcesses: int):
+        self.iMaxProcesses = max(1, int(iMaxProcesses))
+        self.setActive = set()
+        self.oLock = threading.Lock()
+        self.dStats = {"started": 0, "finished": 0, "timed_out": 0, "cancelled": 0, "waiting": 0}
+        self.oLoop = asyncio.new_event_loop()
+        self.oThread = threading.Thread(target=self.oLoop.run_forever, name="fluxcli-runner", daemon=True)
+        self.oThread.start()
+        # Created on the loop itself; older Pythons bind primitives to the loop at construction
+        self.oSemaphore = self.submit(self._makeSemaphore()).result()
+
+    async def _makeSemaphore(self):
+        return asyncio.Semaphore(self.iMaxProcesses)
+
+    def submit(self, oCoroutine):
+        """
+        Schedule oCoroutine on the runner loop and return a concurrent.futures.Future.
+        """
+        return asyncio.run_coroutine_threadsafe(oCoroutine, self.oLoop)
+
+    def count(self, sName: str, iValue: int = 1) -> None:
+        with self.oLock:
+            self.dStats[sName] += iValue
+
+    def killAll(self) -> None:
+        """
+        Kill every process still running (at interpreter exit).
+        """
+        for oProc in list(self.setActive):
+            killProcessGroup(oProc, signal.SIGKILL if hasattr(signal, "SIGKILL") else None)
+
+_RUNNER_ = None
+_RUNNER_LOCK_ = threading.Lock()
+
+# Set by setProcessLimit, overriding the max_processes setting
+_PROCESS_LIMIT_ = None
+
+def getMaxProcesses() -> int:
+    """
+    Return the number of external processes this process may run at once.
+    """
+    if _PROCESS_LIMIT_ is not None:
+        return _PROCESS_LIMIT_
+    from ..settings import loadUserSettings
+    dSettings = loadUserSettings().get("runner") or {}
+    return max(1, int(dSettings.get("max_processes", _DEFAULT_MAX_PROCESSES_)))
+
+def setProcessLimit(iMaxProcesses: int) -> None:
+    """
+    Use iMaxProcesses instead of the max_processes setting. Only has an effect
+    before the runner starts; worker processes (see workerpool.py) use it to
+    share the setting between them.
+    """
+    global _PROCESS_LIMIT_
+    _PROCESS_LIMIT_ = max(1, int(iMaxProcesses))
+
+def getRunner() -> Runner:
+    """
+    Return the process-wide Runner, starting it on first use.
+    """
+    global _RUNNER_
+    if _RUNNER_ is None:
+        with _RUNNER_LOCK_:
+            if _RUNNER_ is None:
+                _RUNNER_ = Runner(getMaxProcesses())
+                atexit.register(_RUNNER_.killAll)
+    return _RUNNER_
+
+def getRunnerStats() -> dict:
+    """
+    Return process counters of the runner (zeros if it was never started).
+    """
+    if _RUNNER_ is None:
+        return {"max_processes": None, "running": 0, "started": 0, "finished": 0, "timed_out": 0, "cancelled": 0, "waiting": 0}
+    with _RUNNER_.oLock:
+        return dict(_RUNNER_.dStats, max_processes=_RUNNER_.iMaxProcesses, running=len(_RUNNER_.setActive))
+
+def killRunning() -> None:
+    """
+    Kill every process the runner is running, if it was started. For processes
+    that exit without running atexit handlers (e.g. worker processes, see workerpool.py).
+    """
+    if _RUNNER_ is not None:
+        _RUNNER_.killAll()
+
+def getSpawnOptions() -> dict:
+    """
+    Start children in their own process group so they can be killed as a group.
+    """
+    if os.name == "nt":
+        return {"creationflags": subprocess.CREATE_NEW_PROCESS_GROUP}
+    return {"start_new_session": True}
+
+def killProcessGroup(oProc, iSignal=None) -> None:
+    """
+    Send iSignal (default SIGTERM) to oProc's process group, or kill oProc on Windows.
+    """
+    if oProc.returncode is not None:
+        return
+    try:
+        if os.name == "nt":
+            oProc.kill()
+        else:
+            os.killpg(oProc.pid, iSignal or signal.SIGTERM)
+    except (ProcessLookupError, PermissionError, OSError):
+        pass
+
+async def discardStream(oReader) -> None:
+    while await oReader.read(_CHUNK_SIZE_):
+        pass
+
+async def waitDrained(oProc) -> bool:
+    """
+    Wait up to _KILL_GRACE_ seconds for oProc to exit, discarding unread output
+    (asyncio only reports the exit once both pipes are closed).
+    """
+    try:
+        await asyncio.wait_for(
+            asyncio.gather(oProc.wait(), discardStream(oProc.stdout), discardStream(oProc.stderr)),
+            _KILL_GRACE_
+        )
+        return True
+    except asyncio.TimeoutError:
+        return False
+
+async def terminate(oProc) -> None:
+    """
+    Stop oProc's process group: SIGTERM, then SIGKILL after _KILL_GRACE_ seconds.
+    A descendant that left the group and keeps a pipe open is abandoned.
+    """
+    killProcessGroup(oProc)
+    if not await waitDrained(oProc):
+        killProcessGroup(oProc, signal.SIGKILL if hasattr(signal, "SIGKILL") else None)
+        await waitDrained(oProc)
+
+async def callHandler(funcHandler, bChunk) -> None:
+    oValue = funcHandler(bChunk)
+    if asyncio.iscoroutine(oValue):
+        await oValue
+
+async def pumpStream(oReader, funcHandler) -> int:
+    """
+    Pass every chunk read from oReader to funcHandler; return the byte count.
+    """
+    iBytes = 0
+    while True:
+        bChunk = await oReader.read(_CHUNK_SIZE_)
+        if not bChunk:
+            return iBytes
+        iBytes += len(bChunk)
+        await callHandler(funcHandler, bChunk)
+
+def adoptContext(oContext) -> None:
+    """
+    Set the context variables of oContext (captured with contextvars.copy_context()
+    by the thread starting a run) in the running task's own context.
+    """
+    for oVar, oValue in oContext.items():
+        oVar.set(oValue)
+
+async def runOnLoop(lstCmd, fTimeout, funcOnStdout, funcOnStderr, oContext) -> RunResult:
+    """
+    Run lstCmd on the runner loop, in oContext, the context of the code starting
+    the run (its RunScope and timing recording). See runAsync for the other parameters.
+    """
+    adoptContext(oContext)
+    oScope = _CURRENT_SCOPE_.get()
+    oRunner = getRunner()
+    oResult = RunResult(lstCmd)
+    lstStdout = []
+    lstStderr = []
+    iStderrKept = 0
+
+    def keepStderr(bChunk):
+        # Keep only the last _STDERR_LIMIT_ bytes
+        nonlocal iStderrKept
+        lstStderr.append(bChunk)
+        iStderrKept += len(bChunk)
+        while iStderrKept - len(lstStderr[0]) >= _STDERR_LIMIT_:
+            iStderrKept -= len(lstStderr.pop(0))
+
+    fQueued = time.perf_counter()
+    oRunner.count("waiting")
+    try:
+        await oRunner.oSemaphore.acquire()
+    finally:
+        oRunner.count("waiting", -1)
+    try:
+        oResult.fQueued = time.perf_counter() - fQueued
+        if oScope is not None and oScope.bCancelled:
+            oResult.bCancelled = True
+            raise RunCancelled(f"'{lstCmd[0]}' was cancelled")
+
+        fStart = time.perf_counter()
+        oProc = await asyncio.create_subprocess_exec(
+            *lstCmd,
+            stdin=asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            **getSpawnOptions()
+        )
+        oResult.iPid = oProc.pid
+        oRunner.count("started")
+        oRunner.setActive.add(oProc)
+        if oScope is not None:
+            oScope.add(oProc)
+        try:
+            oWork = asyncio.gather(
+                pumpStream(oProc.stdout, funcOnStdout or lstStdout.append),
+                pumpStream(oProc.stderr, funcOnStderr or keepStderr),
+                oProc.wait()
+            )
+            try:
+                oResult.iStdoutBytes, oResult.iStderrBytes, _ = await asyncio.wait_for(oWork, fTimeout)
+            except asyncio.TimeoutError:
+                oResult.bTimedOut = True
+                oRunner.count("timed_out")
+                await terminate(oProc)
+            except asyncio.CancelledError:
+                oResult.bCancelled = True
+                oRunner.count("cancelled")
+                await terminate(oProc)
+                raise
+        finally:
+            oRunner.setActive.discard(oProc)
+            if oScope is not None:
+                oScope.discard(oProc)
+            oRunner.count("finished")
+            oResult.iExitCode = oProc.returncode
+            oResult.fElapsed = time.perf_counter() - fStart
+            recordSubprocess(os.path.basename(lstCmd[0]), oResult.iExitCode, oResult.fElapsed, oResult.iStdoutBytes)
+    finally:
+        oRunner.oSemaphore.release()
+
+    oResult.bStdout = b"".join(lstStdout)
+    oResult.bStderr = b"".join(lstStderr)
+    if oScope is not None and oScope.bCancelled and oResult.iExitCode != 0:
+        oResult.bCancelled = True
+        raise RunCancelled(f"'{lstCmd[0]}' was cancelled")
+    if oResult.bTimedOut:
+        raise subprocess.TimeoutExpired(lstCmd, fTimeout, output=oResult.bStdout, stderr=oResult.bStderr)
+    return oResult
+
+def runCommand(lstCmd, fTimeout=None) -> RunResult:
+    """
+    Run lstCmd to completion and return its RunResult, with stdout in bStdout
+    and the tail of stderr in bStderr. Blocks the calling thread only.
+    Raises subprocess.TimeoutExpired after fTimeout seconds (the process group
+    is killed), RunCancelled if the current scope is cancelled, and OSError
+    if the program cannot be started.
+    """
+    oFuture = getRunner().submit(runOnLoop(lstCmd, fTimeout, None, None, contextvars.copy_context()))
+    try:
+        return oFuture.result()
+    except BaseException:
+        # KeyboardInterrupt and the like: don't leave the process running
+        oFuture.cancel()
+        raise
+
+class OutputStream:
+    """
+    Iterator over the stdout chunks of a running command (see streamCommand).
+    After iteration ends, oResult holds the RunResult (without bStdout).
+    """
+
+    def __init__(self, lstCmd, fTimeout=None):
+        self.lstCmd = list(lstCmd)
+        self.oResult = None
+        self.oQueue = queue.Queue()
+        self.oRunner = getRunner()
+        self.oSpace = None
+        self.oFuture = self.oRunner.submit(self._run(fTimeout, contextvars.copy_context()))
+
+    async def _run(self, fTimeout, oContext):
+        self.oSpace = asyncio.Event()
+        try:
+            self.oResult = await runOnLoop(self.lstCmd, fTimeout, self._put, None, oContext)
+        finally:
+            self.oQueue.put(_END_)
+
+    async def _put(self, bChunk):
+        # Pause reading (and so, via the pipe, the process) while the consumer is behind
+        while self.oQueue.qsize() >= _STREAM_BACKLOG_:
+            self.oSpace.clear()
+            await self.oSpace.wait()
+        self.oQueue.put_nowait(bChunk)
+
+    def __iter__(self):
+        bFinished = False
+        try:
+            while True:
+                oItem = self.oQueue.get()
+                if oItem is _END_:
+                    bFinished = True
+                    break
+                self.oRunner.oLoop.call_soon_threadsafe(self.oSpace.set)
+                yield oItem
+            # Re-raise TimeoutExpired, RunCancelled or OSError from the run
+            self.oFuture.result()
+        finally:
+            if not bFinished:
+                self.close()
+
+    def close(self) -> None:
+        """
+        Stop the command (killing its process group) if it is still running.
+        """
+        if not self.oFuture.done():
+            self.oFuture.cancel()
+            if self.oSpace is not None:
+                self.oRunner.oLoop.call_soon_threadsafe(self.oSpace.set)
+            try:
+                self.oFuture.result(timeout=_KILL_GRACE_ + 1)
+            except BaseException:
+                pass
+
+def streamCommand(lstCmd, fTimeout=None) -> OutputStream:
+    """
+    Start lstCmd and return an OutputStream yielding its stdout in chunks as
+    they are produced. Errors (see runCommand) are raised from the iteration.
+    Stopping iteration early kills the process group.
+    """
+    return OutputStream(lstCmd, fTimeout)
+
+async def runAsync(lstCmd, fTimeout=None, funcOnStdout=None, funcOnStderr=None) -> RunResult:
+    """
+    Coroutine version of runCommand, usable from any event loop.
+    If given, funcOnStdout / funcOnStderr receive each chunk instead of it being
+    kept on the result; they run on the runner's loop thread, may be coroutine
+    functions, and must not block.
+    """
+    oFuture = getRunner().submit(runOnLoop(lstCmd, fTimeout, funcOnStdout, funcOnStderr, contextvars.copy_context()))
+    try:
+        return await asyncio.wrap_future(oFuture)
+    except asyncio.CancelledError:
+        oFuture.cancel()
+        raise
+
+async def iterOutputAsync(lstCmd, fTimeout=None):
+    """
+    Async generator version of streamCommand, usable from any event loop.
+    """
+    oStream = OutputStream(lstCmd, fTimeout)
+    oLoop = asyncio.get_running_loop()
+    iterChunks = iter(oStream)
+    try:
+        while True:
+            bChunk = await oLoop.run_in_executor(None, next, iterChunks, _END_)
+            if bChunk is _END_:
+                return
+            yield bChunk
+    finally:
+        oStream.close()
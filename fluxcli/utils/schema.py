@@ -0,0 +1,309 @@
+"""
+schema.py - Typed argument schemas for module commands.
+
+A command may declare its arguments in commands.yaml:
+
+    pingsweep:
+      usage: "pingsweep <subnet> [shard-prefix]"
+      args:
+        - {name: subnet, type: cidr, required: true}
+        - {name: shard-prefix, type: int, min: 1, max: 128}
+        - {name: timeout, type: float, min: 0, default: 300}
+
+Argument types:
+    str       any value
+    int       integer, optionally within min/max
+    float     number, optionally within min/max
+    flag      true/false; '--name' alone means true
+    choice    one of 'choices'
+    ip        IPv4/IPv6 address
+    cidr      network (a bare address is a single-host network)
+    target    anything nmap accepts: address, network, octet range or hostname
+    port      port number 1-65535
+    ports     nmap port list, e.g. "22,80,8000-8100" or "T:80,U:53"
+
+Arguments are given positionally or as '--name value' ('--name=value');
+other words starting with '--' are rejected as unknown options.
+The last argument may be 'variadic: true' to collect every remaining word,
+including words starting with '--'.
+A positional slot that is skipped because a later argument was given by name
+is filled with its default (or None).
+
+compileSchema() checks a declaration once, when the command manifest is
+built, and returns a JSON-serializable form that is stored in the manifest;
+ArgValidator turns that into one converter per argument. Values are validated
+and normalized ("10.0.0.7/24" -> "10.0.0.0/24", "080" -> "80") before the
+command runs, and are still passed to module functions as strings.
+"""
+
+import re
+import ipaddress
+
+__all__ = ["compileSchema", "ArgValidator", "formatUsage"]
+
+_TRUE_VALUES_ = ("true", "yes", "on", "1")
+_FALSE_VALUES_ = ("false", "no", "off", "0")
+
+# Hostnames and nmap octet ranges (e.g. 10.0.1-5.*) accepted by the 'target' type
+_HOSTNAME_RE_ = re.compile(r"^(?=.{1,253}$)[A-Za-z0-9_]([A-Za-z0-9_-]{0,62})(\.[A-Za-z0-9_]([A-Za-z0-9_-]{0,62}))*\.?$")
+_OCTET_RANGE_RE_ = re.compile(r"^[0-9*,-]+(\.[0-9*,-]+){3}$")
+
+# Keys allowed in an argument declaration
+_SPEC_KEYS_ = ("name", "type", "required", "default", "min", "max", "choices", "variadic", "description")
+
+def checkStr(sValue: str, dArg) -> str:
+    return sValue
+
+def checkBounds(oValue, dArg):
+    if dArg.get("min") is not None and oValue < dArg["min"]:
+        raise ValueError(f"must be at least {dArg['min']}")
+    if dArg.get("max") is not None and oValue > dArg["max"]:
+        raise ValueError(f"must be at most {dArg['max']}")
+    return oValue
+
+def checkInt(sValue: str, dArg) -> str:
+    try:
+        iValue = int(sValue, 10)
+    except ValueError:
+        raise ValueError("expected an integer")
+    return str(checkBounds(iValue, dArg))
+
+def checkFloat(sValue: str, dArg) -> str:
+    try:
+        fValue = float(sValue)
+    except ValueError:
+        raise ValueError("expected a number")
+    if fValue != fValue:
+        raise ValueError("expected a number")
+    return f"{checkBounds(fValue, dArg):g}"
+
+def checkFlag(sValue: str, dArg) -> str:
+    sLower = sValue.lower()
+    if sLower in _TRUE_VALUES_:
+        return "true"
+    if sLower in _FALSE_VALUES_:
+        return "false"
+    raise ValueError("expected true or false")
+
+def checkChoice(sValue: str, dArg) -> str:
+    if sValue not in dArg["choices"]:
+        raise ValueError(f"expected one of: {', '.join(dArg['choices'])}")
+    return sValue
+
+def checkIp(sValue: str, dArg) -> str:
+    try:
+        return str(ipaddress.ip_address(sValue))
+    except ValueError:
+        raise ValueError("expected an IP address")
+
+def checkCidr(sValue: str, dArg) -> str:
+    try:
+        return str(ipaddress.ip_network(sValue, strict=False))
+    except ValueError:
+        raise ValueError("expected a network, e.g. 192.168.1.0/24")
+
+def checkTarget(sValue: str, dArg) -> str:
+    try:
+        if "/" in sValue:
+            return str(ipaddress.ip_network(sValue, strict=False))
+        return str(ipaddress.ip_address(sValue))
+    except ValueError:
+        pass
+    if _OCTET_RANGE_RE_.match(sValue):
+        for sOctet in sValue.split("."):
+            for sPart in sOctet.replace("*", "0-255").split(","):
+                sLow, _, sHigh = sPart.partition("-")
+                if not sLow.isdigit() or int(sLow) > 255 or (sHigh and (not sHigh.isdigit() or int(sHigh) > 255)):
+                    raise ValueError("invalid octet range")
+        return sValue
+    if _HOSTNAME_RE_.match(sValue) and not sValue.replace(".", "").isdigit():
+        return sValue.lower()
+    raise ValueError("expected an address, network, octet range or hostname")
+
+def checkPort(sValue: str, dArg) -> str:
+    if not sValue.isdigit() or not 1 <= int(sValue) <= 65535:
+        raise ValueError("expected a port number (1-65535)")
+    return str(int(sValue))
+
+def checkPorts(sValue: str, dArg) -> str:
+    """
+    Validate an nmap port list: comma-separated ports and ranges ("-100",
+    "1000-", "-" for all), each group optionally prefixed with T:, U: or S:.
+    """
+    lstParts = []
+    for sPart in sValue.replace(" ", "").split(","):
+        sProto = ""
+        if len(sPart) > 2 and sPart[1] == ":" and sPart[0].upper() in "TUS":
+            sProto, sPart = sPart[:2].upper(), sPart[2:]
+        sLow, sDash, sHigh = sPart.partition("-")
+        for sPort in (sLow, sHigh):
+            if sPort and (not sPort.isdigit() or int(sPort) > 65535):
+                raise ValueError(f"invalid port '{sPort}' (expected 0-65535)")
+        if not sLow and not sDash:
+            raise ValueError("empty port in list")
+        if sLow and sHigh and int(sLow) > int(sHigh):
+            raise ValueError(f"invalid range '{sPart}'")
+        lstParts.append(sProto + "-".join(str(int(sPort)) if sPort else "" for sPort in ((sLow, sHigh) if sDash else (sLow,))))
+    return ",".join(lstParts)
+
+# Converter per argument type: (value, declaration) -> normalized value, or ValueError
+_TYPES_ = {
+    "str": checkStr,
+    "int": checkInt,
+    "float": checkFloat,
+    "flag": checkFlag,
+    "choice": checkChoice,
+    "ip": checkIp,
+    "cidr": checkCidr,
+    "target": checkTarget,
+    "port": checkPort,
+    "ports": checkPorts,
+}
+
+def compileSchema(lstArgs) -> dict:
+    """
+    Check the 'args' declaration of a command and return its compiled form:
+    {"args": [...], "options": {"--name": index}, "required": N, "variadic": bool}.
+    Defaults are validated and normalized too. Raises ValueError on a bad declaration.
+    """
+    if not isinstance(lstArgs, list):
+        raise ValueError("'args' must be a list")
+    lstCompiled = []
+    dOptions = {}
+    iRequired = 0
+    for iIndex, dArg in enumerate(lstArgs):
+        if not isinstance(dArg, dict) or not dArg.get("name"):
+            raise ValueError(f"argument {iIndex + 1} needs a name")
+        sName = str(dArg["name"])
+        lstUnknown = [sKey for sKey in dArg if sKey not in _SPEC_KEYS_]
+        if lstUnknown:
+            raise ValueError(f"argument '{sName}': unknown key(s) {', '.join(lstUnknown)}")
+        sType = str(dArg.get("type", "str"))
+        if sType not in _TYPES_:
+            raise ValueError(f"argument '{sName}': unknown type '{sType}'")
+        dCompiled = {"name": sName, "type": sType, "required": bool(dArg.get("required")), "variadic": bool(dArg.get("variadic"))}
+        for sKey in ("min", "max", "description"):
+            if dArg.get(sKey) is not None:
+                dCompiled[sKey] = dArg[sKey]
+        if sType == "choice":
+            if not dArg.get("choices"):
+                raise ValueError(f"argument '{sName}': type 'choice' needs 'choices'")
+            dCompiled["choices"] = [str(sChoice) for sChoice in dArg["choices"]]
+        if dCompiled["variadic"] and iIndex != len(lstArgs) - 1:
+            raise ValueError(f"argument '{sName}': only the last argument can be variadic")
+        if dCompiled["required"]:
+            if iRequired != iIndex:
+                raise ValueError(f"argument '{sName}': required arguments must come first")
+            iRequired += 1
+        dCompiled["default"] = None
+        if dArg.get("default") is not None:
+            sDefault = str(dArg["default"]).lower() if isinstance(dArg["default"], bool) else str(dArg["default"])
+            try:
+                dCompiled["default"] = _TYPES_[sType](sDefault, dCompiled)
+            except ValueError as e:
+                raise ValueError(f"argument '{sName}': bad default '{sDefault}': {e}")
+        if not dCompiled["variadic"]:
+            dOptions[f"--{sName}"] = iIndex
+        lstCompiled.append(dCompiled)
+    return {
+        "args": lstCompiled,
+        "options": dOptions,
+        "required": iRequired,
+        "variadic": bool(lstCompiled) and lstCompiled[-1]["variadic"]
+    }
+
+def formatUsage(sCmdName: str, dSchema) -> str:
+    """
+    Return a usage line built from a compiled schema, e.g. "portscan <target> [ports]".
+    """
+    lstParts = [sCmdName]
+    for dArg in dSchema["args"]:
+        sName = dArg["name"] + ("..." if dArg["variadic"] else "")
+        lstParts.append(f"<{sName}>" if dArg["required"] else f"[{sName}]")
+    return " ".join(lstParts)
+
+class ArgValidator:
+    """
+    Validates and normalizes the arguments of one command against its compiled schema.
+    """
+
+    def __init__(self, dSchema):
+        self.lstArgs = dSchema["args"]
+        self.dOptions = dSchema["options"]
+        self.iRequired = dSchema["required"]
+        self.bVariadic = dSchema["variadic"]
+        self.lstCheckers = [_TYPES_[dArg["type"]] for dArg in self.lstArgs]
+
+    def check(self, iIndex: int, sValue: str) -> str:
+        """
+        Return the normalized value of argument iIndex. Raises ValueError.
+        """
+        try:
+            return self.lstCheckers[iIndex](str(sValue).strip(), self.lstArgs[iIndex])
+        except ValueError as e:
+            raise ValueError(f"Invalid {self.lstArgs[iIndex]['name']} '{sValue}': {e}")
+
+    def isVariadic(self, iPos: int) -> bool:
+        """
+        Return True if positional word iPos belongs to a variadic argument.
+        """
+        return self.bVariadic and iPos >= len(self.lstArgs) - 1
+
+    def validate(self, lstTokens, iOffset: int = 0) -> list:
+        """
+        Return the normalized positional argument list for lstTokens.
+        iOffset skips leading arguments supplied elsewhere (e.g. the target of
+        each --targets-file line). A None token is a skipped slot, as in the
+        output of an earlier validate(), and takes its default.
+        Raises ValueError on the first problem.
+        """
+        lstPositional = []
+        dNamed = {}
+        iIndex = 0
+        while iIndex < len(lstTokens):
+            sToken = lstTokens[iIndex]
+            if sToken is None:
+                lstPositional.append(sToken)
+                iIndex += 1
+                continue
+            sOption, sEquals, sValue = sToken.partition("=")
+            iArg = self.dOptions.get(sOption) if sToken.startswith("--") else None
+            if iArg is None and sToken.startswith("--") and len(sToken) > 2 and not self.isVariadic(len(lstPositional) + iOffset):
+                raise ValueError(f"Unknown option '{sOption}'.")
+            if iArg is None or iArg < iOffset:
+                lstPositional.append(sToken)
+                iIndex += 1
+                continue
+            if not sEquals:
+                if self.lstArgs[iArg]["type"] == "flag":
+                    sValue = "true"
+                elif iIndex + 1 >= len(lstTokens):
+                    raise ValueError(f"Option '{sOption}' expects a value.")
+                else:
+                    iIndex += 1
+                    sValue = lstTokens[iIndex]
+            if iArg in dNamed:
+                raise ValueError(f"Option '{sOption}' given twice.")
+            dNamed[iArg] = self.check(iArg, sValue)
+            iIndex += 1
+
+        iSlots = len(self.lstArgs) - iOffset
+        if not self.bVariadic and len(lstPositional) > iSlots:
+            raise ValueError(f"Too many arguments (at most {iSlots}).")
+
+        lstValues = []
+        for iPos, sToken in enumerate(lstPositional):
+            iArg = min(iPos + iOffset, len(self.lstArgs) - 1)
+            if iArg in dNamed and not self.lstArgs[iArg]["variadic"]:
+                raise ValueError(f"{self.lstArgs[iArg]['name']} given both by position and as --{self.lstArgs[iArg]['name']}.")
+            lstValues.append(self.lstArgs[iArg]["default"] if sToken is None else self.check(iArg, sToken))
+
+        # Named arguments beyond the positional ones; skipped slots take their default
+        iLast = max(dNamed, default=-1)
+        for iArg in range(len(lstValues) + iOffset, iLast + 1):
+            lstValues.append(dNamed[iArg] if iArg in dNamed else self.lstArgs[iArg]["default"])
+
+        for iArg in range(iOffset, self.iRequired):
+            if iArg - iOffset >= len(lstValues) or lstValues[iArg - iOffset] is None:
+                raise ValueError(f"Missing required argument: {self.lstArgs[iArg]['name']}.")
+        return lstValues
@@ -0,0 +1,207 @@
+"""
+timings.py - Per-command timing and profiling instrumentation.
+
+A TimingRecorder collects how long one fluxcli call spends in each phase:
+    registry     building the command registry (manifest load or rebuild)
+    import       importing the module.py of the dispatched module
+    command      the module function itself (includes the two below, and
+                 serialize too in --stream and --targets-file modes)
+    subprocess   wall time of external tools such as nmap
+    parse        parsing tool output (e.g. nmap XML)
+    serialize    encoding results as JSON
+plus every subprocess's exit code, the bytes of tool output read and the
+peak RSS of the process and its children. Enable it with '--timings' (the
+record is written to stderr as one JSON line), '--profile FILE' (also dumps
+cProfile stats of the calling thread to FILE, readable with pstats) or the
+settings file:
+
+    timings:
+      enabled: false                      # record every call
+      metrics_file: ~/.fluxcli/metrics.ndjson  # append records here instead of stderr
+
+Instrumented code wraps its work in timedPhase(); when no recording is active
+that is a single context variable lookup, so the hooks cost nothing in normal
+runs. The recording belongs to the calling context, so concurrent calls (daemon
+clients) each get their own, and untimed calls are never counted in another's.
+Worker threads started through inCurrentScope() (shards, batch targets,
+pipeline stages) and processes run by the runner report to the recording of
+the code that started them.
+"""
+
+import os
+import sys
+import json
+import time
+import threading
+import contextvars
+from contextlib import contextmanager
+
+__all__ = [
+    "TimingRecorder", "timedPhase", "addPhase", "recordSubprocess", "addCount",
+    "isRecording", "recordTimings", "getPeakRss"
+]
+
+# The recording of the calling context, or None when timings are off
+_CURRENT_RECORDER_ = contextvars.ContextVar("fluxcli_timings", default=None)
+
+class TimingRecorder:
+    """
+    Accumulates phase durations, counters and subprocess results for one command.
+    Safe to update from several threads.
+    """
+
+    def __init__(self, lstArgv):
+        self.lstArgv = list(lstArgv)
+        self.fStart = time.perf_counter()
+        self.oLock = threading.Lock()
+        self.dPhases = {}
+        self.dCounts = {}
+        self.lstSubprocesses = []
+
+    def addPhase(self, sPhase: str, fSeconds: float) -> None:
+        with self.oLock:
+            self.dPhases[sPhase] = self.dPhases.get(sPhase, 0.0) + fSeconds
+
+    def addCount(self, sName: str, iValue: int) -> None:
+        with self.oLock:
+            self.dCounts[sName] = self.dCounts.get(sName, 0) + iValue
+
+    def addSubprocess(self, sCommand: str, iExitCode, fSeconds: float, iBytesRead: int = 0) -> None:
+        with self.oLock:
+            self.lstSubprocesses.append({
+                "command": sCommand, "exit_code": iExitCode, "seconds": round(fSeconds, 6), "bytes_read": iBytesRead
+            })
+            self.dPhases["subprocess"] = self.dPhases.get("subprocess", 0.0) + fSeconds
+            self.dCounts["bytes_read"] = self.dCounts.get("bytes_read", 0) + iBytesRead
+
+    def toRecord(self) -> dict:
+        """
+        Return the JSON-serializable timing record.
+        """
+        with self.oLock:
+            return {
+                "timestamp": time.time(),
+                "argv": self.lstArgv,
+                "total": round(time.perf_counter() - self.fStart, 6),
+                "phases": {sPhase: round(fSeconds, 6) for sPhase, fSeconds in self.dPhases.items()},
+                "subprocesses": list(self.lstSubprocesses),
+                "bytes_read": self.dCounts.get("bytes_read", 0),
+                "counts": dict(self.dCounts),
+                "peak_rss_kb": getPeakRss()
+            }
+
+@contextmanager
+def timedPhase(sPhase: str):
+    """
+    Add the time spent in the block to phase sPhase of the active recording, if any.
+    """
+    oRecorder = _CURRENT_RECORDER_.get()
+    if oRecorder is None:
+        yield
+        return
+    fStart = time.perf_counter()
+    try:
+        yield
+    finally:
+        oRecorder.addPhase(sPhase, time.perf_counter() - fStart)
+
+def addPhase(sPhase: str, fSeconds: float) -> None:
+    """
+    Add fSeconds to phase sPhase of the active recording, for code that times
+    interleaved work itself (e.g. a parser that yields between chunks).
+    """
+    oRecorder = _CURRENT_RECORDER_.get()
+    if oRecorder is not None:
+        oRecorder.addPhase(sPhase, fSeconds)
+
+def recordSubprocess(sCommand: str, iExitCode, fSeconds: float, iBytesRead: int = 0) -> None:
+    """
+    Report a finished subprocess and the bytes of output read from it
+    (its wall time counts towards the 'subprocess' phase).
+    """
+    oRecorder = _CURRENT_RECORDER_.get()
+    if oRecorder is not None:
+        oRecorder.addSubprocess(sCommand, iExitCode, fSeconds, iBytesRead)
+
+def addCount(sName: str, iValue: int) -> None:
+    """
+    Add iValue to counter sName of the active recording (e.g. "bytes_read").
+    """
+    oRecorder = _CURRENT_RECORDER_.get()
+    if oRecorder is not None:
+        oRecorder.addCount(sName, iValue)
+
+def getPeakRss() -> dict:
+    """
+    Return the peak resident set size in KiB of this process ("self") and of its
+    waited-for children ("children"), or None where the resource module is unavailable.
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+    # ru_maxrss is in KiB on Linux but in bytes on macOS
+    iDivisor = 1024 if sys.platform == "darwin" else 1
+    return {
+        "self": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss // iDivisor,
+        "children": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss // iDivisor
+    }
+
+def writeRecord(dRecord: dict, sMetricsFile=None, bStderr: bool = True) -> None:
+    """
+    Write dRecord as one JSON line to stderr and/or append it to sMetricsFile.
+    """
+    sLine = json.dumps(dRecord) + "\n"
+    if sMetricsFile:
+        try:
+            sPath = os.path.expanduser(sMetricsFile)
+            os.makedirs(os.path.dirname(sPath) or ".", exist_ok=True)
+            with open(sPath, "a", encoding="utf-8") as fMetrics:
+                fMetrics.write(sLine)
+        except OSError as e:
+            print(f"[Warning] Failed to write timings to '{sMetricsFile}': {e}")
+    if bStderr:
+        sys.stderr.write(sLine)
+        sys.stderr.flush()
+
+def isRecording() -> bool:
+    """
+    Return True while a recording is active.
+    """
+    return _CURRENT_RECORDER_.get() is not None
+
+@contextmanager
+def recordTimings(lstArgv, bPrint: bool = True, sMetricsFile=None, sProfilePath=None):
+    """
+    Record timings for the enclosed command and write the record when it ends:
+    to stderr if bPrint, and appended to sMetricsFile if given. With sProfilePath
+    the calling thread also runs under cProfile and the stats are dumped there.
+    Nested uses in the same context (the same command already being recorded)
+    join the outer recording.
+    """
+    oRecorder = _CURRENT_RECORDER_.get()
+    if oRecorder is not None:
+        yield oRecorder
+        return
+
+    oRecorder = TimingRecorder(lstArgv)
+    oToken = _CURRENT_RECORDER_.set(oRecorder)
+    oProfile = None
+    if sProfilePath:
+        import cProfile
+        oProfile = cProfile.Profile()
+        oProfile.enable()
+    try:
+        yield oRecorder
+    finally:
+        if oProfile:
+            oProfile.disable()
+            try:
+                oProfile.dump_stats(sProfilePath)
+            except OSError as e:
+                print(f"[Warning] Failed to write profile to '{sProfilePath}': {e}")
+        _CURRENT_RECORDER_.reset(oToken)
+        dRecord = oRecorder.toRecord()
+        if oProfile:
+            dRecord["profile"] = os.path.abspath(sProfilePath)
+        writeRecord(dRecord, sMetricsFile, bPrint or not sMetricsFile)
@@ -0,0 +1,140 @@
+"""
+yamlcache.py - Fast loading of FluxCLI's YAML files (fluxcli.yaml, commands.yaml).
+
+Parsed documents are cached twice, both keyed on the file's mtime and size:
+    - on disk, marshalled, under <cache dir>/yaml/, so a fresh process
+      never has to parse an unchanged file again;
+    - in memory, so repeated loads in one process (every getXSettings() call
+      reads fluxcli.yaml) only cost a stat and a marshal.loads.
+Every load returns a fresh copy, so callers may modify the result freely.
+
+PyYAML is only imported on a cache miss, and then parses with the libyaml
+C loader (CSafeLoader) when PyYAML was built with it, falling back to the
+pure-Python SafeLoader otherwise. Documents marshal cannot represent (e.g.
+YAML timestamps) are simply not cached.
+"""
+
+import os
+import sys
+import marshal
+import hashlib
+
+__all__ = ["loadYamlFile", "getYamlLoader", "clearYamlCache", "getYamlCacheDir"]
+
+_CACHE_SUBDIR_ = "yaml"
+_CACHE_SUFFIX_ = ".marshal"
+
+# Bumped when the cache file layout changes; the interpreter version is part of
+# the key as well, since the marshal format is not stable across Python versions
+_CACHE_VERSION_ = (1, marshal.version, sys.version_info[:2])
+
+# path -> ((mtime_ns, size), marshalled document)
+_dYamlMemo = {}
+
+def getYamlLoader():
+    """
+    Return the fastest safe PyYAML loader class available (imports PyYAML).
+    """
+    import yaml
+    return getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+def getYamlCacheDir(sCacheDir: str) -> str:
+    return os.path.join(sCacheDir, _CACHE_SUBDIR_)
+
+def getCacheFile(sCacheDir: str, sPath: str) -> str:
+    sDigest = hashlib.sha1(sPath.encode("utf-8")).hexdigest()
+    return os.path.join(getYamlCacheDir(sCacheDir), sDigest + _CACHE_SUFFIX_)
+
+def readCacheFile(sCacheFile: str, sPath: str, tupKey):
+    """
+    Return the marshalled document stored in sCacheFile for sPath at tupKey,
+    or None if the file is missing, unreadable or stale.
+    """
+    try:
+        with open(sCacheFile, "rb") as fCache:
+            tupEntry = marshal.loads(fCache.read())
+    except (OSError, ValueError, EOFError, TypeError):
+        return None
+    if not isinstance(tupEntry, tuple) or len(tupEntry) != 4:
+        return None
+    oVersion, sCachedPath, tupCachedKey, bPayload = tupEntry
+    if oVersion != _CACHE_VERSION_ or sCachedPath != sPath or tupCachedKey != tupKey:
+        return None
+    return bPayload
+
+def writeCacheFile(sCacheFile: str, sPath: str, tupKey, bPayload: bytes) -> None:
+    """
+    Write the cache entry atomically. Failures (read-only home, full disk) are
+    ignored: the file is simply parsed again next time.
+    """
+    sTmpPath = f"{sCacheFile}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(os.path.dirname(sCacheFile), exist_ok=True)
+        with open(sTmpPath, "wb") as fCache:
+            fCache.write(marshal.dumps((_CACHE_VERSION_, sPath, tupKey, bPayload)))
+        os.replace(sTmpPath, sCacheFile)
+    except OSError:
+        removeQuietly(sTmpPath)
+
+def removeQuietly(sPath: str) -> None:
+    try:
+        os.remove(sPath)
+    except OSError:
+        pass
+
+def loadYamlFile(sPath: str, sCacheDir: str = None, bRefresh: bool = False):
+    """
+    Return the parsed contents of the YAML file sPath (None for an empty file).
+    With sCacheDir, the parsed document is cached on disk under it as well as
+    in memory. bRefresh forces a parse and rewrites the cache entries.
+    Raises OSError if sPath cannot be read and yaml.YAMLError if it is invalid.
+    """
+    sPath = os.path.abspath(sPath)
+    oStat = os.stat(sPath)
+    tupKey = (oStat.st_mtime_ns, oStat.st_size)
+
+    if not bRefresh:
+        tupMemo = _dYamlMemo.get(sPath)
+        if tupMemo and tupMemo[0] == tupKey:
+            return marshal.loads(tupMemo[1])
+        if sCacheDir:
+            bPayload = readCacheFile(getCacheFile(sCacheDir, sPath), sPath, tupKey)
+            if bPayload is not None:
+                _dYamlMemo[sPath] = (tupKey, bPayload)
+                return marshal.loads(bPayload)
+
+    import yaml
+    with open(sPath, "r", encoding="utf-8") as fYaml:
+        oData = yaml.load(fYaml, Loader=getYamlLoader())
+
+    try:
+        bPayload = marshal.dumps(oData)
+    except ValueError:
+        # Not representable by marshal; parsed again on every load
+        _dYamlMemo.pop(sPath, None)
+        return oData
+    _dYamlMemo[sPath] = (tupKey, bPayload)
+    if sCacheDir:
+        writeCacheFile(getCacheFile(sCacheDir, sPath), sPath, tupKey, bPayload)
+    return oData
+
+def clearYamlCache(sCacheDir: str = None) -> int:
+    """
+    Forget every document cached in memory and, with sCacheDir, remove the
+    cache files under it. Returns the number of files removed.
+    """
+    _dYamlMemo.clear()
+    if not sCacheDir:
+        return 0
+    sDir = getYamlCacheDir(sCacheDir)
+    if not os.path.isdir(sDir):
+        return 0
+    iRemoved = 0
+    for sName in os.listdir(sDir):
+        if sName.endswith(_CACHE_SUFFIX_):
+            try:
+                os.remove(os.path.join(sDir, sName))
+                iRemoved += 1
+            except OSError:
+                pass
+    return iRemoved
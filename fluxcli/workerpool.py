@@ -0,0 +1,933 @@
+"""
+workerpool.py - Run module commands in a pool of warm worker processes.
+
+Normally module code is imported into the fluxcli process and called
+directly, so a command that hangs, crashes or leaks memory takes the REPL or
+the daemon down with it. Modules listed in the 'isolation' settings run in
+worker processes instead:
+    - workers are forked from a forkserver that already has FluxCLI imported,
+      and import the isolated modules once when they start, so a call only
+      costs a round trip over a pipe;
+    - a call running longer than its timeout, or a worker whose resident
+      memory grows past max_memory_mb, is killed and the call fails with
+      TimeoutError or MemoryError;
+    - a worker is replaced after max_calls calls, after a timeout, crash or
+      memory overrun, and when module code is reloaded (see reloader.py);
+      replacements are started in the background;
+    - calls made from several threads (--targets-file, pipelines, background
+      jobs, daemon clients) run in different workers, so CPU-heavy parsing is
+      spread over the cores.
+
+For an isolated module, resolveModuleInstance() in main.py returns a
+RemoteModule: its functions and '<command>Stream' generators take the same
+arguments as the real ones, so result caching, the inventory and output work
+unchanged. The checkpoint of the running command (see checkpoint.py) is
+proxied back to this process, and anything the module prints is forwarded to
+this process' stdout/stderr. Arguments and results must be picklable.
+
+Budgets meant to be global stay global: a module can offer its worker calls a
+WorkerService running in this process (see callParent), which is how the nmap
+scheduler's max_pps / max_hosts leases are taken from this process' scheduler
+by every worker. The runner's max_processes is split evenly between the
+workers instead (each gets max_processes / workers, at least 1), as a worker
+cannot ask the parent for every process it starts without blocking its runner.
+
+Settings (fluxcli.yaml):
+    isolation:
+      modules: [nmap]       # modules run in workers, or "all" (default: none)
+      workers: 4            # worker processes kept warm
+      timeout: 0            # seconds per call, 0 for no limit ('timeout' in commands.yaml overrides)
+      max_memory_mb: 0      # resident memory per worker, 0 for no limit
+      max_calls: 200        # calls before a worker is replaced
+"""
+
+import os
+import sys
+import time
+import atexit
+import pickle
+import signal
+import inspect
+import importlib
+import itertools
+import threading
+import multiprocessing
+from .settings import loadUserSettings
+from .checkpoint import Checkpoint, checkpointScope, currentCheckpoint
+from .utils.runner import RunCancelled, currentScope, killRunning, getMaxProcesses, setProcessLimit
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+__all__ = [
+    "WorkerPool", "RemoteModule", "WorkerService", "getWorkerPool", "closeWorkerPool", "isIsolated",
+    "getIsolationSettings", "inWorkerProcess", "callParent"
+]
+
+_DEFAULT_WORKERS_ = 4
+_DEFAULT_MAX_CALLS_ = 200
+
+# Seconds a new worker may take to import its modules
+_START_TIMEOUT_ = 30.0
+
+# Seconds between timeout / memory / liveness checks while waiting on a worker
+_POLL_INTERVAL_ = 0.1
+
+# Seconds a worker gets to exit after SIGTERM before it is killed
+_STOP_GRACE_ = 2.0
+
+# Streamed records are sent in batches of up to _STREAM_BATCH_, at least every _STREAM_FLUSH_ seconds
+_STREAM_BATCH_ = 256
+_STREAM_FLUSH_ = 0.05
+
+# Checkpoint methods a worker may call on the checkpoint of the running command
+_CHECKPOINT_METHODS_ = ("begin", "results", "get", "save", "markFailed")
+
+# WorkerService methods the pool calls itself; not callable from workers
+_SERVICE_HOOKS_ = ("suspend", "resume", "close")
+
+# The worker's end of its pipe, in worker processes (see workerMain)
+_CHANNEL_ = None
+
+def getIsolationSettings() -> dict:
+    """
+    Return the 'isolation' settings with defaults filled in
+    (max_memory_mb converted to "max_memory" in bytes).
+    """
+    dIsolation = loadUserSettings().get("isolation") or {}
+    oModules = dIsolation.get("modules") or []
+    if isinstance(oModules, str):
+        oModules = [oModules]
+    return {
+        "modules": [str(sModule) for sModule in oModules],
+        "workers": max(1, int(dIsolation.get("workers") or _DEFAULT_WORKERS_)),
+        "timeout": max(0.0, float(dIsolation.get("timeout") or 0)),
+        "max_memory": max(0, int(float(dIsolation.get("max_memory_mb") or 0) * 1048576)),
+        "max_calls": max(1, int(dIsolation.get("max_calls") or _DEFAULT_MAX_CALLS_))
+    }
+
+def isIsolated(sModuleName: str) -> bool:
+    """
+    Return True if sModuleName runs in worker processes.
+    """
+    lstModules = getIsolationSettings()["modules"]
+    return sModuleName in lstModules or "all" in lstModules
+
+def getImportPath(sModuleName: str) -> str:
+    return f"fluxcli.modules.{sModuleName}.module"
+
+def getPeakMemory() -> int:
+    """
+    Return the peak resident memory of this process in bytes, or 0 if unknown.
+    """
+    if resource is None:
+        return 0
+    iPeak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return iPeak if sys.platform == "darwin" else iPeak * 1024
+
+def getResidentMemory(iPid: int):
+    """
+    Return the current resident memory of process iPid in bytes, or None where
+    /proc is not available.
+    """
+    try:
+        with open(f"/proc/{iPid}/statm", "rb") as fStatm:
+            return int(fStatm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+def toPicklableError(oError: BaseException) -> BaseException:
+    """
+    Return oError if it survives pickling, or a RuntimeError carrying its message.
+    """
+    try:
+        pickle.loads(pickle.dumps(oError))
+        return oError
+    except Exception:
+        return RuntimeError(f"{type(oError).__name__}: {oError}")
+
+# -- Worker process side --------------------------------------------------------
+
+class WorkerChannel:
+    """
+    The worker's end of its pipe. Sends are serialized, since module threads
+    (streams, checkpoint saves, output) share it with the call loop. Several
+    threads may wait on requests to the parent at once: one of them reads the
+    pipe and hands each reply to the thread it belongs to.
+    """
+
+    def __init__(self, oConn):
+        self.oConn = oConn
+        self.oLock = threading.Lock()
+        self.oCondition = threading.Condition()
+        self.oIds = itertools.count()
+        self.dReplies = {}
+        self.bReading = False
+
+    def send(self, tupMessage) -> None:
+        with self.oLock:
+            self.oConn.send(tupMessage)
+
+    def request(self, sTarget: str, sMethod: str, lstArgs):
+        """
+        Call sMethod of sTarget ("checkpoint" or a WorkerService) in the parent
+        and return its value, raising the error it reports.
+        """
+        iId = next(self.oIds)
+        self.send(("request", iId, sTarget, sMethod, tuple(lstArgs)))
+        with self.oCondition:
+            while iId not in self.dReplies:
+                if self.bReading:
+                    self.oCondition.wait()
+                    continue
+                self.bReading = True
+                self.oCondition.release()
+                try:
+                    tupReply = self.oConn.recv()
+                finally:
+                    self.oCondition.acquire()
+                    self.bReading = False
+                    self.oCondition.notify_all()
+                self.dReplies[tupReply[1]] = tupReply
+            sKind, _, oValue = self.dReplies.pop(iId)
+        if sKind == "reply_error":
+            raise oValue
+        return oValue
+
+class ChannelWriter:
+    """
+    Text stream forwarding writes to the parent as ("out" | "err", text)
+    messages, buffered up to each newline.
+    """
+
+    def __init__(self, oChannel: WorkerChannel, sKind: str):
+        self.oChannel = oChannel
+        self.sKind = sKind
+        self.lstBuffer = []
+
+    def write(self, sText):
+        self.lstBuffer.append(sText)
+        if "\n" in sText:
+            self.flush()
+        return len(sText)
+
+    def flush(self):
+        if self.lstBuffer:
+            sText = "".join(self.lstBuffer)
+            self.lstBuffer = []
+            try:
+                self.oChannel.send((self.sKind, sText))
+            except OSError:
+                # The parent is gone; nobody is left to read it
+                pass
+
+    def isatty(self):
+        return False
+
+class RemoteCheckpoint(Checkpoint):
+    """
+    The checkpoint of the running command as seen from a worker: every call is
+    made on the real Checkpoint in the parent process. The parent finishes it.
+    """
+
+    def __init__(self, oChannel: WorkerChannel):
+        self.oChannel = oChannel
+
+    def call(self, sMethod: str, *lstArgs):
+        return self.oChannel.request("checkpoint", sMethod, lstArgs)
+
+    def begin(self, iUnits=None) -> None:
+        self.call("begin", iUnits)
+
+    def results(self) -> dict:
+        return self.call("results")
+
+    def get(self, sUnit: str):
+        return self.call("get", sUnit)
+
+    def save(self, sUnit: str, oResult) -> None:
+        self.call("save", sUnit, oResult)
+
+    def markFailed(self) -> None:
+        self.call("markFailed")
+
+    def finish(self, bCompleted: bool) -> None:
+        pass
+
+def inWorkerProcess() -> bool:
+    """
+    Return True in a worker process.
+    """
+    return _CHANNEL_ is not None
+
+def callParent(sService: str, sMethod: str, *lstArgs):
+    """
+    From a worker process, call sMethod of the running call's instance of the
+    WorkerService sService ("module:Class") in the parent process, and return
+    its value. Blocks until the parent answers; other threads of the call carry on.
+    """
+    if _CHANNEL_ is None:
+        raise RuntimeError("callParent() is only available in worker processes.")
+    return _CHANNEL_.request(sService, sMethod, lstArgs)
+
+class RecordBatcher:
+    """
+    Sends the records of a stream to the parent in batches: as soon as
+    _STREAM_BATCH_ are waiting, and every _STREAM_FLUSH_ seconds otherwise, so
+    a slow stream is not held back.
+    """
+
+    def __init__(self, oChannel: WorkerChannel):
+        self.oChannel = oChannel
+        self.lstRecords = []
+        self.oError = None
+        self.oLock = threading.Lock()
+        self.oStop = threading.Event()
+        self.oThread = threading.Thread(target=self.run, name="fluxcli-worker-flush", daemon=True)
+        self.oThread.start()
+
+    def add(self, oRecord) -> None:
+        with self.oLock:
+            self.lstRecords.append(oRecord)
+            if len(self.lstRecords) >= _STREAM_BATCH_:
+                self.flushLocked()
+
+    def flushLocked(self) -> None:
+        if self.oError is not None:
+            raise self.oError
+        if self.lstRecords:
+            lstRecords = self.lstRecords
+            self.lstRecords = []
+            self.oChannel.send(("records", lstRecords))
+
+    def run(self) -> None:
+        while not self.oStop.wait(_STREAM_FLUSH_):
+            with self.oLock:
+                try:
+                    self.flushLocked()
+                except Exception as e:
+                    # Raised again to the call loop by the next add() or close()
+                    self.oError = e
+                    return
+
+    def stop(self) -> None:
+        self.oStop.set()
+        self.oThread.join()
+
+    def close(self) -> None:
+        """
+        Stop the flush thread and send the records still waiting.
+        """
+        self.stop()
+        with self.oLock:
+            self.flushLocked()
+
+def exitOnSignal(iSignal, oFrame):
+    """
+    SIGTERM handler of a worker: unwind, so running commands clean up their subprocesses.
+    """
+    raise SystemExit(1)
+
+def listFunctions(oModule) -> dict:
+    """
+    Return {name: is a generator function} for the public functions of oModule.
+    """
+    return {
+        sName: inspect.isgeneratorfunction(oValue)
+        for sName, oValue in vars(oModule).items()
+        if not sName.startswith("_") and inspect.isfunction(oValue)
+    }
+
+def runWorkerCall(oChannel: WorkerChannel, oModule, sFunc: str, tupArgs, bStream: bool, bCheckpoint: bool):
+    """
+    Run one call and return its result (None for a stream, whose records are
+    sent as they are produced).
+    """
+    funcCall = getattr(oModule, sFunc)
+    with checkpointScope(RemoteCheckpoint(oChannel) if bCheckpoint else None):
+        if not bStream:
+            return funcCall(*tupArgs)
+        oBatcher = RecordBatcher(oChannel)
+        try:
+            for oRecord in funcCall(*tupArgs):
+                oBatcher.add(oRecord)
+        except BaseException:
+            # Nothing more is sent for a failed or stopped stream
+            oBatcher.stop()
+            raise
+        oBatcher.close()
+    return None
+
+def workerMain(oConn, lstPreload, iMaxProcesses: int) -> None:
+    """
+    Entry point of a worker process: import the modules in lstPreload, report
+    ready, then serve calls until told to stop or the pipe closes.
+    iMaxProcesses is the worker's share of the runner's max_processes.
+    Ctrl-C is left to the parent, which stops the worker if it needs to.
+    """
+    global _CHANNEL_
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, exitOnSignal)
+    setProcessLimit(iMaxProcesses)
+    oChannel = _CHANNEL_ = WorkerChannel(oConn)
+    dModules = {}
+    for sModule in lstPreload:
+        try:
+            dModules[sModule] = importlib.import_module(getImportPath(sModule))
+        except Exception:
+            # Reported when the module is first used
+            pass
+    sys.stdout = ChannelWriter(oChannel, "out")
+    sys.stderr = ChannelWriter(oChannel, "err")
+    try:
+        oChannel.send(("ready",))
+        serveCalls(oChannel, dModules)
+    finally:
+        # Worker processes end without atexit handlers; don't leave nmap and the like behind
+        killRunning()
+        sys.stdout = sys.__stdout__
+        sys.stderr = sys.__stderr__
+
+def serveCalls(oChannel: WorkerChannel, dModules: dict) -> None:
+    """
+    The worker's call loop: answer "exports" and "call" requests until told to stop.
+    """
+    while True:
+        try:
+            tupMessage = oChannel.oConn.recv()
+        except (EOFError, OSError):
+            return
+        if tupMessage[0] == "stop":
+            return
+        try:
+            sModule = tupMessage[1]
+            if sModule not in dModules:
+                dModules[sModule] = importlib.import_module(getImportPath(sModule))
+            if tupMessage[0] == "exports":
+                tupReply = ("done", listFunctions(dModules[sModule]))
+            else:
+                _, _, sFunc, tupArgs, bStream, bCheckpoint = tupMessage
+                tupReply = ("done", runWorkerCall(oChannel, dModules[sModule], sFunc, tupArgs, bStream, bCheckpoint))
+        except Exception as e:
+            tupReply = ("error", toPicklableError(e))
+        sys.stdout.flush()
+        sys.stderr.flush()
+        try:
+            oChannel.send(tupReply + (getPeakMemory(),))
+        except OSError:
+            # The parent is gone
+            return
+        except Exception as e:
+            oChannel.send(("error", RuntimeError(f"Result could not be sent: {type(e).__name__}: {e}"), getPeakMemory()))
+
+# -- Parent process side --------------------------------------------------------
+
+class WorkerService:
+    """
+    Base of the objects a module offers its isolated calls in the parent
+    process (see callParent). One instance serves one call. Its public methods
+    can be called from the worker; each runs on its own thread, so it may block.
+    The pool calls suspend() and resume() around each batch of records handed
+    to the caller, and close() when the call ends.
+    """
+
+    def suspend(self) -> None:
+        pass
+
+    def resume(self) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+def getServiceType(sService: str) -> type:
+    """
+    Return the WorkerService class named by sService ("module:Class", a
+    FluxCLI module), importing its module in this process if needed.
+    """
+    sModule, _, sClass = sService.partition(":")
+    if sModule.split(".")[0] != __name__.split(".")[0]:
+        raise RuntimeError(f"Worker service '{sService}' is not part of FluxCLI.")
+    typeService = getattr(importlib.import_module(sModule), sClass, None)
+    if not (isinstance(typeService, type) and issubclass(typeService, WorkerService)):
+        raise RuntimeError(f"'{sService}' is not a worker service.")
+    return typeService
+
+def getWorkerContext():
+    """
+    Return the multiprocessing context workers are started from: a forkserver
+    with this module preloaded where available (cheap, safe to use from a
+    threaded process), otherwise spawn.
+    """
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        oContext = multiprocessing.get_context("forkserver")
+        oContext.set_forkserver_preload([__name__])
+        return oContext
+    return multiprocessing.get_context("spawn")
+
+class WorkerProcess:
+    """
+    One worker process and the parent's end of its pipe.
+    """
+
+    def __init__(self, oContext, lstPreload, iGeneration: int, iMaxProcesses: int):
+        oConn, oChildConn = oContext.Pipe()
+        self.oProcess = oContext.Process(target=workerMain, args=(oChildConn, lstPreload, iMaxProcesses), name="fluxcli-worker", daemon=True)
+        self.oProcess.start()
+        oChildConn.close()
+        self.oConn = oConn
+        self.iGeneration = iGeneration
+        self.iCalls = 0
+        self.fNextMemoryCheck = 0.0
+        self.bCancelled = False
+        # Set while a call runs, so a late cancel() cannot hit the worker's next call
+        self.bBusy = False
+        self.oLock = threading.Lock()
+
+    def waitReady(self) -> None:
+        """
+        Wait for the worker to finish importing its modules.
+        Raises RuntimeError if it fails to start within _START_TIMEOUT_.
+        """
+        try:
+            tupMessage = self.receive(time.monotonic() + _START_TIMEOUT_, 0, "Worker startup", _START_TIMEOUT_)
+        except (TimeoutError, RuntimeError) as e:
+            self.kill()
+            raise RuntimeError(f"Worker process failed to start: {e}")
+        if tupMessage[0] != "ready":
+            self.kill()
+            raise RuntimeError(f"Worker process failed to start: unexpected message '{tupMessage[0]}'")
+
+    def receive(self, fDeadline, iMaxMemory: int, sCall: str, fTimeout=None):
+        """
+        Return the next message from the worker. Raises TimeoutError once
+        fDeadline (time.monotonic(), None for none) passes, MemoryError if the
+        worker's resident memory exceeds iMaxMemory bytes (0 for no limit), and
+        RuntimeError if the worker dies. The limits are checked before every
+        message as well as while waiting, so a worker sending a steady stream of
+        messages is held to them too; memory at most every _POLL_INTERVAL_.
+        """
+        while True:
+            fNow = time.monotonic()
+            if fDeadline is not None and fNow >= fDeadline:
+                raise TimeoutError(f"{sCall} timed out after {fTimeout:g}s")
+            if iMaxMemory and fNow >= self.fNextMemoryCheck:
+                self.fNextMemoryCheck = fNow + _POLL_INTERVAL_
+                iResident = getResidentMemory(self.oProcess.pid)
+                if iResident is not None and iResident > iMaxMemory:
+                    raise MemoryError(f"{sCall}: worker process exceeded {iMaxMemory // 1048576} MB")
+            fWait = _POLL_INTERVAL_
+            if fDeadline is not None:
+                fWait = max(0.0, min(fWait, fDeadline - fNow))
+            if self.oConn.poll(fWait):
+                try:
+                    return self.oConn.recv()
+                except (EOFError, OSError):
+                    self.oProcess.join(_POLL_INTERVAL_)
+                    raise RuntimeError(f"{sCall}: worker process exited unexpectedly (exit code {self.oProcess.exitcode})")
+            if not self.oProcess.is_alive():
+                raise RuntimeError(f"{sCall}: worker process exited unexpectedly (exit code {self.oProcess.exitcode})")
+
+    def cancel(self) -> None:
+        """
+        Stop the worker's current call from another thread (see RunScope): it is
+        sent SIGTERM, so its command cleans up, and the waiting caller gets RunCancelled.
+        """
+        with self.oLock:
+            if self.bBusy:
+                self.bCancelled = True
+                self.oProcess.terminate()
+
+    def setBusy(self, bBusy: bool) -> None:
+        with self.oLock:
+            self.bBusy = bBusy
+
+    def send(self, tupMessage) -> None:
+        with self.oLock:
+            self.oConn.send(tupMessage)
+
+    def reply(self, iCall: int, tupMessage) -> None:
+        """
+        Send an answer to a request of call number iCall, from any thread,
+        unless that call has ended since.
+        """
+        with self.oLock:
+            if self.bBusy and self.iCalls == iCall:
+                self.oConn.send(tupMessage)
+
+    def stop(self) -> None:
+        """
+        Ask an idle worker to exit.
+        """
+        try:
+            self.oConn.send(("stop",))
+        except OSError:
+            pass
+        self.oConn.close()
+        self.oProcess.join(_STOP_GRACE_)
+        if self.oProcess.is_alive():
+            self.oProcess.kill()
+
+    def kill(self) -> None:
+        """
+        Stop a worker in the middle of a call: SIGTERM first, so its command can
+        clean up (e.g. kill nmap), then SIGKILL.
+        """
+        self.oConn.close()
+        self.oProcess.terminate()
+        self.oProcess.join(_STOP_GRACE_)
+        if self.oProcess.is_alive():
+            self.oProcess.kill()
+            self.oProcess.join()
+
+class WorkerPool:
+    """
+    Up to iWorkers warm worker processes, each preloading the modules in
+    lstPreload. A worker serves one call at a time.
+    """
+
+    def __init__(self, lstPreload=(), iWorkers: int = _DEFAULT_WORKERS_, iMaxMemory: int = 0,
+                 iMaxCalls: int = _DEFAULT_MAX_CALLS_):
+        self.oContext = getWorkerContext()
+        self.lstPreload = list(lstPreload)
+        self.iWorkers = max(1, int(iWorkers))
+        self.iMaxMemory = int(iMaxMemory)
+        self.iMaxCalls = max(1, int(iMaxCalls))
+        self.iMaxProcesses = max(1, getMaxProcesses() // self.iWorkers)
+        self.lstIdle = []
+        # Workers started and not retired: idle, busy or starting
+        self.iLive = 0
+        # Workers being started in the background by prefill()
+        self.iStarting = 0
+        self.iGeneration = 0
+        self.dExports = {}
+        self.bClosed = False
+        self.oCondition = threading.Condition()
+
+    def preload(self, sModuleName: str) -> None:
+        """
+        Have workers started from now on import sModuleName up front.
+        """
+        with self.oCondition:
+            if sModuleName not in self.lstPreload:
+                self.lstPreload.append(sModuleName)
+
+    def spawn(self) -> WorkerProcess:
+        with self.oCondition:
+            lstPreload = list(self.lstPreload)
+            iGeneration = self.iGeneration
+        oWorker = WorkerProcess(self.oContext, lstPreload, iGeneration, self.iMaxProcesses)
+        oWorker.waitReady()
+        return oWorker
+
+    def prefill(self) -> None:
+        """
+        Start workers in the background until the pool is full again.
+        """
+        with self.oCondition:
+            iMissing = 0 if self.bClosed else self.iWorkers - self.iLive
+            self.iLive += iMissing
+            self.iStarting += iMissing
+        for _ in range(iMissing):
+            threading.Thread(target=self.addWorker, name="fluxcli-worker-start", daemon=True).start()
+
+    def addWorker(self) -> None:
+        try:
+            oWorker = self.spawn()
+        except Exception as e:
+            print(f"[Warning] {e}")
+            with self.oCondition:
+                self.iLive -= 1
+                self.iStarting -= 1
+                self.oCondition.notify_all()
+            return
+        self.release(oWorker, True)
+        with self.oCondition:
+            self.iStarting -= 1
+            self.oCondition.notify_all()
+
+    def acquire(self) -> WorkerProcess:
+        """
+        Take an idle worker, starting one if the pool is not full, or wait for one.
+        """
+        with self.oCondition:
+            while True:
+                if self.bClosed:
+                    raise RuntimeError("The worker pool is closed.")
+                if self.lstIdle:
+                    return self.lstIdle.pop()
+                if self.iLive < self.iWorkers:
+                    self.iLive += 1
+                    break
+                self.oCondition.wait()
+        try:
+            return self.spawn()
+        except Exception:
+            with self.oCondition:
+                self.iLive -= 1
+                self.oCondition.notify()
+            raise
+
+    def release(self, oWorker: WorkerProcess, bHealthy: bool) -> None:
+        """
+        Return oWorker to the pool, or retire it if it failed, served max_calls
+        calls or predates a recycle(); a replacement is started in the background.
+        """
+        with self.oCondition:
+            bKeep = bHealthy and not self.bClosed and oWorker.iGeneration == self.iGeneration and oWorker.iCalls < self.iMaxCalls
+            if bKeep:
+                self.lstIdle.append(oWorker)
+            else:
+                self.iLive -= 1
+            self.oCondition.notify()
+        if bKeep:
+            return
+        threading.Thread(target=oWorker.stop if bHealthy else oWorker.kill, name="fluxcli-worker-stop", daemon=True).start()
+        self.prefill()
+
+    def recycle(self) -> None:
+        """
+        Replace every worker, e.g. after module code changed. Busy workers are
+        replaced when their call ends.
+        """
+        with self.oCondition:
+            self.iGeneration += 1
+            self.dExports = {}
+            lstIdle = self.lstIdle
+            self.lstIdle = []
+            self.iLive -= len(lstIdle)
+        for oWorker in lstIdle:
+            threading.Thread(target=oWorker.stop, name="fluxcli-worker-stop", daemon=True).start()
+        if lstIdle:
+            self.prefill()
+
+    def close(self) -> None:
+        """
+        Stop the idle workers and refuse new calls. Busy workers are stopped when
+        their call ends. Workers still starting get a moment to come up first, so
+        none is left half-started when the process exits.
+        """
+        fEnd = time.monotonic() + _STOP_GRACE_
+        with self.oCondition:
+            self.bClosed = True
+            while self.iStarting and time.monotonic() < fEnd:
+                self.oCondition.wait(fEnd - time.monotonic())
+            lstIdle = self.lstIdle
+            self.lstIdle = []
+            self.iLive -= len(lstIdle)
+            self.oCondition.notify_all()
+        for oWorker in lstIdle:
+            oWorker.stop()
+
+    def iterReplies(self, tupRequest, sCall: str, fTimeout=None):
+        """
+        Send tupRequest to a worker and yield the record batches it streams back,
+        returning the final result. Output, checkpoint and service requests and
+        errors are handled here. The call's services are suspended while the
+        caller holds a batch. If the caller stops early, or its RunScope is
+        cancelled (e.g. 'cancel' of a REPL job), the worker is killed.
+        """
+        oCheckpoint = currentCheckpoint()
+        oScope = currentScope()
+        if oScope is not None and oScope.bCancelled:
+            raise RunCancelled(f"{sCall} was cancelled")
+        oWorker = self.acquire()
+        oWorker.setBusy(True)
+        bHealthy = False
+        dServices = {}
+        if oScope is not None and not oScope.addCallback(oWorker.cancel):
+            oWorker.setBusy(False)
+            self.release(oWorker, True)
+            raise RunCancelled(f"{sCall} was cancelled")
+        try:
+            oWorker.iCalls += 1
+            oWorker.send(tupRequest + ((oCheckpoint is not None,) if tupRequest[0] == "call" else ()))
+            fDeadline = time.monotonic() + fTimeout if fTimeout else None
+            while True:
+                try:
+                    tupMessage = oWorker.receive(fDeadline, self.iMaxMemory, sCall, fTimeout)
+                except RuntimeError:
+                    if oWorker.bCancelled:
+                        raise RunCancelled(f"{sCall} was cancelled")
+                    raise
+                sKind = tupMessage[0]
+                if sKind == "records":
+                    lstServices = list(dServices.values())
+                    for oService in lstServices:
+                        oService.suspend()
+                    yield tupMessage[1]
+                    for oService in lstServices:
+                        oService.resume()
+                elif sKind == "out":
+                    sys.stdout.write(tupMessage[1])
+                elif sKind == "err":
+                    sys.stderr.write(tupMessage[1])
+                elif sKind == "request" and tupMessage[2] == "checkpoint":
+                    self.answerCheckpoint(oWorker, oCheckpoint, tupMessage[1], tupMessage[3], tupMessage[4])
+                elif sKind == "request":
+                    self.answerService(oWorker, dServices, *tupMessage[1:])
+                elif sKind in ("done", "error"):
+                    bHealthy = not (self.iMaxMemory and tupMessage[2] > self.iMaxMemory) and not isinstance(tupMessage[1], MemoryError)
+                    if sKind == "error":
+                        raise tupMessage[1]
+                    return tupMessage[1]
+        finally:
+            if oScope is not None:
+                oScope.discardCallback(oWorker.cancel)
+            oWorker.setBusy(False)
+            for oService in dServices.values():
+                oService.close()
+            self.release(oWorker, bHealthy and not oWorker.bCancelled)
+
+    def answerCheckpoint(self, oWorker: WorkerProcess, oCheckpoint, iId: int, sMethod: str, lstArgs) -> None:
+        if oCheckpoint is None or sMethod not in _CHECKPOINT_METHODS_:
+            oWorker.send(("reply_error", iId, RuntimeError(f"No checkpoint method '{sMethod}' for this call.")))
+            return
+        try:
+            oValue = getattr(oCheckpoint, sMethod)(*lstArgs)
+        except Exception as e:
+            oWorker.send(("reply_error", iId, toPicklableError(e)))
+            return
+        oWorker.send(("reply", iId, oValue))
+
+    def answerService(self, oWorker: WorkerProcess, dServices: dict, iId: int, sService: str, sMethod: str, lstArgs) -> None:
+        """
+        Run a method of the call's instance of a WorkerService on its own thread
+        (it may block, e.g. waiting for a scheduler lease) and send its answer.
+        """
+        try:
+            oService = dServices.get(sService)
+            if oService is None:
+                oService = dServices[sService] = getServiceType(sService)()
+            if sMethod.startswith("_") or sMethod in _SERVICE_HOOKS_ or not callable(getattr(oService, sMethod, None)):
+                raise RuntimeError(f"No method '{sMethod}' in worker service '{sService}'.")
+        except Exception as e:
+            oWorker.send(("reply_error", iId, toPicklableError(e)))
+            return
+        iCall = oWorker.iCalls
+
+        def runService():
+            try:
+                tupReply = ("reply", iId, getattr(oService, sMethod)(*lstArgs))
+            except Exception as e:
+                tupReply = ("reply_error", iId, toPicklableError(e))
+            try:
+                oWorker.reply(iCall, tupReply)
+            except OSError:
+                # The worker is gone
+                pass
+
+        threading.Thread(target=runService, name="fluxcli-worker-service", daemon=True).start()
+
+    def runToEnd(self, tupRequest, sCall: str, fTimeout=None):
+        oReplies = self.iterReplies(tupRequest, sCall, fTimeout)
+        while True:
+            try:
+                next(oReplies)
+            except StopIteration as e:
+                return e.value
+
+    def exports(self, sModuleName: str) -> dict:
+        """
+        Return {function name: is a generator function} for the module.py of
+        sModuleName, as imported by the workers. Raises the ImportError (or other
+        error) of a module that fails to import.
+        """
+        with self.oCondition:
+            dFunctions = self.dExports.get(sModuleName)
+        if dFunctions is None:
+            dFunctions = self.runToEnd(("exports", sModuleName), f"Importing '{sModuleName}'", _START_TIMEOUT_)
+            with self.oCondition:
+                self.dExports[sModuleName] = dFunctions
+        return dFunctions
+
+    def call(self, sModuleName: str, sFunc: str, tupArgs, fTimeout=None):
+        """
+        Run sModuleName's sFunc(*tupArgs) in a worker and return its result.
+        """
+        return self.runToEnd(("call", sModuleName, sFunc, tuple(tupArgs), False), f"'{sModuleName} {sFunc}'", fTimeout)
+
+    def stream(self, sModuleName: str, sFunc: str, tupArgs, fTimeout=None):
+        """
+        Run the generator sModuleName's sFunc(*tupArgs) in a worker, yielding its records.
+        """
+        oReplies = self.iterReplies(("call", sModuleName, sFunc, tuple(tupArgs), True), f"'{sModuleName} {sFunc}'", fTimeout)
+        try:
+            for lstRecords in oReplies:
+                yield from lstRecords
+        finally:
+            oReplies.close()
+
+class RemoteModule:
+    """
+    Stands in for the module.py of an isolated module: its public functions run
+    in the worker pool. Timeouts come from the 'timeout' of the command in the
+    module's registry entry (dModuleInfo), or the isolation settings.
+    """
+
+    def __init__(self, oPool: WorkerPool, sModuleName: str, dModuleInfo: dict):
+        self.oPool = oPool
+        self.sModuleName = sModuleName
+        self.dModuleInfo = dModuleInfo
+        self.__name__ = getImportPath(sModuleName)
+
+    def getTimeout(self, sFunc: str):
+        dCommands = self.dModuleInfo.get("commands") or {}
+        dCmdInfo = dCommands.get(sFunc)
+        for sSuffix in ("Stream", "Diff"):
+            if dCmdInfo is None and sFunc.endswith(sSuffix):
+                dCmdInfo = dCommands.get(sFunc[:-len(sSuffix)])
+        fTimeout = (dCmdInfo or {}).get("timeout")
+        if fTimeout is None:
+            fTimeout = getIsolationSettings()["timeout"]
+        return float(fTimeout) or None
+
+    def __getattr__(self, sName):
+        dFunctions = self.oPool.exports(self.sModuleName)
+        if sName not in dFunctions:
+            raise AttributeError(f"module '{self.__name__}' has no attribute '{sName}'")
+        oPool = self.oPool
+        sModuleName = self.sModuleName
+        if dFunctions[sName]:
+            def funcRemote(*lstArgs):
+                return oPool.stream(sModuleName, sName, lstArgs, self.getTimeout(sName))
+        else:
+            def funcRemote(*lstArgs):
+                return oPool.call(sModuleName, sName, lstArgs, self.getTimeout(sName))
+        funcRemote.__name__ = sName
+        funcRemote.__qualname__ = sName
+        return funcRemote
+
+    def __repr__(self):
+        return f"<RemoteModule '{self.__name__}'>"
+
+_POOL_ = None
+_POOL_LOCK_ = threading.Lock()
+
+def getWorkerPool() -> WorkerPool:
+    """
+    Return the process-wide WorkerPool configured from the isolation settings.
+    """
+    global _POOL_
+    with _POOL_LOCK_:
+        if _POOL_ is None:
+            dSettings = getIsolationSettings()
+            lstPreload = [sModule for sModule in dSettings["modules"] if sModule != "all"]
+            _POOL_ = WorkerPool(lstPreload, dSettings["workers"], dSettings["max_memory"], dSettings["max_calls"])
+            _POOL_.prefill()
+            atexit.register(closeWorkerPool)
+        return _POOL_
+
+def closeWorkerPool() -> None:
+    """
+    Stop the process-wide pool's workers, if a pool was started.
+    """
+    global _POOL_
+    with _POOL_LOCK_:
+        oPool = _POOL_
+        _POOL_ = None
+    if oPool is not None:
+        oPool.close()
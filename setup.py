@@ -4,13 +4,16 @@ setup(
     name="fluxcli",
     version="0.1.0",
     packages=find_packages(),
+    package_data={
+        "fluxcli": ["config/*.yaml", "modules/*/commands.yaml"]
+    },
     install_requires=[
         "PyYAML",
         # any other dependencies, e.g. "requests", etc.
     ],
     entry_points={
         "console_scripts": [
-            "fluxcli = fluxcli.main:main"
+            "fluxcli = fluxcli.client:main"
         ]
     }
 )
@@ -0,0 +1,226 @@
+"""
+Distributed scans (see cluster.py): a Coordinator and runWorker talking over
+127.0.0.1, with units run by a stub instead of module commands.
+"""
+
+import io
+import socket
+import threading
+import unittest
+from unittest import mock
+from fluxcli import cluster
+from fluxcli.cluster import Coordinator, runWorker, splitTarget, mergeResults, readMessage, sendMessage, makeProof
+
+class StubUnits:
+    """
+    Stand-in for funcRunUnit: records its calls and reports one host per unit.
+    Units listed in dGates wait for their event first.
+    """
+
+    def __init__(self, dGates=None):
+        self.lstCalls = []
+        self.dGates = dGates or {}
+        self.oLock = threading.Lock()
+
+    def __call__(self, sModuleName, sCmdName, lstArgs):
+        with self.oLock:
+            self.lstCalls.append((sModuleName, sCmdName, lstArgs))
+        if lstArgs[0] in self.dGates:
+            self.dGates[lstArgs[0]].wait(10)
+        return {"hosts": [{"ip": lstArgs[0]}]}
+
+def hangUp(oSock) -> None:
+    # close() alone leaves the connection open while makefile() objects exist
+    oSock.shutdown(socket.SHUT_RDWR)
+    oSock.close()
+
+class ClusterTest(unittest.TestCase):
+
+    def setUp(self):
+        with socket.socket() as oSock:
+            oSock.bind(("127.0.0.1", 0))
+            self.iPort = oSock.getsockname()[1]
+        self.sAddress = f"127.0.0.1:{self.iPort}"
+        self.dSettings = dict(cluster._DEFAULTS_, listen=self.sAddress, heartbeat=0.2, lease_timeout=30)
+        self.oOut = io.StringIO()
+        for oPatch in (
+            mock.patch.object(cluster, "loadUserSettings", lambda: {"cluster": self.dSettings}),
+            mock.patch.object(cluster, "_RETRY_DELAY_", 0.2),
+            mock.patch("sys.stdout", self.oOut),
+            mock.patch("sys.stderr", io.StringIO())
+        ):
+            oPatch.start()
+            self.addCleanup(oPatch.stop)
+
+    def startWorker(self, funcRunUnit, iSlots=2, sToken=None) -> threading.Thread:
+        oStop = threading.Event()
+        oThread = threading.Thread(target=runWorker, args=(self.sAddress, funcRunUnit, iSlots, sToken, oStop), daemon=True)
+        oThread.start()
+        self.addCleanup(oThread.join, 10)
+        self.addCleanup(oStop.set)
+        return oThread
+
+    def startCoordinator(self, lstUnits, **dSettings):
+        """
+        Run a pingsweep Coordinator over lstUnits in a thread; returns it and
+        the list its (iUnit, dResult) pairs are collected in.
+        """
+        oCoordinator = Coordinator("nmap", "pingsweep", [[sUnit] for sUnit in lstUnits], dict(self.dSettings, **dSettings))
+        lstResults = []
+        oCoordinator.oThread = threading.Thread(target=lambda: lstResults.extend(oCoordinator.iterResults()), daemon=True)
+        oCoordinator.oThread.start()
+        self.addCleanup(oCoordinator.close)
+        return oCoordinator, lstResults
+
+    def waitFinished(self, oCoordinator):
+        oCoordinator.oThread.join(20)
+        self.assertFalse(oCoordinator.oThread.is_alive(), "coordinator did not finish")
+
+    def connectRaw(self, sToken=None):
+        """
+        Join the coordinator by hand and return the connection's (socket, reader, writer).
+        """
+        for _ in range(100):
+            try:
+                oSock = socket.create_connection(("127.0.0.1", self.iPort), timeout=10)
+                break
+            except OSError:
+                threading.Event().wait(0.05)
+        self.addCleanup(oSock.close)
+        fIn, fOut = oSock.makefile("rb"), oSock.makefile("wb")
+        dChallenge = readMessage(fIn)
+        sendMessage(fOut, {"type": "hello", "worker": "raw", "nonce": "n", "proof": makeProof(sToken, dChallenge["nonce"])})
+        self.assertEqual(readMessage(fIn)["type"], "welcome")
+        return oSock, fIn, fOut
+
+    def readUnit(self, fIn) -> dict:
+        while True:
+            dMessage = readMessage(fIn)
+            if dMessage["type"] == "unit":
+                return dMessage
+
+    def listenFake(self):
+        """
+        Listen where workers expect the coordinator, to play its part by hand.
+        """
+        oServer = socket.create_server(("127.0.0.1", self.iPort))
+        self.addCleanup(oServer.close)
+        return oServer
+
+    def acceptFake(self, oServer, fTimeout=10, sProof=None, fHeartbeat=0.2):
+        """
+        Accept one worker and answer its hello; sProof overrides the welcome proof.
+        """
+        oServer.settimeout(fTimeout)
+        oSock, _ = oServer.accept()
+        self.addCleanup(oSock.close)
+        oSock.settimeout(10)
+        fIn, fOut = oSock.makefile("rb"), oSock.makefile("wb")
+        sendMessage(fOut, {"type": "challenge", "nonce": "c", "protocol": 1, "heartbeat": fHeartbeat})
+        dHello = readMessage(fIn)
+        sendMessage(fOut, {"type": "welcome", "proof": makeProof(None, dHello["nonce"]) if sProof is None else sProof})
+        return oSock, fIn, fOut
+
+    def testUnitsMergedInUnitOrder(self):
+        lstUnits = splitTarget("10.0.0.0/22", 6)
+        self.assertEqual(lstUnits, [f"10.0.{i}.0/24" for i in range(4)])
+        # The first unit finishes last
+        oGate = threading.Event()
+        oStub = StubUnits({lstUnits[0]: oGate})
+        oCoordinator, lstResults = self.startCoordinator(lstUnits, token="secret")
+        self.startWorker(oStub, 2, "secret")
+        while len(lstResults) < 3 and oCoordinator.oThread.is_alive():
+            threading.Event().wait(0.05)
+        oGate.set()
+        self.waitFinished(oCoordinator)
+
+        self.assertEqual(lstResults[-1][0], 0)
+        self.assertEqual(sorted(oStub.lstCalls), [("nmap", "pingsweep", [sUnit]) for sUnit in lstUnits])
+        dMerged = mergeResults(lstUnits, {lstUnits[iUnit]: dResult for iUnit, dResult in lstResults})
+        self.assertEqual(dMerged, {"hosts": [{"ip": sUnit} for sUnit in lstUnits]})
+
+    def testLeaseRequeuedAfterDisconnect(self):
+        oCoordinator, lstResults = self.startCoordinator(["10.0.0.0/24"])
+        oSock, fIn, _ = self.connectRaw()
+        self.assertEqual(self.readUnit(fIn)["args"], ["10.0.0.0/24"])
+        hangUp(oSock)
+
+        oStub = StubUnits()
+        self.startWorker(oStub, 1)
+        self.waitFinished(oCoordinator)
+        self.assertEqual(lstResults, [(0, {"hosts": [{"ip": "10.0.0.0/24"}]})])
+        self.assertEqual(oCoordinator.dAttempts, {0: 1})
+
+    def testGivesUpAfterMaxAttempts(self):
+        oCoordinator, lstResults = self.startCoordinator(["10.0.0.0/24", "10.0.1.0/24"], max_attempts=2)
+        for iAttempt in (1, 2):
+            oSock, fIn, fOut = self.connectRaw()
+            self.assertEqual(self.readUnit(fIn)["id"], 0)
+            hangUp(oSock)
+            while oCoordinator.dAttempts.get(0) != iAttempt:
+                threading.Event().wait(0.05)
+        # The other unit still completes
+        oSock, fIn, fOut = self.connectRaw()
+        dUnit = self.readUnit(fIn)
+        sendMessage(fOut, {"type": "result", "id": dUnit["id"], "result": {"hosts": []}})
+        self.waitFinished(oCoordinator)
+
+        dResults = dict(lstResults)
+        self.assertEqual(dResults[1], {"hosts": []})
+        self.assertRegex(dResults[0]["error"], r"^failed on 2 worker\(s\), last: worker raw: ")
+
+    def testCoordinatorRejectsWrongToken(self):
+        oCoordinator = Coordinator("nmap", "pingsweep", [["10.0.0.0/24"]], dict(self.dSettings, token="secret"))
+        oCoordinator.start()
+        self.addCleanup(oCoordinator.close)
+        oStub = StubUnits()
+        for sToken in ("wrong", None):
+            oThread = self.startWorker(oStub, 1, sToken)
+            oThread.join(10)
+            self.assertFalse(oThread.is_alive(), "worker kept retrying after rejection")
+        self.assertEqual(oStub.lstCalls, [])
+        self.assertEqual(self.oOut.getvalue().count("authentication failed"), 2)
+        self.assertTrue(oCoordinator.dqPending)
+
+    def testWorkerRejectsCoordinatorWithoutToken(self):
+        oServer = self.listenFake()
+        oStub = StubUnits()
+        oThread = self.startWorker(oStub, 1, "secret")
+        oSock, fIn, fOut = self.acceptFake(oServer, sProof="")
+        sendMessage(fOut, {"type": "unit", "id": 0, "module": "nmap", "command": "pingsweep", "args": ["10.0.0.0/24"]})
+        oThread.join(10)
+        self.assertFalse(oThread.is_alive(), "worker kept retrying after rejection")
+        self.assertEqual(oStub.lstCalls, [])
+        self.assertIn("coordinator failed authentication", self.oOut.getvalue())
+
+    def testWorkerLeavesSilentCoordinator(self):
+        oServer = self.listenFake()
+        self.startWorker(StubUnits(), 1)
+        self.acceptFake(oServer, fHeartbeat=0.1)
+        # Nothing is sent after the welcome: the worker gives up and reconnects
+        self.acceptFake(oServer, fTimeout=5)
+        self.assertIn("coordinator silent for 0.3s", self.oOut.getvalue())
+
+    def testAbandonedUnitFinishesBeforeReconnect(self):
+        oServer = self.listenFake()
+        oGate = threading.Event()
+        oStub = StubUnits({"10.0.0.0/24": oGate})
+        self.startWorker(oStub, 1)
+        oSock, fIn, fOut = self.acceptFake(oServer)
+        sendMessage(fOut, {"type": "unit", "id": 0, "module": "nmap", "command": "pingsweep", "args": ["10.0.0.0/24"]})
+        self.assertEqual(readMessage(fIn), {"type": "heartbeat", "id": 0})
+        hangUp(oSock)
+        # The slot's only thread is still busy with the lost unit
+        oServer.settimeout(1.5)
+        self.assertRaises(socket.timeout, oServer.accept)
+        oGate.set()
+        oSock, fIn, fOut = self.acceptFake(oServer, fTimeout=5)
+        sendMessage(fOut, {"type": "unit", "id": 1, "module": "nmap", "command": "pingsweep", "args": ["10.0.1.0/24"]})
+        dMessage = readMessage(fIn)
+        while dMessage["type"] == "heartbeat":
+            dMessage = readMessage(fIn)
+        self.assertEqual(dMessage, {"type": "result", "id": 1, "result": {"hosts": [{"ip": "10.0.1.0/24"}]}})
+        self.assertIn("waiting for the current unit to finish", self.oOut.getvalue())
+
+if __name__ == "__main__":
+    unittest.main()
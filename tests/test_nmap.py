@@ -0,0 +1,106 @@
+"""
+nmap module commands over checkpoint units and shards (see module.py), with
+nmap replaced by synthetic XML.
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+import threading
+import ipaddress
+import subprocess
+from fluxcli.checkpoint import CheckpointStore, Checkpoint, checkpointScope
+from fluxcli.bench.fixtures import iterNmapXml
+from fluxcli.modules.nmap import module as nmapModule
+from fluxcli.modules.nmap import scheduler as nmapScheduler
+from fluxcli.modules.nmap import delta as nmapDelta
+
+class FakeRunNmap:
+    """
+    Stand-in for runNmap: records each run's target and timeout and reports
+    one live host per target; targets in setFailing time out.
+    """
+
+    def __init__(self):
+        self.lstRuns = []
+        self.setFailing = set()
+        self.oLock = threading.Lock()
+
+    def __call__(self, lstArgs, fTimeout=None):
+        sTarget = lstArgs[-1]
+        with self.oLock:
+            self.lstRuns.append((sTarget, fTimeout))
+        if sTarget in self.setFailing:
+            raise subprocess.TimeoutExpired(lstArgs, 5)
+        sBase = str(ipaddress.ip_network(sTarget, strict=False).network_address)
+        return b"".join(iterNmapXml(1, "-p" in lstArgs, sBase))
+
+class NmapUnitTest(unittest.TestCase):
+
+    def setUp(self):
+        self.sTempDir = tempfile.mkdtemp()
+        self.oStore = CheckpointStore(os.path.join(self.sTempDir, "checkpoints.db"))
+        self.oSavedScheduler = nmapScheduler._SCHEDULER_
+        nmapScheduler._SCHEDULER_ = nmapScheduler.ScanScheduler(0, 1 << 20)
+        self.funcSavedRun = nmapModule.runNmap
+        self.oNmap = nmapModule.runNmap = FakeRunNmap()
+        self.oSavedBaselines = nmapDelta._oBaselineStore
+        nmapDelta._oBaselineStore = nmapDelta.BaselineStore(os.path.join(self.sTempDir, "baselines.db"))
+
+    def tearDown(self):
+        nmapDelta._oBaselineStore.oConn.close()
+        nmapDelta._oBaselineStore = self.oSavedBaselines
+        nmapModule.runNmap = self.funcSavedRun
+        nmapScheduler._SCHEDULER_ = self.oSavedScheduler
+        self.oStore.oConn.close()
+        shutil.rmtree(self.sTempDir)
+
+    def checkpointed(self, sCmdName, lstArgs):
+        return checkpointScope(Checkpoint(self.oStore, "nmap", sCmdName, {"args": lstArgs, "targets_file": None}))
+
+    def testCheckpointUnitsHaveNoTimeout(self):
+        with self.checkpointed("pingsweep", ["10.0.0.0/16"]):
+            dResult = nmapModule.pingsweep("10.0.0.0/16")
+        self.assertNotIn("errors", dResult)
+        self.assertEqual(len(dResult["hosts"]), 64)
+        self.assertEqual({fTimeout for _, fTimeout in self.oNmap.lstRuns}, {None})
+
+    def testStreamedCheckpointUnitsHaveNoTimeout(self):
+        with self.checkpointed("pingsweep", ["10.0.0.0/16"]):
+            lstRecords = list(nmapModule.pingsweepStream("10.0.0.0/16"))
+        self.assertEqual(len(lstRecords), 64)
+        self.assertEqual({fTimeout for _, fTimeout in self.oNmap.lstRuns}, {None})
+
+    def testExplicitTimeouts(self):
+        with self.checkpointed("pingsweep", ["10.0.0.0/16"]):
+            nmapModule.pingsweep("10.0.0.0/16", None, "4", "50")
+        self.assertEqual({fTimeout for _, fTimeout in self.oNmap.lstRuns}, {50.0})
+        self.oNmap.lstRuns.clear()
+        # Sharding asked for by the caller keeps its default timeout
+        nmapModule.pingsweep("10.0.0.0/22", "24")
+        self.assertEqual(sorted(self.oNmap.lstRuns), [(f"10.0.{i}.0/24", 300.0) for i in range(4)])
+
+    def testPortscanDiffKeepsFailedUnits(self):
+        def runDiff():
+            with self.checkpointed("portscan", ["10.0.0.0/22", "22"]):
+                return nmapModule.portscanDiff("10.0.0.0/22", "22")
+
+        dFirst = runDiff()
+        iPorts = len(dFirst["added"])
+        self.assertEqual(len({dPort["ip"] for dPort in dFirst["added"]}), 4)
+        self.assertNotIn("errors", dFirst)
+
+        # A failed unit is reported, and its known port is neither removed now...
+        self.oNmap.setFailing = {"10.0.1.0/24"}
+        dPartial = runDiff()
+        self.assertEqual(dPartial["errors"], [{"shard": "10.0.1.0/24", "error": "timed out after 5s"}])
+        self.assertEqual((dPartial["added"], dPartial["removed"], dPartial["unchanged"]), ([], [], iPorts))
+
+        # ...nor added again once the unit scans fine
+        self.oNmap.setFailing = set()
+        dNext = runDiff()
+        self.assertEqual((dNext["added"], dNext["removed"], dNext["unchanged"]), ([], [], iPorts))
+
+if __name__ == "__main__":
+    unittest.main()
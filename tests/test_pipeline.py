@@ -0,0 +1,292 @@
+"""
+Pipelines of module commands (see pipeline.py and dispatchPipeline in
+main.py), and the scan budget leases of the nmap scans streaming through them
+(see scheduler.py).
+"""
+
+import io
+import os
+import sys
+import json
+import time
+import tempfile
+import threading
+import unittest
+import ipaddress
+import subprocess
+from unittest import mock
+from fluxcli.main import buildCommandRegistry, splitPipeline, dispatchPipeline
+from fluxcli.pipeline import PipelineStage, iterPipeline, getRecordTarget
+from fluxcli.bench.fixtures import iterNmapXml
+from fluxcli.modules.nmap import module as nmapModule
+from fluxcli.modules.nmap import scheduler as nmapScheduler
+
+_ROOT_ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Hosts reported up by the fake nmap for any network target
+_UPSTREAM_HOSTS_ = 300
+
+# Seconds a pipeline may take before it counts as deadlocked
+_DEADLINE_ = 30
+
+class FakeNmap:
+    """
+    Stand-in for streamCommand: answers from synthetic XML, and raises
+    TimeoutExpired for the first iFailing port scans so the scheduler backs off.
+    """
+
+    def __init__(self, iFailing=1):
+        self.iPortScans = 0
+        self.iFailing = iFailing
+        self.oLock = threading.Lock()
+
+    def __call__(self, lstCmd, fTimeout=None):
+        sTarget = lstCmd[-1]
+        bPorts = "-p" in lstCmd
+        if bPorts:
+            with self.oLock:
+                self.iPortScans += 1
+                if self.iPortScans <= self.iFailing:
+                    raise subprocess.TimeoutExpired(lstCmd, 1)
+        oNetwork = ipaddress.ip_network(sTarget, strict=False)
+        iHosts = 1 if bPorts else min(_UPSTREAM_HOSTS_, oNetwork.num_addresses - 2)
+        # Hosts are numbered from the address after the base
+        oBase = oNetwork.network_address - (1 if oNetwork.num_addresses == 1 else 0)
+        return iterNmapXml(iHosts, bPorts, str(oBase))
+
+class IterPipelineTest(unittest.TestCase):
+
+    def stage(self, sName, funcRecords, iWorkers=2) -> PipelineStage:
+        """
+        A stage running funcRecords(sTarget) that records the targets it ran on in its lstTargets.
+        """
+        lstTargets = []
+
+        def funcRun(sTarget):
+            lstTargets.append(sTarget)
+            return funcRecords(sTarget)
+
+        oStage = PipelineStage(sName, funcRun, iWorkers)
+        oStage.lstTargets = lstTargets
+        return oStage
+
+    def testComposition(self):
+        lstSource = [{"ip": "10.0.0.1"}, {"ip": "10.0.0.2"}, {"ip": "10.0.0.1"}, {"note": "no target"}, {"error": "source failed"}]
+        oPorts = self.stage("ports", lambda sTarget: [{"target": f"{sTarget}:{iPort}"} for iPort in (22, 443)])
+        oBanners = self.stage("banners", lambda sTarget: iter([{"host": sTarget, "banner": "ssh" if sTarget.endswith(":22") else "https"}]))
+        lstRecords = list(iterPipeline(iter(lstSource), [oPorts, oBanners], 2))
+
+        # Each target runs once per stage; records without a target pass through
+        self.assertEqual(sorted(oPorts.lstTargets), ["10.0.0.1", "10.0.0.2"])
+        self.assertEqual(len(oBanners.lstTargets), 4)
+        self.assertCountEqual(lstRecords, [
+            {"host": "10.0.0.1:22", "banner": "ssh"}, {"host": "10.0.0.1:443", "banner": "https"},
+            {"host": "10.0.0.2:22", "banner": "ssh"}, {"host": "10.0.0.2:443", "banner": "https"},
+            {"note": "no target"}, {"error": "source failed"}
+        ])
+
+    def testErrorsPassThrough(self):
+        def funcRecords(sTarget):
+            if sTarget == "10.0.0.2":
+                raise RuntimeError("host unreachable")
+            return [{"ip": sTarget, "port": 22}]
+
+        def iterSource():
+            yield {"ip": "10.0.0.1"}
+            yield {"ip": "10.0.0.2"}
+            raise RuntimeError("sweep aborted")
+
+        oLater = self.stage("later", lambda sTarget: [{"ip": sTarget, "seen": True}])
+        lstRecords = list(iterPipeline(iterSource(), [self.stage("ports", funcRecords), oLater], 2))
+        self.assertCountEqual(lstRecords, [
+            {"ip": "10.0.0.1", "seen": True},
+            {"target": "10.0.0.2", "stage": "ports", "error": "host unreachable"},
+            {"error": "sweep aborted"}
+        ])
+        self.assertEqual(oLater.lstTargets, ["10.0.0.1"])
+
+    def testCloseStopsStages(self):
+        oClosed = threading.Event()
+
+        def iterSource():
+            try:
+                for iHost in range(1, 10000):
+                    yield {"ip": f"10.0.{iHost // 256}.{iHost % 256}"}
+            finally:
+                oClosed.set()
+
+        oStage = self.stage("ports", lambda sTarget: [{"ip": sTarget}])
+        oPipeline = iterPipeline(iterSource(), [oStage], 4)
+        self.assertIn("ip", next(oPipeline))
+        oPipeline.close()
+        self.assertTrue(oClosed.wait(5))
+        fEnd = time.monotonic() + 5
+        while any(oThread.name.startswith("fluxcli-pipe-") for oThread in threading.enumerate()) and time.monotonic() < fEnd:
+            time.sleep(0.05)
+        self.assertEqual([oThread.name for oThread in threading.enumerate() if oThread.name.startswith("fluxcli-pipe-")], [])
+        self.assertLess(len(oStage.lstTargets), 100)
+
+    def testRecordTarget(self):
+        self.assertEqual(getRecordTarget({"ip": "10.0.0.1", "target": "x"}), "10.0.0.1")
+        self.assertEqual(getRecordTarget({"ip": None, "host": "db.example.net"}), "db.example.net")
+        self.assertIsNone(getRecordTarget({"ip": "10.0.0.1", "error": "down"}))
+        self.assertIsNone(getRecordTarget(["10.0.0.1"]))
+
+class DispatchPipelineTest(unittest.TestCase):
+
+    def setUp(self):
+        self.oHome = tempfile.TemporaryDirectory()
+        self.addCleanup(self.oHome.cleanup)
+        self.dEnv = dict(os.environ, HOME=self.oHome.name, FLUXCLI_NO_DAEMON="1", PYTHONPATH=_ROOT_)
+        self.oNmap = FakeNmap(0)
+        for oPatch in (
+            mock.patch.dict(os.environ, {"HOME": self.oHome.name}),
+            mock.patch.object(nmapModule, "streamCommand", self.oNmap),
+            mock.patch.object(nmapScheduler, "_SCHEDULER_", nmapScheduler.ScanScheduler(0, 1 << 20))
+        ):
+            oPatch.start()
+            self.addCleanup(oPatch.stop)
+        self.dRegistry = buildCommandRegistry()
+
+    def runPipeline(self, sCommandLine) -> tuple:
+        """
+        Run a pipeline command line and return (records, other output lines).
+        """
+        oOut = io.StringIO()
+        with mock.patch("sys.stdout", oOut):
+            dispatchPipeline(self.dRegistry, splitPipeline(self.dRegistry, sCommandLine.split()))
+        lstRecords, lstLines = [], []
+        for sLine in oOut.getvalue().splitlines():
+            if sLine.startswith("{"):
+                lstRecords.append(json.loads(sLine))
+            else:
+                lstLines.append(sLine)
+        return lstRecords, lstLines
+
+    def testSplitPipeline(self):
+        self.assertEqual(splitPipeline(self.dRegistry, "nmap pingsweep 10.0.0.0/24 | portscan --ports 22".split()), [
+            ("nmap", "pingsweep", ["10.0.0.0/24"]),
+            ("nmap", "portscan", ["--ports", "22"])
+        ])
+        self.assertEqual(splitPipeline(self.dRegistry, "pingsweep 10.0.0.0/24 | tmux send %1".split(), "nmap"), [
+            ("nmap", "pingsweep", ["10.0.0.0/24"]),
+            ("tmux", "send", ["%1"])
+        ])
+        # A '|' followed by neither a module nor a command of the stage's module is an argument
+        self.assertEqual(splitPipeline(self.dRegistry, "tmux send %1 ps aux | grep nmap".split()), [
+            ("tmux", "send", ["%1", "ps", "aux", "|", "grep", "nmap"])
+        ])
+
+    def testMalformedPipelines(self):
+        for sCommandLine in ("nmap | portscan", "| nmap portscan", "nmap pingsweep 10.0.0.0/24 | nmap"):
+            with self.subTest(sCommandLine=sCommandLine):
+                with self.assertRaisesRegex(ValueError, "^Each pipeline stage needs a module command\\.$"):
+                    splitPipeline(self.dRegistry, sCommandLine.split())
+        # On the command line: an error line and exit status 1, no traceback
+        oProcess = subprocess.run(
+            [sys.executable, "-m", "fluxcli.main", "nmap", "|", "portscan"],
+            env=self.dEnv, cwd=self.oHome.name, capture_output=True, text=True, timeout=60
+        )
+        self.assertEqual(oProcess.returncode, 1)
+        self.assertEqual(oProcess.stdout.strip(), "Error: Each pipeline stage needs a module command.")
+        self.assertNotIn("Traceback", oProcess.stderr)
+
+    def testNmapPipeline(self):
+        lstRecords, lstLines = self.runPipeline("nmap pingsweep 10.0.0.0/29 | portscan --ports 22 --format ndjson")
+        self.assertEqual(lstLines, [])
+        # Every host found by the sweep is port scanned once
+        self.assertEqual(self.oNmap.iPortScans, 6)
+        self.assertCountEqual([dRecord["ip"] for dRecord in lstRecords if dRecord["port"] == 22], [f"10.0.0.{i}" for i in range(1, 7)])
+
+    def testStageErrorsReachOutput(self):
+        self.oNmap.iFailing = 1
+        lstRecords, _ = self.runPipeline("nmap pingsweep 10.0.0.0/29 | portscan --ports 22 --format ndjson")
+        lstErrors = [dRecord for dRecord in lstRecords if "error" in dRecord]
+        self.assertEqual(len(lstErrors), 1)
+        self.assertEqual(len({dRecord["ip"] for dRecord in lstRecords if "error" not in dRecord}), 5)
+
+    def testStagesCheckedBeforeRunning(self):
+        for sCommandLine, sError in (
+            ("nmap pingsweep 10.0.0.0/29 | portscan --diff", "Error: --diff is not supported in pipelines."),
+            ("nmap pingsweep 10.0.0.0/29 | portscan 22 --bogus", "Error: Unknown option '--bogus'."),
+            ("nmap pingsweep nope | portscan", "Error: Invalid subnet 'nope': expected a network, e.g. 192.168.1.0/24")
+        ):
+            with self.subTest(sCommandLine=sCommandLine):
+                lstRecords, lstLines = self.runPipeline(sCommandLine)
+                self.assertEqual((lstRecords, lstLines[0]), ([], sError))
+        self.assertEqual(self.oNmap.iPortScans, 0)
+
+class PipelineLeaseTest(unittest.TestCase):
+
+    def setUp(self):
+        self.oSavedScheduler = nmapScheduler._SCHEDULER_
+        self.funcSavedStream = nmapModule.streamCommand
+        nmapModule.streamCommand = FakeNmap()
+
+    def tearDown(self):
+        nmapScheduler._SCHEDULER_ = self.oSavedScheduler
+        nmapModule.streamCommand = self.funcSavedStream
+
+    def startPipeline(self, sSubnet) -> tuple:
+        """
+        Start 'nmap pingsweep sSubnet | portscan' with a slow consumer on a thread.
+        Returns (oThread, lstRecords).
+        """
+        lstRecords = []
+
+        def consume():
+            oStage = PipelineStage("portscan", lambda sTarget: nmapModule.portscanStream(sTarget, "22"), 2)
+            for dRecord in iterPipeline(nmapModule.pingsweepStream(sSubnet), [oStage], 4):
+                lstRecords.append(dRecord)
+                time.sleep(0.001)
+
+        oThread = threading.Thread(target=consume, daemon=True)
+        oThread.start()
+        return oThread, lstRecords
+
+    def runPipelines(self, oScheduler, lstSubnets) -> list:
+        """
+        Run one pipeline per subnet concurrently and return the records of each;
+        fails if they do not all finish.
+        """
+        nmapScheduler._SCHEDULER_ = oScheduler
+        lstRuns = [self.startPipeline(sSubnet) for sSubnet in lstSubnets]
+        fDeadline = time.monotonic() + _DEADLINE_
+        for oThread, _ in lstRuns:
+            oThread.join(max(0, fDeadline - time.monotonic()))
+            self.assertFalse(oThread.is_alive(), f"pipeline deadlocked: {oScheduler.stats()}")
+        self.assertEqual(oScheduler.iActiveHosts, 0)
+        self.assertEqual(oScheduler.iActiveScans, 0)
+        return [lstRecords for _, lstRecords in lstRuns]
+
+    def assertScanned(self, lstRecords, iHosts):
+        # Every upstream host is port scanned, except the one whose scan timed out
+        setScanned = {dRecord["ip"] for dRecord in lstRecords if "error" not in dRecord}
+        self.assertGreaterEqual(len(setScanned), iHosts - 1)
+
+    def assertBackedOff(self, oScheduler, lstRecords, iHosts):
+        lstErrors = [dRecord for dRecord in lstRecords if "error" in dRecord]
+        self.assertEqual(len(lstErrors), 1)
+        self.assertGreaterEqual(oScheduler.dStats["congested"], 1)
+        self.assertScanned(lstRecords, iHosts)
+
+    def testUpstreamHoldingWholeBudget(self):
+        # A /24 fits the budget of 256 hosts exactly, so the upstream scan takes all of it
+        oScheduler = nmapScheduler.ScanScheduler(1000, 256)
+        lstRecords, = self.runPipelines(oScheduler, ["10.0.0.0/24"])
+        self.assertBackedOff(oScheduler, lstRecords, 254)
+
+    def testBudgetShrinksUnderUpstream(self):
+        # The upstream /16 is granted half of 512 hosts; the timed-out portscan halves the budget to 256
+        oScheduler = nmapScheduler.ScanScheduler(1000, 512)
+        lstRecords, = self.runPipelines(oScheduler, ["10.0.0.0/16"])
+        self.assertBackedOff(oScheduler, lstRecords, _UPSTREAM_HOSTS_)
+
+    def testConcurrentPipelines(self):
+        # Two pipelines (e.g. background jobs or daemon clients) share one scheduler
+        oScheduler = nmapScheduler.ScanScheduler(1000, 512)
+        for lstRecords in self.runPipelines(oScheduler, ["10.0.0.0/24", "10.1.0.0/24"]):
+            self.assertScanned(lstRecords, 254)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,49 @@
+"""
+nmap scan budgets (see scheduler.py): lease rates, host budgets and back-off.
+"""
+
+import unittest
+import subprocess
+from fluxcli.modules.nmap import scheduler as nmapScheduler
+
+class ScanSchedulerTest(unittest.TestCase):
+
+    def testLoneScanGetsWholeBudget(self):
+        oScheduler = nmapScheduler.ScanScheduler(1000, 1024)
+        with oScheduler.lease(["10.0.0.1"]) as oLease:
+            self.assertEqual(oLease.fRate, 1000)
+            self.assertEqual(oLease.iTemplate, 4)
+            self.assertEqual(oLease.nmapArgs()[1:5], ["--max-rate", "1000", "--max-hostgroup", "1"])
+        with oScheduler.lease(["10.0.0.0/24"]) as oLease:
+            self.assertEqual((oLease.fRate, oLease.iHosts), (1000, 256))
+
+    def testRateSplitBetweenConcurrentScans(self):
+        oScheduler = nmapScheduler.ScanScheduler(1000, 1024)
+        oFirst = oScheduler.acquire(["10.0.0.1"])
+        oSecond = oScheduler.acquire(["10.0.0.2"])
+        self.assertEqual((oFirst.fRate, oSecond.fRate), (1000, 500))
+        oScheduler.release(oFirst)
+        oThird = oScheduler.acquire(["10.0.0.3"])
+        self.assertEqual(oThird.fRate, 500)
+        oScheduler.release(oSecond)
+        oScheduler.release(oThird)
+        self.assertEqual((oScheduler.iActiveScans, oScheduler.iActiveHosts), (0, 0))
+
+    def testBackoffAndRecovery(self):
+        oScheduler = nmapScheduler.ScanScheduler(1000, 1024)
+        with self.assertRaises(subprocess.TimeoutExpired):
+            with oScheduler.lease(["10.0.0.0/24"]):
+                raise subprocess.TimeoutExpired(["nmap"], 1)
+        with oScheduler.lease(["10.0.0.1"]) as oLease:
+            self.assertEqual((oLease.fRate, oLease.iTemplate), (500, 3))
+        # The healthy scan above grew the budgets back by one step
+        self.assertEqual(oScheduler.stats()["scale"], 0.6)
+
+    def testUnlimitedRate(self):
+        oScheduler = nmapScheduler.ScanScheduler(0, 1024)
+        with oScheduler.lease(["10.0.0.1"]) as oLease:
+            self.assertIsNone(oLease.fRate)
+            self.assertNotIn("--max-rate", oLease.nmapArgs())
+
+if __name__ == "__main__":
+    unittest.main()
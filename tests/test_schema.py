@@ -0,0 +1,115 @@
+"""
+Typed argument schemas of module commands (see utils/schema.py).
+"""
+
+import unittest
+from fluxcli.utils.schema import compileSchema, ArgValidator, formatUsage
+
+# As declared in the nmap and tmux commands.yaml files
+_PINGSWEEP_ = [
+    {"name": "subnet", "type": "cidr", "required": True},
+    {"name": "shard-prefix", "type": "int", "min": 1, "max": 128},
+    {"name": "shard-workers", "type": "int", "min": 1, "default": 4},
+    {"name": "shard-timeout", "type": "float", "min": 1},
+    {"name": "full-interval", "type": "float", "min": 0, "default": 3600}
+]
+_PORTSCAN_ = [
+    {"name": "target", "type": "target", "required": True},
+    {"name": "ports", "type": "ports", "default": "1-1000"}
+]
+_SEND_ = [
+    {"name": "pane", "type": "str", "required": True},
+    {"name": "command", "type": "str", "required": True, "variadic": True}
+]
+
+def getValidator(lstArgs) -> ArgValidator:
+    return ArgValidator(compileSchema(lstArgs))
+
+class SchemaTest(unittest.TestCase):
+
+    def testTypedCoercion(self):
+        oPingsweep = getValidator(_PINGSWEEP_)
+        self.assertEqual(oPingsweep.validate(["10.0.0.7/24", "024", " 8 ", "2.50"]), ["10.0.0.0/24", "24", "8", "2.5"])
+        self.assertEqual(oPingsweep.validate(["10.0.0.9"]), ["10.0.0.9/32"])
+        oPortscan = getValidator(_PORTSCAN_)
+        self.assertEqual(oPortscan.validate(["Host.Example.NET", "t:080, U:53,-100,60000-"]), ["host.example.net", "T:80,U:53,-100,60000-"])
+        self.assertEqual(oPortscan.validate(["10.0.1-5.*"]), ["10.0.1-5.*"])
+        oFlags = getValidator([
+            {"name": "mode", "type": "choice", "choices": ["fast", "full"], "default": "fast"},
+            {"name": "verbose", "type": "flag", "default": False},
+            {"name": "address", "type": "ip"},
+            {"name": "port", "type": "port"}
+        ])
+        self.assertEqual(oFlags.validate(["--verbose"]), ["fast", "true"])
+        self.assertEqual(oFlags.validate(["full", "--verbose=Off", "--port", "0443"]), ["full", "false", None, "443"])
+        self.assertEqual(oFlags.validate(["--address", "2001:DB8::0:1"]), ["fast", "false", "2001:db8::1"])
+
+    def testPositionalOrdering(self):
+        oPortscan = getValidator(_PORTSCAN_)
+        self.assertEqual(oPortscan.validate(["--ports", "22,443", "10.0.0.1"]), ["10.0.0.1", "22,443"])
+        self.assertEqual(oPortscan.validate(["--ports=22", "--target=10.0.0.1"]), ["10.0.0.1", "22"])
+        # Skipped slots take their default; trailing omitted ones are left out
+        oPingsweep = getValidator(_PINGSWEEP_)
+        self.assertEqual(oPingsweep.validate(["10.0.0.0/16", "--shard-timeout", "50"]), ["10.0.0.0/16", None, "4", "50"])
+        self.assertEqual(oPingsweep.validate(["10.0.0.0/16", None, None, "50"]), ["10.0.0.0/16", None, "4", "50"])
+        # --targets-file supplies the first argument
+        self.assertEqual(oPortscan.validate(["22"], 1), ["22"])
+
+    def testUnknownOptions(self):
+        oPortscan = getValidator(_PORTSCAN_)
+        for lstTokens in (["10.0.0.1", "--bogus"], ["--bogus", "10.0.0.1"], ["10.0.0.1", "--bogus=1"], ["10.0.0.1", "22", "--port", "80"]):
+            with self.assertRaisesRegex(ValueError, r"^Unknown option '--(bogus|port)'\.$"):
+                oPortscan.validate(lstTokens)
+        with self.assertRaisesRegex(ValueError, r"^Unknown option '--all'\.$"):
+            getValidator([]).validate(["--all"])
+        # Words of a variadic argument are passed on as they are
+        oSend = getValidator(_SEND_)
+        self.assertEqual(oSend.validate(["work:0.1", "ls", "--all", "-"]), ["work:0.1", "ls", "--all", "-"])
+        with self.assertRaisesRegex(ValueError, r"^Unknown option '--all'\.$"):
+            oSend.validate(["--all", "ls"])
+
+    def testErrorMessages(self):
+        oPingsweep = getValidator(_PINGSWEEP_)
+        oPortscan = getValidator(_PORTSCAN_)
+        for oValidator, lstTokens, sMessage in (
+            (oPingsweep, ["nope"], "Invalid subnet 'nope': expected a network, e.g. 192.168.1.0/24"),
+            (oPingsweep, ["10.0.0.0/8", "0"], "Invalid shard-prefix '0': must be at least 1"),
+            (oPingsweep, ["10.0.0.0/8", "200"], "Invalid shard-prefix '200': must be at most 128"),
+            (oPingsweep, ["10.0.0.0/8", "x"], "Invalid shard-prefix 'x': expected an integer"),
+            (oPingsweep, ["10.0.0.0/8", "--shard-timeout", "nan"], "Invalid shard-timeout 'nan': expected a number"),
+            (oPingsweep, ["--shard-prefix", "24"], "Missing required argument: subnet."),
+            (oPortscan, ["10.0.0.1", "22", "80"], "Too many arguments (at most 2)."),
+            (oPortscan, ["10.0.0.1", "--ports"], "Option '--ports' expects a value."),
+            (oPortscan, ["10.0.0.1", "--ports", "22", "--ports=80"], "Option '--ports' given twice."),
+            (oPortscan, ["10.0.0.1", "--target", "10.0.0.2"], "target given both by position and as --target."),
+            (oPortscan, ["10.0.0.1", "80-22"], "Invalid ports '80-22': invalid range '80-22'"),
+            (oPortscan, ["10.0.0.1", "70000"], "Invalid ports '70000': invalid port '70000' (expected 0-65535)"),
+            (oPortscan, ["10.0.300.1-5"], "Invalid target '10.0.300.1-5': invalid octet range")
+        ):
+            with self.subTest(lstTokens=lstTokens):
+                with self.assertRaises(ValueError) as oContext:
+                    oValidator.validate(lstTokens)
+                self.assertEqual(str(oContext.exception), sMessage)
+
+    def testBadDeclarations(self):
+        for lstArgs, sMessage in (
+            ({"name": "x"}, "'args' must be a list"),
+            ([{"type": "int"}], "argument 1 needs a name"),
+            ([{"name": "x", "kind": "int"}], "argument 'x': unknown key(s) kind"),
+            ([{"name": "x", "type": "number"}], "argument 'x': unknown type 'number'"),
+            ([{"name": "x", "type": "choice"}], "argument 'x': type 'choice' needs 'choices'"),
+            ([{"name": "x", "variadic": True}, {"name": "y"}], "argument 'x': only the last argument can be variadic"),
+            ([{"name": "x"}, {"name": "y", "required": True}], "argument 'y': required arguments must come first"),
+            ([{"name": "x", "type": "port", "default": 0}], "argument 'x': bad default '0': expected a port number (1-65535)")
+        ):
+            with self.subTest(sMessage=sMessage):
+                with self.assertRaises(ValueError) as oContext:
+                    compileSchema(lstArgs)
+                self.assertEqual(str(oContext.exception), sMessage)
+
+    def testUsage(self):
+        self.assertEqual(formatUsage("portscan", compileSchema(_PORTSCAN_)), "portscan <target> [ports]")
+        self.assertEqual(formatUsage("send", compileSchema(_SEND_)), "send <pane> <command...>")
+
+if __name__ == "__main__":
+    unittest.main()
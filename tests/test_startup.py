@@ -0,0 +1,71 @@
+"""
+One-shot command lines only import the subsystems they use (see main.py).
+"""
+
+import os
+import sys
+import json
+import tempfile
+import unittest
+import subprocess
+
+_ROOT_ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Imports a command line that needs none of the subsystems must not pay for
+_HEAVY_MODULES_ = (
+    "asyncio", "sqlite3", "multiprocessing", "socketserver", "concurrent.futures",
+    "fluxcli.resultcache", "fluxcli.checkpoint", "fluxcli.inventory", "fluxcli.engine",
+    "fluxcli.batch", "fluxcli.pipeline", "fluxcli.cluster", "fluxcli.workerpool",
+    "fluxcli.reloader", "fluxcli.daemon", "fluxcli.completion", "fluxcli.utils.runner"
+)
+
+# Runs main() with the given argv and reports the heavy modules it imported on stderr
+_PROBE_ = """
+import sys, json
+lstHeavy = json.loads(sys.argv[2])
+sys.argv = ["fluxcli"] + json.loads(sys.argv[1])
+from fluxcli.main import main
+try:
+    main()
+except SystemExit:
+    pass
+sys.stdout.flush()
+sys.stderr.write(json.dumps([sName for sName in lstHeavy if sName in sys.modules]))
+"""
+
+class StartupImportTest(unittest.TestCase):
+
+    def setUp(self):
+        self.oHome = tempfile.TemporaryDirectory()
+        self.dEnv = dict(os.environ, HOME=self.oHome.name, FLUXCLI_NO_DAEMON="1", PYTHONPATH=_ROOT_)
+
+    def tearDown(self):
+        self.oHome.cleanup()
+
+    def loadedModules(self, lstArgv) -> list:
+        """
+        Run 'fluxcli <lstArgv>' in a fresh interpreter and return the heavy modules it imported.
+        """
+        oProcess = subprocess.run(
+            [sys.executable, "-c", _PROBE_, json.dumps(lstArgv), json.dumps(_HEAVY_MODULES_)],
+            env=self.dEnv, cwd=self.oHome.name, capture_output=True, text=True, timeout=60
+        )
+        return json.loads(oProcess.stderr.strip().splitlines()[-1])
+
+    def testImport(self):
+        oProcess = subprocess.run(
+            [sys.executable, "-c", f"import sys, fluxcli.main; print([s for s in {_HEAVY_MODULES_!r} if s in sys.modules])"],
+            env=self.dEnv, cwd=self.oHome.name, capture_output=True, text=True, timeout=60
+        )
+        self.assertEqual(oProcess.stdout.strip(), "[]")
+
+    def testNativeCommand(self):
+        # Cold (manifest built) and warm start
+        self.assertEqual(self.loadedModules(["cache"]), [])
+        self.assertEqual(self.loadedModules(["cache"]), [])
+
+    def testModuleUsage(self):
+        self.assertEqual(self.loadedModules(["nmap"]), [])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,82 @@
+"""
+tmux module over its control-mode connection (see modules/tmux/control.py),
+against a private server started with 'tmux -L'.
+"""
+
+import os
+import time
+import shutil
+import tempfile
+import unittest
+import subprocess
+from unittest import mock
+from fluxcli.modules.tmux import control
+from fluxcli.modules.tmux import module as tmuxModule
+from fluxcli.modules.tmux.control import ControlClient, TmuxError, getControlClient, quoteArg
+
+@unittest.skipUnless(shutil.which("tmux"), "tmux is not installed")
+class TmuxControlTest(unittest.TestCase):
+
+    def setUp(self):
+        self.oTempDir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.oTempDir.cleanup)
+        self.lstTmux = ["tmux", "-L", f"fluxcli-test-{os.getpid()}"]
+        dSettings = {"tmux": {"socket_name": self.lstTmux[-1], "timeout": 5}}
+        for oPatch in (
+            mock.patch.dict(os.environ, {"TMUX_TMPDIR": self.oTempDir.name}),
+            mock.patch.object(control, "loadUserSettings", lambda: dSettings),
+            mock.patch.object(control, "_CLIENT_", None)
+        ):
+            oPatch.start()
+            self.addCleanup(oPatch.stop)
+        os.environ.pop("TMUX", None)
+        self.addCleanup(self.killServer)
+        self.oClient = ControlClient(self.lstTmux)
+        self.addCleanup(self.oClient.close)
+
+    def killServer(self) -> None:
+        subprocess.run([*self.lstTmux, "kill-server"], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    def testQuoteArg(self):
+        sText = "a;b $HOME ~ \"q\" \\\nc\td"
+        self.assertEqual(quoteArg(sText), "\"a;b \\$HOME ~ \\\"q\\\" \\\\\\nc\\td\"")
+        # The argument reaches tmux verbatim: not split at ';', no '$' or '~' expansion
+        self.oClient.command("set-option", "-g", "@fx", sText)
+        self.assertEqual(self.oClient.command("show-options", "-gv", "@fx"), sText.split("\n"))
+
+    def testPipelinedRepliesInOrder(self):
+        lstCommands = [["display-message", "-p", f"reply {i}"] for i in range(50)]
+        lstCommands[10] = ["has-session", "-t", "=missing"]
+        lstResults = self.oClient.commands(lstCommands)
+        self.assertEqual(len(lstResults), 50)
+        self.assertIsInstance(lstResults[10], TmuxError)
+        self.assertEqual(lstResults[:10] + lstResults[11:], [[f"reply {i}"] for i in range(50) if i != 10])
+
+    def testErrorRaisesTmuxError(self):
+        with self.assertRaisesRegex(TmuxError, "missing"):
+            self.oClient.command("kill-session", "-t", "=missing")
+        # The connection stays usable
+        self.assertEqual(self.oClient.command("display-message", "-p", "ok"), ["ok"])
+        self.assertIn("error", tmuxModule.killsession("=missing"))
+
+    def testReconnectAfterServerKilled(self):
+        self.assertEqual(tmuxModule.run("display-message", "-p", "before"), {"output": ["before"]})
+        oShared = getControlClient()
+        self.addCleanup(oShared.close)
+        self.killServer()
+        for _ in range(100):
+            if not oShared.isAlive():
+                break
+            time.sleep(0.05)
+        self.assertRaises(TmuxError, oShared.command, "display-message", "-p", "x")
+
+        self.assertEqual(tmuxModule.run("display-message", "-p", "after"), {"output": ["after"]})
+        oReconnected = getControlClient()
+        self.addCleanup(oReconnected.close)
+        self.assertIsNot(oReconnected, oShared)
+        dSession = tmuxModule.newsession("fxwork")
+        self.assertEqual(dSession["name"], "fxwork")
+        self.assertEqual([dSession["name"] for dSession in tmuxModule.sessions()["sessions"]], ["fxwork"])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,142 @@
+"""
+Isolated module calls (see workerpool.py): the nmap module run through a
+RemoteModule in worker processes, with nmap replaced by a script.
+"""
+
+import os
+import sys
+import time
+import signal
+import tempfile
+import threading
+import unittest
+import multiprocessing
+from unittest import mock
+from fluxcli import workerpool
+from fluxcli.workerpool import WorkerPool, RemoteModule
+from fluxcli.modules.nmap import module as nmapModule
+
+_ROOT_ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Stand-in for nmap: reports one live host after the target, and records its
+# pid and its parent's (the worker's) in <target>.pid. Targets in 10.9.0.0/16 hang.
+_FAKE_NMAP_ = """#!{sPython}
+import os, sys, time
+sys.path.insert(0, {sRoot!r})
+from fluxcli.bench.fixtures import iterNmapXml
+sTarget = sys.argv[-1]
+with open(os.path.join({sDir!r}, sTarget.replace("/", "_") + ".pid"), "w") as fPid:
+    fPid.write(f"{{os.getpid()}} {{os.getppid()}}")
+if sTarget.startswith("10.9."):
+    time.sleep(60)
+sys.stdout.buffer.write(b"".join(iterNmapXml(1, "-p" in sys.argv, sTarget.split("/")[0])))
+"""
+
+def isRunning(iPid: int) -> bool:
+    try:
+        os.kill(iPid, 0)
+    except ProcessLookupError:
+        return False
+    # A zombie has exited but not been reaped
+    try:
+        with open(f"/proc/{iPid}/stat") as fStat:
+            return fStat.read().rsplit(")", 1)[1].split()[0] != "Z"
+    except OSError:
+        return True
+
+class WorkerPoolTest(unittest.TestCase):
+
+    def setUp(self):
+        self.oTempDir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.oTempDir.cleanup)
+        sDir = self.oTempDir.name
+        sNmap = os.path.join(sDir, "nmap")
+        with open(sNmap, "w") as fNmap:
+            fNmap.write(_FAKE_NMAP_.format(sPython=sys.executable, sRoot=_ROOT_, sDir=sDir))
+        os.chmod(sNmap, 0o755)
+        for oPatch in (
+            mock.patch.dict(os.environ, {"PATH": sDir + os.pathsep + os.environ.get("PATH", ""), "HOME": sDir}),
+            # Spawned workers see this test's PATH; a forkserver keeps the environment it started with
+            mock.patch.object(workerpool, "getWorkerContext", lambda: multiprocessing.get_context("spawn"))
+        ):
+            oPatch.start()
+            self.addCleanup(oPatch.stop)
+        self.oPool = WorkerPool(["nmap"], 1)
+        self.addCleanup(self.oPool.close)
+        self.addCleanup(self.killFakeNmaps)
+        self.oNmap = RemoteModule(self.oPool, "nmap", {"commands": {"pingsweep": {"timeout": 30}, "portscan": {"timeout": 2}}})
+
+    def killFakeNmaps(self) -> None:
+        for sName in os.listdir(self.oTempDir.name):
+            if sName.endswith(".pid"):
+                try:
+                    os.kill(self.readPids(sName[:-4])[0], signal.SIGKILL)
+                except ProcessLookupError:
+                    pass
+
+    def readPids(self, sTarget: str, fWait: float = 0) -> tuple:
+        """
+        Return (nmap pid, worker pid) of the fake nmap run on sTarget, waiting up to fWait seconds for it to start.
+        """
+        sPath = os.path.join(self.oTempDir.name, sTarget.replace("/", "_") + ".pid")
+        fEnd = time.monotonic() + fWait
+        while not os.path.exists(sPath) and time.monotonic() < fEnd:
+            time.sleep(0.05)
+        with open(sPath) as fPid:
+            return tuple(int(sPid) for sPid in fPid.read().split())
+
+    def idleWorker(self):
+        self.assertEqual(len(self.oPool.lstIdle), 1)
+        return self.oPool.lstIdle[0]
+
+    def testIsolatedFromParentState(self):
+        # Patches in this process do not reach the worker's copy of the module
+        with mock.patch.object(nmapModule, "runNmap", side_effect=AssertionError("ran in the parent")):
+            dResult = self.oNmap.pingsweep("10.0.0.0/24")
+        self.assertEqual([dHost["ip"] for dHost in dResult["hosts"]], ["10.0.0.1"])
+        _, iWorkerPid = self.readPids("10.0.0.0/24")
+        self.assertNotEqual(iWorkerPid, os.getpid())
+        self.assertEqual(iWorkerPid, self.idleWorker().oProcess.pid)
+
+    def testCrashedWorkerIsReplaced(self):
+        self.oNmap.pingsweep("10.0.0.0/24")
+        oWorker = self.idleWorker()
+        lstErrors = []
+
+        def runHanging():
+            try:
+                self.oNmap.pingsweep("10.9.0.0/24")
+            except Exception as e:
+                lstErrors.append(e)
+
+        oThread = threading.Thread(target=runHanging)
+        oThread.start()
+        self.assertEqual(self.readPids("10.9.0.0/24", 10)[1], oWorker.oProcess.pid)
+        os.kill(oWorker.oProcess.pid, signal.SIGKILL)
+        oThread.join(10)
+        self.assertRegex(str(lstErrors[0]), "worker process exited unexpectedly")
+
+        # The next call gets a new worker
+        dResult = self.oNmap.pingsweep("10.0.1.0/24")
+        self.assertEqual([dHost["ip"] for dHost in dResult["hosts"]], ["10.0.1.1"])
+        self.assertNotEqual(self.readPids("10.0.1.0/24")[1], oWorker.oProcess.pid)
+
+    def testTimeoutKillsWorker(self):
+        self.oNmap.pingsweep("10.0.0.0/24")
+        oWorker = self.idleWorker()
+        fStart = time.monotonic()
+        with self.assertRaisesRegex(TimeoutError, "timed out after 2s"):
+            self.oNmap.portscan("10.9.0.1", "22")
+        self.assertLess(time.monotonic() - fStart, 10)
+        iNmapPid, iWorkerPid = self.readPids("10.9.0.1")
+        self.assertEqual(iWorkerPid, oWorker.oProcess.pid)
+        # The worker and its nmap are stopped in the background
+        fEnd = time.monotonic() + 10
+        while (isRunning(iWorkerPid) or isRunning(iNmapPid)) and time.monotonic() < fEnd:
+            time.sleep(0.05)
+        self.assertFalse(isRunning(iWorkerPid))
+        self.assertFalse(isRunning(iNmapPid))
+        self.assertEqual(self.oNmap.pingsweep("10.0.1.0/24")["hosts"][0]["ip"], "10.0.1.1")
+
+if __name__ == "__main__":
+    unittest.main()